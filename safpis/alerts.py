@@ -0,0 +1,242 @@
+"""Price alerts evaluated against each refresh of the fuel station prices.
+
+Rules are indexed by fuel, by grid cell of the area they cover and by price
+threshold, so a refresh only looks at the rules that a changed price could
+trigger.
+"""
+
+from __future__ import annotations
+
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass, field
+from typing import Callable, Hashable, Iterable
+
+from safpis.geo import DEFAULT_CELL_SIZE, cells_within, grid_cell, haversine_km
+from safpis.models import as_site_id
+
+
+@dataclass
+class AlertRule:
+    """A rule that fires when the price of a fuel drops to or below a
+    threshold, optionally only within an area.
+
+    :param rule_id: Unique Rule ID
+    :param fuel_id: ID of the Fuel Type the rule applies to
+    :param max_price: Price at or below which the rule fires, in the units
+        returned by the SAFPIS REST API (tenths of a cent per litre)
+    :param latitude: Latitude of the centre of the area
+    :param longitude: Longitude of the centre of the area
+    :param radius_km: Radius of the area in kilometres, or None for anywhere
+    """
+
+    rule_id: Hashable
+    fuel_id: int
+    max_price: float
+    latitude: float | None = field(default=None)
+    longitude: float | None = field(default=None)
+    radius_km: float | None = field(default=None)
+
+    def has_area(self) -> bool:
+        return self.radius_km is not None
+
+
+@dataclass
+class Alert:
+    """An alert fired by a rule for a changed price.
+
+    :param rule: The rule that fired
+    :param site_id: ID of the fuel station
+    :param fuel_id: ID of the Fuel Type
+    :param price: The new price
+    :param previous_price: The previous price, or None for a new price
+    :param distance_km: Distance of the fuel station from the centre of the
+        rule's area, or None for rules without an area
+    """
+
+    rule: AlertRule
+    site_id: int
+    fuel_id: int
+    price: float
+    previous_price: float | None
+    distance_km: float | None
+
+
+class _ThresholdBucket:
+    """Rules ordered by max_price, so those a price satisfies are a suffix."""
+
+    def __init__(self) -> None:
+        self.thresholds: list = []
+        self.rules: list = []
+
+    def add(self, rule: AlertRule) -> None:
+        position = bisect_right(self.thresholds, rule.max_price)
+        self.thresholds.insert(position, rule.max_price)
+        self.rules.insert(position, rule)
+
+    def remove(self, rule: AlertRule) -> None:
+        start = bisect_left(self.thresholds, rule.max_price)
+        end = bisect_right(self.thresholds, rule.max_price)
+        for position in range(start, end):
+            if self.rules[position].rule_id == rule.rule_id:
+                del self.thresholds[position]
+                del self.rules[position]
+                return
+
+    def satisfied_by(self, price: float) -> list:
+        return self.rules[bisect_left(self.thresholds, price) :]
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+
+class AlertEngine:
+    """Evaluates alert rules against the prices that changed between
+    refreshes of GetSitesPrices, handing fired alerts to callbacks.
+
+    A rule fires whenever the price of its fuel at a fuel station within its
+    area changes to a price at or below its threshold.
+
+    :param cell_size: The size in degrees of the grid cells used to index
+            rules spatially, defaults to 0.05.
+    :type cell_size: float
+    """
+
+    def __init__(self, cell_size: float = DEFAULT_CELL_SIZE) -> None:
+        self.cell_size = cell_size
+        self.__rules: dict = {}
+        self.__buckets: dict = {}
+        self.__callbacks: list = []
+        self.__coordinates: dict = {}
+        self.__prices: dict = {}
+
+    def add_rule(self, rule: AlertRule) -> None:
+        """Adds a rule, replacing any rule with the same ID.
+
+        :param rule: The rule to add.
+        :type rule: AlertRule
+        """
+        if rule.rule_id in self.__rules:
+            self.remove_rule(rule.rule_id)
+        self.__rules[rule.rule_id] = rule
+        for key in self.__bucket_keys(rule):
+            self.__buckets.setdefault(key, _ThresholdBucket()).add(rule)
+
+    def remove_rule(self, rule_id: Hashable) -> None:
+        """Removes a rule.
+
+        :param rule_id: The ID of the rule to remove.
+        :type rule_id: Hashable
+        :raises KeyError: if there is no rule with :param rule_id:.
+        """
+        rule = self.__rules.pop(rule_id)
+        for key in self.__bucket_keys(rule):
+            bucket = self.__buckets[key]
+            bucket.remove(rule)
+            if not bucket:
+                del self.__buckets[key]
+
+    def rules(self) -> list:
+        """Gets the rules.
+
+        :return: A list of AlertRule objects.
+        :rtype: list
+        """
+        return list(self.__rules.values())
+
+    def __bucket_keys(self, rule: AlertRule):
+        if not rule.has_area():
+            return [(rule.fuel_id, None)]
+        return [
+            (rule.fuel_id, cell) for cell in cells_within(rule.latitude, rule.longitude, rule.radius_km, self.cell_size)
+        ]
+
+    def add_callback(self, callback: Callable[[Alert], None]) -> None:
+        """Registers a function to be called with each fired Alert.
+
+        :param callback: The function to call.
+        :type callback: Callable[[Alert], None]
+        """
+        self.__callbacks.append(callback)
+
+    def set_fuel_stations(self, fuel_stations: Iterable[dict]) -> None:
+        """Sets the locations of the fuel stations from the "S" list of a
+        GetFullSiteDetails response.
+
+        :param fuel_stations: The fuel station records.
+        :type fuel_stations: Iterable[dict]
+        """
+        self.__coordinates = {
+            as_site_id(fuel_station["S"]): (fuel_station["Lat"], fuel_station["Lng"]) for fuel_station in fuel_stations
+        }
+
+    def apply_station_changes(self, changes) -> None:
+        """Updates the locations of the fuel stations that changed. Can be
+        registered with :meth:`Safpis.add_station_listener`.
+
+        :param changes: The changes to apply.
+        :type changes: StationChanges
+        """
+        for fuel_station in changes.removed:
+            self.__coordinates.pop(as_site_id(fuel_station["S"]), None)
+        for fuel_station in [*changes.added, *(new for _old, new in changes.changed)]:
+            self.__coordinates[as_site_id(fuel_station["S"])] = (fuel_station["Lat"], fuel_station["Lng"])
+
+    def update(self, site_prices: Iterable[dict]) -> list:
+        """Evaluates the rules against the prices that changed since the
+        previous update, calling the callbacks with each fired alert.
+
+        The first update treats every price as changed.
+
+        :param site_prices: The "SitePrices" list of a GetSitesPrices
+                response.
+        :type site_prices: Iterable[dict]
+        :return: A list of the fired Alert objects.
+        :rtype: list
+        """
+        previous_prices = self.__prices
+        self.__prices = {}
+        alerts = []
+        for site_price in site_prices:
+            key = (site_price["SiteId"], site_price["FuelId"])
+            price = site_price["Price"]
+            self.__prices[key] = price
+            previous_price = previous_prices.get(key)
+            if price != previous_price:
+                alerts.extend(self.evaluate(key[0], key[1], price, previous_price))
+
+        for alert in alerts:
+            for callback in self.__callbacks:
+                callback(alert)
+        return alerts
+
+    def evaluate(self, site_id: int, fuel_id: int, price: float, previous_price: float | None = None) -> list:
+        """Gets the alerts fired by a price, without calling the callbacks.
+
+        :param site_id: The ID of the fuel station.
+        :type site_id: int
+        :param fuel_id: The ID of the fuel.
+        :type fuel_id: int
+        :param price: The price.
+        :type price: float
+        :param previous_price: The previous price, defaults to None.
+        :type previous_price: float, optional
+        :return: A list of Alert objects.
+        :rtype: list
+        """
+        alerts = []
+        anywhere = self.__buckets.get((fuel_id, None))
+        if anywhere:
+            alerts.extend(
+                Alert(rule, site_id, fuel_id, price, previous_price, None) for rule in anywhere.satisfied_by(price)
+            )
+
+        coordinates = self.__coordinates.get(site_id)
+        if coordinates is None:
+            return alerts
+        nearby = self.__buckets.get((fuel_id, grid_cell(*coordinates, self.cell_size)))
+        if nearby:
+            for rule in nearby.satisfied_by(price):
+                distance = haversine_km(rule.latitude, rule.longitude, *coordinates)
+                if distance <= rule.radius_km:
+                    alerts.append(Alert(rule, site_id, fuel_id, price, previous_price, distance))
+        return alerts
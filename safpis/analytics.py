@@ -0,0 +1,165 @@
+"""Grouped price statistics over a snapshot of fuel station prices."""
+
+from __future__ import annotations
+
+import math
+from dataclasses import dataclass, field
+from typing import Sequence
+
+from safpis.tables import UNAVAILABLE_PRICE, PriceTable
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+GROUP_COLUMNS = ("FuelId", "B", "P", "G1", "G2", "G3", "G4", "G5")
+MAX_PERCENTILE = 100
+
+
+@dataclass
+class PriceStatistics:
+    """Summary statistics for the prices in one group.
+
+    Prices are in the units returned by the SAFPIS REST API (tenths of a cent
+    per litre).
+
+    :param count: The number of prices in the group.
+    :param min: The lowest price.
+    :param max: The highest price.
+    :param mean: The mean price.
+    :param median: The median price.
+    :param spread: The difference between the highest and lowest price.
+    :param percentiles: The requested percentiles, keyed by percentile.
+    """
+
+    count: int
+    min: float
+    max: float
+    mean: float
+    median: float
+    spread: float
+    percentiles: dict = field(default_factory=dict)
+
+
+def price_statistics(
+    table: PriceTable,
+    by: Sequence[str] = ("FuelId",),
+    percentiles: Sequence[float] = (10, 25, 75, 90),
+    *,
+    exclude_unavailable: bool = True,
+):
+    """Computes price statistics for each group of a PriceTable.
+
+    Percentiles use linear interpolation between the closest ranks, the same
+    as NumPy's default method.
+
+    :param table: The prices to summarise.
+    :type table: PriceTable
+    :param by: The columns to group by, any of "FuelId", "B" (brand), "P"
+            (postcode, as a string) or "G1" to "G5" (geographic regions),
+            defaults to ("FuelId",).
+    :type by: Sequence[str]
+    :param percentiles: The percentiles (0-100) to compute for each group,
+            defaults to (10, 25, 75, 90).
+    :type percentiles: Sequence[float]
+    :param exclude_unavailable: Whether to ignore prices reported for fuels
+            that are not available, defaults to True.
+    :type exclude_unavailable: bool
+    :raises ValueError: if a :param by: column or a percentile is not valid.
+    :return: A dict mapping each group's key, a tuple of the :param by:
+            column values, to a PriceStatistics object.
+    :rtype: dict
+    """
+    by = tuple(by)
+    invalid = [name for name in by if name not in GROUP_COLUMNS]
+    if invalid or not by:
+        msg = f"by must be a non-empty sequence of {GROUP_COLUMNS!r}."
+        raise ValueError(msg)
+    if any(not 0 <= q <= MAX_PERCENTILE for q in percentiles):
+        msg = f"percentiles must be between 0 and {MAX_PERCENTILE}."
+        raise ValueError(msg)
+
+    if table.uses_numpy:
+        return _numpy_statistics(table, by, percentiles, exclude_unavailable)
+    return _python_statistics(table, by, percentiles, exclude_unavailable)
+
+
+def _numpy_statistics(table, by, percentiles, exclude_unavailable):
+    prices = table["Price"]
+    keep = ~np.isnan(prices)
+    if exclude_unavailable:
+        keep &= prices != UNAVAILABLE_PRICE
+    prices = prices[keep]
+    keys = [table[name][keep] for name in by]
+    if not len(prices):
+        return {}
+
+    # Sort by the group columns, then by price within each group, so every
+    # group is a contiguous, ordered run of prices.
+    order = np.lexsort([prices, *reversed(keys)])
+    prices = prices[order]
+    keys = [key[order] for key in keys]
+
+    boundary = np.zeros(len(prices), dtype=bool)
+    boundary[0] = True
+    for key in keys:
+        boundary[1:] |= key[1:] != key[:-1]
+    starts = np.flatnonzero(boundary)
+    counts = np.diff(np.append(starts, len(prices)))
+    ends = starts + counts - 1
+
+    def percentile(q):
+        position = starts + (counts - 1) * (q / 100)
+        lower = np.floor(position).astype("int64")
+        upper = np.ceil(position).astype("int64")
+        return prices[lower] + (prices[upper] - prices[lower]) * (position - lower)
+
+    minimums = prices[starts]
+    maximums = prices[ends]
+    means = np.add.reduceat(prices, starts) / counts
+    medians = percentile(50)
+    quantiles = {q: percentile(q) for q in percentiles}
+
+    group_keys = zip(*(key[starts].tolist() for key in keys))
+    return {
+        group_key: PriceStatistics(
+            count=int(counts[i]),
+            min=float(minimums[i]),
+            max=float(maximums[i]),
+            mean=float(means[i]),
+            median=float(medians[i]),
+            spread=float(maximums[i] - minimums[i]),
+            percentiles={q: float(values[i]) for q, values in quantiles.items()},
+        )
+        for i, group_key in enumerate(group_keys)
+    }
+
+
+def _python_statistics(table, by, percentiles, exclude_unavailable):
+    groups: dict = {}
+    keys = zip(*(table[name] for name in by))
+    for group_key, price in zip(keys, table["Price"]):
+        if math.isnan(price) or (exclude_unavailable and price == UNAVAILABLE_PRICE):
+            continue
+        groups.setdefault(group_key, []).append(price)
+
+    def percentile(prices, q):
+        position = (len(prices) - 1) * (q / 100)
+        lower = math.floor(position)
+        upper = math.ceil(position)
+        return prices[lower] + (prices[upper] - prices[lower]) * (position - lower)
+
+    statistics = {}
+    for group_key, prices in sorted(groups.items()):
+        prices.sort()
+        statistics[group_key] = PriceStatistics(
+            count=len(prices),
+            min=prices[0],
+            max=prices[-1],
+            mean=math.fsum(prices) / len(prices),
+            median=percentile(prices, 50),
+            spread=prices[-1] - prices[0],
+            percentiles={q: percentile(prices, q) for q in percentiles},
+        )
+    return statistics
@@ -1,18 +1,59 @@
-from datetime import timedelta
+from __future__ import annotations
+
+import hashlib
 from os import environ
 
-from requests_cache import CachedSession
+from safpis.profiling import span
+from safpis.transport import RequestsTransport, Transport
+
+DEFAULT_BASE_URL = "https://fppdirectapi-prod.safuelpricinginformation.com.au"
+
+# The path of each endpoint, the cache its responses are kept in and whether
+# it takes a geographic region.
+ENDPOINTS = {
+    "GetCountryBrands": ("/Subscriber/GetCountryBrands", "day", False),
+    "GetCountryFuelTypes": ("/Subscriber/GetCountryFuelTypes", "day", False),
+    "GetCountryGeographicRegions": ("/Subscriber/GetCountryGeographicRegions", "day", False),
+    "GetFullSiteDetails": ("/Subscriber/GetFullSiteDetails", "day", True),
+    "GetSitesPrices": ("/Price/GetSitesPrices", "minute", True),
+}
 
 
 class SafpisAPI:
     """This is a class for interacting with the SAFPIS REST API."""
 
-    def __init__(self) -> None:
-        """Constructor method"""
-        self.base_url = "https://" "fppdirectapi-prod.safuelpricinginformation.com.au"
-        self.__country_id = 21  # 21 = Australia
-        self.__geo_region_level = 3  # 3 = States
-        self.__geo_region_id = 4  # 4 = South Australia
+    def __init__(
+        self,
+        country_id: int = 21,
+        geo_region_level: int = 3,
+        geo_region_id: int = 4,
+        transport: Transport | None = None,
+        base_url: str | None = None,
+    ) -> None:
+        """Constructor method
+
+        :param country_id: The ID of the country requested when an endpoint
+                is not given one, defaults to 21 (Australia).
+        :type country_id: int
+        :param geo_region_level: The level of the geographic region requested
+                when an endpoint is not given one, defaults to 3 (states).
+        :type geo_region_level: int
+        :param geo_region_id: The ID of the geographic region requested when
+                an endpoint is not given one, defaults to 4 (South Australia).
+        :type geo_region_id: int
+        :param transport: The transport to send requests with, defaults to a
+                RequestsTransport with the default timeouts and retries. Use
+                a ResilientTransport to serve stale data during outages.
+        :type transport: Transport, optional
+        :param base_url: The scheme and host of the SAFPIS REST API, e.g. of a
+                stub server, defaults to the environmental variable
+                'SAFPIS_BASE_URL' or else the production service.
+        :type base_url: str, optional
+        """
+        self.base_url = (base_url or environ.get("SAFPIS_BASE_URL") or DEFAULT_BASE_URL).rstrip("/")
+        self.country_id = country_id
+        self.geo_region_level = geo_region_level
+        self.geo_region_id = geo_region_id
 
         try:
             subscriber_token = environ.get("SAFPIS_SUBSCRIBER_TOKEN")
@@ -23,30 +64,23 @@ class SafpisAPI:
 
         self.__token = subscriber_token
 
-        self.cached_session_day = CachedSession(
-            "safpis_cache_day",
-            use_cache_dir=True,
-            cache_control=True,
-            expire_after=timedelta(days=1),
-            allowable_codes=[200, 400],
-            allowable_methods=["GET"],
-            stale_if_error=False,
-        )
+        self.transport = transport if transport is not None else RequestsTransport()
+        # The requests_cache sessions of the default transport.
+        sessions = getattr(self.transport, "sessions", {})
+        self.cached_session_day = sessions.get("day")
+        self.cached_session_minute = sessions.get("minute")
 
-        self.cached_session_minute = CachedSession(
-            "safpis_cache_minute",
-            use_cache_dir=True,
-            cache_control=True,
-            expire_after=timedelta(minutes=1),
-            allowable_codes=[200, 400],
-            allowable_methods=["GET"],
-            stale_if_error=False,
-        )
+        # The fingerprint of the latest payload returned by each endpoint.
+        self.fingerprints: dict = {}
+        # Whether the latest payload returned by each endpoint was decoded
+        # from an expired cached response, e.g. served by a
+        # ResilientTransport because the service failed.
+        self.stale: dict = {}
 
         self.headers = {
             "Content-Type": "application/json",
             "Accept": "*/*",
-            "Accept-Encoding": "gzip, deflate, br",
+            "Accept-Encoding": self.transport.accept_encoding,
             "Authorization": f"FPDAPI SubscriberToken={self.__token}",
         }
 
@@ -64,7 +98,7 @@ class SafpisAPI:
         :type cache: str
         :raises ValueError: if :param cache: value is not recognised.
         :raises HTTPError: if the HTTP response is a 4XX client or 5XX server
-                error response.
+                error response, after any retries.
         :return: The request response.
         :rtype: requests.Response
         """
@@ -72,150 +106,225 @@ class SafpisAPI:
         if cache not in valid_cache:
             raise ValueError("cache must be one of %r." % valid_cache)
 
-        if cache == "day":
-            response = self.cached_session_day.get(
-                url,
-                headers=self.headers,
-                params=params,
-            )
-        elif cache == "minute":
-            response = self.cached_session_minute.get(
+        with span("network", url=url):
+            response = self.transport.get(
                 url,
                 headers=self.headers,
                 params=params,
+                cache=cache,
             )
 
         response.raise_for_status()
 
         return response
 
-    def GetCountryBrands(self, countryId: int = 21):
-        """Sends a request to the GetCountryBrands endpoint, caching responses
-        for a day.
-
-        :param countryId: The ID of the country for which fuel brands are being
-                requested, defaults to 21 (Australia).
-        :type countryId: int
-        :return: The json-encoded content of the response.
+    def __decode(self, endpoint: str, response, fingerprint: str | None = None):
+        """Decodes a response's json-encoded content, unless it is unchanged
+        from the payload identified by :param fingerprint:.
+
+        Expired cached responses are revalidated with the service using
+        conditional requests (If-None-Match / If-Modified-Since) when it
+        returned an ETag or Last-Modified header, so an unchanged payload
+        is not downloaded again.
+
+        :param endpoint: The name of the endpoint.
+        :type endpoint: str
+        :param response: The request response.
+        :type response: requests.Response
+        :param fingerprint: The fingerprint of a previously returned payload,
+                defaults to None.
+        :type fingerprint: str, optional
+        :return: The json-encoded content of the response, or None if it is
+                unchanged, and the fingerprint of the response's payload.
+        :rtype: tuple
+        """
+        current = payload_fingerprint(response)
+        self.fingerprints[endpoint] = current
+        self.stale[endpoint] = getattr(response, "is_expired", False) is True
+        if fingerprint is not None and fingerprint == current:
+            return (None, current)
+        with span("decode", endpoint=endpoint):
+            return (response.json(), current)
+
+    def fetch(
+        self,
+        endpoint: str,
+        fingerprint: str | None = None,
+        countryId: int | None = None,
+        GeoRegionLevel: int | None = None,
+        GeoRegionId: int | None = None,
+    ) -> tuple:
+        """Sends a request to an endpoint, returning its payload together
+        with the payload's fingerprint. Unlike :attr:`fingerprints`, which
+        holds the latest fingerprint of each endpoint, the fingerprint
+        returned belongs to this request, even when other threads share
+        the SafpisAPI.
+
+        :param endpoint: The name of the endpoint, e.g. "GetSitesPrices".
+        :type endpoint: str
+        :param fingerprint: The fingerprint of a previously returned payload.
+                If the payload is unchanged, None is returned instead of
+                decoding it again. Defaults to None.
+        :type fingerprint: str, optional
+        :param countryId: The ID of the country, defaults to
+                :attr:`country_id`.
+        :type countryId: int, optional
+        :param GeoRegionLevel: The level of the geographic region, for the
+                endpoints that take one, defaults to :attr:`geo_region_level`.
+        :type GeoRegionLevel: int, optional
+        :param GeoRegionId: The ID of the geographic region, for the endpoints
+                that take one, defaults to :attr:`geo_region_id`.
+        :type GeoRegionId: int, optional
+        :raises ValueError: if :param endpoint: is not recognised.
+        :return: The json-encoded content of the response, or None if it is
+                unchanged from :param fingerprint:, and the fingerprint of the
+                response's payload.
+        :rtype: tuple
         """
-        url = f"{self.base_url}/Subscriber/GetCountryBrands"
-        params = {"countryId": countryId}
+        if endpoint not in ENDPOINTS:
+            msg = f"endpoint must be one of {tuple(ENDPOINTS)!r}."
+            raise ValueError(msg)
+        endpoint_path, cache, regional = ENDPOINTS[endpoint]
+        params = {"countryId": self.country_id if countryId is None else countryId}
+        if regional:
+            params["geoRegionLevel"] = self.geo_region_level if GeoRegionLevel is None else GeoRegionLevel
+            params["geoRegionId"] = self.geo_region_id if GeoRegionId is None else GeoRegionId
 
         response = self.__call_api(
-            url,
+            f"{self.base_url}{endpoint_path}",
             params=params,
+            cache=cache,
         )
 
-        return response.json()
+        return self.__decode(endpoint, response, fingerprint)
+
+    def GetCountryBrands(self, countryId: int | None = None, fingerprint: str | None = None):
+        """Sends a request to the GetCountryBrands endpoint, caching responses
+        for a day.
+
+        :param countryId: The ID of the country for which fuel brands are being
+                requested, defaults to :attr:`country_id`.
+        :type countryId: int, optional
+        :param fingerprint: The fingerprint of a previously returned payload,
+                see :attr:`fingerprints`. If the payload is unchanged, None is
+                returned instead of decoding it again. Defaults to None.
+        :type fingerprint: str, optional
+        :return: The json-encoded content of the response, or None if it is
+                unchanged from :param fingerprint:.
+        """
+        payload, _fingerprint = self.fetch("GetCountryBrands", fingerprint, countryId)
+        return payload
 
-    def GetCountryGeographicRegions(self, countryId: int = 21):
+    def GetCountryGeographicRegions(self, countryId: int | None = None, fingerprint: str | None = None):
         """Sends a request to the GetCountryGeographicRegions endpoint, caching
         responses for a day.
 
         :param countryId: The ID of the country for which geographic regions
-                are being requested, defaults to 21 (Australia).
-        :type countryId: int
-        :return: The json-encoded content of the response.
+                are being requested, defaults to :attr:`country_id`.
+        :type countryId: int, optional
+        :param fingerprint: The fingerprint of a previously returned payload,
+                see :attr:`fingerprints`. If the payload is unchanged, None is
+                returned instead of decoding it again. Defaults to None.
+        :type fingerprint: str, optional
+        :return: The json-encoded content of the response, or None if it is
+                unchanged from :param fingerprint:.
         """
-        url = f"{self.base_url}/Subscriber/GetCountryGeographicRegions"
-        params = {"countryId": countryId}
-
-        response = self.__call_api(
-            url,
-            params=params,
-        )
-
-        return response.json()
+        payload, _fingerprint = self.fetch("GetCountryGeographicRegions", fingerprint, countryId)
+        return payload
 
-    def GetCountryFuelTypes(self, countryId: int = 21):
+    def GetCountryFuelTypes(self, countryId: int | None = None, fingerprint: str | None = None):
         """Sends a request to the GetCountryFuelTypes endpoint, caching
         responses for a day.
 
         :param countryId: The ID of the country for which fuel types are being
-                requested, defaults to 21 (Australia).
-        :type countryId: int
-        :return: The json-encoded content of the response.
+                requested, defaults to :attr:`country_id`.
+        :type countryId: int, optional
+        :param fingerprint: The fingerprint of a previously returned payload,
+                see :attr:`fingerprints`. If the payload is unchanged, None is
+                returned instead of decoding it again. Defaults to None.
+        :type fingerprint: str, optional
+        :return: The json-encoded content of the response, or None if it is
+                unchanged from :param fingerprint:.
         """
-        url = f"{self.base_url}/Subscriber/GetCountryFuelTypes"
-        params = {"countryId": countryId}
-
-        response = self.__call_api(
-            url,
-            params=params,
-        )
-
-        return response.json()
+        payload, _fingerprint = self.fetch("GetCountryFuelTypes", fingerprint, countryId)
+        return payload
 
     def GetFullSiteDetails(
         self,
-        countryId: int = 21,
-        GeoRegionLevel: int = 3,
-        GeoRegionId: int = 4,
+        countryId: int | None = None,
+        GeoRegionLevel: int | None = None,
+        GeoRegionId: int | None = None,
+        fingerprint: str | None = None,
     ):
         """Sends a request to the GetFullSiteDetails endpoint, caching
         responses for a day.
 
         :param countryId: The ID of the country for which fuel station details
-                are being requested, defaults to 21 (Australia).
-        :type countryId: int
+                are being requested, defaults to :attr:`country_id`.
+        :type countryId: int, optional
         :param GeoRegionLevel: The level of the geographic region for which
-                fuel station details are being requested, defaults to 3 (states).
-        :type GeoRegionLevel: int
+                fuel station details are being requested, defaults to
+                :attr:`geo_region_level`.
+        :type GeoRegionLevel: int, optional
         :param GeoRegionId: The ID of the geographic region for which fuel
-                station details are being requested, defaults to 4 (South
-                Australia).
-        :type GeoRegionId: int
-        :return: The json-encoded content of the response.
+                station details are being requested, defaults to
+                :attr:`geo_region_id`.
+        :type GeoRegionId: int, optional
+        :param fingerprint: The fingerprint of a previously returned payload,
+                see :attr:`fingerprints`. If the payload is unchanged, None is
+                returned instead of decoding it again. Defaults to None.
+        :type fingerprint: str, optional
+        :return: The json-encoded content of the response, or None if it is
+                unchanged from :param fingerprint:.
         """
-        url = f"{self.base_url}/Subscriber/GetFullSiteDetails"
-        params = {
-            "countryId": countryId,
-            "geoRegionLevel": GeoRegionLevel,
-            "geoRegionId": GeoRegionId,
-        }
-
-        response = self.__call_api(
-            url,
-            params=params,
-        )
-
-        return response.json()
+        payload, _fingerprint = self.fetch("GetFullSiteDetails", fingerprint, countryId, GeoRegionLevel, GeoRegionId)
+        return payload
 
     def GetSitesPrices(
         self,
-        countryId: int = 21,
-        GeoRegionLevel: int = 3,
-        GeoRegionId: int = 4,
+        countryId: int | None = None,
+        GeoRegionLevel: int | None = None,
+        GeoRegionId: int | None = None,
+        fingerprint: str | None = None,
     ):
         """Sends a request to the GetSitesPrices endpoint, caching
         responses for a minute.
 
         :param countryId: The ID of the country for which fuel station prices
-                are being requested, defaults to 21 (Australia).
-        :type countryId: int
+                are being requested, defaults to :attr:`country_id`.
+        :type countryId: int, optional
         :param GeoRegionLevel: The level of the geographic region for which
-                fuel station prices are being requested, defaults to 3 (states).
-        :type GeoRegionLevel: int
+                fuel station prices are being requested, defaults to
+                :attr:`geo_region_level`.
+        :type GeoRegionLevel: int, optional
         :param GeoRegionId: The ID of the geographic region for which fuel
-                station prices are being requested, defaults to 4 (South
-                Australia).
-        :type GeoRegionId: int
-        :return: The json-encoded content of the response.
+                station prices are being requested, defaults to
+                :attr:`geo_region_id`.
+        :type GeoRegionId: int, optional
+        :param fingerprint: The fingerprint of a previously returned payload,
+                see :attr:`fingerprints`. If the payload is unchanged, None is
+                returned instead of decoding it again. Defaults to None.
+        :type fingerprint: str, optional
+        :return: The json-encoded content of the response, or None if it is
+                unchanged from :param fingerprint:.
         """
-        url = f"{self.base_url}/Price/GetSitesPrices"
-        params = {
-            "countryId": countryId,
-            "geoRegionLevel": GeoRegionLevel,
-            "geoRegionId": GeoRegionId,
-        }
+        payload, _fingerprint = self.fetch("GetSitesPrices", fingerprint, countryId, GeoRegionLevel, GeoRegionId)
+        return payload
 
-        response = self.__call_api(
-            url,
-            params=params,
-            cache="minute",
-        )
 
-        return response.json()
+def payload_fingerprint(response) -> str:
+    """Gets a fingerprint identifying the payload of a response: its ETag
+    when the service sends one, otherwise a hash of its content.
+
+    :param response: The request response.
+    :type response: requests.Response
+    :return: The payload's fingerprint.
+    :rtype: str
+    """
+    etag = response.headers.get("ETag")
+    if etag:
+        return f"etag:{etag}"
+    return f"sha256:{hashlib.sha256(response.content).hexdigest()}"
 
 
 class APIKeyMissingError(Exception):
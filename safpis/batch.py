@@ -0,0 +1,217 @@
+"""Answers many lookups from one snapshot of the SAFPIS data.
+
+Queries and results are newline-delimited JSON objects. Each query names
+its kind in "query", e.g.::
+
+    {"query": "site", "id": 61205460}
+    {"query": "brand", "name": "Caltex"}
+    {"query": "fuel", "name": "Unleaded"}
+    {"query": "price", "site_id": 61205460, "fuel_id": 2}
+    {"query": "closest", "latitude": -34.9285, "longitude": 138.6007, "k": 5}
+    {"query": "cheapest", "fuel_name": "Unleaded", "k": 10}
+
+Each result echoes the query's "ref", or its line number if it has none,
+with either a "result" or an "error". A failed query does not stop the
+batch.
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import json
+from datetime import date, time
+from decimal import Decimal
+from typing import IO, TYPE_CHECKING, Iterable
+
+from money import Money
+
+from safpis.geo import nearest
+from safpis.safpis import NoResultsError, ToManyResultsError
+from safpis.tables import UNAVAILABLE_PRICE
+
+if TYPE_CHECKING:
+    from safpis.snapshot import Snapshot
+
+QUERIES = ("site", "brand", "fuel", "price", "closest", "cheapest")
+
+DEFAULT_K = 5
+
+
+def jsonable(value):
+    """Converts a result to values the json module can encode: dataclasses
+    such as FuelStation become dicts, dates and times ISO 8601 strings, and
+    decimals and Money amounts floats.
+
+    :param value: The value.
+    :return: The converted value.
+    """
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return {field.name: jsonable(getattr(value, field.name)) for field in dataclasses.fields(value)}
+    if isinstance(value, dict):
+        return {key: jsonable(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [jsonable(item) for item in value]
+    if isinstance(value, (date, time)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, Money):
+        return float(value.amount)
+    return value
+
+
+def _one(found: list, what: str, id_):
+    if not found:
+        raise NoResultsError(what, id_)
+    if len(found) > 1:
+        raise ToManyResultsError(what, id_)
+    return found[0]
+
+
+class BatchQueries:
+    """Answers queries from one snapshot, with the lookups each kind of query
+    needs built once for the whole batch.
+
+    :param snapshot: The snapshot to answer from.
+    :type snapshot: Snapshot
+    """
+
+    def __init__(self, snapshot: Snapshot) -> None:
+        self.snapshot = snapshot
+        self.__brands = {brand["BrandId"]: brand for brand in snapshot.brands}
+        self.__fuels = {fuel["FuelId"]: fuel for fuel in snapshot.fuels}
+        self.__site_ids_by_name: dict = {}
+        for site_id, fuel_station in snapshot.fuel_stations.items():
+            self.__site_ids_by_name.setdefault(fuel_station.N, []).append(site_id)
+        self.__prices = {
+            (site_price["SiteId"], site_price["FuelId"]): site_price for site_price in snapshot.site_prices
+        }
+        self.__prices_by_fuel: dict = {}
+        self.__station_json: dict = {}
+        self.__handlers = {
+            "site": self.__site,
+            "brand": self.__brand,
+            "fuel": self.__fuel,
+            "price": self.__price,
+            "closest": self.__closest,
+            "cheapest": self.__cheapest,
+        }
+
+    def answer(self, query: dict):
+        """Answers a query.
+
+        :param query: The query, with its kind in "query" and its arguments.
+        :type query: dict
+        :raises ValueError: if the kind of query is not recognised.
+        :raises KeyError: if a required argument is missing.
+        :raises NoResultsError: if nothing matches the query.
+        :return: The result, ready to be encoded as JSON.
+        """
+        handler = self.__handlers.get(query.get("query"))
+        if handler is None:
+            msg = f"query must be one of {QUERIES!r}."
+            raise ValueError(msg)
+        return handler(query)
+
+    def __fuel_station(self, site_id: int) -> dict:
+        # Converting a FuelStation costs more than finding it, and the
+        # snapshot never changes, so each is converted once per batch.
+        converted = self.__station_json.get(site_id)
+        if converted is None:
+            converted = self.__station_json[site_id] = jsonable(self.snapshot.fuel_stations[site_id])
+        return converted
+
+    def __site(self, query: dict):
+        if "id" in query:
+            site_ids = [query["id"]] if query["id"] in self.snapshot.fuel_stations else []
+            return self.__fuel_station(_one(site_ids, "fuel station", query["id"]))
+        site_ids = self.__site_ids_by_name.get(query["name"], [])
+        return self.__fuel_station(_one(site_ids, "fuel station", query["name"]))
+
+    def __brand(self, query: dict):
+        if "id" in query:
+            brand = self.__brands.get(query["id"])
+            return _one([] if brand is None else [brand], "brand", query["id"])
+        brands = [brand for brand in self.__brands.values() if brand["Name"] == query["name"]]
+        return _one(brands, "brand", query["name"])
+
+    def __fuel(self, query: dict):
+        if "id" in query:
+            fuel = self.__fuels.get(query["id"])
+            return _one([] if fuel is None else [fuel], "fuel", query["id"])
+        fuels = [fuel for fuel in self.__fuels.values() if fuel["Name"] == query["name"]]
+        return _one(fuels, "fuel", query["name"])
+
+    def __fuel_id(self, query: dict) -> int:
+        if "fuel_id" in query:
+            return query["fuel_id"]
+        return self.__fuel({"name": query["fuel_name"]})["FuelId"]
+
+    def __price(self, query: dict):
+        key = (query["site_id"], self.__fuel_id(query))
+        site_price = self.__prices.get(key)
+        return _one([] if site_price is None else [site_price], "price", key)
+
+    def __closest(self, query: dict):
+        station_table = self.snapshot.station_table
+        closest = nearest(
+            [(query["latitude"], query["longitude"])],
+            station_table["Lat"],
+            station_table["Lng"],
+            query.get("k", DEFAULT_K),
+            mode=query.get("mode", "ellipsoidal"),
+        )[0]
+        # The fuel stations are keyed by their original "S", which the table
+        # holds as an int.
+        records = station_table.records
+        return [
+            {"fuel_station": self.__fuel_station(records[position]["S"]), "distance_km": distance}
+            for position, distance in closest
+        ]
+
+    def __cheapest(self, query: dict):
+        fuel_id = self.__fuel_id(query)
+        site_prices = self.__prices_by_fuel.get(fuel_id)
+        if site_prices is None:
+            # Sorted once per fuel, so later queries only slice.
+            site_prices = self.__prices_by_fuel[fuel_id] = sorted(
+                (
+                    site_price
+                    for site_price in self.snapshot.site_prices
+                    if site_price["FuelId"] == fuel_id and site_price["Price"] != UNAVAILABLE_PRICE
+                ),
+                key=lambda site_price: site_price["Price"],
+            )
+        return site_prices[: query.get("k", DEFAULT_K)]
+
+
+def run(queries: BatchQueries, lines: Iterable[str], output: IO[str]) -> tuple:
+    """Answers NDJSON queries, writing an NDJSON result for each.
+
+    :param queries: The BatchQueries object to answer with.
+    :type queries: BatchQueries
+    :param lines: The query lines; blank lines are skipped.
+    :type lines: Iterable[str]
+    :param output: The stream to write the results to.
+    :type output: IO[str]
+    :return: The number of queries answered and the number that failed.
+    :rtype: tuple
+    """
+    answered = failed = 0
+    encode = json.JSONEncoder(separators=(",", ":")).encode
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        ref = line_number
+        try:
+            query = json.loads(line)
+            ref = query.get("ref", line_number)
+            result = {"ref": ref, "result": queries.answer(query)}
+            answered += 1
+        except (ValueError, KeyError, TypeError, AttributeError, NoResultsError, ToManyResultsError) as exc:
+            error = f"missing argument {exc}" if isinstance(exc, KeyError) else str(exc)
+            result = {"ref": ref, "error": error}
+            failed += 1
+        output.write(encode(result))
+        output.write("\n")
+    return answered, failed
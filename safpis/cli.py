@@ -1,10 +1,40 @@
 """Console script for safpis."""
 
+import json
 import sys
+from os import environ
 
 import click
 
+from safpis import batch as batcher
+from safpis import export as exporter
+from safpis import loadtest, profiling, push, stub
 from safpis.api import SafpisAPI
+from safpis.memo import QueryCache
+from safpis.safpis import Safpis
+from safpis.snapshot import PRICE_INTERVAL, SnapshotRefresher, SnapshotStore
+from safpis.transport import RequestsTransport, TransportConfig
+
+PROFILE_QUERIES = [
+    "brand_by_name",
+    "cheapest_along_route",
+    "cheapest_fuel_type",
+    "closest_fuel_stations",
+    "distance_matrix",
+    "filter_fuel_stations",
+    "fuel_by_name",
+    "fuel_station_by_id",
+    "fuel_station_by_name",
+    "fuel_stations_by_brand_name",
+    "nearest_fuel_stations",
+    "open_fuel_stations",
+    "price",
+    "price_statistics",
+    "price_table",
+    "rank_fuel_stations",
+    "refresh",
+    "search_fuel_stations",
+]
 
 
 @click.group()
@@ -94,5 +124,264 @@ def price(site_id, fuel_id):
     click.echo(price[0])
 
 
+#####
+# Export
+#####
+@main.command()
+@click.argument("dataset", type=click.Choice(exporter.DATASETS))
+@click.option(
+    "--format",
+    "fmt",
+    type=click.Choice(exporter.FORMATS),
+    default="csv",
+    show_default=True,
+    help="Output format. Parquet requires pyarrow.",
+)
+@click.option("--output", "-o", type=str, default="-", help="Output file, or - for standard output.")
+@click.option(
+    "--chunk-size",
+    type=click.IntRange(min=1),
+    default=exporter.DEFAULT_CHUNK_SIZE,
+    show_default=True,
+    help="Number of rows written at a time.",
+)
+@click.option(
+    "--changed-only",
+    is_flag=True,
+    help="Only write rows that changed since the last export, and a Removed row for each row that was removed.",
+)
+@click.option(
+    "--state-file",
+    type=str,
+    default=".safpis_export_state.json",
+    show_default=True,
+    help="File remembering previously exported rows, used by --changed-only.",
+)
+def export(dataset, fmt, output, chunk_size, changed_only, state_file):
+    """Export fuel stations, prices or both joined together."""
+    safpis_api = SafpisAPI()
+
+    records = exporter.dataset_records(safpis_api, dataset)
+    fields = exporter.dataset_fields(dataset)
+    state = None
+    if changed_only:
+        state = exporter.ExportState(state_file)
+        records = state.changed(dataset, records)
+        fields += (exporter.REMOVED_FIELD,)
+
+    if output == "-":
+        output = click.get_binary_stream("stdout") if fmt == "parquet" else sys.stdout
+    try:
+        count = exporter.export(records, fmt, output, fields, chunk_size)
+    except ImportError as exc:
+        raise click.ClickException(str(exc)) from exc
+
+    if state is not None:
+        state.save()
+    click.echo(f"Exported {count} {dataset} rows.", err=True)
+
+
+#####
+# Batch
+#####
+@main.command()
+@click.argument("queries", type=click.File("r"), default="-")
+@click.option("--output", "-o", type=click.File("w"), default="-", help="Output file, or - for standard output.")
+def batch(queries, output):
+    """Answer NDJSON queries from QUERIES (default standard input), one per line.
+
+    Every query is answered from the same snapshot of the data, and one NDJSON
+    result is written per query, e.g. `{"query": "price", "site_id":
+    61205460, "fuel_id": 2}`. Query kinds are site, brand, fuel, price, closest
+    and cheapest.
+    """
+    snapshot = SnapshotStore().current()
+    answered, failed = batcher.run(batcher.BatchQueries(snapshot), queries, output)
+    click.echo(f"Answered {answered} queries, {failed} failed.", err=True)
+
+
+#####
+# Push
+#####
+@main.command(name="push")
+@click.option("--host", type=str, default="127.0.0.1", show_default=True, help="Address to listen on.")
+@click.option("--port", type=int, default=8765, show_default=True, help="Port to listen on.")
+@click.option(
+    "--interval",
+    type=click.FloatRange(min=1),
+    default=PRICE_INTERVAL,
+    show_default=True,
+    help="Seconds between polls of the prices.",
+)
+def push_server(host, port, interval):
+    """Push price changes to subscribers as Server-Sent Events.
+
+    The prices are polled once for every subscriber. Stream the changes to
+    some prices with e.g. `curl -N "http://127.0.0.1:8765/events?key=61205460:2"`.
+    """
+    store = SnapshotStore()
+    feed = push.PriceFeed()
+    store.add_listener(feed.apply_snapshot)
+    store.current()
+    server = push.PushServer(feed, host, port)
+    click.echo(f"Pushing {len(feed)} prices at {server.url}/events", err=True)
+    try:
+        with SnapshotRefresher(store, price_interval=interval):
+            server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+#####
+# Stub and load test
+#####
+def _stub_server(payloads, stations, latency, jitter, error_rate, host="127.0.0.1", port=0):
+    behaviour = stub.StubBehaviour(latency=latency, jitter=jitter, error_rate=error_rate)
+    recorded = stub.load_payloads(payloads) if payloads else stub.synthetic_payloads(stations)
+    return stub.StubServer(recorded, behaviour, host=host, port=port)
+
+
+def _stub_options(function):
+    """The options shared by the commands that start a stub server."""
+    options = [
+        click.option(
+            "--payloads", type=click.Path(exists=True, file_okay=False), help="Directory of recorded payloads."
+        ),
+        click.option(
+            "--stations", type=int, default=stub.DEFAULT_STATIONS, show_default=True, help="Synthetic stations."
+        ),
+        click.option("--latency", type=float, default=0.0, show_default=True, help="Seconds added to every response."),
+        click.option("--jitter", type=float, default=0.0, show_default=True, help="Up to this many more seconds."),
+        click.option("--error-rate", type=float, default=0.0, show_default=True, help="Fraction of requests failed."),
+    ]
+    for option in reversed(options):
+        function = option(function)
+    return function
+
+
+@main.command(name="stub")
+@_stub_options
+@click.option("--host", type=str, default="127.0.0.1", show_default=True, help="Address to listen on.")
+@click.option("--port", type=int, default=8080, show_default=True, help="Port to listen on.")
+def stub_server(payloads, stations, latency, jitter, error_rate, host, port):
+    """Serve recorded or synthetic payloads in place of the SAFPIS REST API.
+
+    Point the client at it with the SAFPIS_BASE_URL environmental variable.
+    """
+    server = _stub_server(payloads, stations, latency, jitter, error_rate, host, port)
+    click.echo(f"Serving the SAFPIS REST API stub at {server.url}", err=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+@main.command(name="loadtest")
+@click.argument("scenario", type=click.Choice(loadtest.SCENARIOS))
+@click.option(
+    "--threads",
+    "-t",
+    type=click.IntRange(min=1),
+    default=loadtest.DEFAULT_THREADS,
+    show_default=True,
+    help="Number of concurrent threads.",
+)
+@click.option(
+    "--requests",
+    "-n",
+    type=click.IntRange(min=1),
+    default=loadtest.DEFAULT_REQUESTS,
+    show_default=True,
+    help="Number of calls to make.",
+)
+@click.option("--duration", type=float, help="Stop after this many seconds.")
+@click.option("--stub/--no-stub", "use_stub", default=True, show_default=True, help="Start a local stub server.")
+@click.option("--query-cache/--no-query-cache", default=False, show_default=True, help="Cache Safpis query results.")
+@_stub_options
+def load_test(
+    scenario, threads, requests, duration, use_stub, query_cache, payloads, stations, latency, jitter, error_rate
+):
+    """Load test SafpisAPI or Safpis with many concurrent threads.
+
+    With --no-stub, the service at SAFPIS_BASE_URL (or the real SAFPIS REST
+    API) is used. HTTP responses are cached in memory for the run.
+    """
+    server = None
+    if use_stub:
+        server = _stub_server(payloads, stations, latency, jitter, error_rate).start()
+        environ.setdefault("SAFPIS_SUBSCRIBER_TOKEN", "stub")
+    try:
+        transport = RequestsTransport(TransportConfig(cache_backend="memory", pool_size=threads))
+        api = SafpisAPI(transport=transport, base_url=server.url if server else None)
+        cache = QueryCache() if query_cache else None
+        safpis = Safpis(api=api, query_cache=cache) if scenario not in {"prices", "stations"} else None
+
+        def counters():
+            values = {}
+            if server is not None:
+                values["upstream"] = sum(server.served.values())
+            if cache is not None:
+                statistics = cache.statistics()
+                values["cache hits"] = statistics.hits
+                values["cache miss"] = statistics.misses
+            return values
+
+        call = loadtest.scenario(scenario, api, safpis)
+        result = loadtest.run(call, threads=threads, calls=requests, duration=duration, counters=counters)
+    finally:
+        if server is not None:
+            server.stop()
+    click.echo(result.report())
+
+
+#####
+# Profile
+#####
+def _argument(value):
+    """Parses a command line argument as JSON, falling back to a string."""
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+
+@main.command()
+@click.argument("query", type=click.Choice(PROFILE_QUERIES))
+@click.argument("arguments", nargs=-1)
+@click.option("--repeat", "-n", type=int, default=20, show_default=True, help="Number of times to run the query.")
+def profile(query, arguments, repeat):
+    """Run a query many times and show where the time goes.
+
+    ARGUMENTS are passed to the Safpis method QUERY, each parsed as JSON if
+    possible, e.g. `safpis profile closest_fuel_stations -- -34.93 138.6`.
+    """
+    safpis = Safpis()
+    method = getattr(safpis, query)
+    arguments = [_argument(argument) for argument in arguments]
+
+    collector = profiling.PhaseCollector()
+    profiling.add_sink(collector)
+    try:
+        for _ in range(repeat):
+            method(*arguments)
+    finally:
+        profiling.remove_sink(collector)
+
+    breakdown = collector.breakdown()
+    total = sum(timing.total for timing in breakdown if len(timing.path) == 1)
+    click.echo(f"{'phase':<40} {'calls':>7} {'total ms':>10} {'mean ms':>9} {'own ms':>9} {'own %':>6}")
+    for timing in breakdown:
+        phase = "  " * (len(timing.path) - 1) + timing.path[-1]
+        share = 100 * timing.own / total if total else 0.0
+        click.echo(
+            f"{phase:<40} {timing.count:>7} {timing.total * 1000:>10.2f} {timing.mean * 1000:>9.3f} "
+            f"{timing.own * 1000:>9.2f} {share:>6.1f}"
+        )
+
+
 if __name__ == "__main__":
     sys.exit(main())  # pragma: no cover
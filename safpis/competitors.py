@@ -0,0 +1,292 @@
+"""Each fuel station's nearest competitors and how its prices compare.
+
+A CompetitorGraph links every fuel station to its k nearest fuel stations
+within a distance, found with a GridIndex rather than by measuring the
+distance between every pair. The graph is built once per load of the fuel
+stations. For each fuel a fuel station sells, the graph keeps the median
+price of its competitors that sell the fuel and the station's difference
+from it. A price change only recomputes the differences of the fuel station
+and of the fuel stations it is a competitor of.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from statistics import median
+from typing import TYPE_CHECKING, Iterable
+
+from safpis.geo import GridIndex
+from safpis.models import as_site_id
+from safpis.tables import UNAVAILABLE_PRICE
+
+if TYPE_CHECKING:
+    from safpis.models import StationChanges
+    from safpis.snapshot import Snapshot
+
+DEFAULT_COMPETITORS = 5
+DEFAULT_MAX_KM = 25.0
+
+
+@dataclass(frozen=True)
+class PriceDifferential:
+    """How a fuel station's price for a fuel compares to its competitors'.
+
+    :param site_id: ID of the fuel station
+    :param fuel_id: ID of the Fuel Type
+    :param price: The fuel station's price, in tenths of a cent per litre
+    :param local_median: The median price of the competitors selling the fuel
+    :param difference: The price less the local median
+    :param competitors: The number of competitors selling the fuel
+    """
+
+    site_id: int
+    fuel_id: int
+    price: float
+    local_median: float
+    difference: float
+    competitors: int
+
+
+class CompetitorGraph:
+    """The k nearest competitors of every fuel station and the difference of
+    each of its prices from theirs.
+
+    :param k: The number of competitors of each fuel station, defaults to 5.
+    :type k: int
+    :param max_km: The furthest a competitor can be, in kilometres, defaults
+            to 25.
+    :type max_km: float
+    """
+
+    def __init__(self, k: int = DEFAULT_COMPETITORS, max_km: float = DEFAULT_MAX_KM) -> None:
+        self.k = k
+        self.max_km = max_km
+        self.__locations: dict = {}
+        self.__competitors: dict = {}
+        self.__competitor_of: dict = {}
+        self.__prices: dict = {}
+        # PriceDifferential objects keyed by fuel ID, then site ID.
+        self.__differentials: dict = {}
+        self.__versions: tuple | None = None
+
+    @classmethod
+    def from_payloads(
+        cls,
+        fuel_stations: Iterable[dict],
+        site_prices: Iterable[dict] = (),
+        k: int = DEFAULT_COMPETITORS,
+        max_km: float = DEFAULT_MAX_KM,
+    ):
+        """Builds a CompetitorGraph from the SAFPIS REST API payloads.
+
+        :param fuel_stations: The "S" list of a GetFullSiteDetails response.
+        :type fuel_stations: Iterable[dict]
+        :param site_prices: The "SitePrices" list of a GetSitesPrices
+                response, defaults to none.
+        :type site_prices: Iterable[dict]
+        :param k: The number of competitors of each fuel station, defaults to
+                5.
+        :type k: int
+        :param max_km: The furthest a competitor can be, in kilometres,
+                defaults to 25.
+        :type max_km: float
+        :return: A CompetitorGraph object.
+        """
+        graph = cls(k, max_km)
+        graph.set_fuel_stations(fuel_stations)
+        graph.apply_site_prices(site_prices)
+        return graph
+
+    def __len__(self) -> int:
+        return len(self.__competitors)
+
+    def set_fuel_stations(self, fuel_stations: Iterable[dict]) -> None:
+        """Rebuilds the graph for a new set of fuel stations, keeping the
+        prices.
+
+        :param fuel_stations: The "S" list of a GetFullSiteDetails response.
+        :type fuel_stations: Iterable[dict]
+        """
+        # Keyed by the prices' "SiteId", whatever the type of the "S".
+        index = GridIndex()
+        for fuel_station in fuel_stations:
+            index.add(as_site_id(fuel_station["S"]), fuel_station["Lat"], fuel_station["Lng"])
+        self.__locations = dict(index.points)
+        self.__competitors = {
+            site_id: tuple(index.nearest(latitude, longitude, self.k, self.max_km, exclude=site_id))
+            for site_id, (latitude, longitude) in index.points.items()
+        }
+        self.__competitor_of = {site_id: set() for site_id in self.__competitors}
+        for site_id, competitors in self.__competitors.items():
+            for competitor, _distance in competitors:
+                self.__competitor_of[competitor].add(site_id)
+        self.__differentials = {}
+        for site_id, fuel_id in self.__prices:
+            self.__update_differential(site_id, fuel_id)
+
+    def apply_station_changes(self, changes: StationChanges) -> None:
+        """Rebuilds the graph if fuel stations were added, removed or moved.
+        Can be registered with :meth:`Safpis.add_station_listener`.
+
+        :param changes: The changes to apply.
+        :type changes: StationChanges
+        """
+        moved = any((old["Lat"], old["Lng"]) != (new["Lat"], new["Lng"]) for old, new in changes.changed)
+        if not (changes.added or changes.removed or moved):
+            return
+        fuel_stations = dict(self.__locations)
+        for fuel_station in changes.removed:
+            fuel_stations.pop(as_site_id(fuel_station["S"]), None)
+        for fuel_station in [*changes.added, *(new for _old, new in changes.changed)]:
+            fuel_stations[as_site_id(fuel_station["S"])] = (fuel_station["Lat"], fuel_station["Lng"])
+        self.set_fuel_stations(
+            {"S": site_id, "Lat": latitude, "Lng": longitude}
+            for site_id, (latitude, longitude) in fuel_stations.items()
+        )
+
+    def apply_site_prices(self, site_prices: Iterable[dict]) -> int:
+        """Replaces the prices with those of a GetSitesPrices response. Only
+        the differentials of the fuel stations whose price, or whose
+        competitors' prices, changed are recomputed.
+
+        :param site_prices: The "SitePrices" list of a GetSitesPrices
+                response.
+        :type site_prices: Iterable[dict]
+        :return: The number of prices that changed.
+        :rtype: int
+        """
+        prices = {
+            (site_price["SiteId"], site_price["FuelId"]): site_price["Price"]
+            for site_price in site_prices
+            if site_price["Price"] != UNAVAILABLE_PRICE
+        }
+        changed = [key for key in prices.keys() | self.__prices.keys() if prices.get(key) != self.__prices.get(key)]
+        self.__prices = prices
+
+        stale = set()
+        for site_id, fuel_id in changed:
+            stale.add((site_id, fuel_id))
+            stale.update((rival, fuel_id) for rival in self.__competitor_of.get(site_id, ()))
+        for site_id, fuel_id in stale:
+            self.__update_differential(site_id, fuel_id)
+        return len(changed)
+
+    def apply_snapshot(self, snapshot: Snapshot) -> None:
+        """Brings the graph up to date with a snapshot, rebuilding it if the
+        fuel stations changed and updating the prices that changed. Can be
+        registered with :meth:`SnapshotStore.add_listener`.
+
+        :param snapshot: The snapshot.
+        :type snapshot: Snapshot
+        """
+        previous = self.__versions
+        self.__versions = (snapshot.reference_version, snapshot.price_version)
+        if previous is None or previous[0] != snapshot.reference_version:
+            self.set_fuel_stations(
+                {"S": site_id, "Lat": fuel_station.Lat, "Lng": fuel_station.Lng}
+                for site_id, fuel_station in snapshot.fuel_stations.items()
+            )
+        if previous is None or previous[1] != snapshot.price_version:
+            self.apply_site_prices(snapshot.site_prices)
+
+    def __update_differential(self, site_id: int, fuel_id: int) -> None:
+        key = (site_id, fuel_id)
+        price = self.__prices.get(key)
+        rivals = [
+            self.__prices[(competitor, fuel_id)]
+            for competitor, _distance in self.__competitors.get(site_id, ())
+            if (competitor, fuel_id) in self.__prices
+        ]
+        differentials = self.__differentials.setdefault(fuel_id, {})
+        if price is None or not rivals:
+            differentials.pop(site_id, None)
+            return
+        local_median = median(rivals)
+        differentials[site_id] = PriceDifferential(
+            site_id, fuel_id, price, local_median, price - local_median, len(rivals)
+        )
+
+    def competitors(self, site_id: int) -> list:
+        """Gets a fuel station's competitors.
+
+        :param site_id: The ID of the fuel station.
+        :type site_id: int
+        :raises KeyError: if the fuel station is not in the graph.
+        :return: (site ID, distance in kilometres) tuples, closest first.
+        :rtype: list
+        """
+        return list(self.__competitors[site_id])
+
+    def differential(self, site_id: int, fuel_id: int) -> PriceDifferential | None:
+        """Gets how a fuel station's price for a fuel compares to its
+        competitors'.
+
+        :param site_id: The ID of the fuel station.
+        :type site_id: int
+        :param fuel_id: The ID of the fuel.
+        :type fuel_id: int
+        :return: A PriceDifferential object, or None if the fuel station or
+                none of its competitors sell the fuel.
+        :rtype: PriceDifferential
+        """
+        return self.__differentials.get(fuel_id, {}).get(site_id)
+
+    def differentials(self, fuel_id: int | None = None) -> list:
+        """Gets the differentials of every fuel station.
+
+        :param fuel_id: Only include this fuel, defaults to every fuel.
+        :type fuel_id: int, optional
+        :return: PriceDifferential objects.
+        :rtype: list
+        """
+        if fuel_id is not None:
+            return list(self.__differentials.get(fuel_id, {}).values())
+        return [
+            differential for differentials in self.__differentials.values() for differential in differentials.values()
+        ]
+
+    def priced_above(self, fuel_id: int, margin: float, min_competitors: int = 1) -> list:
+        """Gets the fuel stations priced more than a margin above the median
+        of their competitors.
+
+        :param fuel_id: The ID of the fuel.
+        :type fuel_id: int
+        :param margin: The margin, in tenths of a cent per litre.
+        :type margin: float
+        :param min_competitors: Only include fuel stations with at least this
+                many competitors selling the fuel, defaults to 1.
+        :type min_competitors: int
+        :return: PriceDifferential objects, furthest above first.
+        :rtype: list
+        """
+        return sorted(
+            (
+                differential
+                for differential in self.differentials(fuel_id)
+                if differential.difference > margin and differential.competitors >= min_competitors
+            ),
+            key=lambda differential: -differential.difference,
+        )
+
+    def priced_below(self, fuel_id: int, margin: float, min_competitors: int = 1) -> list:
+        """Gets the fuel stations priced more than a margin below the median
+        of their competitors.
+
+        :param fuel_id: The ID of the fuel.
+        :type fuel_id: int
+        :param margin: The margin, in tenths of a cent per litre.
+        :type margin: float
+        :param min_competitors: Only include fuel stations with at least this
+                many competitors selling the fuel, defaults to 1.
+        :type min_competitors: int
+        :return: PriceDifferential objects, furthest below first.
+        :rtype: list
+        """
+        return sorted(
+            (
+                differential
+                for differential in self.differentials(fuel_id)
+                if differential.difference < -margin and differential.competitors >= min_competitors
+            ),
+            key=lambda differential: differential.difference,
+        )
@@ -0,0 +1,397 @@
+"""Streaming export of fuel stations and prices to CSV, NDJSON or Parquet.
+
+Records are taken straight from the decoded SAFPIS REST API payloads and
+written in fixed-size chunks, without building a FuelStation or
+FuelStationPrice object for each one.
+"""
+
+from __future__ import annotations
+
+import csv
+import hashlib
+import json
+from itertools import islice
+from os import path, replace
+from typing import IO, Iterable, Iterator
+
+from safpis.models import as_site_id
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover
+    pa = None
+    pq = None
+
+STATION_FIELDS = (
+    "S",
+    "A",
+    "N",
+    "B",
+    "P",
+    "G1",
+    "G2",
+    "G3",
+    "G4",
+    "G5",
+    "Lat",
+    "Lng",
+    "M",
+    "GPI",
+    "MO",
+    "MC",
+    "TO",
+    "TC",
+    "WO",
+    "WC",
+    "THO",
+    "THC",
+    "FO",
+    "FC",
+    "SO",
+    "SC",
+    "SUO",
+    "SUC",
+)
+PRICE_FIELDS = ("SiteId", "FuelId", "CollectionMethod", "TransactionDateUtc", "Price")
+JOINED_FIELDS = PRICE_FIELDS + STATION_FIELDS[1:]
+
+# Set on the records of changed-only exports: True for a tombstone of a record
+# that was removed, which has only its key fields.
+REMOVED_FIELD = "Removed"
+
+# The Parquet column type of each field that isn't a string.
+PARQUET_TYPES = {
+    "S": "int64",
+    "B": "int64",
+    "G1": "int64",
+    "G2": "int64",
+    "G3": "int64",
+    "G4": "int64",
+    "G5": "int64",
+    "Lat": "float64",
+    "Lng": "float64",
+    "SiteId": "int64",
+    "FuelId": "int64",
+    "Price": "float64",
+    REMOVED_FIELD: "bool_",
+}
+
+DATASETS = ("stations", "prices", "joined")
+FORMATS = ("csv", "ndjson", "parquet")
+
+DEFAULT_CHUNK_SIZE = 1000
+
+
+def dataset_fields(dataset: str):
+    """Gets the fields, in output order, of an export dataset.
+
+    :param dataset: One of "stations", "prices" or "joined".
+    :type dataset: str
+    :raises ValueError: if :param dataset: is not recognised.
+    :return: The field names.
+    :rtype: tuple
+    """
+    fields = {"stations": STATION_FIELDS, "prices": PRICE_FIELDS, "joined": JOINED_FIELDS}
+    if dataset not in fields:
+        msg = f"dataset must be one of {DATASETS!r}."
+        raise ValueError(msg)
+    return fields[dataset]
+
+
+def record_key(dataset: str, record: dict) -> str:
+    """Gets the key identifying a record of an export dataset, the site ID
+    for fuel stations and the site and fuel IDs for prices.
+
+    :param dataset: One of "stations", "prices" or "joined".
+    :type dataset: str
+    :param record: The record.
+    :type record: dict
+    :return: The record's key.
+    :rtype: str
+    """
+    if dataset == "stations":
+        return str(record["S"])
+    return f"{record['SiteId']}:{record['FuelId']}"
+
+
+def key_record(dataset: str, key: str) -> dict:
+    """Gets the key fields of a record from its key, the inverse of
+    :func:`record_key`.
+
+    :param dataset: One of "stations", "prices" or "joined".
+    :type dataset: str
+    :param key: The record's key.
+    :type key: str
+    :return: The key fields.
+    :rtype: dict
+    """
+    values = [int(value) if value.isdigit() else value for value in key.split(":")]
+    if dataset == "stations":
+        return {"S": values[0]}
+    return {"SiteId": values[0], "FuelId": values[1]}
+
+
+def iter_stations(fuel_stations: Iterable[dict]) -> Iterator[dict]:
+    """Yields export records for fuel stations.
+
+    :param fuel_stations: The "S" list of a GetFullSiteDetails response.
+    :type fuel_stations: Iterable[dict]
+    """
+    for fuel_station in fuel_stations:
+        yield {name: fuel_station.get(name) for name in STATION_FIELDS}
+
+
+def iter_prices(site_prices: Iterable[dict]) -> Iterator[dict]:
+    """Yields export records for fuel station prices.
+
+    :param site_prices: The "SitePrices" list of a GetSitesPrices response.
+    :type site_prices: Iterable[dict]
+    """
+    for site_price in site_prices:
+        yield {name: site_price.get(name) for name in PRICE_FIELDS}
+
+
+def iter_joined(fuel_stations: Iterable[dict], site_prices: Iterable[dict]) -> Iterator[dict]:
+    """Yields export records for fuel station prices joined to the details of
+    the fuel station. Station fields are empty for unknown fuel stations.
+
+    :param fuel_stations: The "S" list of a GetFullSiteDetails response.
+    :type fuel_stations: Iterable[dict]
+    :param site_prices: The "SitePrices" list of a GetSitesPrices response.
+    :type site_prices: Iterable[dict]
+    """
+    stations_by_id = {as_site_id(fuel_station["S"]): fuel_station for fuel_station in fuel_stations}
+    for site_price in site_prices:
+        fuel_station = stations_by_id.get(site_price.get("SiteId"), {})
+        record = {name: site_price.get(name) for name in PRICE_FIELDS}
+        record.update({name: fuel_station.get(name) for name in STATION_FIELDS[1:]})
+        yield record
+
+
+def dataset_records(api, dataset: str) -> Iterator[dict]:
+    """Yields the export records of a dataset fetched from the SAFPIS REST
+    API.
+
+    :param api: The API to fetch the payloads from.
+    :type api: SafpisAPI
+    :param dataset: One of "stations", "prices" or "joined".
+    :type dataset: str
+    :raises ValueError: if :param dataset: is not recognised.
+    """
+    dataset_fields(dataset)
+    if dataset == "stations":
+        return iter_stations(api.GetFullSiteDetails()["S"])
+    if dataset == "prices":
+        return iter_prices(api.GetSitesPrices()["SitePrices"])
+    return iter_joined(api.GetFullSiteDetails()["S"], api.GetSitesPrices()["SitePrices"])
+
+
+def chunked(records: Iterable[dict], chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[list]:
+    """Yields lists of at most :param chunk_size: records.
+
+    :param records: The records to split into chunks.
+    :type records: Iterable[dict]
+    :param chunk_size: The maximum number of records per chunk, defaults to
+            1000.
+    :type chunk_size: int
+    """
+    if chunk_size < 1:
+        msg = "chunk_size must be at least 1."
+        raise ValueError(msg)
+    records = iter(records)
+    while True:
+        chunk = list(islice(records, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class ExportState:
+    """Remembers a digest of every record exported, so later exports can be
+    restricted to the records that changed, and the records that were removed
+    reported as tombstones. The state is kept in a JSON file.
+
+    :param state_file: Path of the JSON file holding the state.
+    :type state_file: str
+    """
+
+    def __init__(self, state_file: str) -> None:
+        self.state_file = state_file
+        self.digests: dict = {}
+        if path.exists(state_file):
+            with open(state_file) as fh:
+                self.digests = json.load(fh)
+
+    @staticmethod
+    def digest(record: dict) -> str:
+        """Gets a digest of a record's values.
+
+        :param record: The record.
+        :type record: dict
+        :return: A hex digest.
+        :rtype: str
+        """
+        encoded = json.dumps(record, sort_keys=True, default=str).encode()
+        return hashlib.blake2b(encoded, digest_size=16).hexdigest()
+
+    def changed(self, dataset: str, records: Iterable[dict]) -> Iterator[dict]:
+        """Yields only the records that are new or have changed since they
+        were last seen, remembering them as seen, with :data:`REMOVED_FIELD`
+        False. Then yields a tombstone for each record seen before that is
+        no longer in :param records:, with only its key fields and
+        :data:`REMOVED_FIELD` True.
+
+        :param dataset: One of "stations", "prices" or "joined".
+        :type dataset: str
+        :param records: Every record of the dataset.
+        :type records: Iterable[dict]
+        """
+        digests = self.digests.setdefault(dataset, {})
+        seen = set()
+        for record in records:
+            key = record_key(dataset, record)
+            seen.add(key)
+            digest = self.digest(record)
+            if digests.get(key) != digest:
+                digests[key] = digest
+                yield {**record, REMOVED_FIELD: False}
+        for key in [key for key in digests if key not in seen]:
+            del digests[key]
+            yield {**key_record(dataset, key), REMOVED_FIELD: True}
+
+    def save(self) -> None:
+        """Atomically writes the state to its JSON file."""
+        temporary_file = f"{self.state_file}.tmp"
+        with open(temporary_file, "w") as fh:
+            json.dump(self.digests, fh)
+        replace(temporary_file, self.state_file)
+
+
+def write_csv(
+    records: Iterable[dict],
+    fh: IO[str],
+    fields: Iterable[str],
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> int:
+    """Writes records to a text file as CSV with a header row.
+
+    :return: The number of records written.
+    :rtype: int
+    """
+    writer = csv.DictWriter(fh, fieldnames=list(fields), extrasaction="ignore")
+    writer.writeheader()
+    count = 0
+    for chunk in chunked(records, chunk_size):
+        writer.writerows(chunk)
+        count += len(chunk)
+    return count
+
+
+def write_ndjson(
+    records: Iterable[dict],
+    fh: IO[str],
+    fields: Iterable[str],
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> int:
+    """Writes records to a text file as newline-delimited JSON.
+
+    :return: The number of records written.
+    :rtype: int
+    """
+    fields = list(fields)
+    count = 0
+    for chunk in chunked(records, chunk_size):
+        fh.write(
+            "".join(json.dumps({name: record.get(name) for name in fields}, default=str) + "\n" for record in chunk),
+        )
+        count += len(chunk)
+    return count
+
+
+def write_parquet(
+    records: Iterable[dict],
+    where: str | IO[bytes],
+    fields: Iterable[str],
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> int:
+    """Writes records to a Parquet file, one row group per chunk. Requires
+    pyarrow.
+
+    :raises ImportError: if pyarrow is not installed.
+    :return: The number of records written.
+    :rtype: int
+    """
+    if pq is None:
+        msg = "pyarrow is required for Parquet export; install it with: pip install safpis[parquet]"
+        raise ImportError(msg)
+    fields = list(fields)
+    schema = parquet_schema(fields)
+    count = 0
+    with pq.ParquetWriter(where, schema) as writer:
+        for chunk in chunked(records, chunk_size):
+            columns = {name: _parquet_values(name, [record.get(name) for record in chunk]) for name in fields}
+            writer.write_table(pa.table(columns, schema=schema))
+            count += len(chunk)
+    return count
+
+
+def _parquet_values(name: str, values: list) -> list:
+    """Coerces the values of a numeric column to its Parquet type, e.g. the
+    "S" site ID strings of GetFullSiteDetails to ints.
+    """
+    convert = {"int64": int, "float64": float}.get(PARQUET_TYPES.get(name))
+    if convert is None:
+        return values
+    return [None if value is None else convert(value) for value in values]
+
+
+def parquet_schema(fields: Iterable[str]):
+    """Gets the Arrow schema of a Parquet export, typed from the fields
+    rather than the values so that a column which is empty in one chunk
+    still matches the others. Requires pyarrow.
+
+    :param fields: The fields to write, in order.
+    :type fields: Iterable[str]
+    :return: The schema.
+    :rtype: pyarrow.Schema
+    """
+    return pa.schema([(name, getattr(pa, PARQUET_TYPES.get(name, "string"))()) for name in fields])
+
+
+def export(
+    records: Iterable[dict],
+    fmt: str,
+    where: str | IO,
+    fields: Iterable[str],
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> int:
+    """Writes records in CSV, NDJSON or Parquet format.
+
+    :param records: The records to write.
+    :type records: Iterable[dict]
+    :param fmt: One of "csv", "ndjson" or "parquet".
+    :type fmt: str
+    :param where: A path, or an open file (binary for Parquet, text
+            otherwise).
+    :type where: str | IO
+    :param fields: The fields to write, in order.
+    :type fields: Iterable[str]
+    :param chunk_size: The number of records to write at a time, defaults to
+            1000.
+    :type chunk_size: int
+    :raises ValueError: if :param fmt: is not recognised.
+    :return: The number of records written.
+    :rtype: int
+    """
+    if fmt not in FORMATS:
+        msg = f"fmt must be one of {FORMATS!r}."
+        raise ValueError(msg)
+    if fmt == "parquet":
+        return write_parquet(records, where, fields, chunk_size)
+
+    writer = write_csv if fmt == "csv" else write_ndjson
+    if isinstance(where, str):
+        with open(where, "w", newline="") as fh:
+            return writer(records, fh, fields, chunk_size)
+    return writer(records, where, fields, chunk_size)
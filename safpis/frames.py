@@ -0,0 +1,201 @@
+"""Columnar Arrow tables and pandas DataFrames of fuel stations and prices.
+
+Tables are built a column at a time straight from the decoded SAFPIS REST
+API payloads, without a FuelStation or FuelStationPrice object per record:
+
+- brand, fuel and collection method columns are dictionary encoded
+  (categorical in pandas);
+- prices are integers in tenths of a cent per litre, null when the fuel is
+  unavailable;
+- TransactionDateUtc is a UTC timestamp and M an Australia/Adelaide
+  timestamp;
+- opening hours are times of day, null when the fuel station is closed.
+
+Requires pyarrow, and pandas for the DataFrames.
+"""
+
+from __future__ import annotations
+
+from typing import Iterable
+
+import pytz
+
+from safpis.export import STATION_FIELDS
+from safpis.models import parse_timestamp
+from safpis.tables import MISSING, STATION_HOURS_COLUMNS, UNAVAILABLE_PRICE, as_seconds
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:  # pragma: no cover
+    pa = None
+    pc = None
+
+try:
+    import pandas as pd
+except ImportError:  # pragma: no cover
+    pd = None
+
+STATION_TIMEZONE = "Australia/Adelaide"
+
+_INT_FIELDS = ("G1", "G2", "G3", "G4", "G5")
+
+
+def _require_arrow() -> None:
+    if pa is None:
+        msg = "pyarrow is required for Arrow tables; install it with: pip install safpis[pandas]"
+        raise ImportError(msg)
+
+
+def _timestamps(values: list, timezone: str):
+    """Converts ISO 8601 strings to an Arrow timestamp array, treating them
+    as local times in :param timezone: unless they have a UTC offset.
+    """
+    try:
+        naive = pa.array(values, type=pa.string()).cast(pa.timestamp("us"))
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # Not every value is a naive ISO 8601 time, so parse them one at a
+        # time, converting those with a UTC offset to local times.
+        local = pytz.timezone(timezone)
+        parsed = []
+        for value in values:
+            try:
+                date_time = parse_timestamp(value)
+            except (TypeError, ValueError, OverflowError):
+                parsed.append(None)
+                continue
+            if date_time.tzinfo is not None:
+                date_time = date_time.astimezone(local)
+            parsed.append(date_time.replace(tzinfo=None))
+        naive = pa.array(parsed, type=pa.timestamp("us"))
+    if timezone == "UTC":
+        return naive.cast(pa.timestamp("us", tz="UTC"))
+    return pc.assume_timezone(naive, timezone, ambiguous="earliest", nonexistent="earliest")
+
+
+def _categories(codes: list, names: dict | None):
+    """Dictionary encodes IDs, as their names when :param names: is given."""
+    if names is None:
+        return pa.array(codes, type=pa.int64()).dictionary_encode()
+    return pa.array([names.get(code) for code in codes], type=pa.string()).dictionary_encode()
+
+
+def stations_to_arrow(fuel_stations: Iterable[dict], brand_names: dict | None = None):
+    """Builds an Arrow table of fuel stations.
+
+    :param fuel_stations: The "S" list of a GetFullSiteDetails response.
+    :type fuel_stations: Iterable[dict]
+    :param brand_names: Brand names keyed by brand ID. When given, a
+            categorical "Brand" column of names is added.
+    :type brand_names: dict, optional
+    :raises ImportError: if pyarrow is not installed.
+    :return: A table with a row per fuel station.
+    :rtype: pyarrow.Table
+    """
+    _require_arrow()
+    fuel_stations = list(fuel_stations)
+    values = {name: [fuel_station.get(name) for fuel_station in fuel_stations] for name in STATION_FIELDS}
+    columns = {
+        # GetFullSiteDetails gives the site ID as a string.
+        "S": pa.array([None if site_id is None else int(site_id) for site_id in values["S"]], type=pa.int64()),
+        "A": pa.array(values["A"], type=pa.string()),
+        "N": pa.array(values["N"], type=pa.string()),
+        "B": _categories(values["B"], None),
+    }
+    if brand_names is not None:
+        columns["Brand"] = _categories(values["B"], brand_names)
+    columns["P"] = pa.array([None if postcode is None else str(postcode) for postcode in values["P"]], pa.string())
+    for name in _INT_FIELDS:
+        columns[name] = pa.array(values[name], type=pa.int64())
+    columns["Lat"] = pa.array(values["Lat"], type=pa.float64())
+    columns["Lng"] = pa.array(values["Lng"], type=pa.float64())
+    columns["M"] = _timestamps(values["M"], STATION_TIMEZONE)
+    columns["GPI"] = pa.array(values["GPI"], type=pa.string())
+    for name in STATION_HOURS_COLUMNS:
+        seconds = [as_seconds(value) for value in values[name]]
+        columns[name] = pa.array([None if second == MISSING else second for second in seconds], type=pa.int32()).cast(
+            pa.time32("s")
+        )
+    return pa.table(columns)
+
+
+def prices_to_arrow(site_prices: Iterable[dict], fuel_names: dict | None = None):
+    """Builds an Arrow table of fuel station prices.
+
+    :param site_prices: The "SitePrices" list of a GetSitesPrices response.
+    :type site_prices: Iterable[dict]
+    :param fuel_names: Fuel names keyed by fuel ID. When given, a
+            categorical "Fuel" column of names is added.
+    :type fuel_names: dict, optional
+    :raises ImportError: if pyarrow is not installed.
+    :return: A table with a row per price.
+    :rtype: pyarrow.Table
+    """
+    _require_arrow()
+    site_prices = list(site_prices)
+    fuel_ids = [site_price.get("FuelId") for site_price in site_prices]
+    prices = [site_price.get("Price") for site_price in site_prices]
+    columns = {
+        "SiteId": pa.array([site_price.get("SiteId") for site_price in site_prices], type=pa.int64()),
+        "FuelId": _categories(fuel_ids, None),
+    }
+    if fuel_names is not None:
+        columns["Fuel"] = _categories(fuel_ids, fuel_names)
+    columns["CollectionMethod"] = pa.array(
+        [site_price.get("CollectionMethod") for site_price in site_prices], type=pa.string()
+    ).dictionary_encode()
+    columns["TransactionDateUtc"] = _timestamps(
+        [site_price.get("TransactionDateUtc") for site_price in site_prices], "UTC"
+    )
+    columns["Price"] = pa.array(
+        [None if price is None or price == UNAVAILABLE_PRICE else round(price) for price in prices], type=pa.int32()
+    )
+    return pa.table(columns)
+
+
+def joined_to_arrow(
+    fuel_stations: Iterable[dict],
+    site_prices: Iterable[dict],
+    brand_names: dict | None = None,
+    fuel_names: dict | None = None,
+):
+    """Builds an Arrow table of fuel station prices joined to the details of
+    the fuel station. Station columns are null for unknown fuel stations.
+
+    :param fuel_stations: The "S" list of a GetFullSiteDetails response.
+    :type fuel_stations: Iterable[dict]
+    :param site_prices: The "SitePrices" list of a GetSitesPrices response.
+    :type site_prices: Iterable[dict]
+    :param brand_names: Brand names keyed by brand ID, defaults to none.
+    :type brand_names: dict, optional
+    :param fuel_names: Fuel names keyed by fuel ID, defaults to none.
+    :type fuel_names: dict, optional
+    :raises ImportError: if pyarrow is not installed.
+    :return: A table with a row per price.
+    :rtype: pyarrow.Table
+    """
+    stations = stations_to_arrow(fuel_stations, brand_names)
+    prices = prices_to_arrow(site_prices, fuel_names)
+    row_by_id = {site_id: row for row, site_id in enumerate(stations.column("S").to_pylist())}
+    rows = pa.array([row_by_id.get(site_id) for site_id in prices.column("SiteId").to_pylist()], type=pa.int64())
+    joined = stations.drop_columns(["S"]).take(rows)
+    for position, name in enumerate(joined.column_names):
+        prices = prices.append_column(joined.schema.field(position), joined.column(name))
+    return prices
+
+
+def to_pandas(table):
+    """Converts an Arrow table to a pandas DataFrame. Dictionary columns
+    become categoricals and integer columns with nulls nullable integers.
+
+    :param table: The table.
+    :type table: pyarrow.Table
+    :raises ImportError: if pandas is not installed.
+    :return: A DataFrame.
+    :rtype: pandas.DataFrame
+    """
+    if pd is None:
+        msg = "pandas is required for DataFrames; install it with: pip install safpis[pandas]"
+        raise ImportError(msg)
+    nullable = {pa.int32(): pd.Int32Dtype(), pa.int64(): pd.Int64Dtype()}
+    return table.to_pandas(types_mapper=nullable.get)
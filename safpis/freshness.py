@@ -0,0 +1,173 @@
+"""An index of price records ordered by when each price was last updated.
+
+Questions such as "which prices changed in the last ten minutes" or "which
+prices have not been updated for a week" are answered by bisecting the
+update times, so they cost time in proportion to the number of prices
+returned rather than the number of prices in the snapshot.
+"""
+
+from __future__ import annotations
+
+import math
+import time
+from bisect import bisect_left, bisect_right
+from typing import Iterable, Sequence
+
+from safpis.models import epoch_seconds
+
+
+def _as_key(timestamp: float) -> float:
+    # Prices without a parseable update time sort before every other price.
+    return -math.inf if math.isnan(timestamp) else timestamp
+
+
+class FreshnessIndex:
+    """The "SitePrices" records of a GetSitesPrices response, ordered by
+    their TransactionDateUtc. There is one record per fuel station and fuel:
+    where a payload repeats one, its last record is kept.
+
+    Times are in seconds since the epoch.
+
+    :param site_prices: The "SitePrices" records, defaults to none.
+    :type site_prices: Iterable[dict]
+    :param timestamps: The TransactionDateUtc of each record in seconds since
+            the epoch, e.g. the column of a PriceTable, defaults to parsing
+            them from the records.
+    :type timestamps: Sequence[float], optional
+    """
+
+    def __init__(self, site_prices: Iterable[dict] = (), timestamps: Sequence[float] | None = None) -> None:
+        site_prices = list(site_prices)
+        if timestamps is None:
+            timestamps = [epoch_seconds(site_price.get("TransactionDateUtc")) for site_price in site_prices]
+        # The position of the last record of each fuel station and fuel, so
+        # update() finds exactly one record to replace.
+        positions = {
+            (site_price["SiteId"], site_price["FuelId"]): position for position, site_price in enumerate(site_prices)
+        }
+        keys = [_as_key(float(timestamp)) for timestamp in timestamps]
+        order = sorted(positions.values(), key=keys.__getitem__)
+        self.__times = [keys[position] for position in order]
+        self.__records = [site_prices[position] for position in order]
+        self.__updated = {pair: keys[position] for pair, position in positions.items()}
+
+    def __len__(self) -> int:
+        return len(self.__records)
+
+    def update(self, site_price: dict, timestamp: float | None = None) -> None:
+        """Adds a price record, replacing the previous record of its fuel
+        station and fuel.
+
+        :param site_price: The "SitePrices" record.
+        :type site_price: dict
+        :param timestamp: Its TransactionDateUtc in seconds since the epoch,
+                defaults to parsing it from the record.
+        :type timestamp: float, optional
+        """
+        key = (site_price["SiteId"], site_price["FuelId"])
+        previous = self.__updated.get(key)
+        if previous is not None:
+            position = bisect_left(self.__times, previous)
+            while (self.__records[position]["SiteId"], self.__records[position]["FuelId"]) != key:
+                position += 1
+            del self.__times[position]
+            del self.__records[position]
+        if timestamp is None:
+            timestamp = epoch_seconds(site_price.get("TransactionDateUtc"))
+        updated = self.__updated[key] = _as_key(timestamp)
+        position = bisect_right(self.__times, updated)
+        self.__times.insert(position, updated)
+        self.__records.insert(position, site_price)
+
+    def updated_between(self, start: float, end: float) -> list:
+        """Gets the prices last updated at or after :param start: and
+        before :param end:.
+
+        :return: A list of "SitePrices" records, least recently updated first.
+        :rtype: list
+        """
+        return self.__records[bisect_left(self.__times, start) : bisect_left(self.__times, end)]
+
+    def updated_since(self, since: float) -> list:
+        """Gets the prices last updated at or after a time.
+
+        :param since: The time.
+        :type since: float
+        :return: A list of "SitePrices" records, least recently updated first.
+        :rtype: list
+        """
+        return self.__records[bisect_left(self.__times, since) :]
+
+    def updated_before(self, before: float) -> list:
+        """Gets the prices last updated before a time, including any without
+        an update time.
+
+        :param before: The time.
+        :type before: float
+        :return: A list of "SitePrices" records, least recently updated first.
+        :rtype: list
+        """
+        return self.__records[: bisect_left(self.__times, before)]
+
+    def updated_within(self, seconds: float, now: float | None = None) -> list:
+        """Gets the prices updated in the last :param seconds:.
+
+        :param seconds: How far back to look.
+        :type seconds: float
+        :param now: The current time, defaults to now.
+        :type now: float, optional
+        :return: A list of "SitePrices" records, least recently updated first.
+        :rtype: list
+        """
+        return self.updated_since((time.time() if now is None else now) - seconds)
+
+    def older_than(self, seconds: float, now: float | None = None) -> list:
+        """Gets the prices not updated for more than :param seconds:.
+
+        :param seconds: The age.
+        :type seconds: float
+        :param now: The current time, defaults to now.
+        :type now: float, optional
+        :return: A list of "SitePrices" records, least recently updated first.
+        :rtype: list
+        """
+        return self.updated_before((time.time() if now is None else now) - seconds)
+
+    def stale_sites(self, seconds: float, now: float | None = None) -> set:
+        """Gets the fuel stations none of whose prices have been updated for
+        more than :param seconds:.
+
+        :param seconds: The age.
+        :type seconds: float
+        :param now: The current time, defaults to now.
+        :type now: float, optional
+        :return: A set of fuel station IDs.
+        :rtype: set
+        """
+        cutoff = (time.time() if now is None else now) - seconds
+        recent = {site_price["SiteId"] for site_price in self.updated_since(cutoff)}
+        return {site_price["SiteId"] for site_price in self.updated_before(cutoff)} - recent
+
+    def newest(self, n: int) -> list:
+        """Gets the most recently updated prices.
+
+        :param n: The number of prices.
+        :type n: int
+        :return: A list of up to :param n: "SitePrices" records, most recently
+                updated first.
+        :rtype: list
+        """
+        return self.__records[-n:][::-1] if n > 0 else []
+
+    def updated_at(self, site_id: int, fuel_id: int) -> float | None:
+        """Gets when a price was last updated.
+
+        :param site_id: The ID of the fuel station.
+        :type site_id: int
+        :param fuel_id: The ID of the fuel.
+        :type fuel_id: int
+        :return: The time, -inf if it is unknown, or None if there is no such
+                price.
+        :rtype: float
+        """
+        return self.__updated.get((site_id, fuel_id))
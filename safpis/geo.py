@@ -0,0 +1,407 @@
+"""Geographic helpers for bucketing fuel stations into a latitude/longitude
+grid and measuring great-circle distances.
+"""
+
+from __future__ import annotations
+
+import heapq
+import math
+from typing import Iterator, Sequence
+
+from geopy.distance import geodesic
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+# Mean radius of the Earth, as used by geopy's great_circle.
+EARTH_RADIUS_KM = 6371.009
+
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+# WGS-84 ellipsoid, as used by geopy's geodesic.
+WGS84_SEMI_MAJOR_AXIS_KM = 6378.137
+WGS84_FLATTENING = 1 / 298.257223563
+
+DEFAULT_CELL_SIZE = 0.05  # degrees, roughly 5.5km of latitude
+
+# The latitudes beyond which the Web Mercator projection of map tiles is cut off.
+MAX_TILE_LATITUDE = 85.0511287798
+
+# Accuracy modes for bulk distances: a spherical great-circle distance
+# (within about 0.5% of geodesic), Lambert's ellipsoidal approximation
+# (within metres over the distances found in a state) or geopy's exact,
+# but slow, geodesic.
+DISTANCE_MODES = ("haversine", "ellipsoidal", "geodesic")
+
+
+def haversine_km(latitude1: float, longitude1: float, latitude2: float, longitude2: float) -> float:
+    """Gets the great-circle distance between two points.
+
+    :return: The distance in kilometres.
+    :rtype: float
+    """
+    phi1 = math.radians(latitude1)
+    phi2 = math.radians(latitude2)
+    half_dphi = (phi2 - phi1) / 2
+    half_dlambda = math.radians(longitude2 - longitude1) / 2
+    a = math.sin(half_dphi) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(half_dlambda) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def lambert_km(latitude1: float, longitude1: float, latitude2: float, longitude2: float) -> float:
+    """Gets the distance between two points on the WGS-84 ellipsoid using
+    Lambert's formula for long lines.
+
+    :return: The distance in kilometres.
+    :rtype: float
+    """
+    beta1 = math.atan((1 - WGS84_FLATTENING) * math.tan(math.radians(latitude1)))
+    beta2 = math.atan((1 - WGS84_FLATTENING) * math.tan(math.radians(latitude2)))
+    half_dbeta = (beta2 - beta1) / 2
+    half_dlambda = math.radians(longitude2 - longitude1) / 2
+    a = math.sin(half_dbeta) ** 2 + math.cos(beta1) * math.cos(beta2) * math.sin(half_dlambda) ** 2
+    sigma = 2 * math.asin(min(1.0, math.sqrt(a)))
+    if sigma == 0:
+        return 0.0
+    p = (beta1 + beta2) / 2
+    q = half_dbeta
+    x = (sigma - math.sin(sigma)) * math.sin(p) ** 2 * math.cos(q) ** 2 / math.cos(sigma / 2) ** 2
+    y = (sigma + math.sin(sigma)) * math.cos(p) ** 2 * math.sin(q) ** 2 / math.sin(sigma / 2) ** 2
+    return WGS84_SEMI_MAJOR_AXIS_KM * (sigma - WGS84_FLATTENING / 2 * (x + y))
+
+
+def _numpy_haversine_km(latitudes1, longitudes1, latitudes2, longitudes2):
+    phi1 = np.radians(latitudes1)
+    phi2 = np.radians(latitudes2)
+    half_dphi = (phi2 - phi1) / 2
+    half_dlambda = np.radians(longitudes2 - longitudes1) / 2
+    a = np.sin(half_dphi) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(half_dlambda) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(1.0, np.sqrt(a)))
+
+
+def _numpy_lambert_km(latitudes1, longitudes1, latitudes2, longitudes2):
+    beta1 = np.arctan((1 - WGS84_FLATTENING) * np.tan(np.radians(latitudes1)))
+    beta2 = np.arctan((1 - WGS84_FLATTENING) * np.tan(np.radians(latitudes2)))
+    half_dbeta = (beta2 - beta1) / 2
+    half_dlambda = np.radians(longitudes2 - longitudes1) / 2
+    a = np.sin(half_dbeta) ** 2 + np.cos(beta1) * np.cos(beta2) * np.sin(half_dlambda) ** 2
+    sigma = 2 * np.arcsin(np.minimum(1.0, np.sqrt(a)))
+    p = (beta1 + beta2) / 2
+    q = half_dbeta
+    # Coincident points have sigma == 0; give them a harmless denominator.
+    coincident = sigma == 0
+    sin_half_sigma_squared = np.where(coincident, 1.0, np.sin(sigma / 2) ** 2)
+    x = (sigma - np.sin(sigma)) * np.sin(p) ** 2 * np.cos(q) ** 2 / np.cos(sigma / 2) ** 2
+    y = (sigma + np.sin(sigma)) * np.cos(p) ** 2 * np.sin(q) ** 2 / sin_half_sigma_squared
+    distance = WGS84_SEMI_MAJOR_AXIS_KM * (sigma - WGS84_FLATTENING / 2 * (x + y))
+    return np.where(coincident, 0.0, distance)
+
+
+def _check_mode(mode: str) -> None:
+    if mode not in DISTANCE_MODES:
+        msg = f"mode must be one of {DISTANCE_MODES!r}."
+        raise ValueError(msg)
+
+
+def distance_matrix(
+    origins: Sequence[tuple],
+    latitudes: Sequence[float],
+    longitudes: Sequence[float],
+    mode: str = "ellipsoidal",
+):
+    """Gets the distance from each origin to each destination.
+
+    With NumPy installed, the "haversine" and "ellipsoidal" modes are
+    computed for all pairs at once.
+
+    :param origins: The origins, as (latitude, longitude) tuples.
+    :type origins: Sequence[tuple]
+    :param latitudes: The latitudes of the destinations.
+    :type latitudes: Sequence[float]
+    :param longitudes: The longitudes of the destinations.
+    :type longitudes: Sequence[float]
+    :param mode: One of "haversine", "ellipsoidal" or "geodesic", defaults to
+            "ellipsoidal".
+    :type mode: str
+    :raises ValueError: if :param mode: is not recognised.
+    :return: The distances in kilometres, one row per origin and one column
+            per destination, as a NumPy array when NumPy is installed and a
+            list of lists otherwise.
+    """
+    _check_mode(mode)
+    if mode == "geodesic":
+        matrix = [
+            [geodesic(origin, (latitude, longitude)).km for latitude, longitude in zip(latitudes, longitudes)]
+            for origin in origins
+        ]
+        return np.asarray(matrix, dtype="float64").reshape(len(origins), len(latitudes)) if np is not None else matrix
+
+    if np is None:
+        distance = haversine_km if mode == "haversine" else lambert_km
+        return [
+            [distance(*origin, latitude, longitude) for latitude, longitude in zip(latitudes, longitudes)]
+            for origin in origins
+        ]
+
+    origins = np.asarray(origins, dtype="float64").reshape(-1, 2)
+    latitudes = np.asarray(latitudes, dtype="float64")[np.newaxis, :]
+    longitudes = np.asarray(longitudes, dtype="float64")[np.newaxis, :]
+    distance = _numpy_haversine_km if mode == "haversine" else _numpy_lambert_km
+    return distance(origins[:, :1], origins[:, 1:], latitudes, longitudes)
+
+
+def nearest(
+    origins: Sequence[tuple],
+    latitudes: Sequence[float],
+    longitudes: Sequence[float],
+    k: int,
+    mode: str = "ellipsoidal",
+) -> list:
+    """Gets the k nearest destinations to each origin.
+
+    :param origins: The origins, as (latitude, longitude) tuples.
+    :type origins: Sequence[tuple]
+    :param latitudes: The latitudes of the destinations.
+    :type latitudes: Sequence[float]
+    :param longitudes: The longitudes of the destinations.
+    :type longitudes: Sequence[float]
+    :param k: The number of destinations to return for each origin.
+    :type k: int
+    :param mode: One of "haversine", "ellipsoidal" or "geodesic", defaults to
+            "ellipsoidal".
+    :type mode: str
+    :return: For each origin, a list of (destination position, distance in
+            kilometres) tuples, closest first.
+    :rtype: list
+    """
+    matrix = distance_matrix(origins, latitudes, longitudes, mode)
+    if np is None:
+        return [heapq.nsmallest(k, enumerate(row), key=lambda pair: pair[1]) for row in matrix]
+
+    k = min(k, matrix.shape[1])
+    if k <= 0:
+        return [[] for _origin in range(matrix.shape[0])]
+    closest = np.argpartition(matrix, k - 1, axis=1)[:, :k]
+    closest_distances = np.take_along_axis(matrix, closest, axis=1)
+    order = np.argsort(closest_distances, axis=1, kind="stable")
+    closest = np.take_along_axis(closest, order, axis=1)
+    closest_distances = np.take_along_axis(closest_distances, order, axis=1)
+    return [
+        list(zip(positions, distances)) for positions, distances in zip(closest.tolist(), closest_distances.tolist())
+    ]
+
+
+def grid_cell(latitude: float, longitude: float, cell_size: float = DEFAULT_CELL_SIZE) -> tuple:
+    """Gets the grid cell containing a point.
+
+    :param cell_size: The size of the grid cells in degrees, defaults to
+            0.05.
+    :type cell_size: float
+    :return: The cell's (row, column).
+    :rtype: tuple
+    """
+    return (math.floor(latitude / cell_size), math.floor(longitude / cell_size))
+
+
+def map_tile(latitude: float, longitude: float, zoom: int) -> tuple:
+    """Gets the Web Mercator ("slippy map") tile containing a point, as used
+    by OpenStreetMap, Leaflet and most other web maps.
+
+    :param zoom: The zoom level, where the world is 2 ** zoom tiles across.
+    :type zoom: int
+    :return: The tile's (x, y).
+    :rtype: tuple
+    """
+    tiles = 1 << zoom
+    phi = math.radians(max(-MAX_TILE_LATITUDE, min(MAX_TILE_LATITUDE, latitude)))
+    x = math.floor((longitude + 180) / 360 * tiles)
+    y = math.floor((1 - math.asinh(math.tan(phi)) / math.pi) / 2 * tiles)
+    return (min(max(x, 0), tiles - 1), min(max(y, 0), tiles - 1))
+
+
+def cells_within(
+    latitude: float,
+    longitude: float,
+    radius_km: float,
+    cell_size: float = DEFAULT_CELL_SIZE,
+) -> Iterator[tuple]:
+    """Yields every grid cell overlapping the bounding box of a circle.
+
+    :param radius_km: The radius of the circle in kilometres.
+    :type radius_km: float
+    :param cell_size: The size of the grid cells in degrees, defaults to
+            0.05.
+    :type cell_size: float
+    """
+    dlatitude = radius_km / KM_PER_DEGREE
+    # Widen the box by the latitude where a degree of longitude is shortest.
+    widest = min(abs(latitude) + dlatitude, 89.9)
+    dlongitude = radius_km / (KM_PER_DEGREE * math.cos(math.radians(widest)))
+    return cells_in_box(
+        latitude - dlatitude,
+        longitude - dlongitude,
+        latitude + dlatitude,
+        longitude + dlongitude,
+        cell_size,
+    )
+
+
+def cells_in_box(
+    latitude_min: float,
+    longitude_min: float,
+    latitude_max: float,
+    longitude_max: float,
+    cell_size: float = DEFAULT_CELL_SIZE,
+) -> Iterator[tuple]:
+    """Yields every grid cell overlapping a latitude/longitude box.
+
+    :param cell_size: The size of the grid cells in degrees, defaults to
+            0.05.
+    :type cell_size: float
+    """
+    row_min, column_min = grid_cell(latitude_min, longitude_min, cell_size)
+    row_max, column_max = grid_cell(latitude_max, longitude_max, cell_size)
+    for row in range(row_min, row_max + 1):
+        for column in range(column_min, column_max + 1):
+            yield (row, column)
+
+
+def point_segment_distance_km(
+    latitude: float,
+    longitude: float,
+    start: tuple,
+    end: tuple,
+) -> tuple:
+    """Gets the distance from a point to the closest point of a line segment,
+    using an equirectangular projection centred on the point. This is
+    accurate for segments up to a few hundred kilometres long.
+
+    :param start: The (latitude, longitude) of the start of the segment.
+    :type start: tuple
+    :param end: The (latitude, longitude) of the end of the segment.
+    :type end: tuple
+    :return: The distance in kilometres and the fraction (0 to 1) of the way
+            along the segment of its closest point.
+    :rtype: tuple
+    """
+    scale = math.cos(math.radians(latitude))
+    x1 = (start[1] - longitude) * scale
+    y1 = start[0] - latitude
+    x2 = (end[1] - longitude) * scale
+    y2 = end[0] - latitude
+    dx = x2 - x1
+    dy = y2 - y1
+    length_squared = dx * dx + dy * dy
+    fraction = 0.0 if length_squared == 0 else min(1.0, max(0.0, -(x1 * dx + y1 * dy) / length_squared))
+    x = x1 + fraction * dx
+    y = y1 + fraction * dy
+    return (math.hypot(x, y) * KM_PER_DEGREE, fraction)
+
+
+class GridIndex:
+    """A spatial index bucketing points into a latitude/longitude grid.
+
+    :param cell_size: The size of the grid cells in degrees, defaults to
+            0.05.
+    :type cell_size: float
+    """
+
+    def __init__(self, cell_size: float = DEFAULT_CELL_SIZE) -> None:
+        self.cell_size = cell_size
+        self.cells: dict = {}
+        self.points: dict = {}
+
+    @classmethod
+    def from_fuel_stations(cls, fuel_stations, cell_size: float = DEFAULT_CELL_SIZE):
+        """Builds a GridIndex of fuel station locations keyed by site ID.
+
+        :param fuel_stations: The "S" list of a GetFullSiteDetails response.
+        :type fuel_stations: Iterable[dict]
+        :param cell_size: The size of the grid cells in degrees, defaults to
+                0.05.
+        :type cell_size: float
+        :return: A GridIndex object.
+        """
+        index = cls(cell_size)
+        for fuel_station in fuel_stations:
+            index.add(fuel_station["S"], fuel_station["Lat"], fuel_station["Lng"])
+        return index
+
+    def __len__(self) -> int:
+        return len(self.points)
+
+    def add(self, key, latitude: float, longitude: float) -> None:
+        """Adds a point, replacing any point with the same key."""
+        if key in self.points:
+            self.remove(key)
+        self.points[key] = (latitude, longitude)
+        self.cells.setdefault(grid_cell(latitude, longitude, self.cell_size), set()).add(key)
+
+    def remove(self, key) -> None:
+        """Removes a point.
+
+        :raises KeyError: if there is no point with :param key:.
+        """
+        latitude, longitude = self.points.pop(key)
+        cell = grid_cell(latitude, longitude, self.cell_size)
+        self.cells[cell].discard(key)
+        if not self.cells[cell]:
+            del self.cells[cell]
+
+    def apply_station_changes(self, changes) -> None:
+        """Updates the locations of the fuel stations that changed. Can be
+        registered with :meth:`Safpis.add_station_listener`.
+
+        :param changes: The changes to apply.
+        :type changes: StationChanges
+        """
+        for fuel_station in changes.removed:
+            self.remove(fuel_station["S"])
+        for fuel_station in [*changes.added, *(new for _old, new in changes.changed)]:
+            self.add(fuel_station["S"], fuel_station["Lat"], fuel_station["Lng"])
+
+    def keys_in_cells(self, cells) -> set:
+        """Gets the keys of the points in any of the grid cells."""
+        keys: set = set()
+        for cell in cells:
+            keys.update(self.cells.get(cell, ()))
+        return keys
+
+    def within(self, latitude: float, longitude: float, radius_km: float) -> list:
+        """Gets the points within a distance of a location.
+
+        :param radius_km: The distance in kilometres.
+        :type radius_km: float
+        :return: (key, distance in kilometres) tuples, closest first.
+        :rtype: list
+        """
+        found = []
+        for key in self.keys_in_cells(cells_within(latitude, longitude, radius_km, self.cell_size)):
+            distance = haversine_km(latitude, longitude, *self.points[key])
+            if distance <= radius_km:
+                found.append((key, distance))
+        return sorted(found, key=lambda point: point[1])
+
+    def nearest(self, latitude: float, longitude: float, k: int, max_km: float, exclude=None) -> list:
+        """Gets the k nearest points within a distance of a location,
+        searching outwards from the location's grid cell.
+
+        :param k: The number of points to return.
+        :type k: int
+        :param max_km: The maximum distance in kilometres.
+        :type max_km: float
+        :param exclude: The key of a point to leave out, e.g. the point at
+                the location, defaults to none.
+        :return: Up to :param k: (key, distance in kilometres) tuples,
+                closest first.
+        :rtype: list
+        """
+        radius = min(self.cell_size * KM_PER_DEGREE, max_km)
+        while True:
+            found = [point for point in self.within(latitude, longitude, radius) if point[0] != exclude]
+            # Points beyond the radius are further than any point found.
+            if len(found) >= k or radius >= max_km:
+                return found[:k]
+            radius = min(radius * 2, max_km)
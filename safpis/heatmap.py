@@ -0,0 +1,285 @@
+"""Price statistics per fuel for each map tile at several zoom levels.
+
+Fuel stations are placed in the Web Mercator ("slippy map") tiles used by web
+maps, once per zoom level, and each tile keeps the prices of each fuel in
+sorted order. A price change only updates the tiles of its fuel station, and
+the minimum, median and count of each tile are recomputed as it changes, so
+looking up a tile costs the same however many fuel stations it holds.
+"""
+
+from __future__ import annotations
+
+from bisect import bisect_left, insort
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Iterable
+
+from safpis.geo import map_tile
+from safpis.models import as_site_id
+from safpis.tables import UNAVAILABLE_PRICE
+
+if TYPE_CHECKING:
+    from safpis.models import StationChanges
+    from safpis.snapshot import Snapshot
+
+DEFAULT_ZOOMS = (6, 8, 10, 12, 14)
+
+
+@dataclass(frozen=True)
+class CellStatistics:
+    """The prices of one fuel in one map tile, in tenths of a cent per litre.
+
+    :param minimum: The cheapest price
+    :param median: The median price
+    :param count: The number of fuel stations with a price
+    """
+
+    minimum: float
+    median: float
+    count: int
+
+
+def _statistics(prices: list) -> CellStatistics:
+    middle = len(prices) // 2
+    median = prices[middle] if len(prices) % 2 else (prices[middle - 1] + prices[middle]) / 2
+    return CellStatistics(prices[0], median, len(prices))
+
+
+class PriceHeatmap:
+    """Price statistics per fuel for each map tile containing a fuel station.
+
+    Lookups may run while another thread updates the heatmap: each tile's
+    statistics are replaced, never modified, so a lookup sees the tile either
+    before or after a price change.
+
+    :param zooms: The zoom levels to aggregate at, defaults to
+            (6, 8, 10, 12, 14).
+    :type zooms: Iterable[int]
+    """
+
+    def __init__(self, zooms: Iterable[int] = DEFAULT_ZOOMS) -> None:
+        self.zooms = tuple(zooms)
+        self.__locations: dict = {}
+        self.__tiles: dict = {}
+        self.__prices: dict = {}
+        self.__sorted: dict = {}
+        self.__statistics: dict = {zoom: {} for zoom in self.zooms}
+        self.__versions: tuple | None = None
+
+    @classmethod
+    def from_payloads(
+        cls,
+        fuel_stations: Iterable[dict],
+        site_prices: Iterable[dict],
+        zooms: Iterable[int] = DEFAULT_ZOOMS,
+    ):
+        """Builds a PriceHeatmap from the SAFPIS REST API payloads.
+
+        :param fuel_stations: The "S" list of a GetFullSiteDetails response.
+        :type fuel_stations: Iterable[dict]
+        :param site_prices: The "SitePrices" list of a GetSitesPrices
+                response.
+        :type site_prices: Iterable[dict]
+        :param zooms: The zoom levels to aggregate at, defaults to
+                DEFAULT_ZOOMS.
+        :type zooms: Iterable[int]
+        :return: A PriceHeatmap object.
+        :rtype: PriceHeatmap
+        """
+        heatmap = cls(zooms)
+        for fuel_station in fuel_stations:
+            heatmap.set_location(as_site_id(fuel_station["S"]), fuel_station["Lat"], fuel_station["Lng"])
+        heatmap.apply_site_prices(site_prices)
+        return heatmap
+
+    def __len__(self) -> int:
+        return len(self.__locations)
+
+    def __insert(self, tiles: tuple, fuel_id: int, price: float) -> None:
+        for zoom, x, y in tiles:
+            prices = self.__sorted.setdefault((zoom, x, y), {}).setdefault(fuel_id, [])
+            insort(prices, price)
+            self.__statistics[zoom].setdefault((x, y), {})[fuel_id] = _statistics(prices)
+
+    def __remove(self, tiles: tuple, fuel_id: int, price: float) -> None:
+        for zoom, x, y in tiles:
+            by_fuel = self.__sorted[(zoom, x, y)]
+            prices = by_fuel[fuel_id]
+            del prices[bisect_left(prices, price)]
+            statistics = self.__statistics[zoom][(x, y)]
+            if prices:
+                statistics[fuel_id] = _statistics(prices)
+                continue
+            del by_fuel[fuel_id]
+            del statistics[fuel_id]
+            if not by_fuel:
+                del self.__sorted[(zoom, x, y)]
+                del self.__statistics[zoom][(x, y)]
+
+    def set_location(self, site_id: int, latitude: float, longitude: float) -> None:
+        """Places a fuel station, moving its prices if it was already placed.
+
+        :param site_id: The ID of the fuel station.
+        :type site_id: int
+        """
+        if self.__locations.get(site_id) == (latitude, longitude):
+            return
+        self.remove_station(site_id)
+        self.__locations[site_id] = (latitude, longitude)
+        tiles = self.__tiles[site_id] = tuple((zoom, *map_tile(latitude, longitude, zoom)) for zoom in self.zooms)
+        for fuel_id, price in self.__prices.get(site_id, {}).items():
+            self.__insert(tiles, fuel_id, price)
+
+    def remove_station(self, site_id: int) -> None:
+        """Removes a fuel station from the map. Its prices are kept, and shown
+        again if it is placed again.
+
+        :param site_id: The ID of the fuel station.
+        :type site_id: int
+        """
+        tiles = self.__tiles.pop(site_id, None)
+        if tiles is None:
+            return
+        del self.__locations[site_id]
+        for fuel_id, price in self.__prices.get(site_id, {}).items():
+            self.__remove(tiles, fuel_id, price)
+
+    def update_price(self, site_id: int, fuel_id: int, price: float | None) -> bool:
+        """Sets the price of a fuel at a fuel station.
+
+        :param site_id: The ID of the fuel station.
+        :type site_id: int
+        :param fuel_id: The ID of the fuel.
+        :type fuel_id: int
+        :param price: The price, or None or 9999 if the fuel is unavailable.
+        :type price: float
+        :return: Whether the price changed.
+        :rtype: bool
+        """
+        if price == UNAVAILABLE_PRICE:
+            price = None
+        prices = self.__prices.get(site_id, {})
+        previous = prices.get(fuel_id)
+        if previous == price:
+            return False
+        tiles = self.__tiles.get(site_id, ())
+        if previous is not None:
+            del prices[fuel_id]
+            self.__remove(tiles, fuel_id, previous)
+        if price is not None:
+            prices[fuel_id] = price
+            self.__prices[site_id] = prices
+            self.__insert(tiles, fuel_id, price)
+        elif not prices:
+            del self.__prices[site_id]
+        return True
+
+    def apply_site_prices(self, site_prices: Iterable[dict]) -> int:
+        """Replaces the prices with those of a GetSitesPrices response. Only
+        the tiles of prices that changed are updated.
+
+        :param site_prices: The "SitePrices" list of a GetSitesPrices
+                response.
+        :type site_prices: Iterable[dict]
+        :return: The number of prices that changed.
+        :rtype: int
+        """
+        current = set()
+        changed = 0
+        for site_price in site_prices:
+            key = (site_price["SiteId"], site_price["FuelId"])
+            current.add(key)
+            changed += self.update_price(*key, site_price["Price"])
+        gone = [
+            (site_id, fuel_id)
+            for site_id, prices in self.__prices.items()
+            for fuel_id in prices
+            if (site_id, fuel_id) not in current
+        ]
+        for site_id, fuel_id in gone:
+            changed += self.update_price(site_id, fuel_id, None)
+        return changed
+
+    def apply_station_changes(self, changes: StationChanges) -> None:
+        """Moves the fuel stations that changed. Can be registered with
+        :meth:`Safpis.add_station_listener`.
+
+        :param changes: The changes to apply.
+        :type changes: StationChanges
+        """
+        for fuel_station in changes.removed:
+            self.remove_station(as_site_id(fuel_station["S"]))
+        for fuel_station in [*changes.added, *(new for _old, new in changes.changed)]:
+            self.set_location(as_site_id(fuel_station["S"]), fuel_station["Lat"], fuel_station["Lng"])
+
+    def apply_snapshot(self, snapshot: Snapshot) -> None:
+        """Brings the heatmap up to date with a snapshot, updating only the
+        fuel stations and prices that changed. Can be registered with
+        :meth:`SnapshotStore.add_listener`.
+
+        :param snapshot: The snapshot.
+        :type snapshot: Snapshot
+        """
+        previous = self.__versions
+        self.__versions = (snapshot.reference_version, snapshot.price_version)
+        if previous is None or previous[0] != snapshot.reference_version:
+            fuel_stations = {
+                as_site_id(site_id): fuel_station for site_id, fuel_station in snapshot.fuel_stations.items()
+            }
+            for site_id in set(self.__locations) - set(fuel_stations):
+                self.remove_station(site_id)
+            for site_id, fuel_station in fuel_stations.items():
+                self.set_location(site_id, fuel_station.Lat, fuel_station.Lng)
+        if previous is None or previous[1] != snapshot.price_version:
+            self.apply_site_prices(snapshot.site_prices)
+
+    def cell(self, zoom: int, x: int, y: int, fuel_id: int) -> CellStatistics | None:
+        """Gets the price statistics of a fuel in a map tile.
+
+        :param zoom: The zoom level.
+        :type zoom: int
+        :raises KeyError: if the zoom level is not aggregated.
+        :return: A CellStatistics object, or None if no fuel station in the
+                tile has a price for the fuel.
+        :rtype: CellStatistics
+        """
+        return self.__statistics[zoom].get((x, y), {}).get(fuel_id)
+
+    def tile(self, zoom: int, x: int, y: int) -> dict:
+        """Gets the price statistics of every fuel in a map tile.
+
+        :param zoom: The zoom level.
+        :type zoom: int
+        :raises KeyError: if the zoom level is not aggregated.
+        :return: A dict mapping fuel IDs to CellStatistics objects.
+        :rtype: dict
+        """
+        return dict(self.__statistics[zoom].get((x, y), {}))
+
+    def at(self, latitude: float, longitude: float, zoom: int, fuel_id: int) -> CellStatistics | None:
+        """Gets the price statistics of a fuel in the map tile containing a
+        point.
+
+        :param zoom: The zoom level.
+        :type zoom: int
+        :raises KeyError: if the zoom level is not aggregated.
+        :return: A CellStatistics object, or None if no fuel station in the
+                tile has a price for the fuel.
+        :rtype: CellStatistics
+        """
+        return self.cell(zoom, *map_tile(latitude, longitude, zoom), fuel_id)
+
+    def layer(self, zoom: int, fuel_id: int) -> dict:
+        """Gets the price statistics of a fuel in every map tile at a zoom
+        level.
+
+        :param zoom: The zoom level.
+        :type zoom: int
+        :param fuel_id: The ID of the fuel.
+        :type fuel_id: int
+        :raises KeyError: if the zoom level is not aggregated.
+        :return: A dict mapping each tile's (x, y) to a CellStatistics object.
+        :rtype: dict
+        """
+        tiles = dict(self.__statistics[zoom])
+        layer = {xy: by_fuel.get(fuel_id) for xy, by_fuel in tiles.items()}
+        return {xy: statistics for xy, statistics in layer.items() if statistics is not None}
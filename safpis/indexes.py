@@ -0,0 +1,142 @@
+"""Inverted indexes from fuel station attributes to fuel station IDs.
+
+Filters on several attributes are answered by intersecting the sets of fuel
+station IDs for each attribute, smallest first, rather than by scanning every
+fuel station.
+"""
+
+from __future__ import annotations
+
+from typing import Iterable
+
+INDEXED_FIELDS = ("B", "P", "G1", "G2", "G3", "G4", "G5")
+
+
+def _normalise(field: str, value):
+    # Postcodes are strings in the payloads but are often given as numbers.
+    return str(value) if field == "P" and value is not None else value
+
+
+def _values(value) -> list:
+    if isinstance(value, (str, bytes)) or not isinstance(value, Iterable):
+        return [value]
+    return list(value)
+
+
+class AttributeIndex:
+    """Inverted indexes over fuel station records from the "S" list of a
+    GetFullSiteDetails response.
+
+    :param fields: The fields to index, defaults to the brand ("B"),
+            postcode ("P") and geographic regions ("G1" to "G5").
+    :type fields: Iterable[str]
+    """
+
+    def __init__(self, fields: Iterable[str] = INDEXED_FIELDS) -> None:
+        self.fields = tuple(fields)
+        self.__indexes: dict = {field: {} for field in self.fields}
+        self.__records: dict = {}
+
+    @classmethod
+    def from_fuel_stations(cls, fuel_stations: Iterable[dict], fields: Iterable[str] = INDEXED_FIELDS):
+        """Builds the indexes of fuel station records.
+
+        :param fuel_stations: The fuel station records.
+        :type fuel_stations: Iterable[dict]
+        :param fields: The fields to index, defaults to INDEXED_FIELDS.
+        :type fields: Iterable[str]
+        :return: An AttributeIndex object.
+        :rtype: AttributeIndex
+        """
+        index = cls(fields)
+        for fuel_station in fuel_stations:
+            index.add(fuel_station)
+        return index
+
+    def __len__(self) -> int:
+        return len(self.__records)
+
+    def add(self, fuel_station: dict) -> None:
+        """Adds a fuel station record, replacing any with the same ID.
+
+        :param fuel_station: The fuel station record.
+        :type fuel_station: dict
+        """
+        site_id = fuel_station["S"]
+        self.remove(site_id)
+        self.__records[site_id] = fuel_station
+        for field in self.fields:
+            value = _normalise(field, fuel_station.get(field))
+            self.__indexes[field].setdefault(value, set()).add(site_id)
+
+    def remove(self, site_id: int) -> None:
+        """Removes a fuel station.
+
+        :param site_id: The ID of the fuel station.
+        :type site_id: int
+        """
+        fuel_station = self.__records.pop(site_id, None)
+        if fuel_station is None:
+            return
+        for field in self.fields:
+            value = _normalise(field, fuel_station.get(field))
+            site_ids = self.__indexes[field][value]
+            site_ids.discard(site_id)
+            if not site_ids:
+                del self.__indexes[field][value]
+
+    def apply_station_changes(self, changes) -> None:
+        """Updates the fuel stations that changed. Can be registered with
+        :meth:`Safpis.add_station_listener`.
+
+        :param changes: The changes to apply.
+        :type changes: StationChanges
+        """
+        for fuel_station in changes.removed:
+            self.remove(fuel_station["S"])
+        for fuel_station in [*changes.added, *(new for _old, new in changes.changed)]:
+            self.add(fuel_station)
+
+    def values(self, field: str) -> set:
+        """Gets the distinct values of a field.
+
+        :param field: The field.
+        :type field: str
+        :return: A set of values.
+        :rtype: set
+        """
+        return set(self.__indexes[field])
+
+    def lookup(self, field: str, values) -> set:
+        """Gets the IDs of the fuel stations whose field has any of the values.
+
+        :param field: The field.
+        :type field: str
+        :param values: A value, or an iterable of values.
+        :raises KeyError: if :param field: is not indexed.
+        :return: A set of fuel station IDs.
+        :rtype: set
+        """
+        index = self.__indexes[field]
+        found: set = set()
+        for value in _values(values):
+            found |= index.get(_normalise(field, value), set())
+        return found
+
+    def filter(self, **criteria) -> set:
+        """Gets the IDs of the fuel stations matching every criterion, e.g.
+        ``filter(B=[2, 23], P="5094")`` for Caltex or United fuel stations in
+        postcode 5094.
+
+        :param criteria: The values of each field to match, as a value or an
+                iterable of values. A fuel station matches a criterion if its
+                field has any of the values.
+        :raises KeyError: if a field is not indexed.
+        :return: A set of fuel station IDs; every fuel station when there are
+                no criteria.
+        :rtype: set
+        """
+        if not criteria:
+            return set(self.__records)
+        matches = sorted((self.lookup(field, values) for field, values in criteria.items()), key=len)
+        return matches[0].intersection(*matches[1:])
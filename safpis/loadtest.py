@@ -0,0 +1,209 @@
+"""A load-test harness driving SafpisAPI and Safpis from many threads.
+
+Each scenario is a function making one call, e.g. one GetSitesPrices
+request or one closest_fuel_stations query. :func:`run` makes a number of
+calls from a pool of threads and reports the throughput, the latency
+percentiles, the errors and how counters such as the number of requests a
+StubServer served changed over the run.
+"""
+
+from __future__ import annotations
+
+import itertools
+import math
+import random
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import TYPE_CHECKING, Callable
+
+from safpis.models import ADELAIDE
+
+if TYPE_CHECKING:
+    from safpis.api import SafpisAPI
+    from safpis.safpis import Safpis
+
+SCENARIOS = ("prices", "stations", "closest", "cheapest", "open", "mixed")
+
+DEFAULT_THREADS = 8
+DEFAULT_REQUESTS = 1000
+
+REPORTED_PERCENTILES = (50, 90, 99)
+
+# Popular places to search from: the Adelaide CBD and nearby suburbs.
+HOT_LOCATIONS = (
+    (-34.9285, 138.6007),
+    (-34.8193, 138.5921),
+    (-35.1390, 138.4990),
+    (-34.9790, 138.5150),
+    (-34.8540, 138.6460),
+)
+
+
+@dataclass
+class LoadResult:
+    """The outcome of a load test.
+
+    :param calls: The number of calls made
+    :param threads: The number of threads that made them
+    :param elapsed: The wall-clock duration of the run in seconds
+    :param latencies: The duration of every call in seconds, sorted
+    :param errors: The number of failed calls, keyed by exception type
+    :param counters: How much each counter increased over the run
+    """
+
+    calls: int
+    threads: int
+    elapsed: float
+    latencies: list = field(repr=False)
+    errors: Counter = field(default_factory=Counter)
+    counters: dict = field(default_factory=dict)
+
+    @property
+    def throughput(self) -> float:
+        """Calls per second."""
+        return self.calls / self.elapsed if self.elapsed else 0.0
+
+    def percentile(self, q: float) -> float:
+        """Gets a latency percentile by the nearest-rank method.
+
+        :param q: The percentile, from 0 to 100.
+        :type q: float
+        :return: The latency in seconds, or NaN if no calls were made.
+        :rtype: float
+        """
+        if not self.latencies:
+            return math.nan
+        rank = max(math.ceil(q / 100 * len(self.latencies)), 1)
+        return self.latencies[rank - 1]
+
+    def report(self) -> str:
+        """Formats the result for the console.
+
+        :return: Lines of text.
+        :rtype: str
+        """
+        failed = sum(self.errors.values())
+        lines = [
+            f"calls       {self.calls} from {self.threads} threads in {self.elapsed:.2f}s, {failed} failed",
+            f"throughput  {self.throughput:.1f} calls/s",
+            "latency ms  "
+            + "  ".join(f"p{q} {self.percentile(q) * 1000:.2f}" for q in REPORTED_PERCENTILES)
+            + f"  max {(self.latencies[-1] if self.latencies else math.nan) * 1000:.2f}",
+        ]
+        lines.extend(f"error       {name}: {count}" for name, count in self.errors.most_common())
+        lines.extend(f"{name:<11} {value}" for name, value in self.counters.items())
+        return "\n".join(lines)
+
+
+def scenario(name: str, api: SafpisAPI, safpis: Safpis | None = None) -> Callable[[random.Random], object]:
+    """Gets the function making one call of a scenario.
+
+    :param name: One of "prices", "stations", "closest", "cheapest", "open"
+            or "mixed", which picks one of the others at random each call.
+    :type name: str
+    :param api: The API for the "prices" and "stations" scenarios.
+    :type api: SafpisAPI
+    :param safpis: The Safpis object for the other scenarios.
+    :type safpis: Safpis, optional
+    :raises ValueError: if the scenario is not recognised, or needs a Safpis
+            object and none was given.
+    :return: A function of a random number generator.
+    :rtype: Callable
+    """
+    if name not in SCENARIOS:
+        msg = f"scenario must be one of {SCENARIOS!r}."
+        raise ValueError(msg)
+    if name in {"prices", "stations"}:
+        endpoint = api.GetSitesPrices if name == "prices" else api.GetFullSiteDetails
+        return lambda _generator: endpoint()
+    if safpis is None:
+        msg = f"the {name} scenario needs a Safpis object."
+        raise ValueError(msg)
+    fuel_names = [fuel["Name"] for fuel in api.GetCountryFuelTypes()["Fuels"]]
+    calls = {
+        "closest": lambda generator: safpis.closest_fuel_stations(*generator.choice(HOT_LOCATIONS)),
+        "cheapest": lambda generator: safpis.cheapest_fuel_type(generator.choice(fuel_names)),
+        "open": lambda _generator: safpis.open_fuel_stations(datetime.now(ADELAIDE)),
+    }
+    if name == "mixed":
+        calls["prices"] = lambda _generator: api.GetSitesPrices()
+        mixed = list(calls.values())
+        return lambda generator: generator.choice(mixed)(generator)
+    return calls[name]
+
+
+def run(
+    call: Callable[[random.Random], object],
+    threads: int = DEFAULT_THREADS,
+    calls: int = DEFAULT_REQUESTS,
+    duration: float | None = None,
+    counters: Callable[[], dict] | None = None,
+    seed: int = 0,
+) -> LoadResult:
+    """Makes calls from a pool of threads, timing each one.
+
+    :param call: Makes one call, given a random number generator of the
+            calling thread.
+    :type call: Callable[[random.Random], object]
+    :param threads: The number of threads, defaults to 8.
+    :type threads: int
+    :param calls: The number of calls to make, defaults to 1000.
+    :type calls: int
+    :param duration: Stop after this many seconds, even if fewer calls have
+            been made, defaults to no limit.
+    :type duration: float, optional
+    :param counters: Gets counters, e.g. of the requests a server has
+            served, to report how much they increased, defaults to none.
+    :type counters: Callable[[], dict], optional
+    :param seed: Seeds each thread's random number generator, defaults to 0.
+    :type seed: int
+    :return: A LoadResult object.
+    :rtype: LoadResult
+    """
+    numbers = itertools.count()
+    latencies: list = []
+    errors: Counter = Counter()
+    lock = threading.Lock()
+    before = counters() if counters is not None else {}
+    start = time.perf_counter()
+    deadline = math.inf if duration is None else start + duration
+
+    def worker(generator: random.Random) -> None:
+        timings = []
+        failures: Counter = Counter()
+        # next() on an itertools.count is atomic, so calls are shared out
+        # between the threads without a lock.
+        while next(numbers) < calls and time.perf_counter() < deadline:
+            began = time.perf_counter()
+            try:
+                call(generator)
+            except Exception as exc:  # noqa: BLE001
+                failures[type(exc).__name__] += 1
+            timings.append(time.perf_counter() - began)
+        with lock:
+            latencies.extend(timings)
+            errors.update(failures)
+
+    pool = [
+        threading.Thread(target=worker, args=(random.Random(seed + number),), name=f"safpis-load-{number}")  # noqa: S311
+        for number in range(threads)
+    ]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    after = counters() if counters is not None else {}
+    latencies.sort()
+    return LoadResult(
+        calls=len(latencies),
+        threads=threads,
+        elapsed=elapsed,
+        latencies=latencies,
+        errors=errors,
+        counters={name: value - before.get(name, 0) for name, value in after.items()},
+    )
@@ -0,0 +1,196 @@
+"""A result cache for frequently repeated Safpis queries.
+
+Results are keyed by the query, its arguments and the versions of the data
+it was computed from, and are evicted least recently used first once the
+cache holds too many entries or too many result objects. Entries are
+dropped as soon as the reference data or prices they depend on change, so a
+cached result is never older than the data a fresh query would use.
+
+Coordinates are rounded before they are used as a key, so nearby lookups
+share a result, and datetimes are truncated to the minute, the resolution of
+fuel station opening hours. Only the key is rounded: a miss is computed from
+the arguments it was asked with.
+"""
+
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from collections.abc import Sized
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Iterable
+
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_MAX_RESULTS = 100_000
+DEFAULT_PRECISION = 4  # decimal places of a degree, about 11m
+
+DEPENDENCIES = ("reference", "prices")
+
+
+@dataclass
+class CacheStatistics:
+    """Counts of a QueryCache's lookups and evictions.
+
+    :param hits: Lookups answered from the cache
+    :param misses: Lookups that had to be computed
+    :param evictions: Entries evicted to stay within the limits
+    :param invalidations: Entries dropped because their data changed
+    :param entries: The number of entries held
+    :param results: The number of result objects held
+    """
+
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    invalidations: int = 0
+    entries: int = 0
+    results: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+def _weight(value) -> int:
+    return max(len(value), 1) if isinstance(value, Sized) and not isinstance(value, (str, bytes)) else 1
+
+
+class QueryCache:
+    """A thread-safe LRU cache of query results.
+
+    :param max_entries: The most results to hold, defaults to 1024.
+    :type max_entries: int
+    :param max_results: The most result objects to hold, counting each item
+            of a list result, defaults to 100,000.
+    :type max_results: int
+    :param precision: The decimal places coordinates are rounded to, or None
+            to use them exactly, defaults to 4.
+    :type precision: int, optional
+    """
+
+    def __init__(
+        self,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        max_results: int = DEFAULT_MAX_RESULTS,
+        precision: int | None = DEFAULT_PRECISION,
+    ) -> None:
+        self.max_entries = max_entries
+        self.max_results = max_results
+        self.precision = precision
+        self.__entries: OrderedDict = OrderedDict()
+        self.__lock = threading.Lock()
+        self.__statistics = CacheStatistics()
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def key(self, query: str, arguments: Iterable, versions: tuple) -> tuple:
+        """Builds the key of a query's result, rounding coordinates and
+        truncating datetimes to the minute.
+
+        :param query: The name of the query.
+        :type query: str
+        :param arguments: The arguments of the query.
+        :type arguments: Iterable
+        :param versions: The versions of the data the result depends on.
+        :type versions: tuple
+        :return: The key.
+        :rtype: tuple
+        """
+        return (query, tuple(self.__normalise(argument) for argument in arguments), versions)
+
+    def __normalise(self, argument):
+        if isinstance(argument, float) and self.precision is not None:
+            return round(argument, self.precision)
+        if isinstance(argument, datetime):
+            return argument.replace(second=0, microsecond=0)
+        return argument
+
+    def get_or_compute(
+        self,
+        key: tuple,
+        compute: Callable,
+        depends_on: Iterable[str] = ("reference",),
+        is_current: Callable[[], bool] | None = None,
+    ):
+        """Gets a cached result, computing and caching it on a miss.
+
+        :param key: The key, see :meth:`key`.
+        :type key: tuple
+        :param compute: Computes the result.
+        :type compute: Callable
+        :param depends_on: The data the result depends on, any of
+                "reference" and "prices", defaults to ("reference",).
+        :type depends_on: Iterable[str]
+        :param is_current: Called after computing a miss; the result is only
+                cached if it returns True, so one computed from data that
+                changed meanwhile isn't kept under the key's old versions.
+        :type is_current: Callable[[], bool], optional
+        :return: The result.
+        """
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is not None:
+                self.__entries.move_to_end(key)
+                self.__statistics.hits += 1
+                return entry[0]
+            self.__statistics.misses += 1
+        value = compute()
+        weight = _weight(value)
+        if weight > self.max_results or (is_current is not None and not is_current()):
+            return value
+        with self.__lock:
+            previous = self.__entries.pop(key, None)
+            if previous is not None:
+                self.__statistics.results -= previous[2]
+            self.__entries[key] = (value, frozenset(depends_on), weight)
+            self.__statistics.results += weight
+            while len(self.__entries) > self.max_entries or self.__statistics.results > self.max_results:
+                _key, (_value, _depends_on, evicted) = self.__entries.popitem(last=False)
+                self.__statistics.results -= evicted
+                self.__statistics.evictions += 1
+        return value
+
+    def invalidate(self, dependency: str) -> int:
+        """Drops every result that depends on some data, after it changed.
+
+        :param dependency: "reference" or "prices".
+        :type dependency: str
+        :raises ValueError: if dependency is not recognised.
+        :return: The number of results dropped.
+        :rtype: int
+        """
+        if dependency not in DEPENDENCIES:
+            msg = f"dependency must be one of {DEPENDENCIES!r}."
+            raise ValueError(msg)
+        with self.__lock:
+            stale = [key for key, (_value, depends_on, _weight) in self.__entries.items() if dependency in depends_on]
+            for key in stale:
+                self.__statistics.results -= self.__entries.pop(key)[2]
+            self.__statistics.invalidations += len(stale)
+        return len(stale)
+
+    def clear(self) -> None:
+        """Drops every result and resets the statistics."""
+        with self.__lock:
+            self.__entries.clear()
+            self.__statistics = CacheStatistics()
+
+    def statistics(self) -> CacheStatistics:
+        """Gets the hit, miss and eviction counts.
+
+        :return: A copy of the statistics.
+        :rtype: CacheStatistics
+        """
+        with self.__lock:
+            statistics = self.__statistics
+            return CacheStatistics(
+                statistics.hits,
+                statistics.misses,
+                statistics.evictions,
+                statistics.invalidations,
+                len(self.__entries),
+                statistics.results,
+            )
@@ -1,14 +1,97 @@
 from __future__ import annotations
 
 from dataclasses import dataclass, field
-from datetime import datetime, time
+from datetime import datetime, time, timezone
 from decimal import Decimal
+from functools import lru_cache
 
 import pytz
 from dateutil import parser
 from geopy.distance import geodesic
 from money import Money
 
+ADELAIDE = pytz.timezone("Australia/Adelaide")
+
+# The opening and closing times of a fuel station for each day of the week,
+# Monday first.
+STATION_HOURS_COLUMNS = ("MO", "MC", "TO", "TC", "WO", "WC", "THO", "THC", "FO", "FC", "SO", "SC", "SUO", "SUC")
+
+# Payloads repeat the same timestamps and opening hours many times, and
+# successive payloads mostly repeat the previous ones.
+PARSE_CACHE_SIZE = 16384
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def parse_timestamp(value: str) -> datetime:
+    """Parses a TransactionDateUtc value such as "2021-01-06T22:55:00".
+
+    ISO 8601 values are parsed by :meth:`datetime.fromisoformat`, which is far
+    faster than dateutil; dateutil parses anything else.
+
+    :param value: The timestamp.
+    :type value: str
+    :return: The datetime, without a timezone unless :param value: has one.
+    :rtype: datetime
+    """
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return parser.parse(value)
+
+
+def epoch_seconds(value: str) -> float:
+    """Converts a TransactionDateUtc value to seconds since the epoch with
+    :func:`parse_timestamp`, treating values without a timezone as UTC.
+
+    :param value: The timestamp.
+    :type value: str
+    :return: The seconds since the epoch, or NaN if :param value: is not a
+            timestamp.
+    :rtype: float
+    """
+    try:
+        date_time = parse_timestamp(value)
+    except (TypeError, ValueError, OverflowError):
+        return float("nan")
+    if date_time.tzinfo is None:
+        date_time = date_time.replace(tzinfo=timezone.utc)
+    return date_time.timestamp()
+
+
+def as_site_id(value: int | str) -> int:
+    """Converts the "S" of a GetFullSiteDetails record, which the REST API
+    gives as a string, to an int like the "SiteId" of its GetSitesPrices
+    records, so the two can be joined.
+
+    :param value: The site ID.
+    :type value: int | str
+    :return: The site ID as an int.
+    :rtype: int
+    """
+    return int(value)
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _parse_modified(value: str) -> datetime:
+    try:
+        return datetime.fromisoformat(value).replace(tzinfo=ADELAIDE)
+    except ValueError:
+        pass
+    try:
+        return datetime.strptime(value, "%Y-%m-%dT%H:%M:%S.%f").replace(tzinfo=ADELAIDE)
+    except ValueError:
+        return datetime.strptime(value, "%Y-%m-%dT%H:%M:%S").replace(tzinfo=ADELAIDE)
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _parse_opening_time(value: str) -> time | None:
+    if value.strip() == "":
+        return None
+    try:
+        return time.fromisoformat(value)
+    except ValueError:
+        return datetime.strptime(value, "%H:%M").replace(tzinfo=ADELAIDE).time()
+
 
 @dataclass
 class Brand:
@@ -81,40 +164,13 @@ class FuelStation:
     SUC: time
 
     def __post_init__(self):
-        adl_tz = pytz.timezone("Australia/Adelaide")
-
         if isinstance(self.M, str):
-            try:
-                self.M = datetime.strptime(self.M, "%Y-%m-%dT%H:%M:%S.%f").replace(tzinfo=adl_tz)
-            except ValueError:
-                self.M = datetime.strptime(self.M, "%Y-%m-%dT%H:%M:%S").replace(tzinfo=adl_tz)
-
-        for variable_name in [
-            "MO",
-            "MC",
-            "TO",
-            "TC",
-            "WO",
-            "WC",
-            "THO",
-            "THC",
-            "FO",
-            "FC",
-            "SO",
-            "SC",
-            "SUO",
-            "SUC",
-        ]:
+            self.M = _parse_modified(self.M)
+
+        for variable_name in STATION_HOURS_COLUMNS:
             value = getattr(self, variable_name, None)
-            if value is not None:
-                if value.strip() == "":
-                    setattr(self, variable_name, None)
-                else:
-                    setattr(
-                        self,
-                        variable_name,
-                        datetime.strptime(value, "%H:%M").replace(tzinfo=adl_tz).time(),
-                    )
+            if isinstance(value, str):
+                setattr(self, variable_name, _parse_opening_time(value))
 
     def distance(self, latitude: float, longitude: float):
         """Function to return a distance between the fuel station and a
@@ -165,9 +221,93 @@ class FuelStationPrice:
 
     def __post_init__(self):
         if isinstance(self.TransactionDateUtc, str):
-            self.TransactionDateUtc = parser.parse(self.TransactionDateUtc)
+            self.TransactionDateUtc = parse_timestamp(self.TransactionDateUtc)
         if isinstance(self.Price, float):
             self.Price = Money(
                 amount=Decimal(str(self.Price)),
                 currency="AUD",
             )
+
+
+@dataclass
+class NumericFuelStationPrice:
+    """A fuel station price held as integer tenths of a cent per litre, the
+    units of the SAFPIS REST API, so prices sort and compare as integers.
+    A Money object like :attr:`FuelStationPrice.Price` is only built when
+    :attr:`Price` is read.
+
+    :param SiteId: ID of the fuel station
+    :param FuelId: ID of the Fuel Type
+    :param CollectionMethod: How the price was collected
+    :param TransactionDateUtc: When the price was last updated
+    :param tenths: The price in tenths of a cent per litre
+    """
+
+    __slots__ = ("SiteId", "FuelId", "CollectionMethod", "TransactionDateUtc", "tenths")
+
+    SiteId: int
+    FuelId: int
+    CollectionMethod: str
+    TransactionDateUtc: datetime
+    tenths: int
+
+    @classmethod
+    def from_payload(cls, site_price: dict) -> NumericFuelStationPrice:
+        """Builds a price from a GetSitesPrices "SitePrices" record.
+
+        :param site_price: The record.
+        :type site_price: dict
+        :return: A NumericFuelStationPrice object.
+        :rtype: NumericFuelStationPrice
+        """
+        return cls(
+            site_price["SiteId"],
+            site_price["FuelId"],
+            site_price["CollectionMethod"],
+            parse_timestamp(site_price["TransactionDateUtc"]),
+            round(site_price["Price"]),
+        )
+
+    @property
+    def Price(self) -> Money:  # noqa: N802
+        """The price as a Money object, equal to :attr:`FuelStationPrice.Price`."""
+        return Money(amount=Decimal(str(float(self.tenths))), currency="AUD")
+
+
+@dataclass
+class StationChanges:
+    """The fuel station records added, removed or edited between two
+    GetFullSiteDetails payloads.
+
+    :param added: Records of the fuel stations that were added.
+    :param removed: Records of the fuel stations that were removed.
+    :param changed: (old, new) record pairs of the fuel stations that were
+        edited.
+    """
+
+    added: list = field(default_factory=list)
+    removed: list = field(default_factory=list)
+    changed: list = field(default_factory=list)
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.changed)
+
+    @classmethod
+    def between(cls, old: dict, new: dict):
+        """Compares two sets of fuel station records.
+
+        :param old: The previous records, keyed by fuel station ID.
+        :type old: dict
+        :param new: The current records, keyed by fuel station ID.
+        :type new: dict
+        :return: A StationChanges object.
+        """
+        changes = cls()
+        for site_id, record in new.items():
+            previous = old.get(site_id)
+            if previous is None:
+                changes.added.append(record)
+            elif previous != record:
+                changes.changed.append((previous, record))
+        changes.removed = [record for site_id, record in old.items() if site_id not in new]
+        return changes
@@ -0,0 +1,262 @@
+"""Optional timing spans around the phases of SAFPIS queries.
+
+Spans are only timed while at least one sink is registered with
+:func:`add_sink`. Otherwise :func:`span` returns a shared object whose
+``with`` block does nothing, so instrumented code costs a list check per
+phase.
+
+A sink is any object with a ``record(span)`` method, or a plain function,
+called with each finished :class:`Span`. Sinks may also have an
+``enter(name, attributes)`` method returning a context manager that is
+entered for the duration of the span, which lets tracers such as
+OpenTelemetry nest spans in their own context.
+"""
+
+from __future__ import annotations
+
+import functools
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+
+try:
+    from opentelemetry import trace
+except ImportError:  # pragma: no cover
+    trace = None
+
+_sinks: list = []
+_local = threading.local()
+
+
+@dataclass
+class Span:
+    """A timed phase of a query.
+
+    :param name: Name of the phase, e.g. "network" or "parse"
+    :param path: Names of the enclosing spans and this span, outermost first
+    :param start: When the phase started, in seconds since the epoch
+    :param duration: How long the phase took, in seconds
+    :param attributes: Details of the phase
+    :param error: The exception raised by the phase, if any
+    """
+
+    name: str
+    path: tuple
+    start: float
+    duration: float
+    attributes: dict = field(default_factory=dict)
+    error: BaseException | None = field(default=None)
+
+
+class _NullSpan:
+    """The span returned when profiling is disabled."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        return None
+
+    def set_attribute(self, key: str, value) -> None:
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _ActiveSpan:
+    __slots__ = ("name", "attributes", "path", "start", "started", "contexts")
+
+    def __init__(self, name: str, attributes: dict) -> None:
+        self.name = name
+        self.attributes = attributes
+        self.contexts: list = []
+
+    def set_attribute(self, key: str, value) -> None:
+        self.attributes[key] = value
+
+    def __enter__(self):
+        stack = getattr(_local, "stack", None)
+        if stack is None:
+            stack = _local.stack = []
+        stack.append(self.name)
+        self.path = tuple(stack)
+        for sink in _sinks:
+            enter = getattr(sink, "enter", None)
+            if enter is not None:
+                context = enter(self.name, self.attributes)
+                context.__enter__()
+                self.contexts.append(context)
+        self.start = time.time()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        duration = time.perf_counter() - self.started
+        _local.stack.pop()
+        for context in reversed(self.contexts):
+            context.__exit__(*exc_info)
+        finished = Span(self.name, self.path, self.start, duration, self.attributes, exc_info[1])
+        for sink in _sinks:
+            record = getattr(sink, "record", sink)
+            record(finished)
+
+
+def span(name: str, **attributes):
+    """Times a phase of a query, for use in a ``with`` statement.
+
+    :param name: The name of the phase.
+    :type name: str
+    :param attributes: Details of the phase, passed to the sinks.
+    :return: A context manager.
+    """
+    if not _sinks:
+        return _NULL_SPAN
+    return _ActiveSpan(name, attributes)
+
+
+def profiled(function):
+    """Decorates a function or method to be timed as a span named after it."""
+    name = function.__name__
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not _sinks:
+            return function(*args, **kwargs)
+        with _ActiveSpan(name, {}):
+            return function(*args, **kwargs)
+
+    return wrapper
+
+
+def add_sink(sink) -> None:
+    """Registers a sink, enabling profiling.
+
+    :param sink: An object with a ``record(span)`` method, or a function
+            called with each finished Span.
+    """
+    _sinks.append(sink)
+
+
+def remove_sink(sink) -> None:
+    """Unregisters a sink, disabling profiling if it was the last one.
+
+    :param sink: The sink.
+    :raises ValueError: if :param sink: is not registered.
+    """
+    _sinks.remove(sink)
+
+
+def enabled() -> bool:
+    """Gets whether any sinks are registered.
+
+    :return: Whether spans are being timed.
+    :rtype: bool
+    """
+    return bool(_sinks)
+
+
+class LoggingSink:
+    """Logs each finished span.
+
+    :param logger: The logger, defaults to the "safpis.profiling" logger.
+    :type logger: logging.Logger, optional
+    :param level: The level to log at, defaults to DEBUG.
+    :type level: int
+    """
+
+    def __init__(self, logger: logging.Logger | None = None, level: int = logging.DEBUG) -> None:
+        self.logger = logger if logger is not None else logging.getLogger(__name__)
+        self.level = level
+
+    def record(self, span: Span) -> None:
+        self.logger.log(self.level, "%s took %.3fms", "/".join(span.path), span.duration * 1000)
+
+
+class OpenTelemetrySink:
+    """Reports spans to an OpenTelemetry tracer, nested in the current
+    OpenTelemetry context.
+
+    :param tracer: The tracer, defaults to the tracer named "safpis" from the
+            global tracer provider.
+    :raises ImportError: if OpenTelemetry is not installed.
+    """
+
+    def __init__(self, tracer=None) -> None:
+        if tracer is None:
+            if trace is None:
+                msg = "OpenTelemetry is not installed; install safpis[opentelemetry]."
+                raise ImportError(msg)
+            tracer = trace.get_tracer("safpis")
+        self.tracer = tracer
+
+    def enter(self, name: str, attributes: dict):
+        return self.tracer.start_as_current_span(f"safpis.{name}", attributes=dict(attributes))
+
+    def record(self, span: Span) -> None:
+        pass
+
+
+@dataclass
+class PhaseTiming:
+    """The timings of one phase, accumulated over many spans.
+
+    :param path: Names of the enclosing phases and this phase
+    :param count: Number of spans
+    :param total: Total duration in seconds
+    :param own: Total duration in seconds not spent in nested phases
+    :param minimum: Shortest duration in seconds
+    :param maximum: Longest duration in seconds
+    """
+
+    path: tuple
+    count: int = 0
+    total: float = 0.0
+    own: float = 0.0
+    minimum: float = float("inf")
+    maximum: float = 0.0
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+
+class PhaseCollector:
+    """Accumulates the timings of spans by their path, e.g. to break down
+    where the time of a repeated query goes.
+    """
+
+    def __init__(self) -> None:
+        self.timings: dict = {}
+        self.__lock = threading.Lock()
+
+    def record(self, span: Span) -> None:
+        with self.__lock:
+            timing = self.timings.get(span.path)
+            if timing is None:
+                timing = self.timings[span.path] = PhaseTiming(span.path)
+            timing.count += 1
+            timing.total += span.duration
+            timing.own += span.duration
+            timing.minimum = min(timing.minimum, span.duration)
+            timing.maximum = max(timing.maximum, span.duration)
+            if len(span.path) > 1:
+                # Spans finish before their parents, which may not have been
+                # recorded yet.
+                parent = self.timings.get(span.path[:-1])
+                if parent is None:
+                    parent = self.timings[span.path[:-1]] = PhaseTiming(span.path[:-1])
+                parent.own -= span.duration
+
+    def breakdown(self) -> list:
+        """Gets the accumulated timings, each phase followed by the phases
+        nested in it.
+
+        :return: A list of PhaseTiming objects.
+        :rtype: list
+        """
+        with self.__lock:
+            return sorted(self.timings.values(), key=lambda timing: timing.path)
@@ -0,0 +1,431 @@
+"""Pushes price changes to subscribers of individual fuel station prices.
+
+A :class:`PriceFeed` keeps the current price of every fuel at every fuel
+station and, when a new GetSitesPrices payload arrives, works out which
+prices changed. Each change is numbered with the next version and sent only
+to the subscriptions for its ``(site ID, fuel ID)`` key, so hundreds of
+sensors can share one upstream poll: register :meth:`PriceFeed.apply_snapshot`
+with a SnapshotStore refreshed by a SnapshotRefresher.
+
+The most recent changes are kept, so a subscriber that reconnects with the
+last version it saw is sent only the changes it missed. If they are no
+longer kept, it is sent the current prices of its keys instead.
+
+:class:`PushServer` serves a feed to other processes on localhost as
+Server-Sent Events: ``GET /events?key=61205460:2&key=61205460:5`` streams
+the changes to those prices, and browsers' EventSource reconnects with a
+Last-Event-ID header to resume. ``GET /prices?key=...`` returns the current
+prices as JSON.
+"""
+
+from __future__ import annotations
+
+import json
+import queue
+import threading
+import uuid
+from collections import deque
+from dataclasses import asdict, dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import TYPE_CHECKING, Callable, Iterable
+from urllib.parse import parse_qs, urlsplit
+
+from safpis.tables import UNAVAILABLE_PRICE
+
+if TYPE_CHECKING:
+    from safpis.snapshot import Snapshot
+
+DEFAULT_HISTORY = 10_000
+
+# Seconds between the comments sent to keep idle event streams open.
+HEARTBEAT_INTERVAL = 15.0
+
+# Milliseconds EventSource clients wait before reconnecting.
+RECONNECT_DELAY = 5000
+
+# How often, in seconds, the server checks whether it has been stopped.
+SHUTDOWN_POLL_INTERVAL = 0.05
+
+
+@dataclass(frozen=True)
+class PriceChange:
+    """A change to the price of a fuel at a fuel station.
+
+    :param version: Increases by one with each change made to the feed
+    :param site_id: ID of the fuel station
+    :param fuel_id: ID of the Fuel Type
+    :param price: The new price, or None if the fuel is no longer available
+    :param updated: The "TransactionDateUtc" of the new price, or None
+    """
+
+    version: int
+    site_id: int
+    fuel_id: int
+    price: float | None
+    updated: str | None
+
+
+class Subscription:
+    """The prices a subscriber is sent changes to.
+
+    :param keys: The ``(site ID, fuel ID)`` keys, or None for every price
+    :param callback: Called with each list of changes
+    """
+
+    def __init__(self, keys: frozenset | None, callback: Callable[[list], None]) -> None:
+        self.keys = keys
+        self.callback = callback
+        self.version = 0
+
+    def send(self, changes: list) -> None:
+        if changes:
+            self.version = changes[-1].version
+            self.callback(changes)
+
+
+class PriceFeed:
+    """The current prices, the recent changes to them and the subscriptions
+    to those changes.
+
+    Callbacks are called while the feed is locked, so each subscriber sees
+    its changes in order and exactly once. They should return quickly, e.g.
+    by queueing the changes for another thread.
+
+    :param history: The number of changes kept for subscribers resuming
+            from an earlier version, defaults to 10,000.
+    :type history: int
+    """
+
+    def __init__(self, history: int = DEFAULT_HISTORY) -> None:
+        # Identifies this feed's versions, which start again from 0 in every
+        # process.
+        self.epoch = uuid.uuid4().hex[:8]
+        self.version = 0
+        self.__prices: dict = {}
+        self.__log: deque = deque(maxlen=history)
+        self.__subscriptions: dict = {}
+        self.__firehose: set = set()
+        self.__price_version: int | None = None
+        self.__lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self.__prices)
+
+    def apply_site_prices(self, site_prices: Iterable[dict]) -> list:
+        """Replaces the prices with those of a GetSitesPrices response,
+        sending the changes to the subscribers of the prices that changed.
+
+        :param site_prices: The "SitePrices" list of a GetSitesPrices
+                response.
+        :type site_prices: Iterable[dict]
+        :return: The PriceChange objects.
+        :rtype: list
+        """
+        with self.__lock:
+            changes = []
+            current = {}
+            for site_price in site_prices:
+                key = (site_price["SiteId"], site_price["FuelId"])
+                price = site_price["Price"]
+                price = None if price == UNAVAILABLE_PRICE else price
+                updated = site_price.get("TransactionDateUtc")
+                current[key] = (price, updated)
+                previous = self.__prices.get(key)
+                if previous is None or previous[0] != price:
+                    changes.append(self.__change(key, price, updated))
+            changes.extend(
+                self.__change(key, None, None)
+                for key in sorted(self.__prices.keys() - current.keys())
+                if self.__prices[key][0] is not None
+            )
+            self.__prices = current
+            self.__log.extend(changes)
+            self.__publish(changes)
+            return changes
+
+    def apply_snapshot(self, snapshot: Snapshot) -> None:
+        """Brings the feed up to date with a snapshot whose prices changed.
+        Can be registered with :meth:`SnapshotStore.add_listener`.
+
+        :param snapshot: The snapshot.
+        :type snapshot: Snapshot
+        """
+        if snapshot.price_version != self.__price_version:
+            self.__price_version = snapshot.price_version
+            self.apply_site_prices(snapshot.site_prices)
+
+    def __change(self, key: tuple, price: float | None, updated: str | None) -> PriceChange:
+        self.version += 1
+        return PriceChange(self.version, key[0], key[1], price, updated)
+
+    def __publish(self, changes: list) -> None:
+        batches: dict = {subscription: [] for subscription in self.__firehose}
+        for change in changes:
+            for subscription in self.__subscriptions.get((change.site_id, change.fuel_id), ()):
+                batches.setdefault(subscription, []).append(change)
+            for subscription in self.__firehose:
+                batches[subscription].append(change)
+        for subscription, batch in batches.items():
+            subscription.send(batch)
+
+    def prices(self, keys: Iterable[tuple] | None = None) -> list:
+        """Gets the current prices, as changes at the current version.
+
+        :param keys: The ``(site ID, fuel ID)`` keys, defaults to every price.
+        :type keys: Iterable[tuple], optional
+        :return: PriceChange objects for the keys that have prices.
+        :rtype: list
+        """
+        with self.__lock:
+            keys = self.__prices.keys() if keys is None else keys
+            return [
+                PriceChange(self.version, key[0], key[1], *self.__prices[key]) for key in keys if key in self.__prices
+            ]
+
+    def changes_since(self, version: int, keys: Iterable[tuple] | None = None) -> list | None:
+        """Gets the changes made after a version.
+
+        :param version: The last version seen.
+        :type version: int
+        :param keys: The ``(site ID, fuel ID)`` keys, defaults to every price.
+        :type keys: Iterable[tuple], optional
+        :return: The PriceChange objects, oldest first, or None if some are
+                no longer kept or the version is from the future.
+        :rtype: list
+        """
+        with self.__lock:
+            oldest = self.__log[0].version if self.__log else self.version + 1
+            if version > self.version or version < oldest - 1:
+                return None
+            missed = []
+            for change in reversed(self.__log):
+                if change.version <= version:
+                    break
+                missed.append(change)
+        wanted = None if keys is None else set(keys)
+        return [change for change in reversed(missed) if wanted is None or (change.site_id, change.fuel_id) in wanted]
+
+    def subscribe(
+        self,
+        keys: Iterable[tuple] | None,
+        callback: Callable[[list], None],
+        since: int | None = None,
+    ) -> Subscription:
+        """Subscribes to the changes to some prices.
+
+        The callback is first sent the current prices of the keys, or if
+        :param since: is given, the changes made after that version.
+
+        :param keys: The ``(site ID, fuel ID)`` keys, or None for every price.
+        :type keys: Iterable[tuple]
+        :param callback: Called with each list of PriceChange objects.
+        :type callback: Callable[[list], None]
+        :param since: The last version the subscriber saw, defaults to none.
+        :type since: int, optional
+        :return: The Subscription object, to pass to :meth:`unsubscribe`.
+        :rtype: Subscription
+        """
+        subscription = Subscription(None if keys is None else frozenset(keys), callback)
+        with self.__lock:
+            missed = None if since is None else self.changes_since(since, subscription.keys)
+            subscription.send(self.prices(subscription.keys) if missed is None else missed)
+            subscription.version = self.version
+            if subscription.keys is None:
+                self.__firehose.add(subscription)
+            for key in subscription.keys or ():
+                self.__subscriptions.setdefault(key, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        """Stops sending changes to a subscription.
+
+        :param subscription: The subscription.
+        :type subscription: Subscription
+        """
+        with self.__lock:
+            self.__firehose.discard(subscription)
+            for key in subscription.keys or ():
+                subscribers = self.__subscriptions.get(key, set())
+                subscribers.discard(subscription)
+                if not subscribers:
+                    self.__subscriptions.pop(key, None)
+
+    def subscribers(self) -> int:
+        """Gets the number of subscriptions.
+
+        :return: The number of subscriptions.
+        :rtype: int
+        """
+        with self.__lock:
+            keyed = {subscription for subscribers in self.__subscriptions.values() for subscription in subscribers}
+            return len(keyed) + len(self.__firehose)
+
+
+def parse_key(value: str) -> tuple:
+    """Parses a price key written as "<site ID>:<fuel ID>".
+
+    :param value: The key, e.g. "61205460:2".
+    :type value: str
+    :raises ValueError: if the key is malformed.
+    :return: The ``(site ID, fuel ID)`` key.
+    :rtype: tuple
+    """
+    site_id, separator, fuel_id = value.partition(":")
+    if not separator or not site_id.isdigit() or not fuel_id.isdigit():
+        msg = f"price keys are written <site ID>:<fuel ID>, not {value!r}."
+        raise ValueError(msg)
+    return int(site_id), int(fuel_id)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: _PushHTTPServer
+
+    def do_GET(self):  # noqa: N802
+        self.server.push.respond(self)
+
+    def log_message(self, format, *args):  # noqa: A002
+        """Connections are long-lived, so requests are not logged."""
+
+
+class _PushHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: tuple, push: PushServer) -> None:
+        self.push = push
+        super().__init__(address, _Handler)
+
+
+class PushServer:
+    """Serves a PriceFeed as Server-Sent Events from a background thread.
+
+    :param feed: The feed to serve.
+    :type feed: PriceFeed
+    :param host: The address to listen on, defaults to "127.0.0.1".
+    :type host: str
+    :param port: The port to listen on, defaults to any free port.
+    :type port: int
+    :param heartbeat: Seconds between comments sent on idle streams,
+            defaults to 15.
+    :type heartbeat: float
+    """
+
+    def __init__(
+        self,
+        feed: PriceFeed,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        heartbeat: float = HEARTBEAT_INTERVAL,
+    ) -> None:
+        self.feed = feed
+        self.heartbeat = heartbeat
+        self.__streams: set = set()
+        self.__lock = threading.Lock()
+        self.__server = _PushHTTPServer((host, port), self)
+        self.__thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        """The base URL of the server."""
+        host, port = self.__server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> PushServer:
+        """Starts serving in a background thread.
+
+        :return: The server.
+        :rtype: PushServer
+        """
+        self.__thread = threading.Thread(
+            target=self.__server.serve_forever,
+            kwargs={"poll_interval": SHUTDOWN_POLL_INTERVAL},
+            name="safpis-push",
+            daemon=True,
+        )
+        self.__thread.start()
+        return self
+
+    def serve_forever(self) -> None:
+        """Serves in the calling thread until interrupted."""
+        self.__server.serve_forever()
+
+    def stop(self) -> None:
+        """Ends the open event streams, stops serving and closes the socket."""
+        with self.__lock:
+            for stream in self.__streams:
+                stream.put(None)
+        if self.__thread is not None:
+            self.__server.shutdown()
+            self.__thread.join()
+            self.__thread = None
+        self.__server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def respond(self, handler: BaseHTTPRequestHandler) -> None:
+        """Answers a request, called by the request handler threads."""
+        url = urlsplit(handler.path)
+        query = parse_qs(url.query)
+        try:
+            keys = [parse_key(key) for value in query.get("key", []) for key in value.split(",")]
+        except ValueError as exc:
+            _send_json(handler, 400, {"Message": str(exc)})
+            return
+        if url.path == "/prices":
+            _send_json(handler, 200, [asdict(change) for change in self.feed.prices(keys or None)])
+        elif url.path == "/events":
+            last_event_id = handler.headers.get("Last-Event-ID") or query.get("lastEventId", [""])[0]
+            self.__stream(handler, keys or None, self.__since(last_event_id))
+        else:
+            _send_json(handler, 404, {"Message": "No such endpoint."})
+
+    def __since(self, last_event_id: str) -> int | None:
+        """Gets the version of a Last-Event-ID sent by this feed."""
+        epoch, _separator, version = last_event_id.partition(":")
+        return int(version) if epoch == self.feed.epoch and version.isdigit() else None
+
+    def __stream(self, handler: BaseHTTPRequestHandler, keys: list | None, since: int | None) -> None:
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/event-stream; charset=utf-8")
+        handler.send_header("Cache-Control", "no-cache")
+        handler.end_headers()
+
+        stream: queue.Queue = queue.Queue()
+        with self.__lock:
+            self.__streams.add(stream)
+        subscription = self.feed.subscribe(keys, stream.put, since)
+        try:
+            handler.wfile.write(f"retry: {RECONNECT_DELAY}\n\n".encode())
+            handler.wfile.flush()
+            while True:
+                try:
+                    changes = stream.get(timeout=self.heartbeat)
+                except queue.Empty:
+                    handler.wfile.write(b": keep-alive\n\n")
+                    handler.wfile.flush()
+                    continue
+                if changes is None:
+                    break
+                handler.wfile.write("".join(self.__event(change) for change in changes).encode())
+                handler.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            self.feed.unsubscribe(subscription)
+            with self.__lock:
+                self.__streams.discard(stream)
+
+    def __event(self, change: PriceChange) -> str:
+        return f"id: {self.feed.epoch}:{change.version}\nevent: price\ndata: {json.dumps(asdict(change))}\n\n"
+
+
+def _send_json(handler: BaseHTTPRequestHandler, status: int, payload: object) -> None:
+    body = json.dumps(payload).encode()
+    handler.send_response(status)
+    handler.send_header("Content-Type", "application/json; charset=utf-8")
+    handler.send_header("Content-Length", str(len(body)))
+    handler.end_headers()
+    handler.wfile.write(body)
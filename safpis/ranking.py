@@ -0,0 +1,202 @@
+"""Ranking fuel stations by the effective cost of filling up there.
+
+The effective cost of a fill is the cost of a full tank plus the fuel burned
+driving to the fuel station, both at that fuel station's price. Every open
+fuel station selling the fuel is scored in a single pass over the columns of
+a PriceTable.
+"""
+
+from __future__ import annotations
+
+import heapq
+import math
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import TYPE_CHECKING
+
+import pytz
+
+from safpis.geo import distance_matrix
+from safpis.tables import MISSING, UNAVAILABLE_PRICE
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+if TYPE_CHECKING:
+    from safpis.models import FuelStation
+    from safpis.tables import PriceTable
+
+# SAFPIS prices are in tenths of a cent per litre.
+PRICE_UNITS_PER_DOLLAR = 1000
+
+SECONDS_PER_HOUR = 3600
+
+
+@dataclass
+class RankingWeights:
+    """Extra costs, in dollars, added to the effective cost of a fill when
+    ranking fuel stations.
+
+    :param distance: Cost per kilometre to the fuel station, e.g. for time
+        spent driving
+    :param freshness: Cost per hour since the price was last updated
+    :param brands: Cost for each brand ID; negative values favour a brand
+    """
+
+    distance: float = 0.0
+    freshness: float = 0.0
+    brands: dict = field(default_factory=dict)
+
+
+@dataclass
+class RankedStation:
+    """A fuel station ranked by the effective cost of a fill.
+
+    :param site_id: ID of the fuel station
+    :param price: Price of the fuel, in tenths of a cent per litre
+    :param distance_km: Straight-line distance to the fuel station
+    :param fuel_used_litres: Fuel burned driving to the fuel station
+    :param effective_cost: Cost in dollars of a full tank plus the fuel
+        burned driving to the fuel station
+    :param score: The effective cost plus the weighted extra costs; lower is
+        better
+    :param fuel_station: The fuel station, when ranked through Safpis
+    """
+
+    site_id: int
+    price: float
+    distance_km: float
+    fuel_used_litres: float
+    effective_cost: float
+    score: float
+    fuel_station: FuelStation | None = field(default=None)
+
+
+@dataclass
+class _Vehicle:
+    latitude: float
+    longitude: float
+    tank_litres: float
+    litres_per_km: float
+
+
+def rank_effective_cost(
+    table: PriceTable,
+    latitude: float,
+    longitude: float,
+    fuel_id: int,
+    tank_litres: float,
+    consumption: float,
+    k: int = 5,
+    date_time: datetime | None = None,
+    weights: RankingWeights | None = None,
+    *,
+    round_trip: bool = False,
+    mode: str = "haversine",
+) -> list:
+    """Ranks the open fuel stations selling a fuel by the effective cost of
+    a fill.
+
+    :param table: The current prices.
+    :type table: PriceTable
+    :param latitude: The latitude of the vehicle.
+    :type latitude: float
+    :param longitude: The longitude of the vehicle.
+    :type longitude: float
+    :param fuel_id: The ID of the fuel type.
+    :type fuel_id: int
+    :param tank_litres: The volume to fill, in litres.
+    :type tank_litres: float
+    :param consumption: The vehicle's fuel consumption, in litres per 100km.
+    :type consumption: float
+    :param k: The number of fuel stations to return, defaults to 5.
+    :type k: int
+    :param date_time: Only include fuel stations open at this time, defaults
+            to now.
+    :type date_time: datetime, optional
+    :param weights: Extra costs used when ranking, defaults to none.
+    :type weights: RankingWeights, optional
+    :param round_trip: Whether to count the fuel burned returning from the
+            fuel station, defaults to False.
+    :type round_trip: bool
+    :param mode: The distance accuracy mode, defaults to "haversine".
+    :type mode: str
+    :return: A list of up to :param k: RankedStation objects, best first.
+    :rtype: list
+    """
+    if date_time is None:
+        date_time = datetime.now(tz=pytz.timezone("Australia/Adelaide"))
+    vehicle = _Vehicle(latitude, longitude, tank_litres, consumption * (2 if round_trip else 1) / 100)
+    weights = weights if weights is not None else RankingWeights()
+    rank = _numpy_rank if table.uses_numpy else _python_rank
+    return rank(table, vehicle, fuel_id, k, table.stations.open_mask(date_time), weights, mode)
+
+
+def _numpy_rank(table, vehicle, fuel_id, k, open_mask, weights, mode):
+    rows = table["Row"]
+    keep = (table["FuelId"] == fuel_id) & (rows != MISSING) & (table["Price"] != UNAVAILABLE_PRICE)
+    if len(open_mask):
+        keep &= open_mask[np.where(rows != MISSING, rows, 0)]
+    selected = np.flatnonzero(keep)
+    if not len(selected):
+        return []
+
+    prices = table["Price"][selected]
+    origin = [(vehicle.latitude, vehicle.longitude)]
+    distances = distance_matrix(origin, table["Lat"][selected], table["Lng"][selected], mode)[0]
+    fuel_used = distances * vehicle.litres_per_km
+    effective_costs = prices / PRICE_UNITS_PER_DOLLAR * (vehicle.tank_litres + fuel_used)
+    scores = effective_costs + weights.distance * distances
+    if weights.freshness:
+        ages = np.maximum(0.0, time.time() - table["TransactionDateUtc"][selected]) / SECONDS_PER_HOUR
+        scores = scores + weights.freshness * np.nan_to_num(ages)
+    if weights.brands:
+        brands = table["B"][selected]
+        for brand_id, cost in weights.brands.items():
+            scores = scores + np.where(brands == brand_id, cost, 0.0)
+
+    k = min(k, len(selected))
+    best = np.argpartition(scores, k - 1)[:k]
+    best = best[np.argsort(scores[best], kind="stable")]
+    site_ids = table["SiteId"][selected]
+    return [
+        RankedStation(
+            site_id=int(site_ids[i]),
+            price=float(prices[i]),
+            distance_km=float(distances[i]),
+            fuel_used_litres=float(fuel_used[i]),
+            effective_cost=float(effective_costs[i]),
+            score=float(scores[i]),
+        )
+        for i in best.tolist()
+    ]
+
+
+def _python_rank(table, vehicle, fuel_id, k, open_mask, weights, mode):
+    selected = [
+        i
+        for i, (row, price_fuel_id, price) in enumerate(zip(table["Row"], table["FuelId"], table["Price"]))
+        if price_fuel_id == fuel_id and row != MISSING and price != UNAVAILABLE_PRICE and open_mask[row]
+    ]
+    distances = distance_matrix(
+        [(vehicle.latitude, vehicle.longitude)],
+        [table["Lat"][i] for i in selected],
+        [table["Lng"][i] for i in selected],
+        mode,
+    )[0]
+
+    now = time.time()
+    ranked = []
+    for i, distance in zip(selected, distances):
+        price = table["Price"][i]
+        fuel_used = distance * vehicle.litres_per_km
+        effective_cost = price / PRICE_UNITS_PER_DOLLAR * (vehicle.tank_litres + fuel_used)
+        score = effective_cost + weights.distance * distance + weights.brands.get(table["B"][i], 0.0)
+        age = (now - table["TransactionDateUtc"][i]) / SECONDS_PER_HOUR
+        if weights.freshness and not math.isnan(age):
+            score += weights.freshness * max(0.0, age)
+        ranked.append(RankedStation(table["SiteId"][i], price, distance, fuel_used, effective_cost, score))
+    return heapq.nsmallest(k, ranked, key=lambda ranked_station: ranked_station.score)
@@ -0,0 +1,279 @@
+"""Serving stale responses and circuit breakers for upstream outages.
+
+:class:`ResilientTransport` wraps another transport. When a request fails
+after its retries, with a connection error, a timeout or a 5XX response, the
+expired cached response is returned instead if there is one; SafpisAPI
+reports the payloads it decoded from such responses in
+:attr:`SafpisAPI.stale <safpis.api.SafpisAPI.stale>`.
+
+Each endpoint has a :class:`CircuitBreaker`. After ``failure_threshold``
+consecutive failures it opens and, for ``cooldown`` seconds, requests to the
+endpoint are answered from the cache, or fail with
+:class:`CircuitOpenError`, without waiting on the service. After the
+cool-down one request is let through: if it succeeds the breaker closes,
+otherwise it opens again.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable
+from urllib.parse import urlsplit
+
+import requests
+
+from safpis.transport import RequestsTransport, Transport
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_COOLDOWN = 30.0
+
+
+class CircuitBreaker:
+    """Stops calling an endpoint after consecutive failures, until a
+    cool-down period has passed.
+
+    :param name: The name passed to listeners, e.g. the endpoint's path.
+    :type name: str
+    :param failure_threshold: Consecutive failures that open the breaker,
+            defaults to 5.
+    :type failure_threshold: int
+    :param cooldown: Seconds the breaker stays open before a trial request
+            is let through, defaults to 30.
+    :type cooldown: float
+    :param listener: Called with the name, the old state and the new state
+            whenever the state changes, defaults to none.
+    :type listener: Callable[[str, str, str], None], optional
+    :param clock: Gets the time in seconds, defaults to time.monotonic.
+    :type clock: Callable[[], float]
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+        cooldown: float = DEFAULT_COOLDOWN,
+        listener: Callable[[str, str, str], None] | None = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.listener = listener
+        self.clock = clock
+        self.failures = 0
+        self.__state = CLOSED
+        self.__opened_at = 0.0
+        self.__trial = False
+        self.__lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        """The state: "closed", "open" or "half-open"."""
+        return self.__state
+
+    def allow(self) -> bool:
+        """Checks whether a request may be sent. Once the cool-down has
+        passed, the breaker becomes half-open and allows one trial request.
+
+        :return: Whether to send the request.
+        :rtype: bool
+        """
+        with self.__lock:
+            if self.__state == CLOSED:
+                return True
+            if self.__state == OPEN and self.clock() - self.__opened_at >= self.cooldown:
+                self.__change(HALF_OPEN)
+            if self.__state == HALF_OPEN and not self.__trial:
+                self.__trial = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        """Records a successful request, closing the breaker."""
+        with self.__lock:
+            self.failures = 0
+            self.__trial = False
+            self.__change(CLOSED)
+
+    def record_failure(self) -> None:
+        """Records a failed request, opening the breaker after
+        ``failure_threshold`` consecutive failures or a failed trial request.
+        """
+        with self.__lock:
+            self.failures += 1
+            self.__trial = False
+            if self.__state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self.__opened_at = self.clock()
+                self.__change(OPEN)
+
+    def __change(self, state: str) -> None:
+        old, self.__state = self.__state, state
+        if old != state and self.listener is not None:
+            self.listener(self.name, old, state)
+
+
+class ResilientTransport(Transport):
+    """Wraps a transport, serving expired cached responses when requests
+    fail and stopping requests to failing endpoints for a while.
+
+    :param transport: The transport sending the requests, defaults to a
+            RequestsTransport, whose cache provides the stale responses.
+    :type transport: Transport, optional
+    :param failure_threshold: Consecutive failures that open an endpoint's
+            circuit breaker, defaults to 5.
+    :type failure_threshold: int
+    :param cooldown: Seconds an endpoint's breaker stays open, defaults to 30.
+    :type cooldown: float
+    :param max_stale: How long after expiring a cached response may still be
+            served, defaults to no limit.
+    :type max_stale: timedelta, optional
+    :param clock: Gets the time in seconds for the breakers, defaults to
+            time.monotonic.
+    :type clock: Callable[[], float]
+    """
+
+    def __init__(
+        self,
+        transport: Transport | None = None,
+        failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+        cooldown: float = DEFAULT_COOLDOWN,
+        max_stale: timedelta | None = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.transport = transport if transport is not None else RequestsTransport()
+        super().__init__(self.transport.config)
+        self.retry_exceptions = self.transport.retry_exceptions
+        self.accept_encoding = self.transport.accept_encoding
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_stale = max_stale
+        self.clock = clock
+        self.breakers: dict = {}
+        self.__listeners: list = []
+        self.__lock = threading.Lock()
+
+    @property
+    def sessions(self) -> dict:
+        """The requests_cache sessions of the wrapped transport, if any."""
+        return getattr(self.transport, "sessions", {})
+
+    def add_listener(self, listener: Callable[[str, str, str], None]) -> None:
+        """Registers a function to call when an endpoint's circuit breaker
+        changes state.
+
+        :param listener: The function to call with the endpoint's path, the
+                old state and the new state.
+        :type listener: Callable[[str, str, str], None]
+        """
+        self.__listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[str, str, str], None]) -> None:
+        """Unregisters a function added with :meth:`add_listener`.
+
+        :param listener: The function.
+        :type listener: Callable[[str, str, str], None]
+        """
+        self.__listeners.remove(listener)
+
+    def breaker(self, url: str) -> CircuitBreaker:
+        """Gets the circuit breaker of a URL's endpoint.
+
+        :param url: The URL.
+        :type url: str
+        :return: The endpoint's CircuitBreaker object.
+        :rtype: CircuitBreaker
+        """
+        path = urlsplit(url).path
+        with self.__lock:
+            if path not in self.breakers:
+                self.breakers[path] = CircuitBreaker(
+                    path, self.failure_threshold, self.cooldown, self.__notify, self.clock
+                )
+            return self.breakers[path]
+
+    def states(self) -> dict:
+        """Gets the state of every endpoint's circuit breaker.
+
+        :return: The states, keyed by the endpoints' paths.
+        :rtype: dict
+        """
+        return {path: breaker.state for path, breaker in self.breakers.items()}
+
+    def send(self, url: str, headers: dict, params: dict, cache: str, timeout: tuple):
+        return self.transport.send(url, headers, params, cache, timeout)
+
+    def get(self, url: str, headers: dict, params: dict, cache: str = "day"):
+        """Sends a GET request through the wrapped transport, unless the
+        endpoint's circuit breaker is open, falling back to the expired
+        cached response if it fails.
+
+        :param url: The URL.
+        :type url: str
+        :param headers: The request headers.
+        :type headers: dict
+        :param params: The query parameters.
+        :type params: dict
+        :param cache: How long the response may be cached: 'day' or
+                'minute', defaults to 'day'.
+        :type cache: str
+        :raises CircuitOpenError: if the breaker is open and there is no
+                cached response.
+        :raises retry_exceptions: if the request fails to connect or times
+                out and there is no cached response.
+        :return: The response, or the expired cached response.
+        """
+        breaker = self.breaker(url)
+        if not breaker.allow():
+            stale = self.cached(url, headers, params, cache)
+            if stale is None:
+                msg = f"The circuit breaker of {breaker.name} is open."
+                raise CircuitOpenError(msg)
+            return stale
+
+        try:
+            response = self.transport.get(url, headers, params, cache)
+        except self.retry_exceptions:
+            breaker.record_failure()
+            stale = self.cached(url, headers, params, cache)
+            if stale is None:
+                raise
+            return stale
+        except BaseException:
+            # Any other exception still ends a half-open trial request.
+            breaker.record_failure()
+            raise
+        if response.status_code in self.config.retry_statuses:
+            breaker.record_failure()
+            stale = self.cached(url, headers, params, cache)
+            return response if stale is None else stale
+        breaker.record_success()
+        return response
+
+    def cached(self, url: str, headers: dict, params: dict, cache: str = "day"):
+        """Gets the cached response to a GET request, if it expired no longer
+        ago than ``max_stale``.
+        """
+        response = self.transport.cached(url, headers, params, cache)
+        if response is None or self.max_stale is None or response.expires is None:
+            return response
+        if datetime.now(timezone.utc) - response.expires > self.max_stale:
+            return None
+        return response
+
+    def close(self) -> None:
+        self.transport.close()
+
+    def __notify(self, name: str, old: str, new: str) -> None:
+        for listener in self.__listeners:
+            listener(name, old, new)
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """Exception for a request not sent because the endpoint's circuit
+    breaker is open, when there is no cached response to serve instead."""
@@ -0,0 +1,82 @@
+"""Searching for fuel stations within a corridor around a route."""
+
+from __future__ import annotations
+
+import math
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Sequence
+
+from safpis.geo import KM_PER_DEGREE, cells_in_box, haversine_km, point_segment_distance_km
+
+if TYPE_CHECKING:
+    from safpis.geo import GridIndex
+    from safpis.models import FuelStation, FuelStationPrice
+
+
+@dataclass
+class RouteStation:
+    """A fuel station near a route.
+
+    :param fuel_station: The fuel station
+    :param price: The price of the requested fuel at the fuel station
+    :param distance_from_route_km: Distance from the closest point of the
+        route to the fuel station
+    :param detour_km: Extra distance travelled to visit the fuel station and
+        return to the route
+    :param route_km: Distance along the route to its closest point to the
+        fuel station
+    """
+
+    fuel_station: FuelStation
+    price: FuelStationPrice
+    distance_from_route_km: float
+    detour_km: float
+    route_km: float
+
+
+def corridor_candidates(index: GridIndex, polyline: Sequence[tuple], buffer_km: float) -> dict:
+    """Finds the points of a GridIndex within a distance of a route.
+
+    Only the grid cells overlapping each segment's bounding box, widened by
+    :param buffer_km:, are searched.
+
+    :param index: The points to search.
+    :type index: GridIndex
+    :param polyline: The route, as a sequence of (latitude, longitude)
+            tuples.
+    :type polyline: Sequence[tuple]
+    :param buffer_km: The maximum distance from the route in kilometres.
+    :type buffer_km: float
+    :raises ValueError: if :param polyline: is empty.
+    :return: A dict mapping each key found to a tuple of its distance from
+            the route and the distance along the route to its closest point,
+            both in kilometres.
+    :rtype: dict
+    """
+    if not polyline:
+        msg = "polyline must contain at least one point."
+        raise ValueError(msg)
+    polyline = [tuple(point) for point in polyline]
+    if len(polyline) == 1:
+        polyline = polyline * 2
+
+    found: dict = {}
+    route_km = 0.0
+    for start, end in zip(polyline, polyline[1:]):
+        segment_km = haversine_km(*start, *end)
+        dlatitude = buffer_km / KM_PER_DEGREE
+        widest = min(max(abs(start[0]), abs(end[0])) + dlatitude, 89.9)
+        dlongitude = buffer_km / (KM_PER_DEGREE * math.cos(math.radians(widest)))
+        cells = cells_in_box(
+            min(start[0], end[0]) - dlatitude,
+            min(start[1], end[1]) - dlongitude,
+            max(start[0], end[0]) + dlatitude,
+            max(start[1], end[1]) + dlongitude,
+            index.cell_size,
+        )
+        for key in index.keys_in_cells(cells):
+            distance, fraction = point_segment_distance_km(*index.points[key], start, end)
+            if distance <= buffer_km and (key not in found or distance < found[key][0]):
+                found[key] = (distance, route_km + fraction * segment_km)
+        route_km += segment_km
+    return found
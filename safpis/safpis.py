@@ -1,23 +1,190 @@
 from __future__ import annotations
 
+import heapq
 from configparser import ConfigParser
+from operator import attrgetter
 from os import environ
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Callable, Sequence
 
+from safpis import frames
+from safpis.analytics import price_statistics
 from safpis.api import SafpisAPI
-from safpis.models import Brand, Fuel, FuelStation, FuelStationPrice
+from safpis.competitors import DEFAULT_COMPETITORS, DEFAULT_MAX_KM, CompetitorGraph
+from safpis.export import DATASETS
+from safpis.geo import GridIndex, distance_matrix, nearest
+from safpis.heatmap import DEFAULT_ZOOMS, PriceHeatmap
+from safpis.indexes import AttributeIndex
+from safpis.models import (
+    Brand,
+    Fuel,
+    FuelStation,
+    FuelStationPrice,
+    NumericFuelStationPrice,
+    StationChanges,
+    as_site_id,
+)
+from safpis.profiling import profiled, span
+from safpis.ranking import RankingWeights, rank_effective_cost
+from safpis.routes import RouteStation, corridor_candidates
+from safpis.search import SearchIndex
+from safpis.tables import UNAVAILABLE_PRICE, PriceTable, StationTable
 
 if TYPE_CHECKING:
     from datetime import datetime
 
+    from safpis.memo import QueryCache
+
 
 class Safpis:
-    def __init__(self):
-        self.__api = SafpisAPI()
-        self.__brands = self._api().GetCountryBrands()["Brands"]
-        self.__fuels = self._api().GetCountryFuelTypes()["Fuels"]
-        self.__regions = self._api().GetCountryGeographicRegions()["GeographicRegions"]
-        self.__fuel_stations = self._api().GetFullSiteDetails()["S"]
+    def __init__(
+        self,
+        api: SafpisAPI | None = None,
+        query_cache: QueryCache | None = None,
+        *,
+        numeric_prices: bool = False,
+    ):
+        self.__api = api if api is not None else SafpisAPI()
+        self.__query_cache = query_cache
+        # Whether prices are returned as NumericFuelStationPrice objects.
+        self.__numeric_prices = numeric_prices
+        self.__reference_version = 0
+        self.__price_version = 0
+        self.__price_fingerprint: str | None = None
+        self.__fingerprints: dict = {}
+        self.__brands: list = []
+        self.__fuels: list = []
+        self.__regions: list = []
+        self.__fuel_stations: list = []
+        self.__fuel_stations_by_id: dict = {}
+        self.__parsed_fuel_stations: dict = {}
+        self.__station_listeners: list = []
+        self.__station_grid: GridIndex | None = None
+        self.__station_table: StationTable | None = None
+        self.__search_index: SearchIndex | None = None
+        self.__attribute_index: AttributeIndex | None = None
+        # PriceHeatmap objects keyed by their zoom levels.
+        self.__heatmaps: dict = {}
+        # CompetitorGraph objects keyed by (k, max_km).
+        self.__competitor_graphs: dict = {}
+        self.refresh()
+
+    def __fetch(self, endpoint: str, key: str):
+        """Fetches a payload from an endpoint, returning None if it is
+        unchanged since it was last fetched.
+        """
+        payload, self.__fingerprints[endpoint] = self._api().fetch(endpoint, self.__fingerprints.get(endpoint))
+        return None if payload is None else payload[key]
+
+    @profiled
+    def refresh(self):
+        """Reloads the brands, fuels, regions and fuel stations if they have
+        changed.
+
+        Payloads that are unchanged since they were last loaded are not
+        decoded again. Fuel stations that were added, removed or edited are
+        updated individually, along with any indexes derived from them.
+
+        :return: The changes made to the fuel stations.
+        :rtype: StationChanges
+        """
+        brands = self.__fetch("GetCountryBrands", "Brands")
+        if brands is not None:
+            self.__brands = brands
+            if self.__search_index is not None:
+                self.__search_index.set_brand_names(self.__brand_names())
+        fuels = self.__fetch("GetCountryFuelTypes", "Fuels")
+        if fuels is not None:
+            self.__fuels = fuels
+        regions = self.__fetch("GetCountryGeographicRegions", "GeographicRegions")
+        if regions is not None:
+            self.__regions = regions
+
+        changes = StationChanges()
+        fuel_stations = self.__fetch("GetFullSiteDetails", "S")
+        if fuel_stations is not None:
+            changes = StationChanges.between(
+                self.__fuel_stations_by_id,
+                {fuel_station["S"]: fuel_station for fuel_station in fuel_stations},
+            )
+            if changes:
+                self._apply_station_changes(changes)
+        if brands is not None or fuels is not None or regions is not None or changes:
+            self.__reference_changed()
+        return changes
+
+    def __reference_changed(self):
+        self.__reference_version += 1
+        if self.__query_cache is not None:
+            self.__query_cache.invalidate("reference")
+
+    def __current_price_version(self):
+        """Gets the version of the prices, checking whether they changed
+        without decoding them if they did not.
+        """
+        payload, self.__price_fingerprint = self._api().fetch("GetSitesPrices", self.__price_fingerprint)
+        if payload is not None:
+            self.__price_version += 1
+            self.__query_cache.invalidate("prices")
+        return self.__price_version
+
+    def __cached(self, query: str, compute: Callable, arguments: tuple, depends_on: tuple = ("reference",)):
+        """Answers a query from the query cache, if there is one. Misses are
+        computed with the caller's arguments, and only cached if the data
+        they were computed from is still the version in the key.
+        """
+        if self.__query_cache is None:
+            return compute(*arguments)
+
+        def current_versions():
+            if "prices" in depends_on:
+                return (self.__reference_version, self.__current_price_version())
+            return (self.__reference_version,)
+
+        versions = current_versions()
+        key = self.__query_cache.key(query, arguments, versions)
+        # Copied, so callers can't change the cached result.
+        return list(
+            self.__query_cache.get_or_compute(
+                key,
+                lambda: compute(*arguments),
+                depends_on,
+                is_current=lambda: current_versions() == versions,
+            )
+        )
+
+    def _apply_station_changes(self, changes: StationChanges):
+        for fuel_station in changes.removed:
+            del self.__fuel_stations_by_id[fuel_station["S"]]
+            self.__parsed_fuel_stations.pop(fuel_station["S"], None)
+        for _old, fuel_station in changes.changed:
+            self.__fuel_stations_by_id[fuel_station["S"]] = fuel_station
+            self.__parsed_fuel_stations.pop(fuel_station["S"], None)
+        for fuel_station in changes.added:
+            self.__fuel_stations_by_id[fuel_station["S"]] = fuel_station
+        self.__fuel_stations = list(self.__fuel_stations_by_id.values())
+        self.__station_table = None
+
+        for listener in self.__station_listeners:
+            listener(changes)
+
+    def add_station_listener(self, listener: Callable[[StationChanges], None]):
+        """Registers a function to be called with the StationChanges whenever
+        fuel stations are added, removed or edited by :meth:`refresh`.
+
+        :param listener: The function to call.
+        :type listener: Callable[[StationChanges], None]
+        """
+        self.__station_listeners.append(listener)
+
+    def remove_station_listener(self, listener: Callable[[StationChanges], None]):
+        """Stops calling a function registered with
+        :meth:`add_station_listener`.
+
+        :param listener: The function to stop calling.
+        :type listener: Callable[[StationChanges], None]
+        :raises ValueError: if the function is not registered.
+        """
+        self.__station_listeners.remove(listener)
 
     @staticmethod
     def load_token(
@@ -32,9 +199,22 @@ class Safpis:
     def _api(self):
         return self.__api
 
+    def _fuel_station_price(self, site_price: dict):
+        if self.__numeric_prices:
+            return NumericFuelStationPrice.from_payload(site_price)
+        return FuelStationPrice(**site_price)
+
+    def __price_amount(self, fuel_station_price):
+        """Gets the price to sort by: an int in numeric mode, so no Money
+        objects are built."""
+        if self.__numeric_prices:
+            return fuel_station_price.tenths
+        return fuel_station_price.Price.amount
+
     def _brands(self):
         return self.__brands
 
+    @profiled
     def brand_by_id(self, brand_id: int):
         """Gets a Brand object by brand ID.
 
@@ -50,6 +230,7 @@ class Safpis:
             raise ToManyResultsError(what, brand_id)
         return brands[0]
 
+    @profiled
     def brand_by_name(self, brand_name: str):
         """Gets a Brand object by brand name.
 
@@ -68,6 +249,7 @@ class Safpis:
     def _fuels(self):
         return self.__fuels
 
+    @profiled
     def fuel_by_id(self, fuel_id: int):
         """Gets a Fuel object by fuel ID.
 
@@ -83,6 +265,7 @@ class Safpis:
             raise ToManyResultsError(what, fuel_id)
         return fuels[0]
 
+    @profiled
     def fuel_by_name(self, fuel_name: str):
         """Gets a Fuel object by fuel name.
 
@@ -101,6 +284,69 @@ class Safpis:
     def _fuel_stations(self):
         return self.__fuel_stations
 
+    def _fuel_station(self, fuel_station: dict):
+        """Gets the FuelStation object for a fuel station record, parsing it
+        only the first time it is requested.
+        """
+        parsed = self.__parsed_fuel_stations.get(fuel_station["S"])
+        if parsed is None:
+            parsed = FuelStation(**fuel_station)
+            self.__parsed_fuel_stations[fuel_station["S"]] = parsed
+        return parsed
+
+    def _station_table(self):
+        """Gets the fuel stations as a column-oriented table, built on first
+        use after each change to the fuel stations.
+        """
+        if self.__station_table is None:
+            self.__station_table = StationTable.from_payload(self._fuel_stations())
+        return self.__station_table
+
+    def _station_grid(self):
+        """Gets a spatial index of the fuel stations, built on first use and
+        kept up to date by :meth:`refresh`.
+        """
+        if self.__station_grid is None:
+            self.__station_grid = GridIndex.from_fuel_stations(self._fuel_stations())
+            self.add_station_listener(self.__station_grid.apply_station_changes)
+        return self.__station_grid
+
+    def _attribute_index(self):
+        """Gets inverted indexes of the fuel stations' brand, postcode and
+        regions, built on first use and kept up to date by :meth:`refresh`.
+        """
+        if self.__attribute_index is None:
+            self.__attribute_index = AttributeIndex.from_fuel_stations(self._fuel_stations())
+            self.add_station_listener(self.__attribute_index.apply_station_changes)
+        return self.__attribute_index
+
+    def __brand_names(self):
+        return {brand["BrandId"]: brand["Name"] for brand in self.__brands}
+
+    def _search_index(self):
+        """Gets a search index of the fuel stations, built on first use and
+        kept up to date by :meth:`refresh`.
+        """
+        if self.__search_index is None:
+            self.__search_index = SearchIndex.from_fuel_stations(self._fuel_stations(), self.__brand_names())
+            self.add_station_listener(self.__search_index.apply_station_changes)
+        return self.__search_index
+
+    @profiled
+    def search_fuel_stations(self, query: str, limit: int = 10):
+        """Searches the fuel stations' names, addresses, postcodes and brand
+        names, matching each word of the query by prefix or with a few typos.
+
+        :param query: The query, e.g. as typed so far into a search box.
+        :type query: str
+        :param limit: The maximum number of fuel stations, defaults to 10.
+        :type limit: int
+        :return: A list of FuelStation objects, best match first.
+        :rtype: List
+        """
+        return [self.fuel_station_by_id(site_id) for site_id, _score in self._search_index().search(query, limit=limit)]
+
+    @profiled
     def fuel_station_by_id(self, fuel_station_id: int):
         """Gets a FuelStation object by fuel station ID.
 
@@ -108,18 +354,13 @@ class Safpis:
         :type fuel_station_id: int
         :return: A FuelStation object.
         """
-        fuel_stations = [
-            FuelStation(**fuel_station)
-            for fuel_station in self._fuel_stations()
-            if fuel_station["S"] == fuel_station_id
-        ]
+        fuel_station = self.__fuel_stations_by_id.get(fuel_station_id)
         what = "fuel station"
-        if not fuel_stations:
+        if fuel_station is None:
             raise NoResultsError(what, fuel_station_id)
-        if len(fuel_stations) > 1:
-            raise ToManyResultsError(what, fuel_station_id)
-        return fuel_stations[0]
+        return self._fuel_station(fuel_station)
 
+    @profiled
     def fuel_station_by_name(self, fuel_station_name: str):
         """Gets a FuelStation object by fuel station name.
 
@@ -128,7 +369,7 @@ class Safpis:
         :return: A FuelStation object.
         """
         fuel_stations = [
-            FuelStation(**fuel_station)
+            self._fuel_station(fuel_station)
             for fuel_station in self._fuel_stations()
             if fuel_station["N"] == fuel_station_name
         ]
@@ -139,6 +380,7 @@ class Safpis:
             raise ToManyResultsError(what, fuel_station_name)
         return fuel_stations[0]
 
+    @profiled
     def fuel_stations_by_brand_name(self, brand_name: str):
         """Gets a list of FuelStation objects by brand name.
 
@@ -146,16 +388,34 @@ class Safpis:
         :type brand_name: int
         :return: A list of FuelStation object.
         """
-        fuel_stations = [
-            FuelStation(**fuel_station)
-            for fuel_station in self._fuel_stations()
-            if fuel_station["B"] == self.brand_by_name(brand_name).BrandId
-        ]
+        site_ids = self._attribute_index().lookup("B", self.brand_by_name(brand_name).BrandId)
         what = "fuel station"
-        if not fuel_stations:
+        if not site_ids:
             raise NoResultsError(what, brand_name)
-        return fuel_stations
+        return [self.fuel_station_by_id(site_id) for site_id in sorted(site_ids)]
+
+    @profiled
+    def filter_fuel_stations(self, brand_names: Sequence[str] = (), **criteria):
+        """Gets the fuel stations matching every criterion, e.g.
+        ``filter_fuel_stations(brand_names=["Caltex", "United"], P=["5094", "5095"])``.
+
+        :param brand_names: The names of the brands to match, defaults to any
+                brand.
+        :type brand_names: Sequence[str]
+        :param criteria: The values to match for any of the fields "B", "P"
+                and "G1" to "G5", each as a value or a list of values. A fuel
+                station matches a criterion if its field has any of the
+                values.
+        :return: A list of FuelStation objects, ordered by ID.
+        :rtype: List
+        """
+        site_ids = self._attribute_index().filter(**criteria)
+        if brand_names:
+            brand_ids = [self.brand_by_name(brand_name).BrandId for brand_name in brand_names]
+            site_ids &= self._attribute_index().lookup("B", brand_ids)
+        return [self.fuel_station_by_id(site_id) for site_id in sorted(site_ids)]
 
+    @profiled
     def closest_fuel_stations(self, latitude: float, longitude: float):
         """Gets a list of FuelStation objects with associated distances from of
         a latitude/longitude location.
@@ -167,17 +427,63 @@ class Safpis:
         :return: A list of FuelStation object.
         :rtype: List
         """
-        fuel_stations = [FuelStation(**fuel_station) for fuel_station in self._fuel_stations()]
+        return self.__cached("closest_fuel_stations", self.__closest_fuel_stations, (latitude, longitude))
+
+    def __closest_fuel_stations(self, latitude: float, longitude: float):
+        with span("parse"):
+            fuel_stations = [self._fuel_station(fuel_station) for fuel_station in self._fuel_stations()]
         # filtered_fuel_stations = filter(
         #    lambda fuel_station: fuel_station.distance(latitude, longitude)
         #    <= max_distance,
         #    fuel_stations,
         # )
-        return sorted(
-            fuel_stations,
-            key=lambda fuel_station: fuel_station.distance(latitude, longitude),
-        )
+        with span("geodesic"):
+            distances = [fuel_station.distance(latitude, longitude) for fuel_station in fuel_stations]
+        with span("sort"):
+            order = sorted(range(len(fuel_stations)), key=distances.__getitem__)
+        return [fuel_stations[i] for i in order]
+
+    @profiled
+    def distance_matrix(self, origins: Sequence[tuple], mode: str = "ellipsoidal"):
+        """Gets the distance from each of many origins to every fuel station,
+        computed for all pairs at once.
+
+        :param origins: The origins, as (latitude, longitude) tuples.
+        :type origins: Sequence[tuple]
+        :param mode: The accuracy mode, one of "haversine", "ellipsoidal" or
+                "geodesic" (exact, but slow), defaults to "ellipsoidal".
+        :type mode: str
+        :return: The fuel station IDs and the distances in kilometres, with
+                one row per origin and one column per fuel station ID.
+        :rtype: tuple
+        """
+        station_table = self._station_table()
+        matrix = distance_matrix(origins, station_table["Lat"], station_table["Lng"], mode=mode)
+        return (list(self.__fuel_stations_by_id), matrix)
+
+    @profiled
+    def nearest_fuel_stations(self, origins: Sequence[tuple], k: int = 5, mode: str = "ellipsoidal"):
+        """Gets the k nearest fuel stations to each of many origins.
+
+        :param origins: The origins, as (latitude, longitude) tuples.
+        :type origins: Sequence[tuple]
+        :param k: The number of fuel stations for each origin, defaults to 5.
+        :type k: int
+        :param mode: The accuracy mode, one of "haversine", "ellipsoidal" or
+                "geodesic" (exact, but slow), defaults to "ellipsoidal".
+        :type mode: str
+        :return: For each origin, a list of (FuelStation, distance in
+                kilometres) tuples, closest first.
+        :rtype: List
+        """
+        station_table = self._station_table()
+        fuel_stations = self._fuel_stations()
+        return [
+            [(self._fuel_station(fuel_stations[position]), distance) for position, distance in closest]
+            for closest in nearest(origins, station_table["Lat"], station_table["Lng"], k, mode=mode)
+        ]
 
+    @profiled
     def open_fuel_stations(self, datetime: datetime):
         """Gets a list of FuelStation objects for fuel stations open on the
         requested datetime.
@@ -186,13 +492,88 @@ class Safpis:
         :type datetime: datetime
         :return: A list of FuelStation object.
         """
-        fuel_stations = [FuelStation(**fuel_station) for fuel_station in self._fuel_stations()]
-        filtered_fuel_stations = filter(lambda fuel_station: fuel_station.is_open(datetime), fuel_stations)
-
-        return list(filtered_fuel_stations)
+        return self.__cached("open_fuel_stations", self.__open_fuel_stations, (datetime,))
+
+    def __open_fuel_stations(self, datetime: datetime):
+        with span("parse"):
+            fuel_stations = [self._fuel_station(fuel_station) for fuel_station in self._fuel_stations()]
+        with span("filter"):
+            filtered_fuel_stations = filter(lambda fuel_station: fuel_station.is_open(datetime), fuel_stations)
+            return list(filtered_fuel_stations)
+
+    @profiled
+    def cheapest_along_route(
+        self,
+        polyline: Sequence[tuple],
+        buffer_km: float,
+        fuel_name: str,
+        k: int = 5,
+        date_time: datetime | None = None,
+        detour_cost: float = 0.0,
+    ):
+        """Gets the cheapest fuel stations selling a fuel within a distance of
+        a route.
+
+        Fuel stations are ranked by price plus :param detour_cost: for each
+        kilometre of detour, then by detour. The detour is taken as the
+        distance from the route to the fuel station and back.
+
+        :param polyline: The route, as a sequence of (latitude, longitude)
+                tuples.
+        :type polyline: Sequence[tuple]
+        :param buffer_km: The maximum distance from the route in kilometres.
+        :type buffer_km: float
+        :param fuel_name: The name of a fuel type.
+        :type fuel_name: str
+        :param k: The number of fuel stations to return, defaults to 5.
+        :type k: int
+        :param date_time: Only include fuel stations open at this time, defaults
+                to now.
+        :type date_time: datetime, optional
+        :param detour_cost: The cost, in the units of the fuel price, added
+                for each kilometre of detour, defaults to 0.
+        :type detour_cost: float
+        :return: A list of up to :param k: RouteStation objects, best first.
+        :rtype: List
+        """
+        # Keyed by the prices' "SiteId", whatever the type of the "S" the fuel
+        # stations are found by.
+        candidates = {
+            as_site_id(site_id): (site_id, found)
+            for site_id, found in corridor_candidates(self._station_grid(), polyline, buffer_km).items()
+        }
+        fuel_id = self.fuel_by_name(fuel_name).FuelId
+        route_stations = []
+        for site_price in self._api().GetSitesPrices()["SitePrices"]:
+            candidate = candidates.get(site_price["SiteId"])
+            if site_price["FuelId"] != fuel_id or candidate is None or site_price["Price"] == UNAVAILABLE_PRICE:
+                continue
+            site_id, (distance, route_km) = candidate
+            fuel_station = self.fuel_station_by_id(site_id)
+            if not fuel_station.is_open(date_time):
+                continue
+            route_stations.append(
+                RouteStation(
+                    fuel_station=fuel_station,
+                    price=self._fuel_station_price(site_price),
+                    distance_from_route_km=distance,
+                    detour_km=2 * distance,
+                    route_km=route_km,
+                ),
+            )
+        return heapq.nsmallest(
+            k,
+            route_stations,
+            key=lambda route_station: (
+                float(self.__price_amount(route_station.price)) + detour_cost * route_station.detour_km,
+                route_station.detour_km,
+            ),
+        )
 
+    @profiled
     def cheapest_fuel_type(self, fuel_name: str):
-        """Gets a list of FuelStationPrice objects for a particular fuel.
+        """Gets a list of FuelStationPrice objects for a particular fuel, or
+        NumericFuelStationPrice objects in numeric mode.
 
         :param fuel_name: The name of a fuel type.
         :type fuel_name: str
@@ -200,19 +581,37 @@ class Safpis:
                 costliest.
         :rtype: List
         """
-        fuel_station_prices = [
-            FuelStationPrice(**fuel_station_price) for fuel_station_price in self._api().GetSitesPrices()["SitePrices"]
-        ]
+        return self.__cached(
+            "cheapest_fuel_type", self.__cheapest_fuel_type, (fuel_name,), depends_on=("reference", "prices")
+        )
+
+    def __cheapest_fuel_type(self, fuel_name: str):
+        site_prices = self._api().GetSitesPrices()["SitePrices"]
         fuel_id = self.fuel_by_name(fuel_name).FuelId
+        if self.__numeric_prices:
+            # Filter the records before parsing them, and sort on the ints.
+            with span("parse"):
+                fuel_station_prices = [
+                    NumericFuelStationPrice.from_payload(site_price)
+                    for site_price in site_prices
+                    if site_price["FuelId"] == fuel_id
+                ]
+            with span("sort"):
+                fuel_station_prices.sort(key=attrgetter("tenths"))
+                return fuel_station_prices
+        with span("parse"):
+            fuel_station_prices = [FuelStationPrice(**fuel_station_price) for fuel_station_price in site_prices]
         filtered_fuel_station_prices = filter(
             lambda fuel_station_price: fuel_station_price.FuelId == fuel_id,
             fuel_station_prices,
         )
-        return sorted(
-            filtered_fuel_station_prices,
-            key=lambda fuel_station_price: fuel_station_price.Price.amount,
-        )
+        with span("sort"):
+            return sorted(
+                filtered_fuel_station_prices,
+                key=lambda fuel_station_price: fuel_station_price.Price.amount,
+            )
 
+    @profiled
     def price(self, fuel_station_id: int, fuel_id: int):
         """Function to return the current price of a particular fuel at a
         particular fuel station.
@@ -224,9 +623,16 @@ class Safpis:
         :return: The price of the fuel.
         :rtype: Decimal
         """
-        fuel_station_prices = [
-            FuelStationPrice(**fuel_station_price) for fuel_station_price in self._api().GetSitesPrices()["SitePrices"]
-        ]
+        site_prices = self._api().GetSitesPrices()["SitePrices"]
+        if self.__numeric_prices:
+            with span("parse"):
+                return [
+                    NumericFuelStationPrice.from_payload(site_price)
+                    for site_price in site_prices
+                    if site_price["FuelId"] == fuel_id and site_price["SiteId"] == fuel_station_id
+                ]
+        with span("parse"):
+            fuel_station_prices = [FuelStationPrice(**fuel_station_price) for fuel_station_price in site_prices]
         filtered_fuel_station_prices = filter(
             lambda fuel_station_price: (
                 fuel_station_price.FuelId == fuel_id and fuel_station_price.SiteId == fuel_station_id
@@ -235,6 +641,185 @@ class Safpis:
         )
         return list(filtered_fuel_station_prices)
 
+    @profiled
+    def price_table(self):
+        """Gets the current fuel station prices as a column-oriented table
+        joined to each fuel station's brand, postcode and regions.
+
+        :return: A PriceTable object.
+        :rtype: PriceTable
+        """
+        site_prices = self._api().GetSitesPrices()["SitePrices"]
+        with span("tabulate"):
+            return PriceTable.from_payloads(self._station_table(), site_prices)
+
+    @profiled
+    def price_heatmap(self, zooms: Sequence[int] = DEFAULT_ZOOMS):
+        """Gets the minimum, median and count of the current prices of each
+        fuel in each map tile, at several zoom levels. One heatmap is built
+        for each set of zoom levels and kept up to date by :meth:`refresh`;
+        calling this again updates its prices to the current ones.
+
+        :param zooms: The zoom levels, defaults to (6, 8, 10, 12, 14).
+        :type zooms: Sequence[int]
+        :return: A PriceHeatmap object.
+        :rtype: PriceHeatmap
+        """
+        site_prices = self._api().GetSitesPrices()["SitePrices"]
+        heatmap = self.__heatmaps.get(tuple(zooms))
+        if heatmap is not None:
+            with span("aggregate"):
+                heatmap.apply_site_prices(site_prices)
+            return heatmap
+        with span("aggregate"):
+            heatmap = PriceHeatmap.from_payloads(self._fuel_stations(), site_prices, zooms)
+        self.__heatmaps[tuple(zooms)] = heatmap
+        self.add_station_listener(heatmap.apply_station_changes)
+        return heatmap
+
+    @profiled
+    def competitor_graph(self, k: int = DEFAULT_COMPETITORS, max_km: float = DEFAULT_MAX_KM):
+        """Gets the k nearest competitors of every fuel station and how each
+        of its current prices compares to the median of theirs. One graph is
+        built for each k and max_km and rebuilt when fuel stations are added,
+        removed or moved by :meth:`refresh`; calling this again updates its
+        prices to the current ones.
+
+        :param k: The number of competitors of each fuel station, defaults to
+                5.
+        :type k: int
+        :param max_km: The furthest a competitor can be, in kilometres,
+                defaults to 25.
+        :type max_km: float
+        :return: A CompetitorGraph object.
+        :rtype: CompetitorGraph
+        """
+        site_prices = self._api().GetSitesPrices()["SitePrices"]
+        graph = self.__competitor_graphs.get((k, max_km))
+        if graph is not None:
+            with span("build"):
+                graph.apply_site_prices(site_prices)
+            return graph
+        with span("build"):
+            graph = CompetitorGraph.from_payloads(self._fuel_stations(), site_prices, k, max_km)
+        self.__competitor_graphs[(k, max_km)] = graph
+        self.add_station_listener(graph.apply_station_changes)
+        return graph
+
+    @profiled
+    def price_statistics(
+        self,
+        by: Sequence[str] = ("FuelId",),
+        percentiles: Sequence[float] = (10, 25, 75, 90),
+    ):
+        """Gets summary statistics of the current fuel station prices, grouped
+        by fuel, brand, postcode and/or region.
+
+        :param by: The columns to group by, any of "FuelId", "B", "P" or "G1"
+                to "G5", defaults to ("FuelId",).
+        :type by: Sequence[str]
+        :param percentiles: The percentiles (0-100) to compute for each group,
+                defaults to (10, 25, 75, 90).
+        :type percentiles: Sequence[float]
+        :return: A dict mapping each group's key to a PriceStatistics object.
+        :rtype: dict
+        """
+        return price_statistics(self.price_table(), by=by, percentiles=percentiles)
+
+    @profiled
+    def to_arrow(self, dataset: str = "joined"):
+        """Gets the fuel stations, their current prices or both joined
+        together as an Arrow table with categorical brand and fuel names.
+        Requires pyarrow.
+
+        :param dataset: One of "stations", "prices" or "joined", defaults to
+                "joined".
+        :type dataset: str
+        :raises ValueError: if dataset is not recognised.
+        :raises ImportError: if pyarrow is not installed.
+        :return: A pyarrow.Table.
+        """
+        if dataset not in DATASETS:
+            msg = f"dataset must be one of {DATASETS!r}."
+            raise ValueError(msg)
+        if dataset == "stations":
+            return frames.stations_to_arrow(self._fuel_stations(), self.__brand_names())
+        site_prices = self._api().GetSitesPrices()["SitePrices"]
+        fuel_names = {fuel["FuelId"]: fuel["Name"] for fuel in self._fuels()}
+        with span("tabulate"):
+            if dataset == "prices":
+                return frames.prices_to_arrow(site_prices, fuel_names)
+            return frames.joined_to_arrow(self._fuel_stations(), site_prices, self.__brand_names(), fuel_names)
+
+    def to_pandas(self, dataset: str = "joined"):
+        """Gets the fuel stations, their current prices or both joined
+        together as a pandas DataFrame. Requires pandas and pyarrow.
+
+        :param dataset: One of "stations", "prices" or "joined", defaults to
+                "joined".
+        :type dataset: str
+        :raises ValueError: if dataset is not recognised.
+        :raises ImportError: if pandas or pyarrow is not installed.
+        :return: A pandas.DataFrame.
+        """
+        return frames.to_pandas(self.to_arrow(dataset))
+
+    @profiled
+    def rank_fuel_stations(
+        self,
+        latitude: float,
+        longitude: float,
+        fuel_name: str,
+        tank_litres: float,
+        consumption: float,
+        k: int = 5,
+        date_time: datetime | None = None,
+        weights: RankingWeights | None = None,
+    ):
+        """Ranks the open fuel stations selling a fuel by the effective cost of
+        filling up there: the cost of :param tank_litres: of fuel plus the
+        fuel burned driving to the fuel station.
+
+        :param latitude: The latitude of the vehicle.
+        :type latitude: float
+        :param longitude: The longitude of the vehicle.
+        :type longitude: float
+        :param fuel_name: The name of a fuel type.
+        :type fuel_name: str
+        :param tank_litres: The volume to fill, in litres.
+        :type tank_litres: float
+        :param consumption: The vehicle's fuel consumption, in litres per
+                100km.
+        :type consumption: float
+        :param k: The number of fuel stations to return, defaults to 5.
+        :type k: int
+        :param date_time: Only include fuel stations open at this time, defaults
+                to now.
+        :type date_time: datetime, optional
+        :param weights: Extra costs for distance, price age and brand, defaults
+                to none.
+        :type weights: RankingWeights, optional
+        :return: A list of up to :param k: RankedStation objects, best first.
+        :rtype: List
+        """
+        fuel_id = self.fuel_by_name(fuel_name).FuelId
+        table = self.price_table()
+        ranked_stations = rank_effective_cost(
+            table,
+            latitude,
+            longitude,
+            fuel_id,
+            tank_litres,
+            consumption,
+            k=k,
+            date_time=date_time,
+            weights=weights,
+        )
+        for ranked_station in ranked_stations:
+            # The table holds the site IDs as ints, whatever the type of "S".
+            ranked_station.fuel_station = self._fuel_station(table.stations.record_for(ranked_station.site_id))
+        return ranked_stations
+
 
 class NoResultsError(Exception):
     """Exception raised when no results are returned from the REST API."""
@@ -0,0 +1,279 @@
+"""Prefix and typo-tolerant search over fuel station names, addresses,
+postcodes and brand names, for autocompletion.
+
+Each field is split into lower-case words. Words are kept in a sorted list,
+so the words starting with a prefix are found by bisection, and in a trigram
+index, so words within a small edit distance of a misspelt prefix are found
+without comparing the query with every word.
+"""
+
+from __future__ import annotations
+
+import heapq
+import re
+from bisect import bisect_left, insort
+from collections import Counter
+from typing import Iterable
+
+# How much a match in each field counts towards a fuel station's score.
+FIELD_WEIGHTS = {"N": 1.0, "P": 1.0, "brand": 0.8, "A": 0.6}
+
+# How much each kind of match counts towards a fuel station's score.
+EXACT_SCORE = 3.0
+PREFIX_SCORE = 2.0
+FUZZY_SCORE = 1.0
+
+# Query words shorter than this are only matched by prefix; longer words may
+# have one typo, and words of LONG_WORD_LENGTH or more two.
+MIN_FUZZY_LENGTH = 4
+LONG_WORD_LENGTH = 8
+
+TERM_CACHE_SIZE = 1024
+
+_WORD = re.compile(r"[0-9a-z]+")
+
+
+def words(text) -> list:
+    """Splits text into lower-case words.
+
+    :param text: The text.
+    :type text: str
+    :return: A list of words.
+    :rtype: list
+    """
+    return _WORD.findall(str(text).lower()) if text is not None else []
+
+
+def _trigrams(word: str) -> set:
+    padded = f"$${word}"
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def _max_edits(word: str) -> int:
+    # Numbers such as postcodes are only matched by prefix.
+    if len(word) < MIN_FUZZY_LENGTH or word.isdigit():
+        return 0
+    return 1 if len(word) < LONG_WORD_LENGTH else 2
+
+
+def edit_distance(a: str, b: str, max_edits: int, *, prefix: bool = False) -> int:
+    """Gets the number of insertions, deletions, substitutions and
+    transpositions of adjacent letters that turn one word into another,
+    stopping early once it exceeds :param max_edits:.
+
+    :param a: A word.
+    :type a: str
+    :param b: Another word.
+    :type b: str
+    :param max_edits: The largest distance of interest.
+    :type max_edits: int
+    :param prefix: Whether to measure the distance to the closest prefix of
+            :param b: instead, defaults to False.
+    :type prefix: bool
+    :return: The distance, or :param max_edits: + 1 if it is larger.
+    :rtype: int
+    """
+    if prefix:
+        b = b[: len(a) + max_edits]
+    elif abs(len(a) - len(b)) > max_edits:
+        return max_edits + 1
+    before: list = []
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i]
+        for j in range(1, len(b) + 1):
+            distance = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (a[i - 1] != b[j - 1]))
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                distance = min(distance, before[j - 2] + 1)
+            current.append(distance)
+        # A transposition reaches back two rows, so both must be exceeded.
+        if min(current) > max_edits and min(previous) > max_edits:
+            return max_edits + 1
+        before, previous = previous, current
+    distance = min(previous) if prefix else previous[-1]
+    return min(distance, max_edits + 1)
+
+
+class SearchIndex:
+    """A search index over fuel station records from the "S" list of a
+    GetFullSiteDetails response.
+
+    :param brand_names: Brand names keyed by brand ID, defaults to none.
+    :type brand_names: dict, optional
+    """
+
+    def __init__(self, brand_names: dict | None = None) -> None:
+        self.brand_names = dict(brand_names or {})
+        self.__records: dict = {}
+        self.__postings: dict = {}
+        self.__words: list = []
+        self.__trigrams: dict = {}
+        # Scores of recent query words, as each keystroke repeats the earlier
+        # words of the query.
+        self.__term_cache: dict = {}
+
+    @classmethod
+    def from_fuel_stations(cls, fuel_stations: Iterable[dict], brand_names: dict | None = None) -> SearchIndex:
+        """Builds an index of fuel station records.
+
+        :param fuel_stations: The fuel station records.
+        :type fuel_stations: Iterable[dict]
+        :param brand_names: Brand names keyed by brand ID, defaults to none.
+        :type brand_names: dict, optional
+        :return: A SearchIndex object.
+        :rtype: SearchIndex
+        """
+        index = cls(brand_names)
+        for fuel_station in fuel_stations:
+            index.add(fuel_station)
+        return index
+
+    def __len__(self) -> int:
+        return len(self.__records)
+
+    def __fields(self, fuel_station: dict):
+        yield "N", fuel_station.get("N")
+        yield "A", fuel_station.get("A")
+        yield "P", fuel_station.get("P")
+        yield "brand", self.brand_names.get(fuel_station.get("B"))
+
+    def add(self, fuel_station: dict) -> None:
+        """Adds a fuel station record, replacing any with the same ID.
+
+        :param fuel_station: The fuel station record.
+        :type fuel_station: dict
+        """
+        site_id = fuel_station["S"]
+        if site_id in self.__records:
+            self.remove(site_id)
+        self.__term_cache.clear()
+        self.__records[site_id] = fuel_station
+        for field, text in self.__fields(fuel_station):
+            for word in words(text):
+                postings = self.__postings.get(word)
+                if postings is None:
+                    postings = self.__postings[word] = {}
+                    insort(self.__words, word)
+                    for trigram in _trigrams(word):
+                        self.__trigrams.setdefault(trigram, set()).add(word)
+                postings[site_id] = max(postings.get(site_id, 0.0), FIELD_WEIGHTS[field])
+
+    def remove(self, site_id: int) -> None:
+        """Removes a fuel station.
+
+        :param site_id: The ID of the fuel station.
+        :type site_id: int
+        """
+        fuel_station = self.__records.pop(site_id, None)
+        if fuel_station is None:
+            return
+        self.__term_cache.clear()
+        for _field, text in self.__fields(fuel_station):
+            for word in words(text):
+                postings = self.__postings.get(word)
+                if postings is None:
+                    continue
+                postings.pop(site_id, None)
+                if not postings:
+                    del self.__postings[word]
+                    del self.__words[bisect_left(self.__words, word)]
+                    for trigram in _trigrams(word):
+                        self.__trigrams[trigram].discard(word)
+
+    def apply_station_changes(self, changes) -> None:
+        """Updates the fuel stations that changed. Can be registered with
+        :meth:`Safpis.add_station_listener`.
+
+        :param changes: The changes to apply.
+        :type changes: StationChanges
+        """
+        for fuel_station in changes.removed:
+            self.remove(fuel_station["S"])
+        for fuel_station in [*changes.added, *(new for _old, new in changes.changed)]:
+            self.add(fuel_station)
+
+    def set_brand_names(self, brand_names: dict) -> None:
+        """Replaces the brand names, re-indexing the fuel stations.
+
+        :param brand_names: Brand names keyed by brand ID.
+        :type brand_names: dict
+        """
+        fuel_stations = list(self.__records.values())
+        for fuel_station in fuel_stations:
+            self.remove(fuel_station["S"])
+        self.brand_names = dict(brand_names)
+        for fuel_station in fuel_stations:
+            self.add(fuel_station)
+
+    def __prefixed(self, prefix: str):
+        position = bisect_left(self.__words, prefix)
+        while position < len(self.__words) and self.__words[position].startswith(prefix):
+            yield self.__words[position]
+            position += 1
+
+    def __fuzzy(self, term: str, max_edits: int):
+        # A word within max_edits of the term shares all but 3 trigrams per
+        # edit with it.
+        trigrams = _trigrams(term)
+        shared = Counter(word for trigram in trigrams for word in self.__trigrams.get(trigram, ()))
+        needed = max(1, len(trigrams) - 3 * max_edits)
+        for word, count in shared.items():
+            if count < needed:
+                continue
+            if edit_distance(term, word, max_edits, prefix=True) <= max_edits:
+                yield word
+
+    def __term_scores(self, term: str) -> dict:
+        scores = self.__term_cache.get(term)
+        if scores is None:
+            if len(self.__term_cache) >= TERM_CACHE_SIZE:
+                self.__term_cache.clear()
+            scores = self.__term_cache[term] = self.__match_term(term)
+        return scores
+
+    def __match_term(self, term: str) -> dict:
+        scores: dict = {}
+
+        def match(word: str, kind_score: float) -> None:
+            for site_id, weight in self.__postings[word].items():
+                score = kind_score * weight
+                if score > scores.get(site_id, 0.0):
+                    scores[site_id] = score
+
+        for word in self.__prefixed(term):
+            match(word, EXACT_SCORE if word == term else PREFIX_SCORE)
+        max_edits = _max_edits(term)
+        if max_edits:
+            for word in self.__fuzzy(term, max_edits):
+                if not word.startswith(term):
+                    match(word, FUZZY_SCORE)
+        return scores
+
+    def search(self, query: str, limit: int = 10) -> list:
+        """Finds the fuel stations matching every word of a query, by prefix
+        or with a few typos.
+
+        :param query: The query.
+        :type query: str
+        :param limit: The maximum number of results, defaults to 10.
+        :type limit: int
+        :return: A list of up to :param limit: (fuel station ID, score)
+                tuples, best match first.
+        :rtype: list
+        """
+        totals: dict | None = None
+        for term in words(query):
+            scores = self.__term_scores(term)
+            if totals is None:
+                totals = scores
+            else:
+                totals = {site_id: total + scores[site_id] for site_id, total in totals.items() if site_id in scores}
+            if not totals:
+                return []
+        if totals is None:
+            return []
+        return heapq.nsmallest(
+            limit,
+            totals.items(),
+            key=lambda item: (-item[1], str(self.__records[item[0]].get("N")), item[0]),
+        )
@@ -0,0 +1,275 @@
+"""Serving several geographic regions, each loaded as an independent shard.
+
+Each region's fuel stations and prices are fetched and indexed the first time
+they are needed, into a SnapshotStore of their own. Loaded shards are kept in
+least recently used order and the oldest are dropped whenever their
+estimated size exceeds a memory budget; a dropped shard is loaded again the
+next time it is queried. Each region is loaded by one thread at a time, and
+the region of every fuel station loaded is remembered, so a fuel station is
+looked up in its own region without loading the others.
+"""
+
+from __future__ import annotations
+
+import heapq
+import math
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Iterable
+
+from safpis.api import SafpisAPI
+from safpis.geo import KM_PER_DEGREE
+from safpis.snapshot import Snapshot, SnapshotStore
+from safpis.tables import UNAVAILABLE_PRICE, as_list, is_array
+
+# Rough sizes in bytes of a parsed fuel station, with its record and index
+# entries, and of a price record. The column tables are measured directly.
+STATION_BYTES = 4096
+PRICE_BYTES = 512
+
+DEFAULT_MEMORY_BUDGET = 256 * 1024 * 1024
+
+
+@dataclass(frozen=True)
+class RegionKey:
+    """A geographic region served as one shard.
+
+    :param country_id: ID of the country, 21 for Australia
+    :param geo_region_level: Level of the geographic region, 3 for states
+    :param geo_region_id: ID of the geographic region, 4 for South Australia
+    """
+
+    country_id: int = 21
+    geo_region_level: int = 3
+    geo_region_id: int = 4
+
+
+def estimated_bytes(snapshot: Snapshot) -> int:
+    """Estimates the memory used by a snapshot.
+
+    :param snapshot: The snapshot.
+    :type snapshot: Snapshot
+    :return: The estimated size in bytes.
+    :rtype: int
+    """
+    size = STATION_BYTES * len(snapshot.fuel_stations) + PRICE_BYTES * len(snapshot.site_prices)
+    for table in (snapshot.station_table, snapshot.price_table):
+        for column in table.columns.values():
+            size += column.nbytes if is_array(column) else 8 * len(column)
+    return size
+
+
+def _default_api(region: RegionKey) -> SafpisAPI:
+    return SafpisAPI(region.country_id, region.geo_region_level, region.geo_region_id)
+
+
+class ShardedSafpis:
+    """Queries the fuel stations and prices of several geographic regions,
+    loading each region on demand and keeping the loaded regions within a
+    memory budget.
+
+    :param regions: The regions to serve.
+    :type regions: Iterable[RegionKey]
+    :param memory_budget: The estimated bytes the loaded regions may use,
+            defaults to 256MiB. The most recently used region is always kept,
+            even if it alone exceeds the budget.
+    :type memory_budget: int
+    :param api_factory: Function creating the API client for a region,
+            defaults to a SafpisAPI for the region.
+    :type api_factory: Callable[[RegionKey], SafpisAPI], optional
+    """
+
+    def __init__(
+        self,
+        regions: Iterable[RegionKey],
+        memory_budget: int = DEFAULT_MEMORY_BUDGET,
+        api_factory: Callable[[RegionKey], SafpisAPI] | None = None,
+    ) -> None:
+        self.regions = list(regions)
+        self.memory_budget = memory_budget
+        self.__api_factory = api_factory if api_factory is not None else _default_api
+        self.__lock = threading.Lock()
+        # Held while a region is loaded, so concurrent first queries of a
+        # region load it once.
+        self.__region_locks = {region: threading.Lock() for region in self.regions}
+        self.__stores: OrderedDict = OrderedDict()
+        self.__sizes: dict = {}
+        # Bounding boxes and the region of each fuel station outlive their
+        # shards, so regions need not be loaded to rule them out of a query.
+        self.__bounds: dict = {}
+        self.__site_regions: dict = {}
+        # The store and reference version each region's fuel stations were
+        # last added to the site regions and bounds from, and the store and
+        # versions each region's size was last estimated from.
+        self.__indexed: dict = {}
+        self.__measured: dict = {}
+
+    def shard(self, region: RegionKey) -> Snapshot:
+        """Gets the current snapshot of a region, loading it if needed and
+        marking it as the most recently used.
+
+        :param region: The region.
+        :type region: RegionKey
+        :return: A Snapshot object.
+        :rtype: Snapshot
+        """
+        with self.__lock:
+            store = self.__stores.get(region)
+            if store is None:
+                store = SnapshotStore(api=self.__api_factory(region))
+                self.__stores[region] = store
+            self.__stores.move_to_end(region)
+            region_lock = self.__region_locks.setdefault(region, threading.Lock())
+
+        with region_lock:
+            snapshot = store.current()
+        with self.__lock:
+            if self.__indexed.get(region) != (store, snapshot.reference_version):
+                self.__bounds[region] = _bounds(snapshot)
+                self.__index_sites(region, snapshot)
+                self.__indexed[region] = (store, snapshot.reference_version)
+            versions = (store, snapshot.reference_version, snapshot.price_version)
+            if self.__measured.get(region) != versions:
+                self.__sizes[region] = estimated_bytes(snapshot)
+                self.__measured[region] = versions
+                self.__evict()
+        return snapshot
+
+    def __index_sites(self, region: RegionKey, snapshot: Snapshot) -> None:
+        removed = [site_id for site_id, site_region in self.__site_regions.items() if site_region == region]
+        for site_id in removed:
+            del self.__site_regions[site_id]
+        self.__site_regions.update(dict.fromkeys(snapshot.fuel_stations, region))
+
+    def __evict(self) -> None:
+        used = sum(self.__sizes.get(region, 0) for region in self.__stores)
+        while len(self.__stores) > 1 and used > self.memory_budget:
+            region, _store = self.__stores.popitem(last=False)
+            used -= self.__sizes.pop(region, 0)
+            self.__indexed.pop(region, None)
+            self.__measured.pop(region, None)
+
+    def loaded_regions(self) -> list:
+        """Gets the regions currently loaded, least recently used first.
+
+        :return: A list of RegionKey objects.
+        :rtype: list
+        """
+        with self.__lock:
+            return list(self.__stores)
+
+    def memory_used(self) -> int:
+        """Gets the estimated bytes used by the loaded regions.
+
+        :return: The estimated size in bytes.
+        :rtype: int
+        """
+        with self.__lock:
+            return sum(self.__sizes.get(region, 0) for region in self.__stores)
+
+    def refresh_prices(self) -> None:
+        """Reloads the prices of the loaded regions."""
+        with self.__lock:
+            stores = list(self.__stores.values())
+        for store in stores:
+            store.refresh_prices()
+
+    def fuel_station_by_id(self, fuel_station_id: int):
+        """Gets a FuelStation object by fuel station ID from the region it was
+        last loaded in. Fuel stations of regions that have never been loaded
+        are looked for by loading those regions.
+
+        :param fuel_station_id: The ID of the fuel station.
+        :type fuel_station_id: int
+        :return: A FuelStation object, or None if no region has the fuel
+                station.
+        """
+        with self.__lock:
+            region = self.__site_regions.get(fuel_station_id)
+            unseen = [other for other in self.regions if other not in self.__bounds]
+        if region is not None:
+            fuel_station = self.shard(region).fuel_station_by_id(fuel_station_id)
+            if fuel_station is not None:
+                return fuel_station
+        for region in unseen:
+            fuel_station = self.shard(region).fuel_station_by_id(fuel_station_id)
+            if fuel_station is not None:
+                return fuel_station
+        return None
+
+    def fuel_stations_within(self, latitude: float, longitude: float, radius_km: float):
+        """Gets the fuel stations within a distance of a point, from every
+        region that may have some.
+
+        :param latitude: The latitude of the point.
+        :type latitude: float
+        :param longitude: The longitude of the point.
+        :type longitude: float
+        :param radius_km: The distance in kilometres.
+        :type radius_km: float
+        :return: A list of (FuelStation, distance in km) tuples, closest first.
+        :rtype: list
+        """
+        found = []
+        for region in self.regions:
+            if not self.__may_contain(region, latitude, longitude, radius_km):
+                continue
+            snapshot = self.shard(region)
+            found.extend(
+                (snapshot.fuel_stations[site_id], distance)
+                for site_id, distance in snapshot.station_grid.within(latitude, longitude, radius_km)
+            )
+        return sorted(found, key=lambda item: item[1])
+
+    def cheapest(self, fuel_id: int, k: int = 5, regions: Iterable[RegionKey] | None = None):
+        """Gets the cheapest prices of a fuel across regions.
+
+        :param fuel_id: The ID of the fuel type.
+        :type fuel_id: int
+        :param k: The number of prices to return, defaults to 5.
+        :type k: int
+        :param regions: The regions to search, defaults to all of them.
+        :type regions: Iterable[RegionKey], optional
+        :return: A list of up to :param k: (RegionKey, "SitePrices" record)
+                tuples, cheapest first.
+        :rtype: list
+        """
+        candidates = []
+        for region in self.regions if regions is None else regions:
+            site_prices = self.shard(region).site_prices
+            candidates.extend(
+                (region, site_price)
+                for site_price in heapq.nsmallest(
+                    k,
+                    (
+                        site_price
+                        for site_price in site_prices
+                        if site_price["FuelId"] == fuel_id and site_price["Price"] != UNAVAILABLE_PRICE
+                    ),
+                    key=lambda site_price: site_price["Price"],
+                )
+            )
+        return heapq.nsmallest(k, candidates, key=lambda candidate: candidate[1]["Price"])
+
+    def __may_contain(self, region: RegionKey, latitude: float, longitude: float, radius_km: float) -> bool:
+        bounds = self.__bounds.get(region)
+        if bounds is None:
+            return True
+        if bounds == ():
+            return False
+        min_lat, max_lat, min_lng, max_lng = bounds
+        lat_margin = radius_km / KM_PER_DEGREE
+        lng_margin = lat_margin / math.cos(math.radians(min(abs(latitude) + lat_margin, 89.9)))
+        return (
+            min_lat - lat_margin <= latitude <= max_lat + lat_margin
+            and min_lng - lng_margin <= longitude <= max_lng + lng_margin
+        )
+
+
+def _bounds(snapshot: Snapshot) -> tuple:
+    latitudes = as_list(snapshot.station_table["Lat"])
+    longitudes = as_list(snapshot.station_table["Lng"])
+    if not latitudes:
+        return ()
+    return (min(latitudes), max(latitudes), min(longitudes), max(longitudes))
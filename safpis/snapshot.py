@@ -0,0 +1,349 @@
+"""Immutable, versioned snapshots of the SAFPIS data for concurrent readers.
+
+A SnapshotStore builds a new Snapshot whenever the reference data (brands,
+fuels, regions and fuel stations) or the prices change, and publishes it by
+replacing a single attribute. Readers take the current snapshot once and use
+it for the whole of a request, so they never take a lock and never see a mix
+of old and new data. A SnapshotRefresher rebuilds the snapshots in a
+background thread on the cadences the SAFPIS data is published at.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from dataclasses import dataclass, field, replace
+from types import MappingProxyType
+from typing import Callable, Mapping
+
+from safpis.api import SafpisAPI
+from safpis.freshness import FreshnessIndex
+from safpis.geo import GridIndex
+from safpis.models import FuelStation, StationChanges
+from safpis.tables import PriceTable, StationTable
+
+# The reference data changes at most daily and the prices every minute.
+REFERENCE_INTERVAL = 24 * 60 * 60
+PRICE_INTERVAL = 60
+
+REFERENCE_ENDPOINTS = {
+    "GetCountryBrands": "Brands",
+    "GetCountryFuelTypes": "Fuels",
+    "GetCountryGeographicRegions": "GeographicRegions",
+    "GetFullSiteDetails": "S",
+}
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    """A consistent view of the SAFPIS data at one point in time.
+
+    Snapshots are never modified once published; the tables and indexes they
+    hold must be treated as read-only.
+
+    :param version: Increases by one with each published snapshot
+    :param reference_version: The version at which the reference data last
+        changed
+    :param price_version: The version at which the prices last changed
+    :param created: When the snapshot was built, in seconds since the epoch
+    :param brands: The "Brands" records of GetCountryBrands
+    :param fuels: The "Fuels" records of GetCountryFuelTypes
+    :param regions: The "GeographicRegions" records of
+        GetCountryGeographicRegions
+    :param fuel_stations: FuelStation objects keyed by fuel station ID
+    :param site_prices: The "SitePrices" records of GetSitesPrices
+    :param prices_by_site: "SitePrices" records keyed by fuel station ID
+    :param station_table: The fuel stations as a column-oriented table
+    :param price_table: The prices as a column-oriented table
+    :param station_grid: A spatial index of the fuel stations
+    :param freshness: The prices ordered by when they were last updated
+    """
+
+    version: int
+    reference_version: int
+    price_version: int
+    created: float
+    brands: tuple
+    fuels: tuple
+    regions: tuple
+    fuel_stations: Mapping
+    site_prices: tuple
+    prices_by_site: Mapping
+    station_table: StationTable
+    price_table: PriceTable
+    station_grid: GridIndex = field(repr=False)
+    freshness: FreshnessIndex = field(repr=False, default_factory=FreshnessIndex)
+
+    def fuel_station_by_id(self, fuel_station_id: int):
+        """Gets a FuelStation object by fuel station ID.
+
+        :param fuel_station_id: The ID of the fuel station.
+        :type fuel_station_id: int
+        :return: A FuelStation object, or None if there is no such fuel
+                station.
+        """
+        return self.fuel_stations.get(fuel_station_id)
+
+    def prices_at(self, fuel_station_id: int):
+        """Gets the "SitePrices" records of a fuel station.
+
+        :param fuel_station_id: The ID of the fuel station.
+        :type fuel_station_id: int
+        :return: A tuple of price records.
+        :rtype: tuple
+        """
+        return self.prices_by_site.get(fuel_station_id, ())
+
+
+class SnapshotStore:
+    """Builds and publishes Snapshot objects.
+
+    :meth:`current` never blocks: publishing a snapshot is a single reference
+    assignment, which is atomic. Refreshes are serialised with a lock that
+    readers never take. Payloads that are unchanged since the last refresh
+    are not decoded again and leave the current snapshot in place.
+
+    :param api: The API client to fetch the data with, defaults to a new
+            SafpisAPI.
+    :type api: SafpisAPI, optional
+    """
+
+    def __init__(self, api: SafpisAPI | None = None) -> None:
+        self.__api = api if api is not None else SafpisAPI()
+        self.__fingerprints: dict = {}
+        self.__records: dict = {}
+        self.__station_records: dict = {}
+        self.__refresh_lock = threading.Lock()
+        self.__snapshot: Snapshot | None = None
+        self.__listeners: list = []
+
+    def current(self) -> Snapshot:
+        """Gets the current snapshot, building the first one if needed.
+
+        :return: A Snapshot object.
+        :rtype: Snapshot
+        """
+        snapshot = self.__snapshot
+        if snapshot is None:
+            self.refresh()
+            snapshot = self.__snapshot
+        return snapshot
+
+    def add_listener(self, listener: Callable[[Snapshot], None]) -> None:
+        """Registers a function to be called with each newly published
+        snapshot.
+
+        :param listener: The function to call.
+        :type listener: Callable[[Snapshot], None]
+        """
+        self.__listeners.append(listener)
+
+    def refresh(self) -> Snapshot:
+        """Reloads the reference data and the prices.
+
+        :return: The current snapshot.
+        :rtype: Snapshot
+        """
+        with self.__refresh_lock:
+            return self.__publish(reference=True, prices=True)
+
+    def refresh_reference(self) -> Snapshot:
+        """Reloads the brands, fuels, regions and fuel stations.
+
+        :return: The current snapshot.
+        :rtype: Snapshot
+        """
+        with self.__refresh_lock:
+            return self.__publish(reference=True, prices=self.__snapshot is None)
+
+    def refresh_prices(self) -> Snapshot:
+        """Reloads the prices.
+
+        :return: The current snapshot.
+        :rtype: Snapshot
+        """
+        with self.__refresh_lock:
+            return self.__publish(reference=self.__snapshot is None, prices=True)
+
+    def __fetch(self, endpoint: str, key: str, fetched: dict):
+        """Fetches an endpoint's records into :param fetched:, returning None
+        if they are unchanged since the last published snapshot.
+        """
+        payload, fingerprint = self.__api.fetch(endpoint, self.__fingerprints.get(endpoint))
+        records = None if payload is None else tuple(payload[key])
+        fetched[endpoint] = (fingerprint, records)
+        return records
+
+    def __publish(self, *, reference: bool, prices: bool) -> Snapshot:
+        previous = self.__snapshot
+        # The fingerprints and records fetched are only kept once a snapshot
+        # built from them is published, so a failed refresh is retried in
+        # full rather than seeing the payloads as unchanged.
+        fetched: dict = {}
+        reference_changed = False
+        if reference:
+            # Fetch every reference endpoint, so all of their fingerprints are kept.
+            changed = [self.__fetch(endpoint, key, fetched) for endpoint, key in REFERENCE_ENDPOINTS.items()]
+            reference_changed = any(records is not None for records in changed)
+        prices_changed = prices and self.__fetch("GetSitesPrices", "SitePrices", fetched) is not None
+        if previous is not None and not reference_changed and not prices_changed:
+            return previous
+
+        records = dict(self.__records)
+        records.update(
+            (endpoint, changed) for endpoint, (_fingerprint, changed) in fetched.items() if changed is not None
+        )
+        version = 1 if previous is None else previous.version + 1
+        snapshot = previous
+        station_records = self.__station_records
+        if previous is None or reference_changed:
+            station_records = {record["S"]: record for record in records.get("GetFullSiteDetails", ())}
+            snapshot = self.__reference_snapshot(previous, version, records, station_records)
+        price_version = version if previous is None or prices_changed else snapshot.price_version
+        snapshot = replace(
+            self.__price_snapshot(snapshot, price_version, records.get("GetSitesPrices", ())),
+            version=version,
+            created=time.time(),
+        )
+
+        self.__snapshot = snapshot
+        self.__records = records
+        self.__station_records = station_records
+        self.__fingerprints.update((endpoint, fingerprint) for endpoint, (fingerprint, _changed) in fetched.items())
+        for listener in self.__listeners:
+            listener(snapshot)
+        return snapshot
+
+    def __reference_snapshot(
+        self, previous: Snapshot | None, version: int, records: dict, station_records: dict
+    ) -> Snapshot:
+        fuel_station_records = records.get("GetFullSiteDetails", ())
+        if previous is None:
+            fuel_stations = {record["S"]: FuelStation(**record) for record in fuel_station_records}
+        else:
+            # Only parse the fuel stations that were added or edited.
+            changes = StationChanges.between(self.__station_records, station_records)
+            fuel_stations = dict(previous.fuel_stations)
+            for record in changes.removed:
+                del fuel_stations[record["S"]]
+            for record in [*changes.added, *(new for _old, new in changes.changed)]:
+                fuel_stations[record["S"]] = FuelStation(**record)
+
+        station_table = StationTable.from_payload(fuel_station_records)
+        return Snapshot(
+            version=version,
+            reference_version=version,
+            price_version=0 if previous is None else previous.price_version,
+            created=time.time(),
+            brands=records.get("GetCountryBrands", ()),
+            fuels=records.get("GetCountryFuelTypes", ()),
+            regions=records.get("GetCountryGeographicRegions", ()),
+            fuel_stations=MappingProxyType(fuel_stations),
+            site_prices=() if previous is None else previous.site_prices,
+            prices_by_site=MappingProxyType({}) if previous is None else previous.prices_by_site,
+            station_table=station_table,
+            price_table=PriceTable.from_payloads(station_table, []),
+            station_grid=GridIndex.from_fuel_stations(fuel_station_records),
+        )
+
+    def __price_snapshot(self, snapshot: Snapshot, price_version: int, site_prices: tuple) -> Snapshot:
+        prices_by_site: dict = {}
+        for site_price in site_prices:
+            prices_by_site.setdefault(site_price["SiteId"], []).append(site_price)
+        price_table = PriceTable.from_payloads(snapshot.station_table, site_prices)
+        return replace(
+            snapshot,
+            price_version=price_version,
+            site_prices=site_prices,
+            prices_by_site=MappingProxyType({site_id: tuple(prices) for site_id, prices in prices_by_site.items()}),
+            price_table=price_table,
+            # Built from the timestamps the price table has already parsed.
+            freshness=FreshnessIndex(site_prices, price_table["TransactionDateUtc"]),
+        )
+
+
+class SnapshotRefresher:
+    """Refreshes a SnapshotStore in a background thread, reloading the prices
+    every :param price_interval: seconds and the reference data every
+    :param reference_interval: seconds.
+
+    Errors raised by a refresh are passed to :param on_error: and the
+    previous snapshot stays current until the next successful refresh. A
+    failed reference data refresh is retried after :param price_interval:
+    seconds rather than waiting for the next :param reference_interval:.
+
+    :param store: The store to refresh.
+    :type store: SnapshotStore
+    :param price_interval: Seconds between price refreshes, defaults to 60.
+    :type price_interval: float
+    :param reference_interval: Seconds between reference data refreshes,
+            defaults to a day.
+    :type reference_interval: float
+    :param on_error: Function called with any exception raised by a refresh,
+            defaults to keeping it in :attr:`last_error`.
+    :type on_error: Callable[[Exception], None], optional
+    """
+
+    def __init__(
+        self,
+        store: SnapshotStore,
+        price_interval: float = PRICE_INTERVAL,
+        reference_interval: float = REFERENCE_INTERVAL,
+        on_error: Callable[[Exception], None] | None = None,
+    ) -> None:
+        self.store = store
+        self.price_interval = price_interval
+        self.reference_interval = reference_interval
+        self.on_error = on_error
+        self.last_error: Exception | None = None
+        self.__stopped = threading.Event()
+        self.__thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        """Starts refreshing in a daemon thread."""
+        if self.__thread is not None and self.__thread.is_alive():
+            return
+        self.__stopped.clear()
+        self.__thread = threading.Thread(target=self.__run, name="safpis-snapshot-refresher", daemon=True)
+        self.__thread.start()
+
+    def stop(self, timeout: float | None = None) -> None:
+        """Stops refreshing, waiting for a refresh in progress to finish.
+
+        :param timeout: The maximum seconds to wait, defaults to no limit.
+        :type timeout: float, optional
+        """
+        self.__stopped.set()
+        if self.__thread is not None:
+            self.__thread.join(timeout)
+            self.__thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def __refresh(self, refresh: Callable[[], Snapshot]) -> bool:
+        """Runs a refresh, returning whether it succeeded."""
+        try:
+            refresh()
+        except Exception as error:  # noqa: BLE001
+            self.last_error = error
+            if self.on_error is not None:
+                self.on_error(error)
+            return False
+        return True
+
+    def __run(self) -> None:
+        next_reference = next_prices = time.monotonic()
+        while not self.__stopped.is_set():
+            now = time.monotonic()
+            if now >= next_reference:
+                succeeded = self.__refresh(self.store.refresh_reference)
+                next_reference = now + (self.reference_interval if succeeded else self.price_interval)
+            if now >= next_prices:
+                self.__refresh(self.store.refresh_prices)
+                next_prices = now + self.price_interval
+            self.__stopped.wait(max(0.0, min(next_reference, next_prices) - time.monotonic()))
@@ -0,0 +1,309 @@
+"""A local stand-in for the SAFPIS REST API.
+
+StubServer serves the five endpoints SafpisAPI uses from recorded or
+synthetic payloads, so the client can be tested and load tested without a
+subscriber token or load on the real service. Latency and server errors can
+be injected, and the size of synthetic payloads chosen. Point a SafpisAPI at
+it with ``base_url=server.url`` or the 'SAFPIS_BASE_URL' environmental
+variable; any subscriber token is accepted.
+"""
+
+from __future__ import annotations
+
+import gzip
+import hashlib
+import json
+import random
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from os import path
+from urllib.parse import urlsplit
+
+from safpis.tables import STATION_HOURS_COLUMNS
+
+# The payload key of each endpoint, keyed by its path.
+ENDPOINTS = {
+    "/Subscriber/GetCountryBrands": ("GetCountryBrands", "Brands"),
+    "/Subscriber/GetCountryFuelTypes": ("GetCountryFuelTypes", "Fuels"),
+    "/Subscriber/GetCountryGeographicRegions": ("GetCountryGeographicRegions", "GeographicRegions"),
+    "/Subscriber/GetFullSiteDetails": ("GetFullSiteDetails", "S"),
+    "/Price/GetSitesPrices": ("GetSitesPrices", "SitePrices"),
+}
+
+DEFAULT_STATIONS = 600
+
+# How often, in seconds, the server checks whether it has been stopped.
+SHUTDOWN_POLL_INTERVAL = 0.05
+
+SYNTHETIC_BRANDS = {2: "Caltex", 5: "BP", 20: "Shell", 23: "United", 72: "Liberty", 169: "On the Run", 5094: "Ampol"}
+SYNTHETIC_FUELS = {2: "Unleaded", 3: "Diesel", 4: "LPG", 5: "Premium Unleaded 95", 8: "Premium Unleaded 98", 12: "e10"}
+
+# Most fuel stations are in and around Adelaide.
+ADELAIDE = (-34.9285, 138.6007)
+METROPOLITAN_SHARE = 0.7
+OPENING_HOURS = ("06:00", "22:00")
+
+
+@dataclass
+class StubBehaviour:
+    """How a StubServer misbehaves.
+
+    :param latency: Seconds to wait before every response
+    :param jitter: Up to this many more seconds, drawn at random, to wait
+    :param error_rate: The fraction of requests answered with an error
+    :param error_status: The status of the injected errors
+    :param seed: Seeds the random jitter and errors
+    """
+
+    latency: float = 0.0
+    jitter: float = 0.0
+    error_rate: float = 0.0
+    error_status: int = 503
+    seed: int | None = None
+
+
+def synthetic_payloads(stations: int = DEFAULT_STATIONS, seed: int = 0) -> dict:
+    """Generates realistic payloads for every endpoint.
+
+    :param stations: The number of fuel stations, defaults to 600.
+    :type stations: int
+    :param seed: Seeds the generated data, defaults to 0.
+    :type seed: int
+    :return: The payloads keyed by endpoint name, e.g. "GetSitesPrices".
+    :rtype: dict
+    """
+    generator = random.Random(seed)  # noqa: S311
+    updated = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    fuel_stations = []
+    site_prices = []
+    for number in range(stations):
+        site_id = 61_000_000 + number
+        if generator.random() < METROPOLITAN_SHARE:
+            latitude = ADELAIDE[0] + generator.gauss(0, 0.15)
+            longitude = ADELAIDE[1] + generator.gauss(0, 0.1)
+        else:
+            latitude = generator.uniform(-38.0, -26.0)
+            longitude = generator.uniform(129.0, 141.0)
+        fuel_stations.append(
+            {
+                "S": site_id,
+                "A": f"{number + 1} Stub Street",
+                "N": f"Stub Station {number + 1}",
+                "B": generator.choice(list(SYNTHETIC_BRANDS)),
+                "P": str(5000 + number % 800),
+                "G1": 170227000 + number % 100,
+                "G2": 189,
+                "G3": 4,
+                "G4": 0,
+                "G5": 0,
+                "Lat": round(latitude, 6),
+                "Lng": round(longitude, 6),
+                "M": (updated - timedelta(days=number % 365)).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3],
+                "GPI": f"stub-{site_id}",
+                # Opening and closing times alternate.
+                **{column: OPENING_HOURS[index % 2] for index, column in enumerate(STATION_HOURS_COLUMNS)},
+            }
+        )
+        fuel_ids = generator.sample(list(SYNTHETIC_FUELS), generator.randint(2, len(SYNTHETIC_FUELS)))
+        site_prices.extend(
+            {
+                "SiteId": site_id,
+                "FuelId": fuel_id,
+                "CollectionMethod": "T",
+                "TransactionDateUtc": (updated - timedelta(minutes=generator.randint(0, 10_000))).strftime(
+                    "%Y-%m-%dT%H:%M:%S"
+                ),
+                "Price": float(generator.randint(1700, 2300)),
+            }
+            for fuel_id in fuel_ids
+        )
+    return {
+        "GetCountryBrands": {"Brands": [{"BrandId": key, "Name": name} for key, name in SYNTHETIC_BRANDS.items()]},
+        "GetCountryFuelTypes": {"Fuels": [{"FuelId": key, "Name": name} for key, name in SYNTHETIC_FUELS.items()]},
+        "GetCountryGeographicRegions": {
+            "GeographicRegions": [{"GeoRegionLevel": 3, "GeoRegionId": 4, "Name": "South Australia", "Abbrev": "SA"}]
+        },
+        "GetFullSiteDetails": {"S": fuel_stations},
+        "GetSitesPrices": {"SitePrices": site_prices},
+    }
+
+
+def record_payloads(api, directory: str) -> None:
+    """Saves the current payload of every endpoint, to be replayed with
+    :func:`load_payloads`.
+
+    :param api: The API to fetch the payloads from.
+    :type api: SafpisAPI
+    :param directory: The directory to write "<endpoint>.json" files to.
+    :type directory: str
+    """
+    for endpoint, _key in ENDPOINTS.values():
+        with open(path.join(directory, f"{endpoint}.json"), "w", encoding="utf-8") as fh:
+            json.dump(getattr(api, endpoint)(), fh)
+
+
+def load_payloads(directory: str) -> dict:
+    """Loads payloads saved by :func:`record_payloads`.
+
+    :param directory: The directory of "<endpoint>.json" files.
+    :type directory: str
+    :raises FileNotFoundError: if an endpoint's payload is missing.
+    :return: The payloads keyed by endpoint name.
+    :rtype: dict
+    """
+    payloads = {}
+    for endpoint, _key in ENDPOINTS.values():
+        with open(path.join(directory, f"{endpoint}.json"), encoding="utf-8") as fh:
+            payloads[endpoint] = json.load(fh)
+    return payloads
+
+
+class _Encoded:
+    """A payload encoded once, so serving it costs no more than a real
+    service would."""
+
+    def __init__(self, payload: dict) -> None:
+        self.body = json.dumps(payload).encode()
+        self.gzipped = gzip.compress(self.body, compresslevel=6)
+        self.etag = f'"{hashlib.sha256(self.body).hexdigest()[:32]}"'
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: _StubHTTPServer
+
+    def do_GET(self):  # noqa: N802
+        self.server.stub.respond(self)
+
+    def log_message(self, format, *args):  # noqa: A002
+        """Requests are counted rather than logged."""
+
+
+class _StubHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: tuple, stub: StubServer) -> None:
+        self.stub = stub
+        super().__init__(address, _Handler)
+
+
+class StubServer:
+    """Serves SAFPIS REST API payloads over HTTP from a background thread.
+
+    :param payloads: Payloads keyed by endpoint name, defaults to
+            synthetic_payloads().
+    :type payloads: dict, optional
+    :param behaviour: The latency and errors to inject, defaults to none.
+    :type behaviour: StubBehaviour, optional
+    :param host: The address to listen on, defaults to "127.0.0.1".
+    :type host: str
+    :param port: The port to listen on, defaults to any free port.
+    :type port: int
+    """
+
+    def __init__(
+        self,
+        payloads: dict | None = None,
+        behaviour: StubBehaviour | None = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ) -> None:
+        self.behaviour = behaviour if behaviour is not None else StubBehaviour()
+        self.__encoded = {}
+        for endpoint, payload in (payloads if payloads is not None else synthetic_payloads()).items():
+            self.set_payload(endpoint, payload)
+        self.__random = random.Random(self.behaviour.seed)  # noqa: S311
+        self.__lock = threading.Lock()
+        self.served: dict = {endpoint: 0 for endpoint, _key in ENDPOINTS.values()}
+        self.errors = 0
+        self.__server = _StubHTTPServer((host, port), self)
+        self.__thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        """The base URL to give SafpisAPI."""
+        host, port = self.__server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def set_payload(self, endpoint: str, payload: dict) -> None:
+        """Replaces the payload of an endpoint, e.g. to publish new prices.
+
+        :param endpoint: The endpoint name, e.g. "GetSitesPrices".
+        :type endpoint: str
+        :param payload: The payload.
+        :type payload: dict
+        """
+        self.__encoded[endpoint] = _Encoded(payload)
+
+    def start(self) -> StubServer:
+        """Starts serving in a background thread.
+
+        :return: The server.
+        :rtype: StubServer
+        """
+        self.__thread = threading.Thread(
+            target=self.__server.serve_forever,
+            kwargs={"poll_interval": SHUTDOWN_POLL_INTERVAL},
+            name="safpis-stub",
+            daemon=True,
+        )
+        self.__thread.start()
+        return self
+
+    def serve_forever(self) -> None:
+        """Serves in the calling thread until interrupted."""
+        self.__server.serve_forever()
+
+    def stop(self) -> None:
+        """Stops serving and closes the socket."""
+        if self.__thread is not None:
+            self.__server.shutdown()
+            self.__thread.join()
+            self.__thread = None
+        self.__server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def respond(self, handler: BaseHTTPRequestHandler) -> None:
+        """Answers a request, called by the request handler threads."""
+        route = ENDPOINTS.get(urlsplit(handler.path).path)
+        behaviour = self.behaviour
+        with self.__lock:
+            delay = behaviour.latency + self.__random.uniform(0, behaviour.jitter)
+            fail = self.__random.random() < behaviour.error_rate
+            if route is not None:
+                self.served[route[0]] += 1
+            self.errors += fail
+        if delay > 0:
+            time.sleep(delay)
+        if route is None:
+            _send(handler, 404, b'{"Message": "No such endpoint."}')
+        elif not handler.headers.get("Authorization", "").startswith("FPDAPI SubscriberToken="):
+            _send(handler, 401, b'{"Message": "Authorization has been denied for this request."}')
+        elif fail:
+            _send(handler, behaviour.error_status, b'{"Message": "Injected error."}')
+        else:
+            encoded = self.__encoded[route[0]]
+            if handler.headers.get("If-None-Match") == encoded.etag:
+                _send(handler, 304, b"", {"ETag": encoded.etag})
+            elif "gzip" in handler.headers.get("Accept-Encoding", ""):
+                _send(handler, 200, encoded.gzipped, {"ETag": encoded.etag, "Content-Encoding": "gzip"})
+            else:
+                _send(handler, 200, encoded.body, {"ETag": encoded.etag})
+
+
+def _send(handler: BaseHTTPRequestHandler, status: int, body: bytes, headers: dict | None = None) -> None:
+    handler.send_response(status)
+    handler.send_header("Content-Type", "application/json; charset=utf-8")
+    handler.send_header("Content-Length", str(len(body)))
+    for name, value in (headers or {}).items():
+        handler.send_header(name, value)
+    handler.end_headers()
+    handler.wfile.write(body)
@@ -0,0 +1,304 @@
+"""Column-oriented views over the raw SAFPIS REST API payloads.
+
+The tables hold one column per payload field, as NumPy arrays when NumPy is
+installed and as plain lists otherwise, so bulk computations can run over a
+whole snapshot without building a dataclass for every record.
+"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Iterable, Sequence
+
+from safpis.models import STATION_HOURS_COLUMNS, epoch_seconds
+
+if TYPE_CHECKING:
+    from datetime import datetime
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+STATION_INT_COLUMNS = ("S", "B", "G1", "G2", "G3", "G4", "G5")
+STATION_FLOAT_COLUMNS = ("Lat", "Lng")
+# Postcodes are held as strings, keeping any leading zeros.
+STATION_STR_COLUMNS = ("P",)
+# The opening and closing times of STATION_HOURS_COLUMNS are held as seconds
+# since midnight.
+STATION_COLUMNS = STATION_INT_COLUMNS + STATION_FLOAT_COLUMNS + STATION_STR_COLUMNS + STATION_HOURS_COLUMNS
+JOINED_INT_COLUMNS = ("B", "G1", "G2", "G3", "G4", "G5")
+JOINED_FLOAT_COLUMNS = ("Lat", "Lng")
+JOINED_STR_COLUMNS = ("P",)
+
+# The price reported by the SAFPIS REST API for a fuel that is not available
+# at a fuel station.
+UNAVAILABLE_PRICE = 9999.0
+
+MISSING = -1
+MISSING_STR = ""
+
+
+def _as_int(value) -> int:
+    """Coerces an ID-like payload value (e.g. a site ID string) to an int."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return MISSING
+
+
+def _as_float(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float("nan")
+
+
+def _as_str(value) -> str:
+    return MISSING_STR if value is None else str(value)
+
+
+def as_seconds(value) -> int:
+    """Converts an "HH:MM" opening time to seconds since midnight, or
+    MISSING if it is not a time."""
+    try:
+        hours, minutes = value.strip().split(":")
+        return int(hours) * 3600 + int(minutes) * 60
+    except (AttributeError, ValueError):
+        return MISSING
+
+
+def _dtype(name: str) -> str:
+    if name in STATION_FLOAT_COLUMNS:
+        return "float64"
+    if name in STATION_STR_COLUMNS:
+        return "str"
+    return "int64"
+
+
+def _column(values: list, dtype: str, *, use_numpy: bool):
+    if use_numpy:
+        return np.asarray(values, dtype=dtype)
+    return values
+
+
+def is_array(column) -> bool:
+    """Whether a table column is a NumPy array rather than a list."""
+    return np is not None and isinstance(column, np.ndarray)
+
+
+def as_list(column) -> list:
+    """Gets the values of a table column as a list."""
+    return column.tolist() if is_array(column) else list(column)
+
+
+def _use_numpy(use_numpy: bool | None) -> bool:
+    if use_numpy is None:
+        return np is not None
+    if use_numpy and np is None:
+        msg = "NumPy is required for use_numpy=True; install it with: pip install safpis[numpy]"
+        raise ImportError(msg)
+    return use_numpy
+
+
+class StationTable:
+    """Column-oriented GetFullSiteDetails site records.
+
+    :param columns: A mapping of column name to column values.
+    :type columns: dict
+    :param records: The fuel station record of each row, defaults to none.
+    :type records: list, optional
+    """
+
+    def __init__(self, columns: dict, records: list | None = None) -> None:
+        self.columns = columns
+        self.records = records
+        self.uses_numpy = is_array(columns["S"])
+        self.row_by_id = {site_id: row for row, site_id in enumerate(as_list(columns["S"]))}
+        self.__sorted_ids = None
+
+    @classmethod
+    def from_payload(cls, fuel_stations: Iterable[dict], use_numpy: bool | None = None):
+        """Builds a StationTable from the "S" list of a GetFullSiteDetails
+        response.
+
+        :param fuel_stations: The fuel station records.
+        :type fuel_stations: Iterable[dict]
+        :param use_numpy: Whether to store columns as NumPy arrays, defaults
+                to using NumPy when it is installed.
+        :type use_numpy: bool, optional
+        :return: A StationTable object.
+        """
+        use_numpy = _use_numpy(use_numpy)
+        fuel_stations = list(fuel_stations)
+        values: dict = {name: [] for name in STATION_COLUMNS}
+        for fuel_station in fuel_stations:
+            for name in STATION_INT_COLUMNS:
+                values[name].append(_as_int(fuel_station.get(name)))
+            for name in STATION_FLOAT_COLUMNS:
+                values[name].append(_as_float(fuel_station.get(name)))
+            for name in STATION_STR_COLUMNS:
+                values[name].append(_as_str(fuel_station.get(name)))
+            for name in STATION_HOURS_COLUMNS:
+                values[name].append(as_seconds(fuel_station.get(name)))
+        columns = {name: _column(values[name], _dtype(name), use_numpy=use_numpy) for name in STATION_COLUMNS}
+        return cls(columns, fuel_stations)
+
+    def __len__(self) -> int:
+        return len(self.columns["S"])
+
+    def __getitem__(self, name: str):
+        return self.columns[name]
+
+    def record_for(self, site_id: int):
+        """Gets the fuel station record of a site ID, whatever the type of
+        its "S" value.
+
+        :param site_id: The fuel station ID, as an int.
+        :type site_id: int
+        :return: The record, or None if it is not in the table.
+        :rtype: dict | None
+        """
+        row = self.row_by_id.get(site_id)
+        if row is None or self.records is None:
+            return None
+        return self.records[row]
+
+    def rows_for(self, site_ids: Sequence):
+        """Gets the row of each site ID, or -1 for unknown sites.
+
+        :param site_ids: The fuel station IDs to look up.
+        :type site_ids: Sequence
+        :return: The row positions, as an array when NumPy is in use.
+        """
+        if not self.uses_numpy:
+            return [self.row_by_id.get(site_id, MISSING) for site_id in site_ids]
+
+        site_ids = np.asarray(site_ids, dtype="int64")
+        if len(self) == 0:
+            return np.full(len(site_ids), MISSING, dtype="int64")
+        if self.__sorted_ids is None:
+            order = np.argsort(self.columns["S"], kind="stable")
+            self.__sorted_ids = (order, self.columns["S"][order])
+        order, sorted_ids = self.__sorted_ids
+        positions = np.minimum(np.searchsorted(sorted_ids, site_ids), len(sorted_ids) - 1)
+        return np.where(sorted_ids[positions] == site_ids, order[positions], MISSING)
+
+    def open_mask(self, date_time: datetime):
+        """Gets whether each fuel station is open at a time, in the same way
+        as :meth:`FuelStation.is_open`.
+
+        :param date_time: The time, in the fuel stations' timezone.
+        :type date_time: datetime
+        :return: A boolean for each fuel station, as an array when NumPy is in
+                use.
+        """
+        weekday = date_time.weekday()
+        opens = self.columns[STATION_HOURS_COLUMNS[2 * weekday]]
+        closes = self.columns[STATION_HOURS_COLUMNS[2 * weekday + 1]]
+        now = date_time.hour * 3600 + date_time.minute * 60 + date_time.second + date_time.microsecond / 1e6
+        if self.uses_numpy:
+            return (opens != MISSING) & (closes != MISSING) & (opens <= now) & (now <= closes)
+        return [
+            opening != MISSING and closing != MISSING and opening <= now <= closing
+            for opening, closing in zip(opens, closes)
+        ]
+
+    def converted(self, *, use_numpy: bool):
+        """Gets this table with its columns stored as NumPy arrays or lists.
+
+        :param use_numpy: Whether the columns should be NumPy arrays.
+        :type use_numpy: bool
+        :return: A StationTable object.
+        """
+        if use_numpy == self.uses_numpy:
+            return self
+        columns = {
+            name: _column(as_list(self.columns[name]), _dtype(name), use_numpy=use_numpy) for name in STATION_COLUMNS
+        }
+        return StationTable(columns, self.records)
+
+
+class PriceTable:
+    """Column-oriented GetSitesPrices price records, joined to the brand,
+    postcode, region and location columns of the fuel station selling the
+    fuel.
+
+    "TransactionDateUtc" is held as seconds since the epoch, and "Row" is the
+    row of the fuel station in :attr:`stations`. Joined columns hold -1 (NaN
+    for locations and "" for postcodes) for prices of fuel stations that are
+    not in the site details.
+
+    :param columns: A mapping of column name to column values.
+    :type columns: dict
+    :param stations: The fuel stations the prices are joined to.
+    :type stations: StationTable
+    """
+
+    def __init__(self, columns: dict, stations: StationTable) -> None:
+        self.columns = columns
+        self.stations = stations
+        self.uses_numpy = is_array(columns["SiteId"])
+
+    @classmethod
+    def from_payloads(
+        cls,
+        fuel_stations: Iterable[dict] | StationTable,
+        site_prices: Iterable[dict],
+        use_numpy: bool | None = None,
+    ):
+        """Builds a PriceTable from the "S" list of a GetFullSiteDetails
+        response and the "SitePrices" list of a GetSitesPrices response.
+
+        :param fuel_stations: The fuel station records, or a StationTable
+                built from them.
+        :type fuel_stations: Iterable[dict] | StationTable
+        :param site_prices: The fuel station price records.
+        :type site_prices: Iterable[dict]
+        :param use_numpy: Whether to store columns as NumPy arrays, defaults
+                to using NumPy when it is installed.
+        :type use_numpy: bool, optional
+        :return: A PriceTable object.
+        """
+        use_numpy = _use_numpy(use_numpy)
+        if isinstance(fuel_stations, StationTable):
+            stations = fuel_stations.converted(use_numpy=use_numpy)
+        else:
+            stations = StationTable.from_payload(fuel_stations, use_numpy=use_numpy)
+
+        site_ids, fuel_ids, prices, timestamps = [], [], [], []
+        for site_price in site_prices:
+            site_ids.append(_as_int(site_price.get("SiteId")))
+            fuel_ids.append(_as_int(site_price.get("FuelId")))
+            prices.append(_as_float(site_price.get("Price")))
+            timestamps.append(epoch_seconds(site_price.get("TransactionDateUtc")))
+
+        rows = stations.rows_for(site_ids)
+        columns = {
+            "SiteId": _column(site_ids, "int64", use_numpy=use_numpy),
+            "FuelId": _column(fuel_ids, "int64", use_numpy=use_numpy),
+            "Price": _column(prices, "float64", use_numpy=use_numpy),
+            "TransactionDateUtc": _column(timestamps, "float64", use_numpy=use_numpy),
+            "Row": rows,
+        }
+        joined = {name: MISSING for name in JOINED_INT_COLUMNS}
+        joined.update({name: float("nan") for name in JOINED_FLOAT_COLUMNS})
+        joined.update({name: MISSING_STR for name in JOINED_STR_COLUMNS})
+        if use_numpy:
+            known = rows != MISSING
+            safe_rows = np.where(known, rows, 0)
+            for name, missing in joined.items():
+                if not len(stations):
+                    columns[name] = np.full(len(rows), missing, dtype=_dtype(name))
+                    continue
+                columns[name] = np.where(known, stations[name][safe_rows], missing)
+        else:
+            for name, missing in joined.items():
+                column = stations[name]
+                columns[name] = [column[row] if row != MISSING else missing for row in rows]
+        return cls(columns, stations)
+
+    def __len__(self) -> int:
+        return len(self.columns["SiteId"])
+
+    def __getitem__(self, name: str):
+        return self.columns[name]
@@ -0,0 +1,477 @@
+"""Price histories built from a series of GetSitesPrices snapshots.
+
+Consecutive snapshots mostly repeat the same prices, so a PriceHistory only
+keeps the price changes of each site and fuel, in NumPy arrays sorted by
+series and time. Resampling, rolling statistics and price-cycle detection
+work on those arrays for every series at once.
+
+Adelaide's fuel prices follow a cycle: prices are restored by a large jump,
+then fall gradually as sites undercut each other until the trough just
+before the next restoration. Restorations are detected as price rises of at
+least a threshold, and the next trough is forecast from the median cycle
+length of each site and fuel.
+"""
+
+from __future__ import annotations
+
+import json
+import math
+import time
+import warnings
+from dataclasses import dataclass, field
+from typing import Iterable, Sequence
+
+from safpis.models import epoch_seconds
+from safpis.tables import UNAVAILABLE_PRICE
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+# A rise of at least 10 cents per litre, in tenths of a cent, restores prices.
+DEFAULT_RESTORATION_JUMP = 100.0
+
+# Rises within a day of a restoration belong to the same restoration.
+DEFAULT_RESTORATION_GAP = 24 * 60 * 60
+
+# A cycle length needs at least two restorations.
+MIN_RESTORATIONS = 2
+
+ROLLING_STATISTICS = ("mean", "std", "min", "max")
+
+
+def _require_numpy() -> None:
+    if np is None:
+        msg = "NumPy is required for price histories; install it with: pip install safpis[numpy]"
+        raise ImportError(msg)
+
+
+@dataclass
+class Resampled:
+    """Prices sampled at regular times, each the price in effect then.
+
+    :param times: The sample times, in seconds since the epoch
+    :param series: The (site ID, fuel ID) of each row of :attr:`prices`
+    :param prices: A 2-D array with a row per series and a column per sample
+        time; NaN before a series' first price or while a fuel is unavailable
+    """
+
+    times: np.ndarray
+    series: list
+    prices: np.ndarray
+
+
+@dataclass
+class CyclePhase:
+    """Where a site and fuel is in the price cycle.
+
+    :param site_id: ID of the fuel station
+    :param fuel_id: ID of the fuel
+    :param cycle_length: Median seconds between restorations
+    :param last_restoration: When prices were last restored, in seconds since
+        the epoch
+    :param phase: Fraction of the current cycle that has elapsed, from 0 just
+        after a restoration to nearly 1 at the trough
+    :param next_trough: Forecast time of the next trough, just before the next
+        restoration, in seconds since the epoch
+    :param trough_price: Median price just before each restoration
+    :param restorations: Number of restorations detected
+    """
+
+    site_id: int
+    fuel_id: int
+    cycle_length: float
+    last_restoration: float
+    phase: float
+    next_trough: float
+    trough_price: float
+    restorations: int = field(default=0)
+
+
+class PriceHistory:
+    """The price changes of every site and fuel over time.
+
+    :raises ImportError: if NumPy is not installed.
+    """
+
+    def __init__(self) -> None:
+        _require_numpy()
+        self.__codes: dict = {}
+        self.__keys: list = []
+        self.__latest: dict = {}
+        self.__pending: tuple = ([], [], [])
+        self.__times = np.empty(0, dtype="float64")
+        self.__series = np.empty(0, dtype="int64")
+        self.__prices = np.empty(0, dtype="float64")
+        self.__starts = np.zeros(1, dtype="int64")
+
+    def __code(self, site_id: int, fuel_id: int) -> int:
+        key = (int(site_id), int(fuel_id))
+        code = self.__codes.get(key)
+        if code is None:
+            code = self.__codes[key] = len(self.__keys)
+            self.__keys.append(key)
+        return code
+
+    @classmethod
+    def from_arrays(cls, times, site_ids, fuel_ids, prices) -> PriceHistory:
+        """Builds a history from arrays of observed prices.
+
+        :param times: Observation times, in seconds since the epoch.
+        :param site_ids: Fuel station IDs.
+        :param fuel_ids: Fuel IDs.
+        :param prices: Prices, in tenths of a cent per litre.
+        :return: A PriceHistory object.
+        :rtype: PriceHistory
+        """
+        history = cls()
+        history.append_arrays(times, site_ids, fuel_ids, prices)
+        return history
+
+    @classmethod
+    def from_files(cls, paths: Iterable[str]) -> PriceHistory:
+        """Builds a history from recorded files: GetSitesPrices responses
+        saved as JSON, or newline-delimited JSON price records such as those
+        written by ``safpis export prices --format ndjson``.
+
+        :param paths: The paths of the files.
+        :type paths: Iterable[str]
+        :return: A PriceHistory object.
+        :rtype: PriceHistory
+        """
+        history = cls()
+        for path in paths:
+            with open(path, encoding="utf-8") as handle:
+                if path.endswith((".ndjson", ".jsonl")):
+                    site_prices = [json.loads(line) for line in handle if line.strip()]
+                else:
+                    site_prices = json.load(handle)["SitePrices"]
+            history.append_snapshot(site_prices)
+        return history
+
+    @classmethod
+    def load(cls, path: str) -> PriceHistory:
+        """Loads a history saved by :meth:`save`.
+
+        :param path: The path of the file.
+        :type path: str
+        :return: A PriceHistory object.
+        :rtype: PriceHistory
+        """
+        with np.load(path) as arrays:
+            keys = arrays["keys"]
+            return cls.from_arrays(
+                arrays["times"], keys[arrays["series"], 0], keys[arrays["series"], 1], arrays["prices"]
+            )
+
+    def save(self, path: str) -> None:
+        """Saves the history as a compressed NumPy file.
+
+        :param path: The path of the file.
+        :type path: str
+        """
+        times, series, prices = self.__arrays()
+        keys = np.asarray(self.__keys, dtype="int64").reshape(-1, 2)
+        np.savez_compressed(path, times=times, series=series, prices=prices, keys=keys)
+
+    def append_snapshot(self, site_prices: Iterable[dict], observed: float | None = None) -> int:
+        """Adds the prices that changed in a GetSitesPrices snapshot.
+
+        Each price is recorded at its TransactionDateUtc, or at
+        :param observed: if that is missing.
+
+        :param site_prices: The "SitePrices" records.
+        :type site_prices: Iterable[dict]
+        :param observed: When the snapshot was taken, in seconds since the
+                epoch, defaults to now.
+        :type observed: float, optional
+        :return: The number of prices that changed.
+        :rtype: int
+        """
+        observed = time.time() if observed is None else observed
+        times, series, prices = self.__pending
+        changed = 0
+        for site_price in site_prices:
+            code = self.__code(site_price["SiteId"], site_price["FuelId"])
+            latest = (site_price["Price"], site_price.get("TransactionDateUtc"))
+            if self.__latest.get(code) == latest:
+                continue
+            self.__latest[code] = latest
+            transaction_time = epoch_seconds(latest[1])
+            times.append(observed if math.isnan(transaction_time) else transaction_time)
+            series.append(code)
+            prices.append(latest[0])
+            changed += 1
+        return changed
+
+    def append_arrays(self, times, site_ids, fuel_ids, prices) -> None:
+        """Adds arrays of observed prices; repeated prices are dropped.
+
+        :param times: Observation times, in seconds since the epoch.
+        :param site_ids: Fuel station IDs.
+        :param fuel_ids: Fuel IDs.
+        :param prices: Prices, in tenths of a cent per litre.
+        """
+        site_ids = np.asarray(site_ids, dtype="int64")
+        fuel_ids = np.asarray(fuel_ids, dtype="int64")
+        if not len(site_ids):
+            return
+        # Unique on one combined key is much faster than on rows of pairs.
+        fuel_span = int(fuel_ids.max()) + 1
+        pairs, inverse = np.unique(site_ids * fuel_span + fuel_ids, return_inverse=True)
+        codes = np.asarray([self.__code(pair // fuel_span, pair % fuel_span) for pair in pairs.tolist()], dtype="int64")
+        self.__merge(
+            np.asarray(times, dtype="float64"),
+            codes[inverse.reshape(-1)],
+            np.asarray(prices, dtype="float64"),
+        )
+
+    def __arrays(self) -> tuple:
+        times, series, prices = self.__pending
+        if times:
+            self.__pending = ([], [], [])
+            self.__merge(
+                np.asarray(times, dtype="float64"),
+                np.asarray(series, dtype="int64"),
+                np.asarray(prices, dtype="float64"),
+            )
+        return self.__times, self.__series, self.__prices
+
+    def __merge(self, times, series, prices) -> None:
+        times = np.concatenate([self.__times, times])
+        series = np.concatenate([self.__series, series])
+        prices = np.concatenate([self.__prices, np.where(prices == UNAVAILABLE_PRICE, np.nan, prices)])
+        # A stable sort of one series * span + time key is about twice as
+        # fast as a lexsort, and appends in order need no sort at all.
+        origin = times.min()
+        keyed = series * (times.max() - origin + 1) + (times - origin)
+        if not (keyed[1:] >= keyed[:-1]).all():
+            order = np.argsort(keyed, kind="stable")
+            times, series, prices = times[order], series[order], prices[order]
+        # Keep only the first of each run of equal prices in a series.
+        keep = np.ones(len(times), dtype=bool)
+        same_price = (prices[1:] == prices[:-1]) | (np.isnan(prices[1:]) & np.isnan(prices[:-1]))
+        keep[1:] = (series[1:] != series[:-1]) | ~same_price
+        self.__times, self.__series, self.__prices = times[keep], series[keep], prices[keep]
+        self.__starts = np.searchsorted(self.__series, np.arange(len(self.__keys) + 1))
+
+    def __len__(self) -> int:
+        return len(self.__arrays()[0])
+
+    def series(self) -> list:
+        """Gets the series in the history.
+
+        :return: A list of (site ID, fuel ID) tuples.
+        :rtype: list
+        """
+        return list(self.__keys)
+
+    def changes(self, site_id: int, fuel_id: int) -> tuple:
+        """Gets the price changes of a site and fuel.
+
+        :param site_id: The ID of the fuel station.
+        :type site_id: int
+        :param fuel_id: The ID of the fuel.
+        :type fuel_id: int
+        :return: A tuple of arrays of the change times and the new prices.
+        :rtype: tuple
+        """
+        times, _series, prices = self.__arrays()
+        code = self.__codes.get((site_id, fuel_id))
+        if code is None:
+            return times[:0], prices[:0]
+        start, end = self.__starts[code], self.__starts[code + 1]
+        return times[start:end], prices[start:end]
+
+    def resample(
+        self,
+        interval: float,
+        start: float | None = None,
+        end: float | None = None,
+        series: Sequence[tuple] | None = None,
+    ) -> Resampled:
+        """Samples the price in effect for each series at regular times.
+
+        :param interval: Seconds between samples, e.g. 3600 for hourly.
+        :type interval: float
+        :param start: The first sample time, defaults to the first price
+                change rounded down to a multiple of :param interval:.
+        :type start: float, optional
+        :param end: The latest sample time, defaults to the last price change.
+        :type end: float, optional
+        :param series: The (site ID, fuel ID) series to sample, defaults to
+                all of them.
+        :type series: Sequence[tuple], optional
+        :return: A Resampled object.
+        :rtype: Resampled
+        """
+        times, codes, prices = self.__arrays()
+        keys = self.series() if series is None else [tuple(key) for key in series]
+        wanted = np.asarray([self.__codes.get(key, -1) for key in keys], dtype="int64")
+        if not len(times):
+            return Resampled(np.empty(0), keys, np.full((len(keys), 0), np.nan))
+        start = math.floor(times.min() / interval) * interval if start is None else start
+        end = times.max() if end is None else end
+        grid = np.arange(start, end + interval * 1e-9, interval)
+
+        # Searching series * span + time finds every series' samples at once.
+        origin = min(times.min(), start)
+        span = max(times.max(), end) - origin + 1
+        keyed = codes * span + (times - origin)
+        known = np.maximum(wanted, 0)
+        positions = np.searchsorted(keyed, known[:, None] * span + (grid - origin)[None, :], side="right") - 1
+        valid = (wanted[:, None] >= 0) & (positions >= self.__starts[known][:, None])
+        return Resampled(grid, keys, np.where(valid, prices[np.maximum(positions, 0)], np.nan))
+
+    def restorations(
+        self,
+        threshold: float = DEFAULT_RESTORATION_JUMP,
+        min_gap: float = DEFAULT_RESTORATION_GAP,
+    ) -> tuple:
+        """Finds the price restorations of every series.
+
+        :param threshold: The smallest price rise counted as a restoration,
+                defaults to 100 (10 cents per litre).
+        :type threshold: float
+        :param min_gap: Seconds after a restoration within which further rises
+                are part of it, defaults to a day.
+        :type min_gap: float
+        :return: A tuple of arrays of each restoration's series index (into
+                :meth:`series`), time, price before and price after, sorted by
+                series and time.
+        :rtype: tuple
+        """
+        times, codes, prices = self.__arrays()
+        with np.errstate(invalid="ignore"):
+            rises = (codes[1:] == codes[:-1]) & (prices[1:] - prices[:-1] >= threshold)
+        positions = np.flatnonzero(rises) + 1
+        series, when = codes[positions], times[positions]
+        distinct = np.ones(len(positions), dtype=bool)
+        distinct[1:] = (series[1:] != series[:-1]) | (when[1:] - when[:-1] >= min_gap)
+        positions = positions[distinct]
+        return codes[positions], times[positions], prices[positions - 1], prices[positions]
+
+    def cycle_phases(
+        self,
+        now: float | None = None,
+        threshold: float = DEFAULT_RESTORATION_JUMP,
+        min_gap: float = DEFAULT_RESTORATION_GAP,
+    ) -> dict:
+        """Finds where each site and fuel is in the price cycle and forecasts
+        its next trough.
+
+        Series with fewer than two restorations are left out.
+
+        :param now: The time to find the phase at, in seconds since the
+                epoch, defaults to the time of the latest price change.
+        :type now: float, optional
+        :param threshold: The smallest price rise counted as a restoration,
+                defaults to 100 (10 cents per litre).
+        :type threshold: float
+        :param min_gap: Seconds after a restoration within which further rises
+                are part of it, defaults to a day.
+        :type min_gap: float
+        :return: A dict mapping each (site ID, fuel ID) to a CyclePhase object.
+        :rtype: dict
+        """
+        times = self.__arrays()[0]
+        if now is None:
+            now = float(times.max()) if len(times) else time.time()
+        series, when, before, _after = self.restorations(threshold, min_gap)
+        bounds = np.searchsorted(series, np.arange(len(self.__keys) + 1))
+        phases = {}
+        for code in np.flatnonzero(np.diff(bounds) >= MIN_RESTORATIONS).tolist():
+            start, end = bounds[code], bounds[code + 1]
+            cycle_length = float(np.median(np.diff(when[start:end])))
+            last_restoration = float(when[end - 1])
+            elapsed = max(0.0, now - last_restoration)
+            cycles = math.floor(elapsed / cycle_length)
+            site_id, fuel_id = self.__keys[code]
+            phases[(site_id, fuel_id)] = CyclePhase(
+                site_id=site_id,
+                fuel_id=fuel_id,
+                cycle_length=cycle_length,
+                last_restoration=last_restoration,
+                phase=elapsed / cycle_length - cycles,
+                next_trough=last_restoration + (cycles + 1) * cycle_length,
+                trough_price=float(np.nanmedian(before[start:end])),
+                restorations=end - start,
+            )
+        return phases
+
+
+def rolling(values, window: int, statistic: str = "mean", min_periods: int | None = None):
+    """Computes a rolling statistic along the last axis, e.g. over the
+    samples of :attr:`Resampled.prices`, ignoring NaNs.
+
+    :param values: The values, e.g. a 2-D array with a row per series.
+    :param window: The number of samples in each window.
+    :type window: int
+    :param statistic: One of "mean", "std", "min" or "max", defaults to
+            "mean".
+    :type statistic: str
+    :param min_periods: The fewest non-NaN values needed for a result,
+            defaults to :param window:.
+    :type min_periods: int, optional
+    :raises ValueError: if :param statistic: is not recognised.
+    :return: An array of the same shape, each value summarising the window
+            ending at it; NaN where there are too few values.
+    """
+    _require_numpy()
+    if statistic not in ROLLING_STATISTICS:
+        msg = f"statistic must be one of {ROLLING_STATISTICS!r}."
+        raise ValueError(msg)
+    values = np.asarray(values, dtype="float64")
+    min_periods = window if min_periods is None else min_periods
+    present = ~np.isnan(values)
+    counts = _window_sums(present.astype("float64"), window)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        if statistic in ("mean", "std"):
+            filled = np.where(present, values, 0.0)
+            means = _window_sums(filled, window) / counts
+            result = means
+            if statistic == "std":
+                squares = _window_sums(filled**2, window) / counts
+                result = np.sqrt(np.maximum(squares - means**2, 0.0) * counts / (counts - 1))
+        else:
+            padded = np.concatenate([np.full((*values.shape[:-1], window - 1), np.nan), values], axis=-1)
+            windows = np.lib.stride_tricks.sliding_window_view(padded, window, axis=-1)
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", RuntimeWarning)
+                result = np.nanmin(windows, axis=-1) if statistic == "min" else np.nanmax(windows, axis=-1)
+    return np.where(counts >= max(min_periods, 1), result, np.nan)
+
+
+def _window_sums(values, window: int):
+    cumulative = np.cumsum(values, axis=-1)
+    shifted = np.concatenate([np.zeros((*values.shape[:-1], window)), cumulative[..., :-window]], axis=-1)
+    return cumulative - shifted[..., : values.shape[-1]]
+
+
+class PriceRecorder:
+    """Records the prices of each new GetSitesPrices snapshot into a
+    PriceHistory.
+
+    :param api: The API client to fetch the prices with.
+    :type api: SafpisAPI
+    :param history: The history to record into, defaults to a new one.
+    :type history: PriceHistory, optional
+    """
+
+    def __init__(self, api, history: PriceHistory | None = None) -> None:
+        self.api = api
+        self.history = history if history is not None else PriceHistory()
+        self.__fingerprint: str | None = None
+
+    def record(self) -> int:
+        """Fetches the prices and records those that changed.
+
+        :return: The number of prices that changed.
+        :rtype: int
+        """
+        payload, self.__fingerprint = self.api.fetch("GetSitesPrices", self.__fingerprint)
+        if payload is None:
+            return 0
+        return self.history.append_snapshot(payload["SitePrices"])
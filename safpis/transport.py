@@ -0,0 +1,236 @@
+"""HTTP transports used by SafpisAPI to send requests.
+
+A transport sends one GET request at a time and returns a response with the
+``status_code``, ``headers``, ``content``, ``json()`` and
+``raise_for_status()`` of a :class:`requests.Response`. :class:`Transport`
+adds timeouts and retries with jittered exponential backoff to any client:
+subclasses only implement :meth:`Transport.send`.
+
+:class:`RequestsTransport`, the default, sends requests through the
+requests_cache sessions that cache responses as required by the SAFPIS API
+(OUT) Guide. Their connections are pooled and kept alive.
+"""
+
+from __future__ import annotations
+
+import random
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from datetime import timedelta
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests_cache import CachedSession
+from urllib3.util.request import ACCEPT_ENCODING
+
+DEFAULT_CONNECT_TIMEOUT = 5.0
+DEFAULT_READ_TIMEOUT = 30.0
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 0.5
+DEFAULT_MAX_BACKOFF = 10.0
+DEFAULT_POOL_SIZE = 10
+
+RETRY_STATUSES = frozenset({500, 502, 503, 504})
+
+CACHE_EXPIRY = {"day": timedelta(days=1), "minute": timedelta(minutes=1)}
+
+
+def accept_encoding() -> str:
+    """Gets the content codings urllib3 can decode with the installed
+    packages, e.g. "gzip, deflate, br" when brotli is installed.
+
+    :return: An Accept-Encoding header value.
+    :rtype: str
+    """
+    return ", ".join(ACCEPT_ENCODING.split(","))
+
+
+@dataclass
+class TransportConfig:
+    """Timeouts, retries and connection pool sizes for a transport.
+
+    :param connect_timeout: Seconds to wait for a connection
+    :param read_timeout: Seconds to wait between bytes of the response
+    :param retries: Times to retry a request after a connection error,
+        timeout or retryable status
+    :param backoff: Base delay in seconds before the first retry, doubled for
+        each further retry; each delay is drawn uniformly from zero up to it
+    :param max_backoff: Longest delay in seconds before a retry
+    :param retry_statuses: The response statuses to retry
+    :param pool_connections: Number of hosts to keep connection pools for
+    :param pool_size: Connections kept alive per host
+    :param cache_backend: The requests_cache backend of RequestsTransport,
+        e.g. "memory" for a cache that only lasts as long as the process
+    """
+
+    connect_timeout: float = DEFAULT_CONNECT_TIMEOUT
+    read_timeout: float = DEFAULT_READ_TIMEOUT
+    retries: int = DEFAULT_RETRIES
+    backoff: float = DEFAULT_BACKOFF
+    max_backoff: float = DEFAULT_MAX_BACKOFF
+    retry_statuses: frozenset = field(default=RETRY_STATUSES)
+    pool_connections: int = DEFAULT_POOL_SIZE
+    pool_size: int = DEFAULT_POOL_SIZE
+    cache_backend: str = "sqlite"
+
+
+class Transport(ABC):
+    """Sends GET requests with timeouts and retries. Subclasses implement
+    :meth:`send` for an HTTP client.
+
+    :param config: Timeouts, retries and pool sizes, defaults to
+            TransportConfig().
+    :type config: TransportConfig, optional
+    """
+
+    # Exceptions raised by send() for connection errors and timeouts.
+    retry_exceptions: tuple = (ConnectionError, TimeoutError)
+
+    # The content codings the client decodes.
+    accept_encoding = "gzip, deflate"
+
+    def __init__(self, config: TransportConfig | None = None) -> None:
+        self.config = config if config is not None else TransportConfig()
+
+    @abstractmethod
+    def send(self, url: str, headers: dict, params: dict, cache: str, timeout: tuple):
+        """Sends one GET request.
+
+        :param url: The URL.
+        :type url: str
+        :param headers: The request headers.
+        :type headers: dict
+        :param params: The query parameters.
+        :type params: dict
+        :param cache: How long the response may be cached: 'day' or
+                'minute'. Transports without a cache ignore it.
+        :type cache: str
+        :param timeout: The (connect, read) timeouts in seconds.
+        :type timeout: tuple
+        :return: The response.
+        """
+
+    def get(self, url: str, headers: dict, params: dict, cache: str = "day"):
+        """Sends a GET request, retrying connection errors, timeouts and
+        retryable statuses with jittered exponential backoff.
+
+        :param url: The URL.
+        :type url: str
+        :param headers: The request headers.
+        :type headers: dict
+        :param params: The query parameters.
+        :type params: dict
+        :param cache: How long the response may be cached: 'day' or
+                'minute', defaults to 'day'.
+        :type cache: str
+        :raises retry_exceptions: if the last attempt fails to connect or
+                times out.
+        :return: The response of the last attempt.
+        """
+        config = self.config
+        timeout = (config.connect_timeout, config.read_timeout)
+        for attempt in range(config.retries + 1):
+            retries_left = attempt < config.retries
+            try:
+                response = self.send(url, headers, params, cache, timeout)
+            except self.retry_exceptions:
+                if not retries_left:
+                    raise
+                time.sleep(self.backoff(attempt))
+                continue
+            if not retries_left or response.status_code not in config.retry_statuses:
+                return response
+            # Release the connection to the pool before the next attempt.
+            response.close()
+            time.sleep(self.backoff(attempt, response.headers.get("Retry-After")))
+        return response  # pragma: no cover
+
+    def backoff(self, attempt: int, retry_after: str | None = None) -> float:
+        """Gets the delay before a retry: a random time up to
+        ``backoff * 2 ** attempt``, or the Retry-After the service asked for,
+        and at most ``max_backoff``.
+
+        :param attempt: The number of the attempt that failed, from 0.
+        :type attempt: int
+        :param retry_after: The response's Retry-After header, if any.
+        :type retry_after: str, optional
+        :return: The delay in seconds.
+        :rtype: float
+        """
+        delay = random.uniform(0, self.config.backoff * 2**attempt)  # noqa: S311
+        if retry_after is not None and retry_after.isdigit():
+            delay = max(delay, float(retry_after))
+        return min(delay, self.config.max_backoff)
+
+    def cached(self, url: str, headers: dict, params: dict, cache: str = "day"):  # noqa: ARG002
+        """Gets the cached response to a GET request without sending it,
+        even if the response has expired.
+
+        :param url: The URL.
+        :type url: str
+        :param headers: The request headers.
+        :type headers: dict
+        :param params: The query parameters.
+        :type params: dict
+        :param cache: The cache to look in: 'day' or 'minute', defaults to
+                'day'.
+        :type cache: str
+        :return: The cached response, or None if there is none. Transports
+                without a cache always return None.
+        """
+        return None
+
+    def close(self) -> None:
+        """Releases the transport's connections."""
+
+
+class RequestsTransport(Transport):
+    """Sends requests with requests_cache sessions that cache responses for
+    a day or a minute, over pooled keep-alive connections.
+
+    :param config: Timeouts, retries and pool sizes, defaults to
+            TransportConfig().
+    :type config: TransportConfig, optional
+    """
+
+    retry_exceptions = (requests.ConnectionError, requests.Timeout)
+
+    accept_encoding = accept_encoding()
+
+    def __init__(self, config: TransportConfig | None = None) -> None:
+        super().__init__(config)
+        self.sessions = {cache: self.__session(cache, expiry) for cache, expiry in CACHE_EXPIRY.items()}
+
+    def __session(self, cache: str, expiry: timedelta) -> CachedSession:
+        session = CachedSession(
+            f"safpis_cache_{cache}",
+            backend=self.config.cache_backend,
+            use_cache_dir=True,
+            cache_control=True,
+            expire_after=expiry,
+            allowable_codes=[200, 400],
+            allowable_methods=["GET"],
+            stale_if_error=False,
+        )
+        # Retries are made by Transport.get, with jitter, not by urllib3.
+        adapter = HTTPAdapter(
+            pool_connections=self.config.pool_connections,
+            pool_maxsize=self.config.pool_size,
+            max_retries=0,
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def send(self, url: str, headers: dict, params: dict, cache: str, timeout: tuple):
+        return self.sessions[cache].get(url, headers=headers, params=params, timeout=timeout)
+
+    def cached(self, url: str, headers: dict, params: dict, cache: str = "day"):
+        session = self.sessions[cache]
+        request = session.prepare_request(requests.Request("GET", url, headers=headers, params=params))
+        return session.cache.get_response(session.cache.create_key(request))
+
+    def close(self) -> None:
+        for session in self.sessions.values():
+            session.close()
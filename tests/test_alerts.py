@@ -0,0 +1,107 @@
+"""Tests for `alerts` module."""
+
+from unittest import TestCase, mock
+
+from safpis.alerts import Alert, AlertEngine, AlertRule
+from safpis.models import StationChanges
+
+# A fuel station and a price recorded from the SAFPIS REST API.
+FUEL_STATION = {
+    "S": "61205460",
+    "A": "11 Vader Street",
+    "N": "OTR Dry Creek",
+    "B": 169,
+    "P": "5094",
+    "G1": 170227225,
+    "G2": 189,
+    "G3": 4,
+    "G4": 0,
+    "G5": 0,
+    "Lat": -34.819297,
+    "Lng": 138.592116,
+    "M": "2023-12-27T09:15:01.100",
+    "GPI": "ChIJKy0p_ra3sGoRaWz3bT-5iEk",
+    "MO": "00:00",
+    "MC": "23:59",
+    "TO": "00:00",
+    "TC": "23:59",
+    "WO": "00:00",
+    "WC": "23:59",
+    "THO": "00:00",
+    "THC": "23:59",
+    "FO": "00:00",
+    "FC": "23:59",
+    "SO": "00:00",
+    "SC": "23:59",
+    "SUO": "00:00",
+    "SUC": "23:59",
+}
+SITE_PRICE = {
+    "SiteId": 61501045,
+    "FuelId": 14,
+    "CollectionMethod": "T",
+    "TransactionDateUtc": "2021-01-06T22:55:00",
+    "Price": 1356.0,
+}
+
+
+class TestAlerts(TestCase):
+    """Tests for `alerts` module."""
+
+    def setUp(self):
+        # Dry Creek and, about 30km away, Noarlunga.
+        self.fuel_stations = [
+            {**FUEL_STATION, "S": 1, "Lat": -34.819297, "Lng": 138.592116},
+            {**FUEL_STATION, "S": 2, "Lat": -35.139, "Lng": 138.499},
+        ]
+        self.engine = AlertEngine()
+        self.engine.set_fuel_stations(self.fuel_stations)
+        self.engine.add_rule(
+            AlertRule("near", fuel_id=2, max_price=1800.0, latitude=-34.82, longitude=138.59, radius_km=5)
+        )
+        self.engine.add_rule(AlertRule("anywhere", fuel_id=2, max_price=1700.0))
+        self.engine.add_rule(AlertRule("e10", fuel_id=12, max_price=9000.0))
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+
+    def test_rule_within_area(self):
+        alerts = self.engine.update([{**SITE_PRICE, "SiteId": 1, "FuelId": 2, "Price": 1799.0}])
+        assert [alert.rule.rule_id for alert in alerts] == ["near"]
+        assert isinstance(alerts[0], Alert)
+        assert alerts[0].distance_km < 1
+
+    def test_rule_outside_area(self):
+        alerts = self.engine.update([{**SITE_PRICE, "SiteId": 2, "FuelId": 2, "Price": 1799.0}])
+        assert alerts == []
+
+    def test_rule_threshold(self):
+        alerts = self.engine.update([{**SITE_PRICE, "SiteId": 2, "FuelId": 2, "Price": 1650.0}])
+        assert [alert.rule.rule_id for alert in alerts] == ["anywhere"]
+
+    def test_only_changed_prices_evaluated(self):
+        callback = mock.Mock()
+        self.engine.add_callback(callback)
+        site_prices = [{**SITE_PRICE, "SiteId": 1, "FuelId": 2, "Price": 1650.0}]
+        assert len(self.engine.update(site_prices)) == 2
+        assert callback.call_count == 2
+        assert self.engine.update(site_prices) == []
+        alerts = self.engine.update([{**SITE_PRICE, "SiteId": 1, "FuelId": 2, "Price": 1640.0}])
+        assert {alert.previous_price for alert in alerts} == {1650.0}
+
+    def test_remove_rule(self):
+        self.engine.remove_rule("near")
+        alerts = self.engine.update([{**SITE_PRICE, "SiteId": 1, "FuelId": 2, "Price": 1799.0}])
+        assert alerts == []
+        assert len(self.engine.rules()) == 2
+
+    def test_apply_station_changes(self):
+        moved = {**FUEL_STATION, "S": 2, "Lat": -34.821, "Lng": 138.591}
+        self.engine.apply_station_changes(StationChanges(changed=[(self.fuel_stations[1], moved)]))
+        alerts = self.engine.update([{**SITE_PRICE, "SiteId": 2, "FuelId": 2, "Price": 1799.0}])
+        assert [alert.rule.rule_id for alert in alerts] == ["near"]
+
+    def test_rule_within_area_site_ids(self):
+        self.engine.set_fuel_stations([FUEL_STATION])
+        alerts = self.engine.update([{**SITE_PRICE, "SiteId": 61205460, "FuelId": 2, "Price": 1799.0}])
+        assert [alert.rule.rule_id for alert in alerts] == ["near"]
@@ -0,0 +1,137 @@
+"""Tests for `analytics` and `tables` modules."""
+
+from unittest import TestCase
+
+import pytest
+
+from safpis.analytics import PriceStatistics, price_statistics
+from safpis.tables import UNAVAILABLE_PRICE, PriceTable, StationTable
+
+# A fuel station and a price recorded from the SAFPIS REST API.
+FUEL_STATION = {
+    "S": "61205460",
+    "A": "11 Vader Street",
+    "N": "OTR Dry Creek",
+    "B": 169,
+    "P": "5094",
+    "G1": 170227225,
+    "G2": 189,
+    "G3": 4,
+    "G4": 0,
+    "G5": 0,
+    "Lat": -34.819297,
+    "Lng": 138.592116,
+    "M": "2023-12-27T09:15:01.100",
+    "GPI": "ChIJKy0p_ra3sGoRaWz3bT-5iEk",
+    "MO": "00:00",
+    "MC": "23:59",
+    "TO": "00:00",
+    "TC": "23:59",
+    "WO": "00:00",
+    "WC": "23:59",
+    "THO": "00:00",
+    "THC": "23:59",
+    "FO": "00:00",
+    "FC": "23:59",
+    "SO": "00:00",
+    "SC": "23:59",
+    "SUO": "00:00",
+    "SUC": "23:59",
+}
+SITE_PRICE = {
+    "SiteId": 61501045,
+    "FuelId": 14,
+    "CollectionMethod": "T",
+    "TransactionDateUtc": "2021-01-06T22:55:00",
+    "Price": 1356.0,
+}
+
+
+class TestAnalytics(TestCase):
+    """Tests for `analytics` module."""
+
+    def setUp(self):
+        self.fuel_stations = [
+            {**FUEL_STATION, "S": 1, "B": 2, "P": "5000", "G1": 10},
+            {**FUEL_STATION, "S": 2, "B": 2, "P": "5000", "G1": 10},
+            {**FUEL_STATION, "S": 3, "B": 23, "P": "5094", "G1": 11},
+        ]
+        self.site_prices = [
+            {**SITE_PRICE, "SiteId": 1, "FuelId": 2, "Price": 1800.0},
+            {**SITE_PRICE, "SiteId": 2, "FuelId": 2, "Price": 1900.0},
+            {**SITE_PRICE, "SiteId": 3, "FuelId": 2, "Price": 2000.0},
+            {**SITE_PRICE, "SiteId": 3, "FuelId": 12, "Price": 1700.0},
+            {**SITE_PRICE, "SiteId": 2, "FuelId": 12, "Price": UNAVAILABLE_PRICE},
+            {**SITE_PRICE, "SiteId": 4, "FuelId": 12, "Price": 1750.0},
+        ]
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+
+    def test_price_table_join(self):
+        table = PriceTable.from_payloads(self.fuel_stations, self.site_prices)
+        assert len(table) == 6
+        assert list(table["B"]) == [2, 2, 23, 23, 2, -1]
+        assert list(table["P"]) == ["5000", "5000", "5094", "5094", "5000", ""]
+
+    def test_price_table_recorded_payloads(self):
+        # The recorded price is for another fuel station.
+        table = PriceTable.from_payloads([FUEL_STATION], [SITE_PRICE, {**SITE_PRICE, "SiteId": 61205460}])
+        assert list(table["SiteId"]) == [61501045, 61205460]
+        assert list(table["Row"]) == [-1, 0]
+        assert list(table["P"]) == ["", "5094"]
+        statistics = price_statistics(table, by=("FuelId", "B"))
+        assert set(statistics) == {(14, -1), (14, 169)}
+        assert statistics[(14, 169)].median == 1356.0
+
+    def test_price_table_from_station_table(self):
+        pytest.importorskip("numpy")
+        stations = StationTable.from_payload(self.fuel_stations, use_numpy=False)
+        table = PriceTable.from_payloads(stations, self.site_prices, use_numpy=True)
+        assert table.uses_numpy
+        assert list(table["G1"]) == [10, 10, 11, 11, 10, -1]
+
+    def test_price_statistics_by_fuel(self):
+        table = PriceTable.from_payloads(self.fuel_stations, self.site_prices)
+        statistics = price_statistics(table, percentiles=(25,))
+        unleaded = statistics[(2,)]
+        assert isinstance(unleaded, PriceStatistics)
+        assert unleaded.count == 3
+        assert unleaded.min == 1800.0
+        assert unleaded.median == 1900.0
+        assert unleaded.mean == 1900.0
+        assert unleaded.spread == 200.0
+        assert unleaded.percentiles == {25: 1850.0}
+        assert statistics[(12,)].count == 2
+
+    def test_price_statistics_keeps_unavailable(self):
+        table = PriceTable.from_payloads(self.fuel_stations, self.site_prices)
+        statistics = price_statistics(table, exclude_unavailable=False)
+        assert statistics[(12,)].max == UNAVAILABLE_PRICE
+
+    def test_price_statistics_by_fuel_and_brand(self):
+        table = PriceTable.from_payloads(self.fuel_stations, self.site_prices)
+        statistics = price_statistics(table, by=("FuelId", "B"))
+        assert set(statistics) == {(2, 2), (2, 23), (12, 23), (12, -1)}
+        assert statistics[(2, 2)].mean == 1850.0
+
+    def test_price_statistics_numpy_matches_python(self):
+        np = pytest.importorskip("numpy")
+        fast = PriceTable.from_payloads(self.fuel_stations, self.site_prices, use_numpy=True)
+        slow = PriceTable.from_payloads(self.fuel_stations, self.site_prices, use_numpy=False)
+        for by in [("FuelId",), ("B",), ("G1", "FuelId"), ("P",)]:
+            assert price_statistics(fast, by=by) == price_statistics(slow, by=by)
+        percentile = price_statistics(fast, percentiles=(90,))[(2,)].percentiles[90]
+        assert percentile == pytest.approx(np.percentile([1800.0, 1900.0, 2000.0], 90))
+
+    def test_price_statistics_by_postcode(self):
+        fuel_stations = [*self.fuel_stations, {**FUEL_STATION, "S": 4, "P": "0800"}]
+        table = PriceTable.from_payloads(fuel_stations, self.site_prices)
+        statistics = price_statistics(table, by=("P",))
+        assert set(statistics) == {("5000",), ("5094",), ("0800",)}
+        assert statistics[("0800",)].mean == 1750.0
+
+    def test_price_statistics_invalid_column(self):
+        table = PriceTable.from_payloads(self.fuel_stations, self.site_prices)
+        with pytest.raises(ValueError, match="by must be"):
+            price_statistics(table, by=("Name",))
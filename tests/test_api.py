@@ -7,7 +7,7 @@ from unittest import TestCase, mock
 import pytest
 import requests
 
-from safpis.api import APIKeyMissingError, SafpisAPI
+from safpis.api import APIKeyMissingError, SafpisAPI, payload_fingerprint
 
 
 class TestApi(TestCase):
@@ -115,3 +115,38 @@ class TestApi(TestCase):
         response = api.GetSitesPrices()
         assert isinstance(response, dict)
         assert "SitePrices" in response
+
+    def test_payload_fingerprint(self):
+        response = mock.Mock(headers={}, content=b'{"SitePrices": []}')
+        assert payload_fingerprint(response).startswith("sha256:")
+        response.headers["ETag"] = '"abc"'
+        assert payload_fingerprint(response) == 'etag:"abc"'
+
+    @mock.patch.dict(os.environ, {"SAFPIS_SUBSCRIBER_TOKEN": "FAKE-TOKEN"})
+    def test_GetSitesPrices_unchanged(self):
+        response = mock.Mock(headers={}, content=b'{"SitePrices": []}')
+        response.json.return_value = {"SitePrices": []}
+        api = SafpisAPI()
+        with mock.patch.object(api.cached_session_minute, "get", return_value=response):
+            assert api.GetSitesPrices() == {"SitePrices": []}
+            fingerprint = api.fingerprints["GetSitesPrices"]
+            assert api.GetSitesPrices(fingerprint=fingerprint) is None
+            response.content = b'{"SitePrices": [{}]}'
+            assert api.GetSitesPrices(fingerprint=fingerprint) == {"SitePrices": []}
+            payload, changed = api.fetch("GetSitesPrices", fingerprint)
+            assert payload == {"SitePrices": []}
+            assert changed == api.fingerprints["GetSitesPrices"] != fingerprint
+            assert api.fetch("GetSitesPrices", changed) == (None, changed)
+            with pytest.raises(ValueError, match="endpoint must be"):
+                api.fetch("GetSites")
+
+    @mock.patch.dict(os.environ, {"SAFPIS_SUBSCRIBER_TOKEN": "FAKE-TOKEN"})
+    def test_default_region(self):
+        response = mock.Mock(headers={}, content=b'{"SitePrices": []}')
+        response.json.return_value = {"SitePrices": []}
+        api = SafpisAPI(geo_region_id=1)
+        with mock.patch.object(api.cached_session_minute, "get", return_value=response) as get:
+            api.GetSitesPrices()
+            assert get.call_args.kwargs["params"] == {"countryId": 21, "geoRegionLevel": 3, "geoRegionId": 1}
+            api.GetSitesPrices(GeoRegionId=4)
+            assert get.call_args.kwargs["params"]["geoRegionId"] == 4
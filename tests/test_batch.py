@@ -0,0 +1,144 @@
+"""Tests for `batch` module."""
+
+import copy
+import io
+import json
+from unittest import TestCase, mock
+
+from safpis.api import SafpisAPI
+from safpis.batch import BatchQueries, jsonable, run
+from safpis.snapshot import SnapshotStore
+
+# A fuel station and a price recorded from the SAFPIS REST API.
+FUEL_STATION = {
+    "S": "61205460",
+    "A": "11 Vader Street",
+    "N": "OTR Dry Creek",
+    "B": 169,
+    "P": "5094",
+    "G1": 170227225,
+    "G2": 189,
+    "G3": 4,
+    "G4": 0,
+    "G5": 0,
+    "Lat": -34.819297,
+    "Lng": 138.592116,
+    "M": "2023-12-27T09:15:01.100",
+    "GPI": "ChIJKy0p_ra3sGoRaWz3bT-5iEk",
+    "MO": "00:00",
+    "MC": "23:59",
+    "TO": "00:00",
+    "TC": "23:59",
+    "WO": "00:00",
+    "WC": "23:59",
+    "THO": "00:00",
+    "THC": "23:59",
+    "FO": "00:00",
+    "FC": "23:59",
+    "SO": "00:00",
+    "SC": "23:59",
+    "SUO": "00:00",
+    "SUC": "23:59",
+}
+SITE_PRICE = {
+    "SiteId": 61501045,
+    "FuelId": 14,
+    "CollectionMethod": "T",
+    "TransactionDateUtc": "2021-01-06T22:55:00",
+    "Price": 1356.0,
+}
+
+
+class TestBatch(TestCase):
+    """Tests for `batch` module."""
+
+    def setUp(self):
+        self.fuel_stations = [
+            {**FUEL_STATION, "S": 1, "N": "Dry Creek"},
+            {**FUEL_STATION, "S": 2, "N": "CBD", "Lat": -34.9285, "Lng": 138.6007},
+        ]
+        self.site_prices = [
+            {**SITE_PRICE, "SiteId": 1, "FuelId": 2, "Price": 1800.0},
+            {**SITE_PRICE, "SiteId": 2, "FuelId": 2, "Price": 1750.0},
+            {**SITE_PRICE, "SiteId": 2, "FuelId": 12, "Price": 9999.0},
+        ]
+
+        self.api = mock.Mock(spec=SafpisAPI)
+        self.api.GetCountryBrands.return_value = {
+            "Brands": [
+                {"BrandId": 2, "Name": "Caltex"},
+                {"BrandId": 23, "Name": "United"},
+                {"BrandId": 169, "Name": "On the Run"},
+            ]
+        }
+        self.api.GetCountryFuelTypes.return_value = {
+            "Fuels": [{"FuelId": 2, "Name": "Unleaded"}, {"FuelId": 12, "Name": "e10"}]
+        }
+        self.api.GetCountryGeographicRegions.return_value = {"GeographicRegions": []}
+        self.api.GetFullSiteDetails.return_value = {"S": list(self.fuel_stations)}
+        self.api.GetSitesPrices.return_value = {"SitePrices": list(self.site_prices)}
+        self.api.fetch.side_effect = self.fetch
+
+        self.queries = BatchQueries(SnapshotStore(self.api).current())
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+
+    def fetch(self, endpoint, fingerprint=None, **_kwargs):
+        """Answers SafpisAPI.fetch from the mocked endpoint, fingerprinting
+        its payload by its repr."""
+        payload = getattr(self.api, endpoint).return_value
+        current = repr(payload)
+        return (None if fingerprint == current else copy.deepcopy(payload)), current
+
+    def _run(self, *queries):
+        output = io.StringIO()
+        counts = run(self.queries, [json.dumps(query) for query in queries], output)
+        return counts, [json.loads(line) for line in output.getvalue().splitlines()]
+
+    def test_lookups(self):
+        counts, results = self._run(
+            {"query": "site", "name": "CBD"},
+            {"query": "brand", "id": 23},
+            {"query": "fuel", "name": "e10"},
+            {"query": "price", "site_id": 1, "fuel_name": "Unleaded", "ref": "a"},
+        )
+        assert counts == (4, 0)
+        assert [result["ref"] for result in results] == [1, 2, 3, "a"]
+        assert results[0]["result"]["S"] == 2
+        assert results[0]["result"]["MO"] == "00:00:00"
+        assert results[1]["result"]["Name"] == "United"
+        assert results[2]["result"]["FuelId"] == 12
+        assert results[3]["result"]["Price"] == 1800.0
+
+    def test_closest_and_cheapest(self):
+        _counts, results = self._run(
+            {"query": "closest", "latitude": -34.93, "longitude": 138.6, "k": 1},
+            {"query": "cheapest", "fuel_id": 2},
+            {"query": "cheapest", "fuel_id": 12},
+        )
+        assert results[0]["result"][0]["fuel_station"]["S"] == 2
+        assert results[0]["result"][0]["distance_km"] < 1
+        assert [site_price["SiteId"] for site_price in results[1]["result"]] == [2, 1]
+        assert results[2]["result"] == []
+
+    def test_closest_site_ids(self):
+        self.api.GetFullSiteDetails.return_value = {"S": [FUEL_STATION]}
+        self.queries = BatchQueries(SnapshotStore(self.api).current())
+        _counts, results = self._run({"query": "closest", "latitude": -34.82, "longitude": 138.59, "k": 1})
+        assert results[0]["result"][0]["fuel_station"]["S"] == "61205460"
+
+    def test_errors_do_not_stop_the_batch(self):
+        output = io.StringIO()
+        lines = ["not json", '{"query": "teleport"}', "", '{"query": "site", "id": 3}', '{"query": "price"}']
+        counts = run(self.queries, [*lines, '{"query": "site", "id": 1}'], output)
+        results = [json.loads(line) for line in output.getvalue().splitlines()]
+        assert counts == (1, 4)
+        assert [result["ref"] for result in results] == [1, 2, 4, 5, 6]
+        assert "teleport" not in results[1]["error"]
+        assert results[2]["error"] == "No fuel station found for: 3"
+        assert results[3]["error"] == "missing argument 'site_id'"
+        assert results[4]["result"]["N"] == "Dry Creek"
+
+    def test_jsonable(self):
+        assert jsonable({"a": (1, 2)}) == {"a": [1, 2]}
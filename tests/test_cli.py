@@ -1,12 +1,56 @@
 """Tests for `safpis` package."""
 
 import configparser
+import copy
+import json
 import os
-from unittest import TestCase
+from unittest import TestCase, mock
 
 from click.testing import CliRunner
 
-from safpis import cli
+from safpis import cli, profiling
+from safpis.api import SafpisAPI
+from safpis.safpis import Safpis
+from safpis.snapshot import SnapshotStore
+
+# A fuel station and a price recorded from the SAFPIS REST API.
+FUEL_STATION = {
+    "S": "61205460",
+    "A": "11 Vader Street",
+    "N": "OTR Dry Creek",
+    "B": 169,
+    "P": "5094",
+    "G1": 170227225,
+    "G2": 189,
+    "G3": 4,
+    "G4": 0,
+    "G5": 0,
+    "Lat": -34.819297,
+    "Lng": 138.592116,
+    "M": "2023-12-27T09:15:01.100",
+    "GPI": "ChIJKy0p_ra3sGoRaWz3bT-5iEk",
+    "MO": "00:00",
+    "MC": "23:59",
+    "TO": "00:00",
+    "TC": "23:59",
+    "WO": "00:00",
+    "WC": "23:59",
+    "THO": "00:00",
+    "THC": "23:59",
+    "FO": "00:00",
+    "FC": "23:59",
+    "SO": "00:00",
+    "SC": "23:59",
+    "SUO": "00:00",
+    "SUC": "23:59",
+}
+SITE_PRICE = {
+    "SiteId": 61501045,
+    "FuelId": 14,
+    "CollectionMethod": "T",
+    "TransactionDateUtc": "2021-01-06T22:55:00",
+    "Price": 1356.0,
+}
 
 
 class TestCli(TestCase):
@@ -19,9 +63,34 @@ class TestCli(TestCase):
             config.read(secret_config_file)
             os.environ["SAFPIS_SUBSCRIBER_TOKEN"] = config["TEST"]["SAFPIS_SUBSCRIBER_TOKEN"]
 
+        self.api = mock.Mock(spec=SafpisAPI)
+        self.api.GetCountryBrands.return_value = {
+            "Brands": [
+                {"BrandId": 2, "Name": "Caltex"},
+                {"BrandId": 23, "Name": "United"},
+                {"BrandId": 169, "Name": "On the Run"},
+            ]
+        }
+        self.api.GetCountryFuelTypes.return_value = {
+            "Fuels": [{"FuelId": 2, "Name": "Unleaded"}, {"FuelId": 12, "Name": "e10"}]
+        }
+        self.api.GetCountryGeographicRegions.return_value = {"GeographicRegions": []}
+        self.api.GetFullSiteDetails.return_value = {
+            "S": [FUEL_STATION, {**FUEL_STATION, "S": "61205461", "Lat": -35.0}]
+        }
+        self.api.GetSitesPrices.return_value = {"SitePrices": [{**SITE_PRICE, "SiteId": 61205460}]}
+        self.api.fetch.side_effect = self.fetch
+
     def tearDown(self):
         """Tear down test fixtures, if any."""
 
+    def fetch(self, endpoint, fingerprint=None, **_kwargs):
+        """Answers SafpisAPI.fetch from the mocked endpoint, fingerprinting
+        its payload by its repr."""
+        payload = getattr(self.api, endpoint).return_value
+        current = repr(payload)
+        return (None if fingerprint == current else copy.deepcopy(payload)), current
+
     def test_command_line_interface(self):
         """Test the CLI."""
         runner = CliRunner()
@@ -31,3 +100,37 @@ class TestCli(TestCase):
         help_result = runner.invoke(cli.main, ["--help"])
         assert help_result.exit_code == 0
         assert "--help  Show this message and exit." in help_result.output
+
+    @mock.patch("safpis.cli.SafpisAPI")
+    def test_export(self, safpis_api):
+        safpis_api.return_value = self.api
+        runner = CliRunner()
+        result = runner.invoke(cli.main, ["export", "joined", "--format", "ndjson"])
+        assert result.exit_code == 0
+        row = json.loads(result.stdout.splitlines()[0])
+        assert row["SiteId"] == 61205460
+        assert row["N"] == "OTR Dry Creek"
+
+    @mock.patch("safpis.cli.Safpis")
+    def test_profile(self, safpis):
+        safpis.return_value = Safpis(api=self.api)
+        runner = CliRunner()
+        result = runner.invoke(cli.main, ["profile", "closest_fuel_stations", "-n", "3", "--", "-34.9", "138.6"])
+        assert result.exit_code == 0
+        lines = result.stdout.splitlines()
+        assert lines[0].split()[:2] == ["phase", "calls"]
+        assert lines[1].split()[:2] == ["closest_fuel_stations", "3"]
+        assert {line.split()[0] for line in lines[2:]} == {"parse", "geodesic", "sort"}
+        assert not profiling.enabled()
+
+    @mock.patch("safpis.cli.SnapshotStore")
+    def test_batch(self, snapshot_store):
+        snapshot_store.return_value = SnapshotStore(self.api)
+        runner = CliRunner()
+        queries = '{"query": "price", "site_id": 61205460, "fuel_id": 14}\n{"query": "site", "id": 3}\n'
+        result = runner.invoke(cli.main, ["batch"], input=queries)
+        assert result.exit_code == 0
+        results = [json.loads(line) for line in result.stdout.splitlines()]
+        assert results[0]["result"]["Price"] == 1356.0
+        assert "error" in results[1]
+        assert "Answered 1 queries, 1 failed." in result.stderr
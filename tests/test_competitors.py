@@ -0,0 +1,215 @@
+"""Tests for `competitors` module."""
+
+import copy
+import random
+import statistics
+from unittest import TestCase, mock
+
+import pytest
+
+from safpis.api import SafpisAPI
+from safpis.competitors import CompetitorGraph, PriceDifferential
+from safpis.geo import haversine_km
+from safpis.models import StationChanges
+from safpis.safpis import Safpis
+from safpis.snapshot import SnapshotStore
+
+# A fuel station and a price recorded from the SAFPIS REST API.
+FUEL_STATION = {
+    "S": "61205460",
+    "A": "11 Vader Street",
+    "N": "OTR Dry Creek",
+    "B": 169,
+    "P": "5094",
+    "G1": 170227225,
+    "G2": 189,
+    "G3": 4,
+    "G4": 0,
+    "G5": 0,
+    "Lat": -34.819297,
+    "Lng": 138.592116,
+    "M": "2023-12-27T09:15:01.100",
+    "GPI": "ChIJKy0p_ra3sGoRaWz3bT-5iEk",
+    "MO": "00:00",
+    "MC": "23:59",
+    "TO": "00:00",
+    "TC": "23:59",
+    "WO": "00:00",
+    "WC": "23:59",
+    "THO": "00:00",
+    "THC": "23:59",
+    "FO": "00:00",
+    "FC": "23:59",
+    "SO": "00:00",
+    "SC": "23:59",
+    "SUO": "00:00",
+    "SUC": "23:59",
+}
+SITE_PRICE = {
+    "SiteId": 61501045,
+    "FuelId": 14,
+    "CollectionMethod": "T",
+    "TransactionDateUtc": "2021-01-06T22:55:00",
+    "Price": 1356.0,
+}
+
+ADELAIDE = (-34.9285, 138.6007)
+MOUNT_GAMBIER = (-37.8284, 140.7804)
+
+
+class TestCompetitorGraph(TestCase):
+    """Tests for `CompetitorGraph`."""
+
+    def setUp(self):
+        # Four fuel stations 1km apart along a line, and one far away.
+        self.fuel_stations = [
+            {**FUEL_STATION, "S": site_id, "Lat": ADELAIDE[0] - 0.009 * site_id, "Lng": ADELAIDE[1]}
+            for site_id in range(1, 5)
+        ]
+        self.fuel_stations.append({**FUEL_STATION, "S": 5, "Lat": MOUNT_GAMBIER[0], "Lng": MOUNT_GAMBIER[1]})
+        self.site_prices = [
+            {**SITE_PRICE, "SiteId": 1, "FuelId": 2, "Price": 1800.0},
+            {**SITE_PRICE, "SiteId": 2, "FuelId": 2, "Price": 1900.0},
+            {**SITE_PRICE, "SiteId": 3, "FuelId": 2, "Price": 1850.0},
+            {**SITE_PRICE, "SiteId": 4, "FuelId": 2, "Price": 2100.0},
+            {**SITE_PRICE, "SiteId": 4, "FuelId": 12, "Price": 9999.0},
+            {**SITE_PRICE, "SiteId": 5, "FuelId": 2, "Price": 2000.0},
+        ]
+        self.graph = CompetitorGraph.from_payloads(self.fuel_stations, self.site_prices, k=2, max_km=10)
+
+        self.api = mock.Mock(spec=SafpisAPI)
+        self.api.GetCountryBrands.return_value = {
+            "Brands": [
+                {"BrandId": 2, "Name": "Caltex"},
+                {"BrandId": 23, "Name": "United"},
+                {"BrandId": 169, "Name": "On the Run"},
+            ]
+        }
+        self.api.GetCountryFuelTypes.return_value = {
+            "Fuels": [{"FuelId": 2, "Name": "Unleaded"}, {"FuelId": 12, "Name": "e10"}]
+        }
+        self.api.GetCountryGeographicRegions.return_value = {"GeographicRegions": []}
+        self.api.GetFullSiteDetails.return_value = {"S": list(self.fuel_stations)}
+        self.api.GetSitesPrices.return_value = {"SitePrices": list(self.site_prices)}
+        self.api.fetch.side_effect = self.fetch
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+
+    def fetch(self, endpoint, fingerprint=None, **_kwargs):
+        """Answers SafpisAPI.fetch from the mocked endpoint, fingerprinting
+        its payload by its repr."""
+        payload = getattr(self.api, endpoint).return_value
+        current = repr(payload)
+        return (None if fingerprint == current else copy.deepcopy(payload)), current
+
+    def test_competitors(self):
+        assert len(self.graph) == 5
+        assert [site_id for site_id, _distance in self.graph.competitors(1)] == [2, 3]
+        assert [site_id for site_id, _distance in self.graph.competitors(3)] in ([2, 4], [4, 2])
+        assert self.graph.competitors(1)[0][1] == pytest.approx(1.0, abs=0.01)
+        assert self.graph.competitors(5) == []
+        with pytest.raises(KeyError):
+            self.graph.competitors(6)
+
+    def test_differentials(self):
+        assert self.graph.differential(1, 2) == PriceDifferential(1, 2, 1800.0, 1875.0, -75.0, 2)
+        assert self.graph.differential(4, 2) == PriceDifferential(4, 2, 2100.0, 1875.0, 225.0, 2)
+        assert self.graph.differential(4, 12) is None
+        assert self.graph.differential(5, 2) is None
+        assert len(self.graph.differentials(2)) == 4
+        assert [differential.site_id for differential in self.graph.priced_above(2, 20)] == [4, 2]
+        assert [differential.site_id for differential in self.graph.priced_below(2, 20)] == [3, 1]
+        assert self.graph.priced_above(2, 20, min_competitors=3) == []
+
+    def test_apply_site_prices(self):
+        self.site_prices[3] = {**SITE_PRICE, "SiteId": 4, "FuelId": 2, "Price": 1800.0}
+        assert self.graph.apply_site_prices(self.site_prices) == 1
+        assert self.graph.differential(4, 2).difference == pytest.approx(-75.0)
+        assert self.graph.differential(2, 2).local_median == 1825.0
+        assert self.graph.apply_site_prices(self.site_prices) == 0
+
+    def test_matches_rebuild(self):
+        generator = random.Random(0)
+        fuel_stations = [
+            {
+                **FUEL_STATION,
+                "S": site_id,
+                "Lat": ADELAIDE[0] + generator.gauss(0, 0.05),
+                "Lng": ADELAIDE[1] + generator.gauss(0, 0.05),
+            }
+            for site_id in range(200)
+        ]
+        site_prices = [
+            {**SITE_PRICE, "SiteId": site_id, "Price": float(generator.randint(1700, 2100))} for site_id in range(200)
+        ]
+        graph = CompetitorGraph.from_payloads(fuel_stations, site_prices)
+        for _ in range(3):
+            for index in generator.sample(range(200), 20):
+                site_prices[index] = {
+                    **SITE_PRICE,
+                    "SiteId": index,
+                    "Price": float(generator.randint(1700, 2100)),
+                }
+            graph.apply_site_prices(site_prices)
+        rebuilt = CompetitorGraph.from_payloads(fuel_stations, site_prices)
+        assert sorted(graph.differentials(14), key=str) == sorted(rebuilt.differentials(14), key=str)
+
+        # The competitors are the nearest fuel stations.
+        station = fuel_stations[0]
+        distances = sorted(
+            (haversine_km(station["Lat"], station["Lng"], other["Lat"], other["Lng"]), other["S"])
+            for other in fuel_stations[1:]
+        )
+        assert [site_id for site_id, _distance in graph.competitors(0)] == [
+            site_id for _distance, site_id in distances[:5]
+        ]
+        prices = {record["SiteId"]: record["Price"] for record in site_prices}
+        local_median = statistics.median(prices[site_id] for _distance, site_id in distances[:5])
+        assert graph.differential(0, 14).local_median == local_median
+
+    def test_apply_station_changes(self):
+        moved = {**FUEL_STATION, "S": 5, "Lat": ADELAIDE[0] - 0.0045, "Lng": ADELAIDE[1]}
+        self.graph.apply_station_changes(StationChanges(changed=[(self.fuel_stations[4], moved)]))
+        assert [site_id for site_id, _distance in self.graph.competitors(5)] in ([1, 2], [2, 1])
+        assert self.graph.differential(5, 2).local_median == 1850.0
+
+        self.graph.apply_station_changes(StationChanges(removed=[moved]))
+        assert len(self.graph) == 4
+        assert self.graph.differential(5, 2) is None
+
+    def test_apply_snapshot(self):
+        store = SnapshotStore(self.api)
+        graph = CompetitorGraph(k=2, max_km=10)
+        store.add_listener(graph.apply_snapshot)
+        store.refresh()
+        assert graph.differentials(2) == self.graph.differentials(2)
+
+    def test_site_ids(self):
+        fuel_stations = [FUEL_STATION, {**FUEL_STATION, "S": "61205461", "Lat": -34.82}]
+        site_prices = [
+            {**SITE_PRICE, "SiteId": 61205460},
+            {**SITE_PRICE, "SiteId": 61205461, "Price": 1456.0},
+        ]
+        graph = CompetitorGraph.from_payloads(fuel_stations, site_prices)
+        assert graph.differential(61205460, 14).difference == -100.0
+        graph.apply_station_changes(StationChanges(removed=[fuel_stations[1]]))
+        assert graph.differential(61205460, 14) is None
+
+    def test_safpis_competitor_graph(self):
+        safpis = Safpis(api=self.api)
+        graph = safpis.competitor_graph(k=2, max_km=10)
+        assert graph.differential(4, 2).difference == 225.0
+        self.api.GetFullSiteDetails.return_value["S"] = self.fuel_stations[:4]
+        safpis.refresh()
+        assert len(graph) == 4
+
+    def test_safpis_competitor_graph_is_reused(self):
+        safpis = Safpis(api=self.api)
+        with mock.patch.object(safpis, "add_station_listener", wraps=safpis.add_station_listener) as add_listener:
+            graph = safpis.competitor_graph(k=2, max_km=10)
+            self.api.GetSitesPrices.return_value["SitePrices"][3]["Price"] = 2000.0
+            assert safpis.competitor_graph(k=2, max_km=10) is graph
+            assert graph.differential(4, 2).difference == 125.0
+            assert safpis.competitor_graph(k=3, max_km=10) is not graph
+        assert add_listener.call_count == 2
@@ -0,0 +1,147 @@
+"""Tests for `export` module."""
+
+import csv
+import io
+import json
+import os
+import tempfile
+from unittest import TestCase
+
+import pytest
+
+from safpis import export
+
+# A fuel station and a price recorded from the SAFPIS REST API.
+FUEL_STATION = {
+    "S": "61205460",
+    "A": "11 Vader Street",
+    "N": "OTR Dry Creek",
+    "B": 169,
+    "P": "5094",
+    "G1": 170227225,
+    "G2": 189,
+    "G3": 4,
+    "G4": 0,
+    "G5": 0,
+    "Lat": -34.819297,
+    "Lng": 138.592116,
+    "M": "2023-12-27T09:15:01.100",
+    "GPI": "ChIJKy0p_ra3sGoRaWz3bT-5iEk",
+    "MO": "00:00",
+    "MC": "23:59",
+    "TO": "00:00",
+    "TC": "23:59",
+    "WO": "00:00",
+    "WC": "23:59",
+    "THO": "00:00",
+    "THC": "23:59",
+    "FO": "00:00",
+    "FC": "23:59",
+    "SO": "00:00",
+    "SC": "23:59",
+    "SUO": "00:00",
+    "SUC": "23:59",
+}
+SITE_PRICE = {
+    "SiteId": 61501045,
+    "FuelId": 14,
+    "CollectionMethod": "T",
+    "TransactionDateUtc": "2021-01-06T22:55:00",
+    "Price": 1356.0,
+}
+
+
+class TestExport(TestCase):
+    """Tests for `export` module."""
+
+    def setUp(self):
+        self.fuel_stations = [
+            {**FUEL_STATION, "S": 1, "N": "One"},
+            {**FUEL_STATION, "S": 2, "N": "Two"},
+        ]
+        self.site_prices = [
+            {**SITE_PRICE, "SiteId": 1, "FuelId": 2, "Price": 1800.0},
+            {**SITE_PRICE, "SiteId": 2, "FuelId": 2, "Price": 1900.0},
+            {**SITE_PRICE, "SiteId": 3, "FuelId": 2, "Price": 2000.0},
+        ]
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+        self.tmp_dir.cleanup()
+
+    def test_chunked(self):
+        chunks = list(export.chunked(range(5), chunk_size=2))
+        assert chunks == [[0, 1], [2, 3], [4]]
+
+    def test_export_csv(self):
+        fh = io.StringIO()
+        records = export.iter_stations(self.fuel_stations)
+        count = export.export(records, "csv", fh, export.STATION_FIELDS, chunk_size=1)
+        assert count == 2
+        rows = list(csv.DictReader(io.StringIO(fh.getvalue())))
+        assert [row["N"] for row in rows] == ["One", "Two"]
+
+    def test_export_ndjson_joined(self):
+        fh = io.StringIO()
+        records = export.iter_joined(self.fuel_stations, self.site_prices)
+        export.export(records, "ndjson", fh, export.JOINED_FIELDS)
+        rows = [json.loads(line) for line in fh.getvalue().splitlines()]
+        assert len(rows) == 3
+        assert rows[0]["N"] == "One"
+        assert rows[0]["Price"] == 1800.0
+        assert rows[2]["N"] is None
+
+    def test_export_parquet(self):
+        pq = pytest.importorskip("pyarrow.parquet")
+        output = os.path.join(self.tmp_dir.name, "prices.parquet")
+        records = export.iter_prices(self.site_prices)
+        export.export(records, "parquet", output, export.PRICE_FIELDS, chunk_size=2)
+        table = pq.read_table(output)
+        assert table.num_rows == 3
+        assert table.column("Price").to_pylist() == [1800.0, 1900.0, 2000.0]
+
+    def test_export_parquet_stations(self):
+        pq = pytest.importorskip("pyarrow.parquet")
+        output = os.path.join(self.tmp_dir.name, "stations.parquet")
+        records = export.iter_stations([FUEL_STATION])
+        export.export(records, "parquet", output, export.STATION_FIELDS)
+        table = pq.read_table(output)
+        assert table.column("S").to_pylist() == [61205460]
+        assert table.column("P").to_pylist() == ["5094"]
+
+    def test_export_joined_site_ids(self):
+        site_price = {**SITE_PRICE, "SiteId": 61205460}
+        records = list(export.iter_joined([FUEL_STATION], [site_price]))
+        assert records[0]["N"] == "OTR Dry Creek"
+
+    def test_export_parquet_empty_first_chunk(self):
+        pq = pytest.importorskip("pyarrow.parquet")
+        output = os.path.join(self.tmp_dir.name, "stations.parquet")
+        self.fuel_stations[0]["GPI"] = None
+        records = export.iter_stations(self.fuel_stations)
+        export.export(records, "parquet", output, export.STATION_FIELDS, chunk_size=1)
+        table = pq.read_table(output)
+        assert table.column("GPI").to_pylist() == [None, "ChIJKy0p_ra3sGoRaWz3bT-5iEk"]
+        assert str(table.schema.field("S").type) == "int64"
+
+    def test_export_invalid_format(self):
+        with pytest.raises(ValueError, match="fmt must be"):
+            export.export([], "xml", io.StringIO(), export.PRICE_FIELDS)
+
+    def test_export_state_changed_only(self):
+        state_file = os.path.join(self.tmp_dir.name, "state.json")
+        state = export.ExportState(state_file)
+        assert len(list(state.changed("prices", export.iter_prices(self.site_prices)))) == 3
+        state.save()
+
+        self.site_prices[1]["Price"] = 1850.0
+        state = export.ExportState(state_file)
+        changed = list(state.changed("prices", export.iter_prices(self.site_prices)))
+        assert [record["SiteId"] for record in changed] == [2]
+        assert changed[0][export.REMOVED_FIELD] is False
+
+        # Removed records are reported once, as tombstones.
+        changed = list(state.changed("prices", export.iter_prices(self.site_prices[1:])))
+        assert changed == [{"SiteId": 1, "FuelId": 2, export.REMOVED_FIELD: True}]
+        assert list(state.changed("prices", export.iter_prices(self.site_prices[1:]))) == []
@@ -0,0 +1,168 @@
+"""Tests for `frames` module."""
+
+import copy
+from datetime import datetime, time, timezone
+from unittest import TestCase, mock
+
+import pytest
+
+from safpis import frames
+from safpis.api import SafpisAPI
+from safpis.safpis import Safpis
+
+# A fuel station and a price recorded from the SAFPIS REST API.
+FUEL_STATION = {
+    "S": "61205460",
+    "A": "11 Vader Street",
+    "N": "OTR Dry Creek",
+    "B": 169,
+    "P": "5094",
+    "G1": 170227225,
+    "G2": 189,
+    "G3": 4,
+    "G4": 0,
+    "G5": 0,
+    "Lat": -34.819297,
+    "Lng": 138.592116,
+    "M": "2023-12-27T09:15:01.100",
+    "GPI": "ChIJKy0p_ra3sGoRaWz3bT-5iEk",
+    "MO": "00:00",
+    "MC": "23:59",
+    "TO": "00:00",
+    "TC": "23:59",
+    "WO": "00:00",
+    "WC": "23:59",
+    "THO": "00:00",
+    "THC": "23:59",
+    "FO": "00:00",
+    "FC": "23:59",
+    "SO": "00:00",
+    "SC": "23:59",
+    "SUO": "00:00",
+    "SUC": "23:59",
+}
+SITE_PRICE = {
+    "SiteId": 61501045,
+    "FuelId": 14,
+    "CollectionMethod": "T",
+    "TransactionDateUtc": "2021-01-06T22:55:00",
+    "Price": 1356.0,
+}
+
+
+pa = pytest.importorskip("pyarrow")
+
+
+class TestFrames(TestCase):
+    """Tests for `frames` module."""
+
+    def setUp(self):
+        self.fuel_stations = [
+            {**FUEL_STATION, "N": "One", "B": 2, "MO": "", "MC": ""},
+            {**FUEL_STATION, "S": "61205461", "N": "Two", "M": "2024-01-02T03:04:05"},
+        ]
+        self.site_prices = [
+            {**SITE_PRICE, "SiteId": 61205461, "FuelId": 2, "Price": 1900.0},
+            {**SITE_PRICE, "SiteId": 61205460, "FuelId": 12, "Price": 9999.0},
+            {**SITE_PRICE, "SiteId": 3, "FuelId": 2, "Price": 2000.0},
+        ]
+        self.site_prices[1]["TransactionDateUtc"] = "2024-04-07T02:30:00.123"
+
+        self.api = mock.Mock(spec=SafpisAPI)
+        self.api.GetCountryBrands.return_value = {
+            "Brands": [
+                {"BrandId": 2, "Name": "Caltex"},
+                {"BrandId": 23, "Name": "United"},
+                {"BrandId": 169, "Name": "On the Run"},
+            ]
+        }
+        self.api.GetCountryFuelTypes.return_value = {
+            "Fuels": [{"FuelId": 2, "Name": "Unleaded"}, {"FuelId": 12, "Name": "e10"}]
+        }
+        self.api.GetCountryGeographicRegions.return_value = {"GeographicRegions": []}
+        self.api.GetFullSiteDetails.return_value = {"S": list(self.fuel_stations)}
+        self.api.GetSitesPrices.return_value = {"SitePrices": list(self.site_prices)}
+        self.api.fetch.side_effect = self.fetch
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+
+    def fetch(self, endpoint, fingerprint=None, **_kwargs):
+        """Answers SafpisAPI.fetch from the mocked endpoint, fingerprinting
+        its payload by its repr."""
+        payload = getattr(self.api, endpoint).return_value
+        current = repr(payload)
+        return (None if fingerprint == current else copy.deepcopy(payload)), current
+
+    def test_stations_to_arrow(self):
+        table = frames.stations_to_arrow(self.fuel_stations, {2: "Caltex", 169: "On the Run"})
+        assert table.column("S").to_pylist() == [61205460, 61205461]
+        assert table.column("Brand").to_pylist() == ["Caltex", "On the Run"]
+        assert pa.types.is_dictionary(table.schema.field("Brand").type)
+        assert table.schema.field("M").type == pa.timestamp("us", tz=frames.STATION_TIMEZONE)
+        modified = table.column("M").to_pylist()[1]
+        assert modified.astimezone(timezone.utc) == datetime(2024, 1, 1, 16, 34, 5, tzinfo=timezone.utc)
+        assert table.column("MO").to_pylist() == [None, time(0, 0)]
+        assert table.column("MC").to_pylist() == [None, time(23, 59)]
+
+    def test_prices_to_arrow(self):
+        table = frames.prices_to_arrow(self.site_prices, {2: "Unleaded", 12: "e10"})
+        assert table.schema.field("Price").type == pa.int32()
+        assert table.column("Price").to_pylist() == [1900, None, 2000]
+        assert table.column("Fuel").to_pylist() == ["Unleaded", "e10", "Unleaded"]
+        assert table.column("TransactionDateUtc").to_pylist()[1] == datetime(
+            2024, 4, 7, 2, 30, 0, 123000, tzinfo=timezone.utc
+        )
+
+    def test_timestamps_fall_back_to_parsing(self):
+        site_prices = [
+            *self.site_prices,
+            {**SITE_PRICE, "TransactionDateUtc": "7 April 2024 02:30"},
+            {**SITE_PRICE, "TransactionDateUtc": None},
+        ]
+        updated = frames.prices_to_arrow(site_prices).column("TransactionDateUtc").to_pylist()
+        assert updated[3] == datetime(2024, 4, 7, 2, 30, tzinfo=timezone.utc)
+        assert updated[4] is None
+
+    def test_timestamps_with_utc_offsets(self):
+        site_prices = [{**SITE_PRICE, "TransactionDateUtc": "2024-04-07T12:00:00+09:30"}]
+        updated = frames.prices_to_arrow(site_prices).column("TransactionDateUtc").to_pylist()
+        assert updated == [datetime(2024, 4, 7, 2, 30, tzinfo=timezone.utc)]
+        fuel_stations = [
+            {**FUEL_STATION, "M": "2024-01-01T16:34:05Z"},
+            {**FUEL_STATION, "M": "2024-01-02T03:04:05"},
+        ]
+        modified = frames.stations_to_arrow(fuel_stations).column("M").to_pylist()
+        assert [value.astimezone(timezone.utc) for value in modified] == [
+            datetime(2024, 1, 1, 16, 34, 5, tzinfo=timezone.utc)
+        ] * 2
+
+    def test_joined_to_arrow(self):
+        table = frames.joined_to_arrow(self.fuel_stations, self.site_prices)
+        assert table.column("SiteId").to_pylist() == [61205461, 61205460, 3]
+        assert table.column("N").to_pylist() == ["Two", "One", None]
+        assert "S" not in table.column_names
+
+    def test_joined_recorded_payloads(self):
+        # The recorded price is for another fuel station.
+        table = frames.joined_to_arrow([FUEL_STATION], [SITE_PRICE, {**SITE_PRICE, "SiteId": 61205460}])
+        assert table.column("N").to_pylist() == [None, "OTR Dry Creek"]
+        assert table.column("P").to_pylist() == [None, "5094"]
+        assert table.column("Price").to_pylist() == [1356, 1356]
+
+    def test_to_pandas(self):
+        pytest.importorskip("pandas")
+        df = frames.to_pandas(frames.joined_to_arrow(self.fuel_stations, self.site_prices))
+        assert df["B"].dtype.name == "category"
+        assert str(df["Price"].dtype) == "Int32"
+        assert df["Price"].isna().tolist() == [False, True, False]
+        assert str(df["TransactionDateUtc"].dt.tz) == "UTC"
+
+    def test_safpis_to_arrow(self):
+        safpis = Safpis(api=self.api)
+        table = safpis.to_arrow()
+        assert table.column("Brand").to_pylist() == ["On the Run", "Caltex", None]
+        assert table.column("Fuel").to_pylist() == ["Unleaded", "e10", "Unleaded"]
+        assert safpis.to_arrow("stations").num_rows == len(self.fuel_stations)
+        with pytest.raises(ValueError, match="dataset"):
+            safpis.to_arrow("regions")
@@ -0,0 +1,156 @@
+"""Tests for `freshness` module."""
+
+import copy
+import math
+from datetime import datetime, timezone
+from unittest import TestCase, mock
+
+from safpis.api import SafpisAPI
+from safpis.freshness import FreshnessIndex
+from safpis.models import FuelStation, FuelStationPrice, epoch_seconds, parse_timestamp
+from safpis.snapshot import SnapshotStore
+
+# A fuel station and a price recorded from the SAFPIS REST API.
+FUEL_STATION = {
+    "S": "61205460",
+    "A": "11 Vader Street",
+    "N": "OTR Dry Creek",
+    "B": 169,
+    "P": "5094",
+    "G1": 170227225,
+    "G2": 189,
+    "G3": 4,
+    "G4": 0,
+    "G5": 0,
+    "Lat": -34.819297,
+    "Lng": 138.592116,
+    "M": "2023-12-27T09:15:01.100",
+    "GPI": "ChIJKy0p_ra3sGoRaWz3bT-5iEk",
+    "MO": "00:00",
+    "MC": "23:59",
+    "TO": "00:00",
+    "TC": "23:59",
+    "WO": "00:00",
+    "WC": "23:59",
+    "THO": "00:00",
+    "THC": "23:59",
+    "FO": "00:00",
+    "FC": "23:59",
+    "SO": "00:00",
+    "SC": "23:59",
+    "SUO": "00:00",
+    "SUC": "23:59",
+}
+SITE_PRICE = {
+    "SiteId": 61501045,
+    "FuelId": 14,
+    "CollectionMethod": "T",
+    "TransactionDateUtc": "2021-01-06T22:55:00",
+    "Price": 1356.0,
+}
+
+NOW = datetime(2024, 1, 2, tzinfo=timezone.utc).timestamp()
+
+
+def _ids(site_prices):
+    return [(site_price["SiteId"], site_price["FuelId"]) for site_price in site_prices]
+
+
+class TestFreshnessIndex(TestCase):
+    """Tests for `FreshnessIndex`."""
+
+    def setUp(self):
+        self.site_prices = [
+            {**SITE_PRICE, "SiteId": 1, "FuelId": 2, "TransactionDateUtc": "2024-01-01T23:55:00"},
+            {**SITE_PRICE, "SiteId": 2, "FuelId": 2, "TransactionDateUtc": "2023-12-01T00:00:00"},
+            {**SITE_PRICE, "SiteId": 2, "FuelId": 12, "TransactionDateUtc": "2024-01-01T12:00:00"},
+            {**SITE_PRICE, "SiteId": 3, "FuelId": 2, "TransactionDateUtc": None},
+        ]
+        self.index = FreshnessIndex(self.site_prices)
+
+        self.api = mock.Mock(spec=SafpisAPI)
+        self.api.GetCountryBrands.return_value = {
+            "Brands": [
+                {"BrandId": 2, "Name": "Caltex"},
+                {"BrandId": 23, "Name": "United"},
+                {"BrandId": 169, "Name": "On the Run"},
+            ]
+        }
+        self.api.GetCountryFuelTypes.return_value = {
+            "Fuels": [{"FuelId": 2, "Name": "Unleaded"}, {"FuelId": 12, "Name": "e10"}]
+        }
+        self.api.GetCountryGeographicRegions.return_value = {"GeographicRegions": []}
+        self.api.GetFullSiteDetails.return_value = {"S": [FUEL_STATION]}
+        self.api.GetSitesPrices.return_value = {"SitePrices": list(self.site_prices)}
+        self.api.fetch.side_effect = self.fetch
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+
+    def fetch(self, endpoint, fingerprint=None, **_kwargs):
+        """Answers SafpisAPI.fetch from the mocked endpoint, fingerprinting
+        its payload by its repr."""
+        payload = getattr(self.api, endpoint).return_value
+        current = repr(payload)
+        return (None if fingerprint == current else copy.deepcopy(payload)), current
+
+    def test_queries(self):
+        assert _ids(self.index.updated_within(10 * 60, now=NOW)) == [(1, 2)]
+        assert _ids(self.index.older_than(24 * 60 * 60, now=NOW)) == [(3, 2), (2, 2)]
+        assert self.index.stale_sites(24 * 60 * 60, now=NOW) == {3}
+        assert _ids(self.index.newest(2)) == [(1, 2), (2, 12)]
+        assert self.index.newest(0) == []
+        assert self.index.updated_at(2, 12) == NOW - 12 * 60 * 60
+        assert self.index.updated_at(4, 2) is None
+
+    def test_recorded_payload(self):
+        index = FreshnessIndex([SITE_PRICE])
+        assert index.updated_at(61501045, 14) == datetime(2021, 1, 6, 22, 55, tzinfo=timezone.utc).timestamp()
+        assert index.stale_sites(24 * 60 * 60, now=NOW) == {61501045}
+
+    def test_update(self):
+        self.index.update({**self.site_prices[1], "TransactionDateUtc": "2024-01-02T00:00:00"})
+        assert len(self.index) == 4
+        assert _ids(self.index.newest(1)) == [(2, 2)]
+        assert _ids(self.index.older_than(24 * 60 * 60, now=NOW)) == [(3, 2)]
+        assert _ids(self.index.updated_between(NOW - 24 * 60 * 60, NOW)) == [(2, 12), (1, 2)]
+
+    def test_repeated_prices(self):
+        repeated = {**self.site_prices[0], "TransactionDateUtc": "2024-01-01T12:00:00"}
+        index = FreshnessIndex([*self.site_prices, repeated])
+        assert len(index) == 4
+        assert index.updated_at(1, 2) == NOW - 12 * 60 * 60
+        index.update({**self.site_prices[0], "TransactionDateUtc": "2024-01-02T00:00:00"})
+        assert len(index) == 4
+        assert _ids(index.newest(2)) == [(1, 2), (2, 12)]
+
+    def test_snapshot(self):
+        snapshot = SnapshotStore(self.api).current()
+        assert _ids(snapshot.freshness.updated_within(10 * 60, now=NOW)) == [(1, 2)]
+
+
+class TestParsing(TestCase):
+    """Tests for the timestamp parsing of the models."""
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+
+    def test_parse_timestamp(self):
+        assert parse_timestamp("2021-01-06T22:55:00") == datetime(2021, 1, 6, 22, 55)  # noqa: DTZ001
+        assert parse_timestamp("6 Jan 2021 22:55") == datetime(2021, 1, 6, 22, 55)  # noqa: DTZ001
+        price = FuelStationPrice(**{**SITE_PRICE, "TransactionDateUtc": "2021-01-06T22:55:00.5"})
+        assert price.TransactionDateUtc.microsecond == 500000
+
+    def test_epoch_seconds(self):
+        assert epoch_seconds("2024-01-02T00:00:00") == NOW
+        assert epoch_seconds("2024-01-02T09:30:00+09:30") == NOW
+        assert math.isnan(epoch_seconds(None))
+        assert math.isnan(epoch_seconds("not a time"))
+
+    def test_fuel_station(self):
+        assert FuelStation(**FUEL_STATION).M.microsecond == 100000
+        station = FuelStation(**{**FUEL_STATION, "M": "2023-12-27T09:15:01", "MO": "7:30", "MC": " "})
+        assert station.M.second == 1
+        assert station.M.tzinfo.zone == "Australia/Adelaide"
+        assert station.MO.isoformat() == "07:30:00"
+        assert station.MC is None
@@ -0,0 +1,152 @@
+"""Tests for `geo` module."""
+
+import copy
+from unittest import TestCase, mock
+
+import pytest
+from geopy.distance import geodesic, great_circle
+
+from safpis import geo
+from safpis.api import SafpisAPI
+from safpis.safpis import Safpis
+
+# A fuel station and a price recorded from the SAFPIS REST API.
+FUEL_STATION = {
+    "S": "61205460",
+    "A": "11 Vader Street",
+    "N": "OTR Dry Creek",
+    "B": 169,
+    "P": "5094",
+    "G1": 170227225,
+    "G2": 189,
+    "G3": 4,
+    "G4": 0,
+    "G5": 0,
+    "Lat": -34.819297,
+    "Lng": 138.592116,
+    "M": "2023-12-27T09:15:01.100",
+    "GPI": "ChIJKy0p_ra3sGoRaWz3bT-5iEk",
+    "MO": "00:00",
+    "MC": "23:59",
+    "TO": "00:00",
+    "TC": "23:59",
+    "WO": "00:00",
+    "WC": "23:59",
+    "THO": "00:00",
+    "THC": "23:59",
+    "FO": "00:00",
+    "FC": "23:59",
+    "SO": "00:00",
+    "SC": "23:59",
+    "SUO": "00:00",
+    "SUC": "23:59",
+}
+SITE_PRICE = {
+    "SiteId": 61501045,
+    "FuelId": 14,
+    "CollectionMethod": "T",
+    "TransactionDateUtc": "2021-01-06T22:55:00",
+    "Price": 1356.0,
+}
+
+
+class TestGeo(TestCase):
+    """Tests for `geo` module."""
+
+    def setUp(self):
+        # Dry Creek, Noarlunga, Mount Gambier, Ceduna and Coober Pedy.
+        self.latitudes = [-34.819297, -35.139, -37.829, -32.126, -29.013]
+        self.longitudes = [138.592116, 138.499, 140.783, 133.673, 134.755]
+        self.origins = [(-34.9285, 138.6007), (-34.8193, 138.5921), (-29.0, 134.7)]
+
+        self.api = mock.Mock(spec=SafpisAPI)
+        self.api.GetCountryBrands.return_value = {
+            "Brands": [
+                {"BrandId": 2, "Name": "Caltex"},
+                {"BrandId": 23, "Name": "United"},
+                {"BrandId": 169, "Name": "On the Run"},
+            ]
+        }
+        self.api.GetCountryFuelTypes.return_value = {
+            "Fuels": [{"FuelId": 2, "Name": "Unleaded"}, {"FuelId": 12, "Name": "e10"}]
+        }
+        self.api.GetCountryGeographicRegions.return_value = {"GeographicRegions": []}
+        self.api.GetFullSiteDetails.return_value = {"S": []}
+        self.api.GetSitesPrices.return_value = {"SitePrices": []}
+        self.api.fetch.side_effect = self.fetch
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+
+    def fetch(self, endpoint, fingerprint=None, **_kwargs):
+        """Answers SafpisAPI.fetch from the mocked endpoint, fingerprinting
+        its payload by its repr."""
+        payload = getattr(self.api, endpoint).return_value
+        current = repr(payload)
+        return (None if fingerprint == current else copy.deepcopy(payload)), current
+
+    def test_haversine_matches_great_circle(self):
+        expected = great_circle(self.origins[0], (self.latitudes[2], self.longitudes[2])).km
+        assert geo.haversine_km(*self.origins[0], self.latitudes[2], self.longitudes[2]) == pytest.approx(expected)
+
+    def test_map_tile(self):
+        assert geo.map_tile(0, 0, 1) == (1, 1)
+        assert geo.map_tile(*self.origins[0], 12) == (3624, 2472)
+        assert geo.map_tile(-90, 180, 2) == (3, 3)
+
+    def test_distance_matrix_accuracy(self):
+        for mode, tolerance in [("haversine", 5e-3), ("ellipsoidal", 1e-4)]:
+            matrix = geo.distance_matrix(self.origins, self.latitudes, self.longitudes, mode=mode)
+            for i, origin in enumerate(self.origins):
+                for j, destination in enumerate(zip(self.latitudes, self.longitudes)):
+                    expected = geodesic(origin, destination).km
+                    assert matrix[i][j] == pytest.approx(expected, rel=tolerance, abs=1e-6)
+
+    def test_distance_matrix_without_numpy(self):
+        pytest.importorskip("numpy")
+        expected = geo.distance_matrix(self.origins, self.latitudes, self.longitudes)
+        with mock.patch.object(geo, "np", None):
+            matrix = geo.distance_matrix(self.origins, self.latitudes, self.longitudes)
+        assert isinstance(matrix, list)
+        for row, expected_row in zip(matrix, expected.tolist()):
+            assert row == pytest.approx(expected_row)
+
+    def test_distance_matrix_coincident(self):
+        matrix = geo.distance_matrix([(self.latitudes[0], self.longitudes[0])], self.latitudes, self.longitudes)
+        assert matrix[0][0] == 0
+
+    def test_distance_matrix_invalid_mode(self):
+        with pytest.raises(ValueError, match="mode"):
+            geo.distance_matrix(self.origins, self.latitudes, self.longitudes, mode="flat")
+
+    def test_nearest(self):
+        nearest = geo.nearest(self.origins, self.latitudes, self.longitudes, k=2)
+        assert [position for position, _distance in nearest[0]] == [0, 1]
+        assert [position for position, _distance in nearest[1]] == [0, 1]
+        assert nearest[1][0][1] == pytest.approx(0, abs=0.01)
+
+    def test_nearest_fuel_stations(self):
+        # The recorded fuel station is at Dry Creek.
+        fuel_stations = [
+            FUEL_STATION,
+            *(
+                {**FUEL_STATION, "S": str(site_id), "Lat": latitude, "Lng": longitude}
+                for site_id, latitude, longitude in zip(range(2, 6), self.latitudes[1:], self.longitudes[1:])
+            ),
+        ]
+        self.api.GetFullSiteDetails.return_value = {"S": fuel_stations}
+        safpis = Safpis(api=self.api)
+        nearest = safpis.nearest_fuel_stations(self.origins, k=1, mode="haversine")
+        assert [closest[0][0].S for closest in nearest] == ["61205460", "61205460", "5"]
+        site_ids, matrix = safpis.distance_matrix(self.origins)
+        assert site_ids == ["61205460", "2", "3", "4", "5"]
+        assert len(matrix) == 3
+
+    def test_grid_index_nearest(self):
+        index = geo.GridIndex()
+        for site_id, latitude, longitude in zip(range(1, 6), self.latitudes, self.longitudes):
+            index.add(site_id, latitude, longitude)
+        index.add(6, -34.85, 138.6)
+        assert [key for key, _distance in index.nearest(-34.819297, 138.592116, 2, 100, exclude=1)] == [6, 2]
+        assert [key for key, _distance in index.nearest(-34.819297, 138.592116, 5, 100)] == [1, 6, 2]
+        assert index.nearest(-29.013, 134.755, 1, 50, exclude=5) == []
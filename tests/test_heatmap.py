@@ -0,0 +1,223 @@
+"""Tests for `heatmap` module."""
+
+import copy
+import random
+import statistics
+from unittest import TestCase, mock
+
+import pytest
+
+from safpis.api import SafpisAPI
+from safpis.geo import map_tile
+from safpis.heatmap import CellStatistics, PriceHeatmap
+from safpis.models import StationChanges
+from safpis.safpis import Safpis
+from safpis.snapshot import SnapshotStore
+
+# A fuel station and a price recorded from the SAFPIS REST API.
+FUEL_STATION = {
+    "S": "61205460",
+    "A": "11 Vader Street",
+    "N": "OTR Dry Creek",
+    "B": 169,
+    "P": "5094",
+    "G1": 170227225,
+    "G2": 189,
+    "G3": 4,
+    "G4": 0,
+    "G5": 0,
+    "Lat": -34.819297,
+    "Lng": 138.592116,
+    "M": "2023-12-27T09:15:01.100",
+    "GPI": "ChIJKy0p_ra3sGoRaWz3bT-5iEk",
+    "MO": "00:00",
+    "MC": "23:59",
+    "TO": "00:00",
+    "TC": "23:59",
+    "WO": "00:00",
+    "WC": "23:59",
+    "THO": "00:00",
+    "THC": "23:59",
+    "FO": "00:00",
+    "FC": "23:59",
+    "SO": "00:00",
+    "SC": "23:59",
+    "SUO": "00:00",
+    "SUC": "23:59",
+}
+SITE_PRICE = {
+    "SiteId": 61501045,
+    "FuelId": 14,
+    "CollectionMethod": "T",
+    "TransactionDateUtc": "2021-01-06T22:55:00",
+    "Price": 1356.0,
+}
+
+ADELAIDE = (-34.9285, 138.6007)
+MOUNT_GAMBIER = (-37.8284, 140.7804)
+
+
+class TestHeatmap(TestCase):
+    """Tests for `heatmap` module."""
+
+    def setUp(self):
+        self.fuel_stations = [
+            {**FUEL_STATION, "S": 1, "Lat": ADELAIDE[0], "Lng": ADELAIDE[1]},
+            {**FUEL_STATION, "S": 2, "Lat": ADELAIDE[0] + 0.001, "Lng": ADELAIDE[1]},
+            {**FUEL_STATION, "S": 3, "Lat": MOUNT_GAMBIER[0], "Lng": MOUNT_GAMBIER[1]},
+        ]
+        self.site_prices = [
+            {**SITE_PRICE, "SiteId": 1, "FuelId": 2, "Price": 1800.0},
+            {**SITE_PRICE, "SiteId": 2, "FuelId": 2, "Price": 1900.0},
+            {**SITE_PRICE, "SiteId": 2, "FuelId": 12, "Price": 9999.0},
+            {**SITE_PRICE, "SiteId": 3, "FuelId": 2, "Price": 2000.0},
+        ]
+        self.heatmap = PriceHeatmap.from_payloads(self.fuel_stations, self.site_prices, zooms=(4, 12))
+
+        self.api = mock.Mock(spec=SafpisAPI)
+        self.api.GetCountryBrands.return_value = {
+            "Brands": [
+                {"BrandId": 2, "Name": "Caltex"},
+                {"BrandId": 23, "Name": "United"},
+                {"BrandId": 169, "Name": "On the Run"},
+            ]
+        }
+        self.api.GetCountryFuelTypes.return_value = {
+            "Fuels": [{"FuelId": 2, "Name": "Unleaded"}, {"FuelId": 12, "Name": "e10"}]
+        }
+        self.api.GetCountryGeographicRegions.return_value = {"GeographicRegions": []}
+        self.api.GetFullSiteDetails.return_value = {"S": list(self.fuel_stations)}
+        self.api.GetSitesPrices.return_value = {"SitePrices": list(self.site_prices)}
+        self.api.fetch.side_effect = self.fetch
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+
+    def fetch(self, endpoint, fingerprint=None, **_kwargs):
+        """Answers SafpisAPI.fetch from the mocked endpoint, fingerprinting
+        its payload by its repr."""
+        payload = getattr(self.api, endpoint).return_value
+        current = repr(payload)
+        return (None if fingerprint == current else copy.deepcopy(payload)), current
+
+    def test_cell(self):
+        assert self.heatmap.at(*ADELAIDE, 12, 2) == CellStatistics(1800.0, 1850.0, 2)
+        assert self.heatmap.at(*ADELAIDE, 4, 2) == CellStatistics(1800.0, 1900.0, 3)
+        assert self.heatmap.at(*ADELAIDE, 12, 12) is None
+        assert self.heatmap.tile(12, 0, 0) == {}
+        with pytest.raises(KeyError):
+            self.heatmap.cell(10, 0, 0, 2)
+
+    def test_layer(self):
+        layer = self.heatmap.layer(12, 2)
+        assert layer == {
+            map_tile(*ADELAIDE, 12): CellStatistics(1800.0, 1850.0, 2),
+            map_tile(*MOUNT_GAMBIER, 12): CellStatistics(2000.0, 2000.0, 1),
+        }
+
+    def test_apply_site_prices(self):
+        site_prices = [
+            {**SITE_PRICE, "SiteId": 1, "FuelId": 2, "Price": 1700.0},
+            {**SITE_PRICE, "SiteId": 2, "FuelId": 12, "Price": 1750.0},
+            {**SITE_PRICE, "SiteId": 3, "FuelId": 2, "Price": 2000.0},
+        ]
+        assert self.heatmap.apply_site_prices(site_prices) == 3
+        assert self.heatmap.at(*ADELAIDE, 12, 2) == CellStatistics(1700.0, 1700.0, 1)
+        assert self.heatmap.at(*ADELAIDE, 12, 12) == CellStatistics(1750.0, 1750.0, 1)
+        assert self.heatmap.apply_site_prices(site_prices) == 0
+        self.heatmap.apply_site_prices([])
+        assert self.heatmap.layer(4, 2) == {}
+
+    def test_matches_rebuild(self):
+        generator = random.Random(42)
+        fuel_stations = [
+            {**FUEL_STATION, "S": site_id, "Lat": -35 + generator.random(), "Lng": 138 + generator.random()}
+            for site_id in range(50)
+        ]
+        heatmap = PriceHeatmap.from_payloads(fuel_stations, [], zooms=(8, 10))
+        for _ in range(5):
+            site_prices = [
+                {
+                    **SITE_PRICE,
+                    "SiteId": site_id,
+                    "FuelId": fuel_id,
+                    "Price": float(generator.randint(1700, 1710)),
+                }
+                for site_id in range(50)
+                for fuel_id in (2, 12)
+                if generator.random() < 0.8
+            ]
+            heatmap.apply_site_prices(site_prices)
+            for fuel_station in generator.sample(fuel_stations, 5):
+                heatmap.set_location(fuel_station["S"], fuel_station["Lat"], fuel_station["Lng"] + 0.5)
+                heatmap.set_location(fuel_station["S"], fuel_station["Lat"], fuel_station["Lng"])
+            rebuilt = PriceHeatmap.from_payloads(fuel_stations, site_prices, zooms=(8, 10))
+            for zoom in (8, 10):
+                for fuel_id in (2, 12):
+                    assert heatmap.layer(zoom, fuel_id) == rebuilt.layer(zoom, fuel_id)
+        locations = {record["S"]: (record["Lat"], record["Lng"]) for record in fuel_stations}
+        by_tile: dict = {}
+        for record in site_prices:
+            if record["FuelId"] == 2:
+                by_tile.setdefault(map_tile(*locations[record["SiteId"]], 8), []).append(record["Price"])
+        for xy, prices in by_tile.items():
+            expected = CellStatistics(min(prices), statistics.median(prices), len(prices))
+            assert heatmap.cell(8, *xy, 2) == expected
+
+    def test_apply_station_changes(self):
+        moved = {**FUEL_STATION, "S": 1, "Lat": MOUNT_GAMBIER[0], "Lng": MOUNT_GAMBIER[1]}
+        self.heatmap.apply_station_changes(
+            StationChanges(changed=[(self.fuel_stations[0], moved)], removed=[self.fuel_stations[2]])
+        )
+        assert self.heatmap.at(*ADELAIDE, 12, 2) == CellStatistics(1900.0, 1900.0, 1)
+        assert self.heatmap.at(*MOUNT_GAMBIER, 12, 2) == CellStatistics(1800.0, 1800.0, 1)
+        assert len(self.heatmap) == 2
+
+    def test_apply_snapshot(self):
+        store = SnapshotStore(api=self.api)
+        heatmap = PriceHeatmap(zooms=(12,))
+        store.add_listener(heatmap.apply_snapshot)
+        store.refresh()
+        assert heatmap.at(*ADELAIDE, 12, 2) == CellStatistics(1800.0, 1850.0, 2)
+        self.api.GetSitesPrices.return_value["SitePrices"][1]["Price"] = 1600.0
+        store.refresh_prices()
+        assert heatmap.at(*ADELAIDE, 12, 2) == CellStatistics(1600.0, 1700.0, 2)
+
+    def test_site_ids(self):
+        fuel_stations = [FUEL_STATION, {**FUEL_STATION, "S": "61205461"}]
+        site_prices = [
+            {**SITE_PRICE, "SiteId": 61205460},
+            {**SITE_PRICE, "SiteId": 61205461, "Price": 1456.0},
+        ]
+        location = (FUEL_STATION["Lat"], FUEL_STATION["Lng"])
+        heatmap = PriceHeatmap.from_payloads(fuel_stations, site_prices, zooms=(12,))
+        assert heatmap.at(*location, 12, 14) == CellStatistics(1356.0, 1406.0, 2)
+
+        self.api.GetFullSiteDetails.return_value = {"S": fuel_stations}
+        self.api.GetSitesPrices.return_value = {"SitePrices": site_prices}
+        store = SnapshotStore(api=self.api)
+        heatmap = PriceHeatmap(zooms=(12,))
+        store.add_listener(heatmap.apply_snapshot)
+        store.refresh()
+        assert heatmap.at(*location, 12, 14) == CellStatistics(1356.0, 1406.0, 2)
+
+    def test_safpis_price_heatmap(self):
+        safpis = Safpis(api=self.api)
+        heatmap = safpis.price_heatmap(zooms=(12,))
+        assert heatmap.at(*MOUNT_GAMBIER, 12, 2) == CellStatistics(2000.0, 2000.0, 1)
+        self.api.GetFullSiteDetails.return_value["S"].pop()
+        safpis.refresh()
+        assert heatmap.at(*MOUNT_GAMBIER, 12, 2) is None
+
+    def test_safpis_price_heatmap_is_reused(self):
+        safpis = Safpis(api=self.api)
+        with mock.patch.object(safpis, "add_station_listener", wraps=safpis.add_station_listener) as add_listener:
+            heatmap = safpis.price_heatmap(zooms=(12,))
+            self.api.GetSitesPrices.return_value["SitePrices"][1]["Price"] = 1600.0
+            assert safpis.price_heatmap(zooms=(12,)) is heatmap
+            assert heatmap.at(*ADELAIDE, 12, 2) == CellStatistics(1600.0, 1700.0, 2)
+            assert safpis.price_heatmap(zooms=(10,)) is not heatmap
+        assert add_listener.call_count == 2
+        self.api.GetFullSiteDetails.return_value["S"].pop()
+        safpis.refresh()
+        assert heatmap.at(*MOUNT_GAMBIER, 12, 2) is None
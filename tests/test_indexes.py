@@ -0,0 +1,137 @@
+"""Tests for `indexes` module."""
+
+import copy
+from unittest import TestCase, mock
+
+import pytest
+
+from safpis.api import SafpisAPI
+from safpis.indexes import AttributeIndex
+from safpis.models import StationChanges
+from safpis.safpis import NoResultsError, Safpis
+
+# A fuel station and a price recorded from the SAFPIS REST API.
+FUEL_STATION = {
+    "S": "61205460",
+    "A": "11 Vader Street",
+    "N": "OTR Dry Creek",
+    "B": 169,
+    "P": "5094",
+    "G1": 170227225,
+    "G2": 189,
+    "G3": 4,
+    "G4": 0,
+    "G5": 0,
+    "Lat": -34.819297,
+    "Lng": 138.592116,
+    "M": "2023-12-27T09:15:01.100",
+    "GPI": "ChIJKy0p_ra3sGoRaWz3bT-5iEk",
+    "MO": "00:00",
+    "MC": "23:59",
+    "TO": "00:00",
+    "TC": "23:59",
+    "WO": "00:00",
+    "WC": "23:59",
+    "THO": "00:00",
+    "THC": "23:59",
+    "FO": "00:00",
+    "FC": "23:59",
+    "SO": "00:00",
+    "SC": "23:59",
+    "SUO": "00:00",
+    "SUC": "23:59",
+}
+SITE_PRICE = {
+    "SiteId": 61501045,
+    "FuelId": 14,
+    "CollectionMethod": "T",
+    "TransactionDateUtc": "2021-01-06T22:55:00",
+    "Price": 1356.0,
+}
+
+
+class TestIndexes(TestCase):
+    """Tests for `indexes` module."""
+
+    def setUp(self):
+        self.fuel_stations = [
+            {**FUEL_STATION, "S": 1, "B": 169, "P": "5094", "G1": 1},
+            {**FUEL_STATION, "S": 2, "B": 2, "P": "5084", "G1": 1},
+            {**FUEL_STATION, "S": 3, "B": 23, "P": "5094", "G1": 2},
+            {**FUEL_STATION, "S": 4, "B": 169, "P": "5008", "G1": 2},
+        ]
+        self.index = AttributeIndex.from_fuel_stations(self.fuel_stations)
+
+        self.api = mock.Mock(spec=SafpisAPI)
+        self.api.GetCountryBrands.return_value = {
+            "Brands": [
+                {"BrandId": 2, "Name": "Caltex"},
+                {"BrandId": 23, "Name": "United"},
+                {"BrandId": 169, "Name": "On the Run"},
+            ]
+        }
+        self.api.GetCountryFuelTypes.return_value = {
+            "Fuels": [{"FuelId": 2, "Name": "Unleaded"}, {"FuelId": 12, "Name": "e10"}]
+        }
+        self.api.GetCountryGeographicRegions.return_value = {"GeographicRegions": []}
+        self.api.GetFullSiteDetails.return_value = {"S": list(self.fuel_stations)}
+        self.api.GetSitesPrices.return_value = {"SitePrices": []}
+        self.api.fetch.side_effect = self.fetch
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+
+    def fetch(self, endpoint, fingerprint=None, **_kwargs):
+        """Answers SafpisAPI.fetch from the mocked endpoint, fingerprinting
+        its payload by its repr."""
+        payload = getattr(self.api, endpoint).return_value
+        current = repr(payload)
+        return (None if fingerprint == current else copy.deepcopy(payload)), current
+
+    def test_lookup(self):
+        assert self.index.lookup("B", 169) == {1, 4}
+        assert self.index.lookup("B", [2, 23]) == {2, 3}
+        assert self.index.lookup("P", 5094) == {1, 3}
+        assert self.index.lookup("B", 99) == set()
+        assert self.index.values("G1") == {1, 2}
+
+    def test_filter(self):
+        assert self.index.filter(B=[169, 23], P="5094") == {1, 3}
+        assert self.index.filter(B=169, G1=2) == {4}
+        assert self.index.filter(B=2, P="5094") == set()
+        assert self.index.filter() == {1, 2, 3, 4}
+        with pytest.raises(KeyError):
+            self.index.filter(N="OTR")
+
+    def test_recorded_payload(self):
+        index = AttributeIndex.from_fuel_stations([FUEL_STATION])
+        assert index.filter(B=169, P=5094, G3=4) == {"61205460"}
+        self.api.GetFullSiteDetails.return_value = {"S": [FUEL_STATION]}
+        fuel_stations = Safpis(api=self.api).filter_fuel_stations(brand_names=["On the Run"], P=["5094"])
+        assert [fuel_station.N for fuel_station in fuel_stations] == ["OTR Dry Creek"]
+
+    def test_apply_station_changes(self):
+        self.index.apply_station_changes(
+            StationChanges(
+                added=[{**FUEL_STATION, "S": 5, "B": 2, "P": "5094"}],
+                removed=[self.fuel_stations[0]],
+                changed=[(self.fuel_stations[3], {**FUEL_STATION, "S": 4, "B": 2, "P": "5008"})],
+            )
+        )
+        assert self.index.lookup("B", 169) == set()
+        assert self.index.lookup("B", 2) == {2, 4, 5}
+        assert 169 not in self.index.values("B")
+        assert len(self.index) == 4
+
+    def test_filter_fuel_stations(self):
+        self.api.GetCountryBrands.return_value["Brands"].append({"BrandId": 5, "Name": "BP"})
+        safpis = Safpis(api=self.api)
+        assert [fuel_station.S for fuel_station in safpis.fuel_stations_by_brand_name("On the Run")] == [1, 4]
+        fuel_stations = safpis.filter_fuel_stations(brand_names=["On the Run", "United"], P=["5094"])
+        assert [fuel_station.S for fuel_station in fuel_stations] == [1, 3]
+        assert [fuel_station.S for fuel_station in safpis.filter_fuel_stations(G1=2)] == [3, 4]
+        assert safpis.filter_fuel_stations(brand_names=["BP"]) == []
+        with pytest.raises(NoResultsError):
+            safpis.fuel_stations_by_brand_name("BP")
+        with pytest.raises(NoResultsError):
+            safpis.filter_fuel_stations(brand_names=["Shell"])
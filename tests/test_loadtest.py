@@ -0,0 +1,62 @@
+"""Tests for `loadtest` module."""
+
+import os
+from unittest import TestCase, mock
+
+import pytest
+from click.testing import CliRunner
+
+from safpis import cli, loadtest
+from safpis.api import SafpisAPI
+from safpis.memo import QueryCache
+from safpis.safpis import Safpis
+from safpis.stub import StubServer, synthetic_payloads
+from safpis.transport import RequestsTransport, TransportConfig
+
+
+@mock.patch.dict(os.environ, {"SAFPIS_SUBSCRIBER_TOKEN": "stub"})
+class TestLoadTest(TestCase):
+    """Tests for `loadtest` module."""
+
+    def test_run(self):
+        calls = []
+
+        def call(generator):
+            calls.append(generator.random())
+            if len(calls) % 10 == 0:
+                raise ValueError
+
+        result = loadtest.run(call, threads=4, calls=50, counters=lambda: {"made": len(calls)})
+        assert result.calls == 50
+        assert result.errors == {"ValueError": 5}
+        assert result.counters == {"made": 50}
+        assert result.latencies == sorted(result.latencies)
+        assert result.percentile(0) == result.latencies[0]
+        assert result.percentile(100) == result.latencies[-1]
+        assert "calls       50 from 4 threads" in result.report()
+
+    def test_duration(self):
+        result = loadtest.run(lambda _generator: None, threads=2, calls=10**9, duration=0.05)
+        assert 0 < result.calls < 10**9
+
+    def test_scenarios(self):
+        with StubServer(synthetic_payloads(stations=30)) as server:
+            transport = RequestsTransport(TransportConfig(cache_backend="memory"))
+            api = SafpisAPI(transport=transport, base_url=server.url)
+            cache = QueryCache()
+            safpis = Safpis(api=api, query_cache=cache)
+            for scenario in loadtest.SCENARIOS:
+                result = loadtest.run(loadtest.scenario(scenario, api, safpis), threads=2, calls=10)
+                assert result.calls == 10
+                assert not result.errors
+            assert cache.statistics().hits > 0
+            transport.close()
+        with pytest.raises(ValueError, match="Safpis"):
+            loadtest.scenario("closest", api)
+
+    def test_cli(self):
+        runner = CliRunner()
+        result = runner.invoke(cli.main, ["loadtest", "prices", "-n", "20", "-t", "2", "--stations", "10"])
+        assert result.exit_code == 0
+        assert "calls       20 from 2 threads" in result.output
+        assert "upstream" in result.output
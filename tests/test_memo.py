@@ -0,0 +1,204 @@
+"""Tests for `memo` module."""
+
+import copy
+from datetime import datetime
+from decimal import Decimal
+from unittest import TestCase, mock
+
+import pytest
+
+from safpis.api import SafpisAPI
+from safpis.memo import QueryCache
+from safpis.models import ADELAIDE
+from safpis.safpis import Safpis
+
+# A fuel station and a price recorded from the SAFPIS REST API.
+FUEL_STATION = {
+    "S": "61205460",
+    "A": "11 Vader Street",
+    "N": "OTR Dry Creek",
+    "B": 169,
+    "P": "5094",
+    "G1": 170227225,
+    "G2": 189,
+    "G3": 4,
+    "G4": 0,
+    "G5": 0,
+    "Lat": -34.819297,
+    "Lng": 138.592116,
+    "M": "2023-12-27T09:15:01.100",
+    "GPI": "ChIJKy0p_ra3sGoRaWz3bT-5iEk",
+    "MO": "00:00",
+    "MC": "23:59",
+    "TO": "00:00",
+    "TC": "23:59",
+    "WO": "00:00",
+    "WC": "23:59",
+    "THO": "00:00",
+    "THC": "23:59",
+    "FO": "00:00",
+    "FC": "23:59",
+    "SO": "00:00",
+    "SC": "23:59",
+    "SUO": "00:00",
+    "SUC": "23:59",
+}
+SITE_PRICE = {
+    "SiteId": 61501045,
+    "FuelId": 14,
+    "CollectionMethod": "T",
+    "TransactionDateUtc": "2021-01-06T22:55:00",
+    "Price": 1356.0,
+}
+
+
+class TestQueryCache(TestCase):
+    """Tests for `memo` module."""
+
+    def setUp(self):
+        self.cache = QueryCache(max_entries=3, max_results=10, precision=2)
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+
+    def test_key(self):
+        key = self.cache.key("closest", (-34.92851, 138.60069, datetime(2024, 1, 2, 3, 4, 5, tzinfo=ADELAIDE)), (1,))
+        assert key == ("closest", (-34.93, 138.6, datetime(2024, 1, 2, 3, 4, tzinfo=ADELAIDE)), (1,))
+
+    def test_get_or_compute(self):
+        key = self.cache.key("query", (1,), (1,))
+        assert self.cache.get_or_compute(key, lambda: [1, 2]) == [1, 2]
+        assert self.cache.get_or_compute(key, lambda: [3]) == [1, 2]
+        statistics = self.cache.statistics()
+        assert (statistics.hits, statistics.misses, statistics.results) == (1, 1, 2)
+        assert statistics.hit_rate == 0.5
+
+    def test_get_or_compute_outdated(self):
+        key = self.cache.key("query", (1,), (1,))
+        assert self.cache.get_or_compute(key, lambda: [1], is_current=lambda: False) == [1]
+        assert len(self.cache) == 0
+        assert self.cache.get_or_compute(key, lambda: [2], is_current=lambda: True) == [2]
+        assert self.cache.get_or_compute(key, lambda: [3]) == [2]
+
+    def test_eviction(self):
+        for argument in range(4):
+            self.cache.get_or_compute(self.cache.key("query", (argument,), ()), lambda: [0])
+        assert len(self.cache) == 3
+        self.cache.get_or_compute(self.cache.key("query", (1,), ()), lambda: [0])
+        self.cache.get_or_compute(self.cache.key("query", (4,), ()), lambda: list(range(9)))
+        assert len(self.cache) == 2
+        assert self.cache.statistics().evictions == 3
+        assert self.cache.statistics().results == 10
+        self.cache.get_or_compute(self.cache.key("query", (5,), ()), lambda: list(range(11)))
+        assert len(self.cache) == 2
+
+    def test_invalidate(self):
+        self.cache.get_or_compute(("reference",), lambda: 1)
+        self.cache.get_or_compute(("prices",), lambda: 1, depends_on=("reference", "prices"))
+        assert self.cache.invalidate("prices") == 1
+        assert len(self.cache) == 1
+        with pytest.raises(ValueError, match="dependency"):
+            self.cache.invalidate("regions")
+
+
+class TestSafpisQueryCache(TestCase):
+    """Tests for Safpis with a query cache."""
+
+    def setUp(self):
+        self.fuel_stations = [
+            {**FUEL_STATION, "S": 1, "N": "One"},
+            {**FUEL_STATION, "S": 2, "N": "Two", "Lat": -35.0},
+        ]
+        self.site_prices = [
+            {**SITE_PRICE, "SiteId": 1, "FuelId": 2, "Price": 1900.0},
+            {**SITE_PRICE, "SiteId": 2, "FuelId": 2, "Price": 1800.0},
+        ]
+        self.api = mock.Mock(spec=SafpisAPI)
+        self.api.GetCountryBrands.return_value = {
+            "Brands": [
+                {"BrandId": 2, "Name": "Caltex"},
+                {"BrandId": 23, "Name": "United"},
+                {"BrandId": 169, "Name": "On the Run"},
+            ]
+        }
+        self.api.GetCountryFuelTypes.return_value = {
+            "Fuels": [{"FuelId": 2, "Name": "Unleaded"}, {"FuelId": 12, "Name": "e10"}]
+        }
+        self.api.GetCountryGeographicRegions.return_value = {"GeographicRegions": []}
+        self.api.GetFullSiteDetails.return_value = {"S": list(self.fuel_stations)}
+        self.api.GetSitesPrices.return_value = {"SitePrices": list(self.site_prices)}
+        self.api.fetch.side_effect = self.fetch
+        self.cache = QueryCache()
+        self.safpis = Safpis(api=self.api, query_cache=self.cache)
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+
+    def fetch(self, endpoint, fingerprint=None, **_kwargs):
+        """Answers SafpisAPI.fetch from the mocked endpoint, fingerprinting
+        its payload by its repr."""
+        payload = getattr(self.api, endpoint).return_value
+        current = repr(payload)
+        return (None if fingerprint == current else copy.deepcopy(payload)), current
+
+    def test_closest_fuel_stations(self):
+        first = self.safpis.closest_fuel_stations(-35.00001, 138.59)
+        assert [fuel_station.S for fuel_station in first] == [2, 1]
+        first.clear()
+        again = self.safpis.closest_fuel_stations(-35.00002, 138.59)
+        assert [fuel_station.S for fuel_station in again] == [2, 1]
+        assert self.cache.statistics().hits == 1
+
+    def test_recorded_payloads(self):
+        self.api.GetFullSiteDetails.return_value = {"S": [FUEL_STATION]}
+        self.api.GetSitesPrices.return_value = {"SitePrices": [SITE_PRICE]}
+        self.api.GetCountryFuelTypes.return_value["Fuels"].append({"FuelId": 14, "Name": "Premium 98"})
+        cache = QueryCache()
+        safpis = Safpis(api=self.api, query_cache=cache)
+        for _ in range(2):
+            closest = safpis.closest_fuel_stations(-34.8193, 138.5921)
+            assert [fuel_station.S for fuel_station in closest] == ["61205460"]
+            cheapest = safpis.cheapest_fuel_type("Premium 98")
+            assert [(price.SiteId, price.Price.amount) for price in cheapest] == [(61501045, Decimal("1356"))]
+        assert cache.statistics().hits == 2
+
+    def test_misses_use_the_exact_arguments(self):
+        safpis = Safpis(api=self.api, query_cache=QueryCache(precision=0))
+        # Keyed as -35.0, where the closest is 2, but -34.7 is closer to 1.
+        closest = safpis.closest_fuel_stations(-34.7, 138.59)
+        assert [fuel_station.S for fuel_station in closest] == [1, 2]
+
+    def test_reference_changes_invalidate(self):
+        self.safpis.open_fuel_stations(datetime(2024, 1, 1, 12, 0, 1, tzinfo=ADELAIDE))
+        self.safpis.open_fuel_stations(datetime(2024, 1, 1, 12, 0, 30, tzinfo=ADELAIDE))
+        assert self.cache.statistics().hits == 1
+        self.safpis.refresh()
+        assert len(self.cache) == 1
+        self.api.GetFullSiteDetails.return_value["S"].pop()
+        self.safpis.refresh()
+        assert len(self.cache) == 0
+        assert len(self.safpis.open_fuel_stations(datetime(2024, 1, 1, 12, 0, tzinfo=ADELAIDE))) == 1
+
+    def test_price_changes_invalidate(self):
+        cheapest = self.safpis.cheapest_fuel_type("Unleaded")
+        assert [price.SiteId for price in cheapest] == [2, 1]
+        self.safpis.cheapest_fuel_type("Unleaded")
+        assert self.cache.statistics().hits == 1
+        self.api.GetSitesPrices.return_value["SitePrices"][0]["Price"] = 1700.0
+        cheapest = self.safpis.cheapest_fuel_type("Unleaded")
+        assert [price.SiteId for price in cheapest] == [1, 2]
+        assert self.cache.statistics().invalidations == 1
+
+    def test_prices_changing_while_computing(self):
+        def changing_prices(*_args, **_kwargs):
+            self.api.GetSitesPrices.return_value["SitePrices"][0]["Price"] = 1700.0
+            return mock.DEFAULT
+
+        self.api.GetSitesPrices.side_effect = changing_prices
+        cheapest = self.safpis.cheapest_fuel_type("Unleaded")
+        self.api.GetSitesPrices.side_effect = None
+        assert [price.SiteId for price in cheapest] == [1, 2]
+        assert len(self.cache) == 0
+        cheapest = self.safpis.cheapest_fuel_type("Unleaded")
+        assert [price.SiteId for price in cheapest] == [1, 2]
+        assert len(self.cache) == 1
@@ -0,0 +1,158 @@
+"""Tests for `profiling` module."""
+
+import copy
+import logging
+from unittest import TestCase, mock
+
+import pytest
+
+from safpis import profiling
+from safpis.api import SafpisAPI
+from safpis.safpis import Safpis
+
+# A fuel station and a price recorded from the SAFPIS REST API.
+FUEL_STATION = {
+    "S": "61205460",
+    "A": "11 Vader Street",
+    "N": "OTR Dry Creek",
+    "B": 169,
+    "P": "5094",
+    "G1": 170227225,
+    "G2": 189,
+    "G3": 4,
+    "G4": 0,
+    "G5": 0,
+    "Lat": -34.819297,
+    "Lng": 138.592116,
+    "M": "2023-12-27T09:15:01.100",
+    "GPI": "ChIJKy0p_ra3sGoRaWz3bT-5iEk",
+    "MO": "00:00",
+    "MC": "23:59",
+    "TO": "00:00",
+    "TC": "23:59",
+    "WO": "00:00",
+    "WC": "23:59",
+    "THO": "00:00",
+    "THC": "23:59",
+    "FO": "00:00",
+    "FC": "23:59",
+    "SO": "00:00",
+    "SC": "23:59",
+    "SUO": "00:00",
+    "SUC": "23:59",
+}
+SITE_PRICE = {
+    "SiteId": 61501045,
+    "FuelId": 14,
+    "CollectionMethod": "T",
+    "TransactionDateUtc": "2021-01-06T22:55:00",
+    "Price": 1356.0,
+}
+
+
+class TestProfiling(TestCase):
+    """Tests for `profiling` module."""
+
+    def setUp(self):
+        self.spans = []
+        self.sink = self.spans.append
+
+        self.api = mock.Mock(spec=SafpisAPI)
+        self.api.GetCountryBrands.return_value = {
+            "Brands": [
+                {"BrandId": 2, "Name": "Caltex"},
+                {"BrandId": 23, "Name": "United"},
+                {"BrandId": 169, "Name": "On the Run"},
+            ]
+        }
+        self.api.GetCountryFuelTypes.return_value = {
+            "Fuels": [{"FuelId": 2, "Name": "Unleaded"}, {"FuelId": 12, "Name": "e10"}]
+        }
+        self.api.GetCountryGeographicRegions.return_value = {"GeographicRegions": []}
+        self.api.GetFullSiteDetails.return_value = {"S": [FUEL_STATION]}
+        self.api.GetSitesPrices.return_value = {
+            "SitePrices": [SITE_PRICE, {**SITE_PRICE, "FuelId": 2}, {**SITE_PRICE, "FuelId": 12}]
+        }
+        self.api.fetch.side_effect = self.fetch
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+        if profiling.enabled():
+            profiling.remove_sink(self.sink)
+
+    def fetch(self, endpoint, fingerprint=None, **_kwargs):
+        """Answers SafpisAPI.fetch from the mocked endpoint, fingerprinting
+        its payload by its repr."""
+        payload = getattr(self.api, endpoint).return_value
+        current = repr(payload)
+        return (None if fingerprint == current else copy.deepcopy(payload)), current
+
+    def test_disabled(self):
+        assert not profiling.enabled()
+        with profiling.span("network") as span:
+            span.set_attribute("url", "x")
+        assert profiling.span("network") is profiling.span("decode")
+
+    def test_spans(self):
+        profiling.add_sink(self.sink)
+        with profiling.span("query", fuel="Unleaded"):
+            with profiling.span("parse"):
+                pass
+            with pytest.raises(ValueError, match="bad"), profiling.span("sort"):
+                int("bad")
+        assert [span.path for span in self.spans] == [("query", "parse"), ("query", "sort"), ("query",)]
+        assert self.spans[2].attributes == {"fuel": "Unleaded"}
+        assert isinstance(self.spans[1].error, ValueError)
+        assert self.spans[2].duration >= self.spans[0].duration + self.spans[1].duration
+
+    def test_profiled(self):
+        @profiling.profiled
+        def query(value):
+            with profiling.span("inner"):
+                return value * 2
+
+        assert query(2) == 4
+        profiling.add_sink(self.sink)
+        assert query(3) == 6
+        assert [span.path for span in self.spans] == [("query", "inner"), ("query",)]
+
+    def test_phase_collector(self):
+        collector = profiling.PhaseCollector()
+        for path, duration in [
+            (("query", "parse"), 1.0),
+            (("query",), 3.0),
+            (("query", "parse"), 1.0),
+            (("query",), 2.5),
+        ]:
+            collector.record(profiling.Span(path[-1], path, 0.0, duration))
+        query, parse = collector.breakdown()
+        assert (query.count, query.total, query.own, query.maximum) == (2, 5.5, 3.5, 3.0)
+        assert (parse.count, parse.mean, parse.minimum) == (2, 1.0, 1.0)
+
+    def test_logging_sink(self):
+        logger = mock.Mock()
+        sink = profiling.LoggingSink(logger, level=logging.INFO)
+        sink.record(profiling.Span("parse", ("query", "parse"), 0.0, 0.0015))
+        logger.log.assert_called_once_with(logging.INFO, "%s took %.3fms", "query/parse", 1.5)
+
+    def test_opentelemetry_sink(self):
+        tracer = mock.MagicMock()
+        sink = profiling.OpenTelemetrySink(tracer)
+        profiling.add_sink(sink)
+        try:
+            with profiling.span("parse", count=2):
+                pass
+        finally:
+            profiling.remove_sink(sink)
+        tracer.start_as_current_span.assert_called_once_with("safpis.parse", attributes={"count": 2})
+        tracer.start_as_current_span.return_value.__exit__.assert_called_once()
+
+    def test_safpis_phases(self):
+        safpis = Safpis(api=self.api)
+        profiling.add_sink(self.sink)
+        safpis.cheapest_fuel_type("Unleaded")
+        paths = [span.path for span in self.spans]
+        assert ("cheapest_fuel_type", "parse") in paths
+        assert ("cheapest_fuel_type", "fuel_by_name") in paths
+        assert ("cheapest_fuel_type", "sort") in paths
+        assert paths[-1] == ("cheapest_fuel_type",)
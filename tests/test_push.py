@@ -0,0 +1,300 @@
+"""Tests for `push` module."""
+
+import copy
+import json
+from unittest import TestCase, mock
+
+import pytest
+import requests
+from click.testing import CliRunner
+
+from safpis import cli
+from safpis.api import SafpisAPI
+from safpis.push import PriceChange, PriceFeed, PushServer, parse_key
+from safpis.snapshot import SnapshotStore
+
+# A fuel station and a price recorded from the SAFPIS REST API.
+FUEL_STATION = {
+    "S": "61205460",
+    "A": "11 Vader Street",
+    "N": "OTR Dry Creek",
+    "B": 169,
+    "P": "5094",
+    "G1": 170227225,
+    "G2": 189,
+    "G3": 4,
+    "G4": 0,
+    "G5": 0,
+    "Lat": -34.819297,
+    "Lng": 138.592116,
+    "M": "2023-12-27T09:15:01.100",
+    "GPI": "ChIJKy0p_ra3sGoRaWz3bT-5iEk",
+    "MO": "00:00",
+    "MC": "23:59",
+    "TO": "00:00",
+    "TC": "23:59",
+    "WO": "00:00",
+    "WC": "23:59",
+    "THO": "00:00",
+    "THC": "23:59",
+    "FO": "00:00",
+    "FC": "23:59",
+    "SO": "00:00",
+    "SC": "23:59",
+    "SUO": "00:00",
+    "SUC": "23:59",
+}
+SITE_PRICE = {
+    "SiteId": 61501045,
+    "FuelId": 14,
+    "CollectionMethod": "T",
+    "TransactionDateUtc": "2021-01-06T22:55:00",
+    "Price": 1356.0,
+}
+
+
+class TestPriceFeed(TestCase):
+    """Tests for `PriceFeed`."""
+
+    def setUp(self):
+        self.feed = PriceFeed()
+        self.feed.apply_site_prices(
+            [
+                {**SITE_PRICE, "SiteId": 1},
+                {**SITE_PRICE, "SiteId": 2, "Price": 1900.0},
+            ]
+        )
+
+        self.api = mock.Mock(spec=SafpisAPI)
+        self.api.GetCountryBrands.return_value = {
+            "Brands": [
+                {"BrandId": 2, "Name": "Caltex"},
+                {"BrandId": 23, "Name": "United"},
+                {"BrandId": 169, "Name": "On the Run"},
+            ]
+        }
+        self.api.GetCountryFuelTypes.return_value = {
+            "Fuels": [{"FuelId": 2, "Name": "Unleaded"}, {"FuelId": 12, "Name": "e10"}]
+        }
+        self.api.GetCountryGeographicRegions.return_value = {"GeographicRegions": []}
+        self.api.GetFullSiteDetails.return_value = {"S": [{**FUEL_STATION, "S": 1}]}
+        self.api.GetSitesPrices.return_value = {"SitePrices": [{**SITE_PRICE, "SiteId": 1, "Price": 1700.0}]}
+        self.api.fetch.side_effect = self.fetch
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+
+    def fetch(self, endpoint, fingerprint=None, **_kwargs):
+        """Answers SafpisAPI.fetch from the mocked endpoint, fingerprinting
+        its payload by its repr."""
+        payload = getattr(self.api, endpoint).return_value
+        current = repr(payload)
+        return (None if fingerprint == current else copy.deepcopy(payload)), current
+
+    def test_apply_site_prices(self):
+        assert len(self.feed) == 2
+        assert self.feed.version == 2
+        changes = self.feed.apply_site_prices(
+            [
+                {**SITE_PRICE, "SiteId": 1},
+                {
+                    **SITE_PRICE,
+                    "SiteId": 2,
+                    "Price": 1890.0,
+                    "TransactionDateUtc": "2021-01-07T01:00:00",
+                },
+            ]
+        )
+        assert changes == [PriceChange(3, 2, 14, 1890.0, "2021-01-07T01:00:00")]
+        changes = self.feed.apply_site_prices([{**SITE_PRICE, "SiteId": 2, "Price": 9999.0}])
+        assert changes == [PriceChange(4, 2, 14, None, "2021-01-06T22:55:00"), PriceChange(5, 1, 14, None, None)]
+        assert self.feed.apply_site_prices([]) == []
+
+    def test_subscribers_only_get_their_keys(self):
+        one, everything = [], []
+        self.feed.subscribe([(1, 14)], one.extend)
+        self.feed.subscribe(None, everything.extend)
+        assert one == [PriceChange(2, 1, 14, 1356.0, "2021-01-06T22:55:00")]
+        assert len(everything) == 2
+        assert self.feed.subscribers() == 2
+
+        self.feed.apply_site_prices(
+            [
+                {**SITE_PRICE, "SiteId": 1},
+                {**SITE_PRICE, "SiteId": 2, "Price": 1880.0},
+            ]
+        )
+        assert len(one) == 1
+        assert everything[-1].price == 1880.0
+        self.feed.apply_site_prices(
+            [
+                {**SITE_PRICE, "SiteId": 1, "Price": 1800.0},
+                {**SITE_PRICE, "SiteId": 2, "Price": 1880.0},
+            ]
+        )
+        assert [change.price for change in one] == [1356.0, 1800.0]
+
+    def test_resume(self):
+        received = []
+        subscription = self.feed.subscribe([(2, 14)], received.extend)
+        self.feed.unsubscribe(subscription)
+        assert self.feed.subscribers() == 0
+        self.feed.apply_site_prices(
+            [
+                {**SITE_PRICE, "SiteId": 1, "Price": 1800.0},
+                {**SITE_PRICE, "SiteId": 2, "Price": 1880.0},
+            ]
+        )
+        self.feed.apply_site_prices(
+            [
+                {**SITE_PRICE, "SiteId": 1, "Price": 1800.0},
+                {**SITE_PRICE, "SiteId": 2, "Price": 1870.0},
+            ]
+        )
+        assert len(received) == 1
+
+        self.feed.subscribe([(2, 14)], received.extend, since=subscription.version)
+        assert [(change.version, change.price) for change in received[1:]] == [(4, 1880.0), (5, 1870.0)]
+        assert self.feed.changes_since(5) == []
+        assert self.feed.changes_since(6) is None
+
+    def test_resume_after_history_is_dropped(self):
+        feed = PriceFeed(history=2)
+        for price in (1800.0, 1810.0, 1820.0):
+            feed.apply_site_prices([{**SITE_PRICE, "Price": price}])
+        assert feed.changes_since(0) is None
+        assert [change.price for change in feed.changes_since(1)] == [1810.0, 1820.0]
+        received = []
+        feed.subscribe([(61501045, 14)], received.extend, since=0)
+        assert received == [PriceChange(3, 61501045, 14, 1820.0, "2021-01-06T22:55:00")]
+
+    def test_apply_snapshot(self):
+        store = SnapshotStore(self.api)
+        store.add_listener(self.feed.apply_snapshot)
+        store.refresh()
+        store.refresh()
+        assert self.feed.prices() == [PriceChange(4, 1, 14, 1700.0, "2021-01-06T22:55:00")]
+
+    def test_parse_key(self):
+        assert parse_key("61205460:2") == (61205460, 2)
+        with pytest.raises(ValueError, match="site ID"):
+            parse_key("61205460")
+
+
+class TestPushServer(TestCase):
+    """Tests for `PushServer`."""
+
+    def setUp(self):
+        self.feed = PriceFeed()
+        self.feed.apply_site_prices(
+            [
+                {**SITE_PRICE, "SiteId": 1},
+                {**SITE_PRICE, "SiteId": 2, "Price": 1900.0},
+            ]
+        )
+        self.server = PushServer(self.feed).start()
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+        self.server.stop()
+
+    def events(self, response, count):
+        events = []
+        event: dict = {}
+        for line in response.iter_lines(chunk_size=1, decode_unicode=True):
+            if not line:
+                if "data" in event:
+                    events.append(event)
+                    if len(events) == count:
+                        return events
+                event = {}
+                continue
+            field, _separator, value = line.partition(": ")
+            event[field] = value
+        return events
+
+    def test_prices(self):
+        response = requests.get(f"{self.server.url}/prices", params={"key": "2:14,3:14"}, timeout=5)
+        assert [price["price"] for price in response.json()] == [1900.0]
+        assert requests.get(f"{self.server.url}/prices", params={"key": "2"}, timeout=5).status_code == 400
+        assert requests.get(f"{self.server.url}/other", timeout=5).status_code == 404
+
+    def test_events(self):
+        url = f"{self.server.url}/events"
+        with requests.get(url, params={"key": "2:14"}, stream=True, timeout=5) as response:
+            assert response.headers["Content-Type"].startswith("text/event-stream")
+            (event,) = self.events(response, 1)
+            assert event["event"] == "price"
+            assert json.loads(event["data"])["price"] == 1900.0
+            self.feed.apply_site_prices(
+                [
+                    {**SITE_PRICE, "SiteId": 1, "Price": 1800.0},
+                    {**SITE_PRICE, "SiteId": 2, "Price": 1890.0},
+                ]
+            )
+            (event,) = self.events(response, 1)
+            assert json.loads(event["data"]) == {
+                "version": 4,
+                "site_id": 2,
+                "fuel_id": 14,
+                "price": 1890.0,
+                "updated": "2021-01-06T22:55:00",
+            }
+            last_event_id = event["id"]
+
+        self.feed.apply_site_prices(
+            [
+                {**SITE_PRICE, "SiteId": 1, "Price": 1800.0},
+                {**SITE_PRICE, "SiteId": 2, "Price": 1880.0},
+            ]
+        )
+        headers = {"Last-Event-ID": last_event_id}
+        with requests.get(url, params={"key": "2:14"}, headers=headers, stream=True, timeout=5) as response:
+            (event,) = self.events(response, 1)
+            assert json.loads(event["data"])["price"] == 1880.0
+            assert event["id"] == f"{self.feed.epoch}:5"
+
+        # An ID from another feed gets the current prices.
+        headers = {"Last-Event-ID": "other:5"}
+        with requests.get(url, params={"key": "2:14"}, headers=headers, stream=True, timeout=5) as response:
+            assert json.loads(self.events(response, 1)[0]["data"])["price"] == 1880.0
+
+
+class TestPushCommand(TestCase):
+    """Tests for the `push` command."""
+
+    def setUp(self):
+        self.api = mock.Mock(spec=SafpisAPI)
+        self.api.GetCountryBrands.return_value = {
+            "Brands": [
+                {"BrandId": 2, "Name": "Caltex"},
+                {"BrandId": 23, "Name": "United"},
+                {"BrandId": 169, "Name": "On the Run"},
+            ]
+        }
+        self.api.GetCountryFuelTypes.return_value = {
+            "Fuels": [{"FuelId": 2, "Name": "Unleaded"}, {"FuelId": 12, "Name": "e10"}]
+        }
+        self.api.GetCountryGeographicRegions.return_value = {"GeographicRegions": []}
+        self.api.GetFullSiteDetails.return_value = {"S": [FUEL_STATION]}
+        self.api.GetSitesPrices.return_value = {"SitePrices": [SITE_PRICE]}
+        self.api.fetch.side_effect = self.fetch
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+
+    def fetch(self, endpoint, fingerprint=None, **_kwargs):
+        """Answers SafpisAPI.fetch from the mocked endpoint, fingerprinting
+        its payload by its repr."""
+        payload = getattr(self.api, endpoint).return_value
+        current = repr(payload)
+        return (None if fingerprint == current else copy.deepcopy(payload)), current
+
+    @mock.patch("safpis.cli.push.PushServer.serve_forever", side_effect=KeyboardInterrupt)
+    @mock.patch("safpis.cli.SnapshotStore")
+    def test_push(self, snapshot_store, serve_forever):
+        snapshot_store.return_value = SnapshotStore(self.api)
+        result = CliRunner().invoke(cli.main, ["push", "--port", "0"])
+        assert result.exit_code == 0
+        assert "Pushing 1 prices at http://127.0.0.1:" in result.output
+        serve_forever.assert_called_once()
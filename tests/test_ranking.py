@@ -0,0 +1,168 @@
+"""Tests for `ranking` module."""
+
+import copy
+import time
+from datetime import datetime, timezone
+from unittest import TestCase, mock
+
+import pytest
+import pytz
+
+from safpis.api import SafpisAPI
+from safpis.ranking import RankedStation, RankingWeights, rank_effective_cost
+from safpis.safpis import Safpis
+from safpis.tables import PriceTable
+
+# A fuel station and a price recorded from the SAFPIS REST API.
+FUEL_STATION = {
+    "S": "61205460",
+    "A": "11 Vader Street",
+    "N": "OTR Dry Creek",
+    "B": 169,
+    "P": "5094",
+    "G1": 170227225,
+    "G2": 189,
+    "G3": 4,
+    "G4": 0,
+    "G5": 0,
+    "Lat": -34.819297,
+    "Lng": 138.592116,
+    "M": "2023-12-27T09:15:01.100",
+    "GPI": "ChIJKy0p_ra3sGoRaWz3bT-5iEk",
+    "MO": "00:00",
+    "MC": "23:59",
+    "TO": "00:00",
+    "TC": "23:59",
+    "WO": "00:00",
+    "WC": "23:59",
+    "THO": "00:00",
+    "THC": "23:59",
+    "FO": "00:00",
+    "FC": "23:59",
+    "SO": "00:00",
+    "SC": "23:59",
+    "SUO": "00:00",
+    "SUC": "23:59",
+}
+SITE_PRICE = {
+    "SiteId": 61501045,
+    "FuelId": 14,
+    "CollectionMethod": "T",
+    "TransactionDateUtc": "2021-01-06T22:55:00",
+    "Price": 1356.0,
+}
+
+CLOSED = {day: "" for day in ["MO", "MC", "TO", "TC", "WO", "WC", "THO", "THC", "FO", "FC", "SO", "SC", "SUO", "SUC"]}
+
+
+def _transaction_date(hours_ago):
+    return datetime.fromtimestamp(time.time() - hours_ago * 3600, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%S")
+
+
+class TestRanking(TestCase):
+    """Tests for `ranking` module."""
+
+    def setUp(self):
+        # Fuel stations at Dry Creek, 12km north of the origin, and in the CBD.
+        self.origin = (-34.9285, 138.6007)
+        self.fuel_stations = [
+            {**FUEL_STATION, "S": 1, "B": 2, "Lat": -34.819297, "Lng": 138.592116},
+            {**FUEL_STATION, "S": 2, "B": 23, "Lat": -34.9290, "Lng": 138.6010},
+            {**FUEL_STATION, "S": 3, "B": 169, "Lat": -34.9280, "Lng": 138.6000, **CLOSED},
+        ]
+        self.site_prices = [
+            {
+                **SITE_PRICE,
+                "SiteId": 1,
+                "FuelId": 2,
+                "Price": 1800.0,
+                "TransactionDateUtc": _transaction_date(1),
+            },
+            {
+                **SITE_PRICE,
+                "SiteId": 2,
+                "FuelId": 2,
+                "Price": 1850.0,
+                "TransactionDateUtc": _transaction_date(48),
+            },
+            {**SITE_PRICE, "SiteId": 3, "FuelId": 2, "Price": 1500.0},
+            {**SITE_PRICE, "SiteId": 2, "FuelId": 12, "Price": 1000.0},
+            {**SITE_PRICE, "SiteId": 4, "FuelId": 2, "Price": 1000.0},
+        ]
+        self.date_time = datetime(2023, 12, 25, 12, 0, 0, tzinfo=pytz.timezone("Australia/Adelaide"))
+
+        self.api = mock.Mock(spec=SafpisAPI)
+        self.api.GetCountryBrands.return_value = {
+            "Brands": [
+                {"BrandId": 2, "Name": "Caltex"},
+                {"BrandId": 23, "Name": "United"},
+                {"BrandId": 169, "Name": "On the Run"},
+            ]
+        }
+        self.api.GetCountryFuelTypes.return_value = {
+            "Fuels": [{"FuelId": 2, "Name": "Unleaded"}, {"FuelId": 12, "Name": "e10"}]
+        }
+        self.api.GetCountryGeographicRegions.return_value = {"GeographicRegions": []}
+        self.api.GetFullSiteDetails.return_value = {"S": list(self.fuel_stations)}
+        self.api.GetSitesPrices.return_value = {"SitePrices": list(self.site_prices)}
+        self.api.fetch.side_effect = self.fetch
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+
+    def fetch(self, endpoint, fingerprint=None, **_kwargs):
+        """Answers SafpisAPI.fetch from the mocked endpoint, fingerprinting
+        its payload by its repr."""
+        payload = getattr(self.api, endpoint).return_value
+        current = repr(payload)
+        return (None if fingerprint == current else copy.deepcopy(payload)), current
+
+    def rank(self, table, **kwargs):
+        return rank_effective_cost(table, *self.origin, 2, 50, 10, date_time=self.date_time, **kwargs)
+
+    def test_rank_effective_cost(self):
+        for use_numpy in [True, False]:
+            if use_numpy:
+                pytest.importorskip("numpy")
+            table = PriceTable.from_payloads(self.fuel_stations, self.site_prices, use_numpy=use_numpy)
+            ranked = self.rank(table)
+            assert [ranked_station.site_id for ranked_station in ranked] == [1, 2]
+            assert ranked[0].distance_km == pytest.approx(12.17, abs=0.05)
+            assert ranked[0].fuel_used_litres == pytest.approx(ranked[0].distance_km / 10)
+            assert ranked[0].effective_cost == pytest.approx(1.8 * (50 + ranked[0].fuel_used_litres))
+            assert ranked[1].effective_cost == pytest.approx(1.85 * 50, abs=0.05)
+
+    def test_rank_round_trip(self):
+        table = PriceTable.from_payloads(self.fuel_stations, self.site_prices)
+        ranked = self.rank(table, round_trip=True)
+        assert ranked[0].fuel_used_litres == pytest.approx(2 * ranked[0].distance_km / 10)
+
+    def test_rank_weights(self):
+        for use_numpy in [True, False]:
+            if use_numpy:
+                pytest.importorskip("numpy")
+            table = PriceTable.from_payloads(self.fuel_stations, self.site_prices, use_numpy=use_numpy)
+            assert self.rank(table, weights=RankingWeights(distance=0.5))[0].site_id == 2
+            assert self.rank(table, weights=RankingWeights(brands={2: 5.0}))[0].site_id == 2
+            ranked = self.rank(table, weights=RankingWeights(distance=0.5, freshness=0.5))
+            assert ranked[0].site_id == 1
+            assert ranked[1].score == pytest.approx(ranked[1].effective_cost + 24.0, abs=0.1)
+
+    def test_rank_k(self):
+        table = PriceTable.from_payloads(self.fuel_stations, self.site_prices)
+        assert len(self.rank(table, k=1)) == 1
+        assert rank_effective_cost(table, *self.origin, 99, 50, 10, date_time=self.date_time) == []
+
+    def test_rank_fuel_stations(self):
+        safpis = Safpis(api=self.api)
+        ranked = safpis.rank_fuel_stations(*self.origin, "Unleaded", 50, 10, date_time=self.date_time)
+        assert isinstance(ranked[0], RankedStation)
+        assert [ranked_station.fuel_station.S for ranked_station in ranked] == [1, 2]
+
+    def test_rank_fuel_stations_site_ids(self):
+        self.api.GetFullSiteDetails.return_value = {"S": [FUEL_STATION]}
+        self.api.GetSitesPrices.return_value = {"SitePrices": [{**SITE_PRICE, "SiteId": 61205460, "FuelId": 2}]}
+        safpis = Safpis(api=self.api)
+        ranked = safpis.rank_fuel_stations(*self.origin, "Unleaded", 50, 10, date_time=self.date_time)
+        assert [ranked_station.site_id for ranked_station in ranked] == [61205460]
+        assert ranked[0].fuel_station.N == "OTR Dry Creek"
@@ -0,0 +1,162 @@
+"""Tests for `resilience` module."""
+
+import os
+from datetime import timedelta
+from unittest import TestCase, mock
+
+import pytest
+import requests
+
+from safpis.api import SafpisAPI
+from safpis.resilience import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError, ResilientTransport
+from safpis.stub import StubBehaviour, StubServer, synthetic_payloads
+from safpis.transport import RequestsTransport, TransportConfig
+
+
+class Clock:
+    """A clock that only moves when told to."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestCircuitBreaker(TestCase):
+    """Tests for `CircuitBreaker`."""
+
+    def test_opens_and_closes(self):
+        clock = Clock()
+        changes = []
+        breaker = CircuitBreaker("/Price/GetSitesPrices", 2, 10, lambda *change: changes.append(change), clock)
+        breaker.record_failure()
+        assert breaker.state == CLOSED
+        breaker.record_failure()
+        assert breaker.state == OPEN
+        assert not breaker.allow()
+
+        clock.now = 10
+        assert breaker.allow()
+        assert breaker.state == HALF_OPEN
+        assert not breaker.allow()
+        breaker.record_failure()
+        assert breaker.state == OPEN
+        assert not breaker.allow()
+
+        clock.now = 20
+        assert breaker.allow()
+        breaker.record_success()
+        assert breaker.state == CLOSED
+        assert breaker.failures == 0
+        assert changes == [
+            ("/Price/GetSitesPrices", CLOSED, OPEN),
+            ("/Price/GetSitesPrices", OPEN, HALF_OPEN),
+            ("/Price/GetSitesPrices", HALF_OPEN, OPEN),
+            ("/Price/GetSitesPrices", OPEN, HALF_OPEN),
+            ("/Price/GetSitesPrices", HALF_OPEN, CLOSED),
+        ]
+
+    def test_success_resets_failures(self):
+        breaker = CircuitBreaker("endpoint", failure_threshold=2)
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        assert breaker.state == CLOSED
+
+
+class TestResilientTransport(TestCase):
+    """Tests for `ResilientTransport`."""
+
+    def setUp(self):
+        self.payloads = synthetic_payloads(stations=10)
+        self.server = StubServer(self.payloads).start()
+        self.clock = Clock()
+        self.transport = ResilientTransport(
+            RequestsTransport(TransportConfig(cache_backend="memory", retries=0)),
+            failure_threshold=2,
+            cooldown=30,
+            clock=self.clock,
+        )
+        self.changes = []
+        self.transport.add_listener(lambda *change: self.changes.append(change))
+        with mock.patch.dict(os.environ, {"SAFPIS_SUBSCRIBER_TOKEN": "stub"}):
+            self.api = SafpisAPI(transport=self.transport, base_url=self.server.url)
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+        self.transport.close()
+        self.server.stop()
+
+    def expire(self):
+        for session in self.transport.sessions.values():
+            session.cache.reset_expiration(timedelta(seconds=-60))
+
+    def test_serves_stale_on_error(self):
+        assert self.api.GetSitesPrices() == self.payloads["GetSitesPrices"]
+        assert not self.api.stale["GetSitesPrices"]
+        self.expire()
+        self.server.behaviour = StubBehaviour(error_rate=1.0)
+
+        assert self.api.GetSitesPrices() == self.payloads["GetSitesPrices"]
+        assert self.api.stale["GetSitesPrices"]
+        self.api.GetSitesPrices()
+        assert self.transport.states() == {"/Price/GetSitesPrices": OPEN}
+        assert self.changes == [("/Price/GetSitesPrices", CLOSED, OPEN)]
+
+        # While the breaker is open the stub is not called at all.
+        errors = self.server.errors
+        assert self.api.GetSitesPrices() == self.payloads["GetSitesPrices"]
+        assert self.server.errors == errors
+
+        self.server.behaviour = StubBehaviour()
+        self.clock.now = 30
+        assert self.api.GetSitesPrices() == self.payloads["GetSitesPrices"]
+        assert not self.api.stale["GetSitesPrices"]
+        assert self.transport.states() == {"/Price/GetSitesPrices": CLOSED}
+
+    def test_fails_without_cached_response(self):
+        self.server.behaviour = StubBehaviour(error_rate=1.0)
+        for _ in range(2):
+            with pytest.raises(requests.HTTPError, match="503"):
+                self.api.GetCountryBrands()
+        with pytest.raises(CircuitOpenError, match="GetCountryBrands"):
+            self.api.GetCountryBrands()
+        assert self.server.errors == 2
+
+    def test_max_stale(self):
+        self.transport.max_stale = timedelta(seconds=1)
+        self.api.GetCountryBrands()
+        self.expire()
+        self.server.behaviour = StubBehaviour(error_rate=1.0)
+        with pytest.raises(requests.HTTPError, match="503"):
+            self.api.GetCountryBrands()
+
+    def test_connection_errors(self):
+        self.api.GetCountryFuelTypes()
+        self.expire()
+        self.server.stop()
+        # Drop the kept-alive connections, which the stopped server still answers.
+        for session in self.transport.sessions.values():
+            session.get_adapter(self.server.url).close()
+        assert self.api.GetCountryFuelTypes() == self.payloads["GetCountryFuelTypes"]
+        assert self.api.stale["GetCountryFuelTypes"]
+        with pytest.raises(requests.ConnectionError):
+            self.api.GetCountryBrands()
+
+    def test_unexpected_error_ends_trial(self):
+        self.server.behaviour = StubBehaviour(error_rate=1.0)
+        for _ in range(2):
+            with pytest.raises(requests.HTTPError, match="503"):
+                self.api.GetCountryBrands()
+        self.server.behaviour = StubBehaviour()
+        self.clock.now = 30
+        error = requests.exceptions.ChunkedEncodingError("Connection broken")
+        broken = mock.patch.object(self.transport.transport, "get", side_effect=error)
+        with broken, pytest.raises(requests.exceptions.ChunkedEncodingError, match="broken"):
+            self.api.GetCountryBrands()
+        assert self.transport.states() == {"/Subscriber/GetCountryBrands": OPEN}
+
+        self.clock.now = 60
+        assert self.api.GetCountryBrands() == self.payloads["GetCountryBrands"]
+        assert self.transport.states() == {"/Subscriber/GetCountryBrands": CLOSED}
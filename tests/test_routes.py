@@ -0,0 +1,149 @@
+"""Tests for `routes` and `geo` modules."""
+
+import copy
+from datetime import datetime
+from unittest import TestCase, mock
+
+import pytest
+import pytz
+
+from safpis.api import SafpisAPI
+from safpis.geo import GridIndex, point_segment_distance_km
+from safpis.models import StationChanges
+from safpis.routes import RouteStation, corridor_candidates
+from safpis.safpis import Safpis
+
+# A fuel station and a price recorded from the SAFPIS REST API.
+FUEL_STATION = {
+    "S": "61205460",
+    "A": "11 Vader Street",
+    "N": "OTR Dry Creek",
+    "B": 169,
+    "P": "5094",
+    "G1": 170227225,
+    "G2": 189,
+    "G3": 4,
+    "G4": 0,
+    "G5": 0,
+    "Lat": -34.819297,
+    "Lng": 138.592116,
+    "M": "2023-12-27T09:15:01.100",
+    "GPI": "ChIJKy0p_ra3sGoRaWz3bT-5iEk",
+    "MO": "00:00",
+    "MC": "23:59",
+    "TO": "00:00",
+    "TC": "23:59",
+    "WO": "00:00",
+    "WC": "23:59",
+    "THO": "00:00",
+    "THC": "23:59",
+    "FO": "00:00",
+    "FC": "23:59",
+    "SO": "00:00",
+    "SC": "23:59",
+    "SUO": "00:00",
+    "SUC": "23:59",
+}
+SITE_PRICE = {
+    "SiteId": 61501045,
+    "FuelId": 14,
+    "CollectionMethod": "T",
+    "TransactionDateUtc": "2021-01-06T22:55:00",
+    "Price": 1356.0,
+}
+
+CLOSED = {day: "" for day in ["MO", "MC", "TO", "TC", "WO", "WC", "THO", "THC", "FO", "FC", "SO", "SC", "SUO", "SUC"]}
+
+
+class TestRoutes(TestCase):
+    """Tests for `routes` module."""
+
+    def setUp(self):
+        # A route north from the Adelaide CBD to Dry Creek.
+        self.polyline = [(-34.9285, 138.6007), (-34.8193, 138.5921)]
+        self.fuel_stations = [
+            {**FUEL_STATION, "S": 1, "Lat": -34.819297, "Lng": 138.592116},
+            {**FUEL_STATION, "S": 2, "Lat": -34.874, "Lng": 138.607},
+            {**FUEL_STATION, "S": 3, "Lat": -35.139, "Lng": 138.499},
+            {**FUEL_STATION, "S": 4, "Lat": -34.880, "Lng": 138.596, **CLOSED},
+            {**FUEL_STATION, "S": 5, "Lat": -34.900, "Lng": 138.598},
+        ]
+        self.site_prices = [
+            {**SITE_PRICE, "SiteId": 1, "FuelId": 2, "Price": 1900.0},
+            {**SITE_PRICE, "SiteId": 2, "FuelId": 2, "Price": 1850.0},
+            {**SITE_PRICE, "SiteId": 3, "FuelId": 2, "Price": 1500.0},
+            {**SITE_PRICE, "SiteId": 4, "FuelId": 2, "Price": 1600.0},
+            {**SITE_PRICE, "SiteId": 5, "FuelId": 12, "Price": 1600.0},
+        ]
+        self.date_time = datetime(2023, 12, 25, 12, 0, 0, tzinfo=pytz.timezone("Australia/Adelaide"))
+
+        self.api = mock.Mock(spec=SafpisAPI)
+        self.api.GetCountryBrands.return_value = {
+            "Brands": [
+                {"BrandId": 2, "Name": "Caltex"},
+                {"BrandId": 23, "Name": "United"},
+                {"BrandId": 169, "Name": "On the Run"},
+            ]
+        }
+        self.api.GetCountryFuelTypes.return_value = {
+            "Fuels": [{"FuelId": 2, "Name": "Unleaded"}, {"FuelId": 12, "Name": "e10"}]
+        }
+        self.api.GetCountryGeographicRegions.return_value = {"GeographicRegions": []}
+        self.api.GetFullSiteDetails.return_value = {"S": list(self.fuel_stations)}
+        self.api.GetSitesPrices.return_value = {"SitePrices": list(self.site_prices)}
+        self.api.fetch.side_effect = self.fetch
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+
+    def fetch(self, endpoint, fingerprint=None, **_kwargs):
+        """Answers SafpisAPI.fetch from the mocked endpoint, fingerprinting
+        its payload by its repr."""
+        payload = getattr(self.api, endpoint).return_value
+        current = repr(payload)
+        return (None if fingerprint == current else copy.deepcopy(payload)), current
+
+    def test_point_segment_distance(self):
+        distance, fraction = point_segment_distance_km(-34.9, 138.6, (-35.0, 138.6), (-34.8, 138.6))
+        assert distance == pytest.approx(0, abs=1e-9)
+        assert fraction == pytest.approx(0.5)
+
+    def test_grid_index_within(self):
+        index = GridIndex.from_fuel_stations(self.fuel_stations)
+        keys = [key for key, _distance in index.within(-34.819297, 138.592116, 10)]
+        assert keys[0] == 1
+        assert 3 not in keys
+        index.apply_station_changes(StationChanges(removed=[self.fuel_stations[0]]))
+        assert 1 not in [key for key, _distance in index.within(-34.819297, 138.592116, 10)]
+
+    def test_corridor_candidates(self):
+        index = GridIndex.from_fuel_stations(self.fuel_stations)
+        candidates = corridor_candidates(index, self.polyline, buffer_km=2)
+        assert set(candidates) == {1, 2, 4, 5}
+        distance, route_km = candidates[1]
+        assert distance < 0.1
+        assert route_km == pytest.approx(12.2, abs=0.2)
+
+    def test_corridor_candidates_empty_polyline(self):
+        with pytest.raises(ValueError, match="polyline"):
+            corridor_candidates(GridIndex(), [], buffer_km=2)
+
+    def test_cheapest_along_route(self):
+        safpis = Safpis(api=self.api)
+        route_stations = safpis.cheapest_along_route(self.polyline, 2, "Unleaded", date_time=self.date_time)
+        assert isinstance(route_stations[0], RouteStation)
+        assert [route_station.fuel_station.S for route_station in route_stations] == [2, 1]
+
+    def test_cheapest_along_route_site_ids(self):
+        self.api.GetFullSiteDetails.return_value = {"S": [FUEL_STATION]}
+        self.api.GetSitesPrices.return_value = {"SitePrices": [{**SITE_PRICE, "SiteId": 61205460, "FuelId": 2}]}
+        safpis = Safpis(api=self.api)
+        route_stations = safpis.cheapest_along_route(self.polyline, 2, "Unleaded", date_time=self.date_time)
+        assert [route_station.fuel_station.S for route_station in route_stations] == ["61205460"]
+
+    def test_cheapest_along_route_detour_cost(self):
+        safpis = Safpis(api=self.api)
+        route_stations = safpis.cheapest_along_route(
+            self.polyline, 2, "Unleaded", k=1, date_time=self.date_time, detour_cost=100
+        )
+        assert [route_station.fuel_station.S for route_station in route_stations] == [1]
@@ -1,5 +1,6 @@
 """Tests for `safpis` package."""
 
+import copy
 import os
 from datetime import datetime
 from decimal import Decimal
@@ -10,7 +11,8 @@ import pytz
 from geopy.distance import Distance
 from money import Money
 
-from safpis.models import Brand, Fuel, FuelStation, FuelStationPrice
+from safpis.api import SafpisAPI
+from safpis.models import Brand, Fuel, FuelStation, FuelStationPrice, NumericFuelStationPrice, StationChanges
 from safpis.safpis import NoResultsError, Safpis
 
 
@@ -61,9 +63,30 @@ class TestSafpis(TestCase):
 
         self.adl_tz = pytz.timezone("Australia/Adelaide")
 
+        self.api = mock.Mock(spec=SafpisAPI)
+        self.api.GetCountryBrands.return_value = {
+            "Brands": [{"BrandId": 2, "Name": "Caltex"}, {"BrandId": 23, "Name": "United"}]
+        }
+        self.api.GetCountryFuelTypes.return_value = {
+            "Fuels": [{"FuelId": 2, "Name": "Unleaded"}, {"FuelId": 12, "Name": "e10"}]
+        }
+        self.api.GetCountryGeographicRegions.return_value = {"GeographicRegions": []}
+        self.api.GetFullSiteDetails.return_value = {
+            "S": [{**self.fuel_station_dict, "S": 1}, {**self.fuel_station_dict, "S": 2, "N": "Two"}]
+        }
+        self.api.GetSitesPrices.return_value = {"SitePrices": []}
+        self.api.fetch.side_effect = self.fetch
+
     def tearDown(self):
         """Tear down test fixtures, if any."""
 
+    def fetch(self, endpoint, fingerprint=None, **_kwargs):
+        """Answers SafpisAPI.fetch from the mocked endpoint, fingerprinting
+        its payload by its repr."""
+        payload = getattr(self.api, endpoint).return_value
+        current = repr(payload)
+        return (None if fingerprint == current else copy.deepcopy(payload)), current
+
     def test_price(self):
         safpis = Safpis()
         prices = safpis.price(61205460, 2)
@@ -224,3 +247,65 @@ class TestSafpis(TestCase):
         fuel_station_prices = safpis.cheapest_fuel_type("e10")
         assert isinstance(fuel_station_prices, list)
         assert isinstance(fuel_station_prices[0], FuelStationPrice)
+
+    def test_refresh_unchanged(self):
+        safpis = Safpis(api=self.api)
+        with mock.patch.object(StationChanges, "between") as between:
+            changes = safpis.refresh()
+        assert isinstance(changes, StationChanges)
+        assert not changes
+        between.assert_not_called()
+
+    def test_refresh_incremental(self):
+        safpis = Safpis(api=self.api)
+        unchanged = safpis.fuel_station_by_id(1)
+        listener = mock.Mock()
+        safpis.add_station_listener(listener)
+
+        self.api.GetFullSiteDetails.return_value = {
+            "S": [
+                {**self.fuel_station_dict, "S": 1},
+                {**self.fuel_station_dict, "S": 2, "N": "Renamed"},
+                {**self.fuel_station_dict, "S": 3},
+            ]
+        }
+        changes = safpis.refresh()
+        assert [record["S"] for record in changes.added] == [3]
+        assert [new["N"] for _old, new in changes.changed] == ["Renamed"]
+        assert changes.removed == []
+        listener.assert_called_once_with(changes)
+        assert safpis.fuel_station_by_id(1) is unchanged
+        assert safpis.fuel_station_by_id(2).N == "Renamed"
+
+        self.api.GetFullSiteDetails.return_value = {"S": [{**self.fuel_station_dict, "S": 1}]}
+        changes = safpis.refresh()
+        assert sorted(record["S"] for record in changes.removed) == [2, 3]
+        with pytest.raises(NoResultsError):
+            safpis.fuel_station_by_id(2)
+
+        safpis.remove_station_listener(listener)
+        self.api.GetFullSiteDetails.return_value = {
+            "S": [{**self.fuel_station_dict, "S": 1}, {**self.fuel_station_dict, "S": 4}]
+        }
+        safpis.refresh()
+        assert listener.call_count == 2
+        with pytest.raises(ValueError, match="not in list"):
+            safpis.remove_station_listener(listener)
+
+    def test_numeric_prices(self):
+        site_prices = [
+            {**self.fuel_station_prices_dict, "SiteId": 1, "FuelId": 2, "Price": 1899.0},
+            {**self.fuel_station_prices_dict, "SiteId": 2, "FuelId": 2, "Price": 1799.0},
+            {**self.fuel_station_prices_dict, "SiteId": 3, "FuelId": 12, "Price": 1699.0},
+        ]
+        self.api.GetFullSiteDetails.return_value = {
+            "S": [{**self.fuel_station_dict, "S": site_id} for site_id in (1, 2, 3)]
+        }
+        self.api.GetSitesPrices.return_value = {"SitePrices": site_prices}
+        numeric = Safpis(api=self.api, numeric_prices=True).cheapest_fuel_type("Unleaded")
+        assert [(price.SiteId, price.tenths) for price in numeric] == [(2, 1799), (1, 1899)]
+        assert isinstance(numeric[0], NumericFuelStationPrice)
+        assert numeric[0].Price == FuelStationPrice(**site_prices[1]).Price
+        assert numeric[0].TransactionDateUtc == FuelStationPrice(**site_prices[1]).TransactionDateUtc
+        assert [price.SiteId for price in Safpis(api=self.api).cheapest_fuel_type("Unleaded")] == [2, 1]
+        assert Safpis(api=self.api, numeric_prices=True).price(3, 12)[0].tenths == 1699
@@ -0,0 +1,159 @@
+"""Tests for `search` module."""
+
+import copy
+from unittest import TestCase, mock
+
+from safpis.api import SafpisAPI
+from safpis.models import StationChanges
+from safpis.safpis import Safpis
+from safpis.search import SearchIndex, edit_distance, words
+
+# A fuel station and a price recorded from the SAFPIS REST API.
+FUEL_STATION = {
+    "S": "61205460",
+    "A": "11 Vader Street",
+    "N": "OTR Dry Creek",
+    "B": 169,
+    "P": "5094",
+    "G1": 170227225,
+    "G2": 189,
+    "G3": 4,
+    "G4": 0,
+    "G5": 0,
+    "Lat": -34.819297,
+    "Lng": 138.592116,
+    "M": "2023-12-27T09:15:01.100",
+    "GPI": "ChIJKy0p_ra3sGoRaWz3bT-5iEk",
+    "MO": "00:00",
+    "MC": "23:59",
+    "TO": "00:00",
+    "TC": "23:59",
+    "WO": "00:00",
+    "WC": "23:59",
+    "THO": "00:00",
+    "THC": "23:59",
+    "FO": "00:00",
+    "FC": "23:59",
+    "SO": "00:00",
+    "SC": "23:59",
+    "SUO": "00:00",
+    "SUC": "23:59",
+}
+SITE_PRICE = {
+    "SiteId": 61501045,
+    "FuelId": 14,
+    "CollectionMethod": "T",
+    "TransactionDateUtc": "2021-01-06T22:55:00",
+    "Price": 1356.0,
+}
+
+
+class TestSearch(TestCase):
+    """Tests for `search` module."""
+
+    def setUp(self):
+        self.fuel_stations = [
+            {**FUEL_STATION, "S": 1},
+            {**FUEL_STATION, "S": 2, "N": "Caltex Kilburn", "A": "1 Churchill Road", "P": "5084", "B": 2},
+            {**FUEL_STATION, "S": 3, "N": "United Kilkenny", "A": "2 Torrens Road", "P": "5009", "B": 23},
+            {**FUEL_STATION, "S": 4, "N": "OTR Croydon", "A": "Kilkenny Road", "P": "5008", "B": 169},
+        ]
+
+        self.api = mock.Mock(spec=SafpisAPI)
+        self.api.GetCountryBrands.return_value = {
+            "Brands": [
+                {"BrandId": 2, "Name": "Caltex"},
+                {"BrandId": 23, "Name": "United"},
+                {"BrandId": 169, "Name": "On the Run"},
+            ]
+        }
+        self.api.GetCountryFuelTypes.return_value = {
+            "Fuels": [{"FuelId": 2, "Name": "Unleaded"}, {"FuelId": 12, "Name": "e10"}]
+        }
+        self.api.GetCountryGeographicRegions.return_value = {"GeographicRegions": []}
+        self.api.GetFullSiteDetails.return_value = {"S": list(self.fuel_stations)}
+        self.api.GetSitesPrices.return_value = {"SitePrices": []}
+        self.api.fetch.side_effect = self.fetch
+        brand_names = {brand["BrandId"]: brand["Name"] for brand in self.api.GetCountryBrands.return_value["Brands"]}
+        self.index = SearchIndex.from_fuel_stations(self.fuel_stations, brand_names)
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+
+    def fetch(self, endpoint, fingerprint=None, **_kwargs):
+        """Answers SafpisAPI.fetch from the mocked endpoint, fingerprinting
+        its payload by its repr."""
+        payload = getattr(self.api, endpoint).return_value
+        current = repr(payload)
+        return (None if fingerprint == current else copy.deepcopy(payload)), current
+
+    def search(self, query, **kwargs):
+        return [site_id for site_id, _score in self.index.search(query, **kwargs)]
+
+    def test_words(self):
+        assert words("OTR Dry-Creek, 5094") == ["otr", "dry", "creek", "5094"]
+        assert words(None) == []
+
+    def test_edit_distance(self):
+        assert edit_distance("kilbrn", "kilbur", 2) == 2
+        assert edit_distance("kilbrun", "kilburn", 1) == 1
+        assert edit_distance("kilburn", "kilburn", 1) == 0
+        assert edit_distance("creek", "cr", 1) == 2
+
+    def test_prefix(self):
+        assert self.search("kil") == [2, 3, 4]
+        assert self.search("509") == [1]
+        assert self.search("dry cr") == [1]
+
+    def test_ranking(self):
+        # A name match ranks above an address match, and an exact word above
+        # a prefix.
+        assert self.search("kilkenny") == [3, 4]
+        assert self.search("otr") == [4, 1]
+
+    def test_fields(self):
+        assert self.search("churchill") == [2]
+        assert self.search("on the run") == [4, 1]
+        assert self.search("united") == [3]
+
+    def test_fuzzy(self):
+        assert self.search("kilbrun") == [2]
+        assert self.search("croyden") == [4]
+        assert self.search("xyzzy") == []
+        assert self.search("") == []
+
+    def test_limit(self):
+        assert len(self.search("kil", limit=2)) == 2
+
+    def test_recorded_payload(self):
+        self.api.GetFullSiteDetails.return_value = {"S": [FUEL_STATION]}
+        safpis = Safpis(api=self.api)
+        for query in ("vader st", "dry creek 5094", "on the run"):
+            assert [fuel_station.S for fuel_station in safpis.search_fuel_stations(query)] == ["61205460"]
+
+    def test_apply_station_changes(self):
+        self.index.apply_station_changes(
+            StationChanges(
+                added=[{**FUEL_STATION, "S": 5, "N": "Caltex Kilburn North", "B": 2}],
+                removed=[self.fuel_stations[1]],
+                changed=[
+                    (
+                        self.fuel_stations[0],
+                        {**FUEL_STATION, "S": 1, "N": "OTR Wingfield", "P": "5013", "B": 169},
+                    )
+                ],
+            )
+        )
+        assert self.search("kilburn") == [5]
+        assert self.search("dry") == []
+        assert self.search("wing") == [1]
+        assert len(self.index) == 4
+
+    def test_search_fuel_stations(self):
+        safpis = Safpis(api=self.api)
+        assert [fuel_station.S for fuel_station in safpis.search_fuel_stations("kilburn")] == [2]
+        self.api.GetCountryBrands.return_value = {"Brands": [{"BrandId": 2, "Name": "Ampol"}]}
+        self.api.GetFullSiteDetails.return_value["S"].append({**FUEL_STATION, "S": 6, "N": "Kilburn Service Station"})
+        safpis.refresh()
+        assert [fuel_station.S for fuel_station in safpis.search_fuel_stations("kilburn")] == [2, 6]
+        assert [fuel_station.S for fuel_station in safpis.search_fuel_stations("ampol")] == [2]
@@ -0,0 +1,209 @@
+"""Tests for `shards` module."""
+
+import copy
+import threading
+import time
+from unittest import TestCase, mock
+
+import pytest
+
+from safpis.api import SafpisAPI
+from safpis.shards import RegionKey, ShardedSafpis, estimated_bytes
+
+# A fuel station and a price recorded from the SAFPIS REST API.
+FUEL_STATION = {
+    "S": "61205460",
+    "A": "11 Vader Street",
+    "N": "OTR Dry Creek",
+    "B": 169,
+    "P": "5094",
+    "G1": 170227225,
+    "G2": 189,
+    "G3": 4,
+    "G4": 0,
+    "G5": 0,
+    "Lat": -34.819297,
+    "Lng": 138.592116,
+    "M": "2023-12-27T09:15:01.100",
+    "GPI": "ChIJKy0p_ra3sGoRaWz3bT-5iEk",
+    "MO": "00:00",
+    "MC": "23:59",
+    "TO": "00:00",
+    "TC": "23:59",
+    "WO": "00:00",
+    "WC": "23:59",
+    "THO": "00:00",
+    "THC": "23:59",
+    "FO": "00:00",
+    "FC": "23:59",
+    "SO": "00:00",
+    "SC": "23:59",
+    "SUO": "00:00",
+    "SUC": "23:59",
+}
+SITE_PRICE = {
+    "SiteId": 61501045,
+    "FuelId": 14,
+    "CollectionMethod": "T",
+    "TransactionDateUtc": "2021-01-06T22:55:00",
+    "Price": 1356.0,
+}
+
+SOUTH_AUSTRALIA = RegionKey(geo_region_id=4)
+WESTERN_AUSTRALIA = RegionKey(geo_region_id=5)
+NORTHERN_TERRITORY = RegionKey(geo_region_id=7)
+
+
+class TestShards(TestCase):
+    """Tests for `shards` module."""
+
+    def setUp(self):
+        self.apis = {
+            SOUTH_AUSTRALIA: self.mock_api(
+                [
+                    {**FUEL_STATION, "S": 1, "Lat": -34.82, "Lng": 138.59},
+                    {**FUEL_STATION, "S": 2, "Lat": -34.93, "Lng": 138.60},
+                ],
+                [
+                    {**SITE_PRICE, "SiteId": 1, "Price": 1900.0},
+                    {**SITE_PRICE, "SiteId": 2, "Price": 1800.0},
+                ],
+            ),
+            WESTERN_AUSTRALIA: self.mock_api(
+                [{**FUEL_STATION, "S": 11, "Lat": -31.95, "Lng": 115.86}],
+                [{**SITE_PRICE, "SiteId": 11, "Price": 1700.0}],
+            ),
+            NORTHERN_TERRITORY: self.mock_api(
+                [{**FUEL_STATION, "S": 21, "Lat": -12.46, "Lng": 130.84}],
+                [
+                    {**SITE_PRICE, "SiteId": 21, "Price": 2100.0},
+                    {**SITE_PRICE, "SiteId": 21, "FuelId": 12, "Price": 1500.0},
+                ],
+            ),
+        }
+        self.created = []
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+
+    def mock_api(self, fuel_stations, site_prices):
+        api = mock.Mock(spec=SafpisAPI)
+        api.GetCountryBrands.return_value = {"Brands": []}
+        api.GetCountryFuelTypes.return_value = {"Fuels": []}
+        api.GetCountryGeographicRegions.return_value = {"GeographicRegions": []}
+        api.GetFullSiteDetails.return_value = {"S": fuel_stations}
+        api.GetSitesPrices.return_value = {"SitePrices": site_prices}
+
+        def fetch(endpoint, fingerprint=None, **_kwargs):
+            payload = getattr(api, endpoint).return_value
+            current = repr(payload)
+            return (None if fingerprint == current else copy.deepcopy(payload)), current
+
+        api.fetch.side_effect = fetch
+        return api
+
+    def api_factory(self, region):
+        self.created.append(region)
+        return self.apis[region]
+
+    def sharded(self, memory_budget=10**9):
+        return ShardedSafpis(self.apis, memory_budget=memory_budget, api_factory=self.api_factory)
+
+    def test_loaded_on_demand(self):
+        sharded = self.sharded()
+        assert sharded.loaded_regions() == []
+        assert sharded.shard(WESTERN_AUSTRALIA).fuel_station_by_id(11) is not None
+        assert sharded.loaded_regions() == [WESTERN_AUSTRALIA]
+        assert sharded.memory_used() == estimated_bytes(sharded.shard(WESTERN_AUSTRALIA))
+
+    def test_lru_eviction(self):
+        sharded = self.sharded()
+        budget = estimated_bytes(sharded.shard(SOUTH_AUSTRALIA)) + estimated_bytes(sharded.shard(NORTHERN_TERRITORY))
+        sharded = self.sharded(memory_budget=budget)
+        sharded.shard(WESTERN_AUSTRALIA)
+        sharded.shard(SOUTH_AUSTRALIA)
+        sharded.shard(NORTHERN_TERRITORY)
+        assert sharded.loaded_regions() == [SOUTH_AUSTRALIA, NORTHERN_TERRITORY]
+        assert sharded.memory_used() <= budget
+        sharded.shard(WESTERN_AUSTRALIA)
+        assert self.created.count(WESTERN_AUSTRALIA) == 2
+
+    def test_loaded_shards_are_measured_once(self):
+        sharded = self.sharded()
+        with mock.patch("safpis.shards.estimated_bytes", wraps=estimated_bytes) as measure:
+            sharded.shard(SOUTH_AUSTRALIA)
+            sharded.shard(SOUTH_AUSTRALIA)
+            assert measure.call_count == 1
+            self.apis[SOUTH_AUSTRALIA].GetSitesPrices.return_value["SitePrices"][0]["Price"] = 1950.0
+            sharded.refresh_prices()
+            sharded.shard(SOUTH_AUSTRALIA)
+            assert measure.call_count == 2
+
+    def test_recorded_payloads(self):
+        self.apis[SOUTH_AUSTRALIA] = self.mock_api([FUEL_STATION], [SITE_PRICE, {**SITE_PRICE, "SiteId": 61205460}])
+        sharded = self.sharded()
+        assert sharded.fuel_station_by_id("61205460").N == "OTR Dry Creek"
+        found = sharded.fuel_stations_within(-34.82, 138.59, 1)
+        assert [fuel_station.S for fuel_station, _distance in found] == ["61205460"]
+        cheapest = sharded.cheapest(14, regions=[SOUTH_AUSTRALIA])
+        assert [site_price["SiteId"] for _region, site_price in cheapest] == [61501045, 61205460]
+
+    def test_budget_keeps_most_recent(self):
+        sharded = self.sharded(memory_budget=0)
+        sharded.shard(SOUTH_AUSTRALIA)
+        sharded.shard(WESTERN_AUSTRALIA)
+        assert sharded.loaded_regions() == [WESTERN_AUSTRALIA]
+
+    def test_fuel_station_by_id(self):
+        sharded = self.sharded()
+        assert sharded.fuel_station_by_id(21).S == 21
+        assert sharded.fuel_station_by_id(99) is None
+
+    def test_fuel_station_by_id_loads_its_region(self):
+        sharded = self.sharded(memory_budget=0)
+        for region in self.apis:
+            sharded.shard(region)
+        self.created.clear()
+        assert sharded.fuel_station_by_id(1).S == 1
+        assert sharded.fuel_station_by_id(99) is None
+        assert self.created == [SOUTH_AUSTRALIA]
+        assert sharded.loaded_regions() == [SOUTH_AUSTRALIA]
+
+    def test_concurrent_first_queries_load_once(self):
+        api = self.apis[SOUTH_AUSTRALIA]
+        fetch = api.fetch.side_effect
+
+        def slow_fetch(endpoint, fingerprint=None, **kwargs):
+            time.sleep(0.01)
+            return fetch(endpoint, fingerprint, **kwargs)
+
+        api.fetch.side_effect = slow_fetch
+        sharded = self.sharded()
+        threads = [threading.Thread(target=sharded.shard, args=(SOUTH_AUSTRALIA,)) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        endpoints = [call.args[0] for call in api.fetch.call_args_list]
+        assert endpoints.count("GetFullSiteDetails") == 1
+        assert endpoints.count("GetSitesPrices") == 1
+
+    def test_fuel_stations_within(self):
+        sharded = self.sharded(memory_budget=0)
+        for region in self.apis:
+            sharded.shard(region)
+        self.created.clear()
+        found = sharded.fuel_stations_within(-34.93, 138.60, 20)
+        assert [fuel_station.S for fuel_station, _distance in found] == [2, 1]
+        assert found[0][1] == pytest.approx(0, abs=0.01)
+        # Only the region whose bounds are near the point is loaded again.
+        assert self.created == [SOUTH_AUSTRALIA]
+
+    def test_cheapest(self):
+        sharded = self.sharded()
+        cheapest = sharded.cheapest(14, k=2)
+        assert [(region, site_price["SiteId"]) for region, site_price in cheapest] == [
+            (WESTERN_AUSTRALIA, 11),
+            (SOUTH_AUSTRALIA, 2),
+        ]
+        assert sharded.cheapest(12, regions=[NORTHERN_TERRITORY])[0][1]["Price"] == 1500.0
@@ -0,0 +1,207 @@
+"""Tests for `snapshot` module."""
+
+import copy
+import threading
+from dataclasses import FrozenInstanceError
+from unittest import TestCase, mock
+
+import pytest
+
+from safpis.api import SafpisAPI
+from safpis.snapshot import Snapshot, SnapshotRefresher, SnapshotStore
+
+# A fuel station and a price recorded from the SAFPIS REST API.
+FUEL_STATION = {
+    "S": "61205460",
+    "A": "11 Vader Street",
+    "N": "OTR Dry Creek",
+    "B": 169,
+    "P": "5094",
+    "G1": 170227225,
+    "G2": 189,
+    "G3": 4,
+    "G4": 0,
+    "G5": 0,
+    "Lat": -34.819297,
+    "Lng": 138.592116,
+    "M": "2023-12-27T09:15:01.100",
+    "GPI": "ChIJKy0p_ra3sGoRaWz3bT-5iEk",
+    "MO": "00:00",
+    "MC": "23:59",
+    "TO": "00:00",
+    "TC": "23:59",
+    "WO": "00:00",
+    "WC": "23:59",
+    "THO": "00:00",
+    "THC": "23:59",
+    "FO": "00:00",
+    "FC": "23:59",
+    "SO": "00:00",
+    "SC": "23:59",
+    "SUO": "00:00",
+    "SUC": "23:59",
+}
+SITE_PRICE = {
+    "SiteId": 61501045,
+    "FuelId": 14,
+    "CollectionMethod": "T",
+    "TransactionDateUtc": "2021-01-06T22:55:00",
+    "Price": 1356.0,
+}
+
+
+class TestSnapshot(TestCase):
+    """Tests for `snapshot` module."""
+
+    def setUp(self):
+        self.fuel_stations = [{**FUEL_STATION, "S": 1}, {**FUEL_STATION, "S": 2, "N": "Two"}]
+        self.site_prices = [
+            {**SITE_PRICE, "SiteId": 1},
+            {**SITE_PRICE, "SiteId": 2, "Price": 1900.0},
+        ]
+
+        self.api = mock.Mock(spec=SafpisAPI)
+        self.api.GetCountryBrands.return_value = {
+            "Brands": [
+                {"BrandId": 2, "Name": "Caltex"},
+                {"BrandId": 23, "Name": "United"},
+                {"BrandId": 169, "Name": "On the Run"},
+            ]
+        }
+        self.api.GetCountryFuelTypes.return_value = {
+            "Fuels": [{"FuelId": 2, "Name": "Unleaded"}, {"FuelId": 12, "Name": "e10"}]
+        }
+        self.api.GetCountryGeographicRegions.return_value = {"GeographicRegions": []}
+        self.api.GetFullSiteDetails.return_value = {"S": list(self.fuel_stations)}
+        self.api.GetSitesPrices.return_value = {"SitePrices": list(self.site_prices)}
+        self.api.fetch.side_effect = self.fetch
+
+        self.store = SnapshotStore(api=self.api)
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+
+    def fetch(self, endpoint, fingerprint=None, **_kwargs):
+        """Answers SafpisAPI.fetch from the mocked endpoint, fingerprinting
+        its payload by its repr."""
+        payload = getattr(self.api, endpoint).return_value
+        current = repr(payload)
+        return (None if fingerprint == current else copy.deepcopy(payload)), current
+
+    def test_current(self):
+        snapshot = self.store.current()
+        assert isinstance(snapshot, Snapshot)
+        assert (snapshot.version, snapshot.reference_version, snapshot.price_version) == (1, 1, 1)
+        assert snapshot.fuel_station_by_id(2).N == "Two"
+        assert snapshot.prices_at(2)[0]["Price"] == 1900.0
+        assert len(snapshot.price_table) == 2
+        assert self.store.current() is snapshot
+
+    def test_recorded_payloads(self):
+        self.api.GetFullSiteDetails.return_value = {"S": [FUEL_STATION]}
+        self.api.GetSitesPrices.return_value = {"SitePrices": [SITE_PRICE, {**SITE_PRICE, "SiteId": 61205460}]}
+        snapshot = SnapshotStore(api=self.api).current()
+        assert snapshot.fuel_station_by_id("61205460").N == "OTR Dry Creek"
+        assert snapshot.prices_at(61501045)[0]["Price"] == 1356.0
+        assert list(snapshot.price_table["Row"]) == [-1, 0]
+
+    def test_snapshot_is_immutable(self):
+        snapshot = self.store.current()
+        with pytest.raises(FrozenInstanceError):
+            snapshot.version = 2
+        with pytest.raises(TypeError):
+            snapshot.fuel_stations[3] = None
+
+    def test_refresh_unchanged(self):
+        snapshot = self.store.current()
+        self.api.fetch.reset_mock()
+        assert self.store.refresh() is snapshot
+        # Every endpoint was asked for with its current fingerprint.
+        assert self.api.fetch.call_count == 5
+        for call in self.api.fetch.call_args_list:
+            endpoint, fingerprint = call.args
+            assert fingerprint == repr(getattr(self.api, endpoint).return_value)
+
+    def test_refresh_prices(self):
+        snapshot = self.store.current()
+        self.api.GetSitesPrices.return_value = {"SitePrices": [{**SITE_PRICE, "SiteId": 1, "Price": 1700.0}]}
+        refreshed = self.store.refresh_prices()
+        assert (refreshed.version, refreshed.reference_version, refreshed.price_version) == (2, 1, 2)
+        assert refreshed.prices_at(1)[0]["Price"] == 1700.0
+        assert refreshed.prices_at(2) == ()
+        assert refreshed.station_table is snapshot.station_table
+        # Readers holding the previous snapshot are unaffected.
+        assert snapshot.prices_at(1)[0]["Price"] == 1356.0
+
+    def test_refresh_reference(self):
+        snapshot = self.store.current()
+        listener = mock.Mock()
+        self.store.add_listener(listener)
+        self.api.GetFullSiteDetails.return_value = {"S": [{**FUEL_STATION, "S": 1}, {**FUEL_STATION, "S": 3}]}
+        refreshed = self.store.refresh_reference()
+        listener.assert_called_once_with(refreshed)
+        assert (refreshed.version, refreshed.reference_version, refreshed.price_version) == (2, 2, 1)
+        assert refreshed.fuel_station_by_id(1) is snapshot.fuel_station_by_id(1)
+        assert refreshed.fuel_station_by_id(2) is None
+        assert refreshed.fuel_station_by_id(3) is not None
+        assert list(refreshed.price_table["Row"]) == [0, -1]
+        assert snapshot.fuel_station_by_id(2) is not None
+
+    def test_failed_refresh_is_retried(self):
+        self.store.current()
+        self.api.GetCountryBrands.return_value = {"Brands": [{"BrandId": 5, "Name": "BP"}]}
+
+        def offline_prices(endpoint, fingerprint=None, **kwargs):
+            if endpoint == "GetSitesPrices":
+                raise OSError(endpoint)
+            return self.fetch(endpoint, fingerprint, **kwargs)
+
+        self.api.fetch.side_effect = offline_prices
+        with pytest.raises(OSError, match="GetSitesPrices"):
+            self.store.refresh()
+        self.api.fetch.side_effect = self.fetch
+        refreshed = self.store.refresh()
+        assert refreshed.version == 2
+        assert refreshed.brands == ({"BrandId": 5, "Name": "BP"},)
+
+    def test_refresher(self):
+        published = threading.Event()
+        self.store.add_listener(lambda _snapshot: published.set())
+        with SnapshotRefresher(self.store, price_interval=0.01):
+            assert published.wait(5)
+        assert self.store.current().version == 1
+
+    def test_refresher_error(self):
+        errors = []
+        failed = threading.Event()
+        self.api.fetch.side_effect = OSError("offline")
+
+        def on_error(error):
+            errors.append(error)
+            failed.set()
+
+        refresher = SnapshotRefresher(self.store, on_error=on_error)
+        refresher.start()
+        assert failed.wait(5)
+        refresher.stop()
+        assert isinstance(refresher.last_error, OSError)
+        assert errors[0] is refresher.last_error
+
+    def test_refresher_retries_reference(self):
+        self.store.current()
+        self.api.GetCountryBrands.return_value = {"Brands": [{"BrandId": 5, "Name": "BP"}]}
+        refreshed = threading.Event()
+        self.store.add_listener(lambda snapshot: snapshot.brands[0]["BrandId"] == 5 and refreshed.set())
+
+        # Only the first reference data refresh fails.
+        failures = [OSError("GetCountryBrands")]
+
+        def offline_brands(endpoint, fingerprint=None, **kwargs):
+            if endpoint == "GetCountryBrands" and failures:
+                raise failures.pop()
+            return self.fetch(endpoint, fingerprint, **kwargs)
+
+        self.api.fetch.side_effect = offline_brands
+        with SnapshotRefresher(self.store, price_interval=0.01) as refresher:
+            assert refreshed.wait(5)
+        assert isinstance(refresher.last_error, OSError)
@@ -0,0 +1,74 @@
+"""Tests for `stub` module."""
+
+import os
+import tempfile
+from unittest import TestCase, mock
+
+import pytest
+import requests
+
+from safpis.api import SafpisAPI
+from safpis.safpis import Safpis
+from safpis.stub import StubBehaviour, StubServer, load_payloads, record_payloads, synthetic_payloads
+from safpis.transport import RequestsTransport, TransportConfig
+
+
+@mock.patch.dict(os.environ, {"SAFPIS_SUBSCRIBER_TOKEN": "stub"})
+class TestStub(TestCase):
+    """Tests for `stub` module."""
+
+    def setUp(self):
+        self.payloads = synthetic_payloads(stations=20)
+        self.server = StubServer(self.payloads).start()
+        self.transport = RequestsTransport(TransportConfig(cache_backend="memory", retries=0))
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+        self.transport.close()
+        self.server.stop()
+
+    def test_synthetic_payloads(self):
+        assert len(self.payloads["GetFullSiteDetails"]["S"]) == 20
+        assert synthetic_payloads(stations=20) == self.payloads
+        assert synthetic_payloads(stations=20, seed=1) != self.payloads
+
+    def test_serves_endpoints(self):
+        api = SafpisAPI(transport=self.transport, base_url=self.server.url)
+        safpis = Safpis(api=api)
+        assert len(safpis.cheapest_fuel_type("Unleaded")) > 0
+        assert api.GetSitesPrices() == self.payloads["GetSitesPrices"]
+        assert self.server.served["GetFullSiteDetails"] == 1
+        assert self.server.served["GetSitesPrices"] == 1
+
+    def test_base_url_from_environment(self):
+        with mock.patch.dict(os.environ, {"SAFPIS_BASE_URL": self.server.url + "/"}):
+            api = SafpisAPI(transport=self.transport)
+        assert api.base_url == self.server.url
+        assert api.GetCountryBrands() == self.payloads["GetCountryBrands"]
+
+    def test_requires_token(self):
+        response = requests.get(f"{self.server.url}/Price/GetSitesPrices", timeout=5)
+        assert response.status_code == 401
+        assert requests.get(f"{self.server.url}/Price/Other", timeout=5).status_code == 404
+
+    def test_etag(self):
+        url = f"{self.server.url}/Price/GetSitesPrices"
+        headers = {"Authorization": "FPDAPI SubscriberToken=stub"}
+        etag = requests.get(url, headers=headers, timeout=5).headers["ETag"]
+        response = requests.get(url, headers={**headers, "If-None-Match": etag}, timeout=5)
+        assert response.status_code == 304
+        self.server.set_payload("GetSitesPrices", {"SitePrices": []})
+        assert requests.get(url, headers={**headers, "If-None-Match": etag}, timeout=5).json() == {"SitePrices": []}
+
+    def test_injected_errors(self):
+        self.server.behaviour = StubBehaviour(error_rate=1.0)
+        api = SafpisAPI(transport=self.transport, base_url=self.server.url)
+        with pytest.raises(requests.HTTPError, match="503"):
+            api.GetSitesPrices()
+        assert self.server.errors == 1
+
+    def test_record_and_load_payloads(self):
+        api = SafpisAPI(transport=self.transport, base_url=self.server.url)
+        with tempfile.TemporaryDirectory() as directory:
+            record_payloads(api, directory)
+            assert load_payloads(directory) == self.payloads
@@ -0,0 +1,125 @@
+"""Tests for `timeseries` module."""
+
+import os
+import tempfile
+from unittest import TestCase
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from safpis.timeseries import PriceHistory, rolling  # noqa: E402
+
+# A price recorded from the SAFPIS REST API.
+SITE_PRICE = {
+    "SiteId": 61501045,
+    "FuelId": 14,
+    "CollectionMethod": "T",
+    "TransactionDateUtc": "2021-01-06T22:55:00",
+    "Price": 1356.0,
+}
+
+DAY = 24 * 60 * 60
+
+
+def _cycle(days, cycle_days, peak=2100.0, fall=20.0):
+    """Daily prices that restore to a peak every `cycle_days` days."""
+    return [peak - fall * (day % cycle_days) for day in range(days)]
+
+
+class TestPriceHistory(TestCase):
+    """Tests for `PriceHistory`."""
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+
+    def test_append_snapshot(self):
+        history = PriceHistory()
+        first = [
+            {**SITE_PRICE, "SiteId": 1, "Price": 1800.0},
+            {**SITE_PRICE, "SiteId": 2, "Price": 1900.0},
+        ]
+        assert history.append_snapshot(first) == 2
+        assert history.append_snapshot(first) == 0
+        # A day later, with the second price no longer available.
+        second = [
+            {**site_price, "Price": price, "TransactionDateUtc": "2021-01-07T22:55:00"}
+            for site_price, price in zip(first, [1750.0, 9999.0])
+        ]
+        assert history.append_snapshot(second) == 2
+        assert len(history) == 4
+        times, prices = history.changes(1, 14)
+        assert list(prices) == [1800.0, 1750.0]
+        assert times[1] - times[0] == DAY
+        assert np.isnan(history.changes(2, 14)[1][1])
+
+    def test_append_recorded_payload(self):
+        history = PriceHistory()
+        assert history.append_snapshot([SITE_PRICE]) == 1
+        times, prices = history.changes(61501045, 14)
+        assert list(prices) == [1356.0]
+        assert list(times) == [1609973700]
+
+    def test_repeated_prices_are_dropped(self):
+        history = PriceHistory.from_arrays([0, 60, 120, 180], [1, 1, 1, 1], [2, 2, 2, 2], [1800, 1800, 1700, 1700])
+        assert len(history) == 2
+        # Out of order appends are merged into place.
+        history.append_arrays([30], [1], [2], [1900])
+        assert list(history.changes(1, 2)[1]) == [1800.0, 1900.0, 1700.0]
+
+    def test_resample(self):
+        history = PriceHistory.from_arrays([0, 90, 100], [1, 1, 2], [2, 2, 2], [1800, 1700, 1500])
+        resampled = history.resample(60)
+        assert list(resampled.times) == [0, 60]
+        assert resampled.series == [(1, 2), (2, 2)]
+        assert resampled.prices[0].tolist() == [1800.0, 1800.0]
+        assert np.isnan(resampled.prices[1]).all()
+
+        resampled = history.resample(60, end=180, series=[(2, 2), (3, 2)])
+        assert resampled.prices[0][2:].tolist() == [1500.0, 1500.0]
+        assert np.isnan(resampled.prices[0][:2]).all()
+        assert np.isnan(resampled.prices[1]).all()
+
+    def test_rolling(self):
+        values = np.array([[1.0, 2.0, 3.0, np.nan, 5.0]])
+        assert np.isnan(rolling(values, 2)[0][0])
+        assert rolling(values, 2)[0][1:3].tolist() == [1.5, 2.5]
+        assert rolling(values, 2, min_periods=1)[0][3:].tolist() == [3.0, 5.0]
+        assert rolling(values, 3, "max", min_periods=1)[0].tolist() == [1.0, 2.0, 3.0, 3.0, 5.0]
+        assert rolling(values, 3, "min")[0][2] == 1.0
+        assert rolling(values, 3, "std")[0][2] == pytest.approx(1.0)
+        with pytest.raises(ValueError, match="statistic"):
+            rolling(values, 2, "median")
+
+    def test_cycle_phases(self):
+        days = np.arange(30) * DAY
+        history = PriceHistory.from_arrays(
+            np.concatenate([days, days]),
+            [1] * 30 + [2] * 30,
+            [2] * 60,
+            _cycle(30, 7) + [1800.0] * 30,
+        )
+        series, when, before, after = history.restorations()
+        assert series.tolist() == [0, 0, 0, 0]
+        assert (when / DAY).tolist() == [7, 14, 21, 28]
+        assert before.tolist() == [1980.0] * 4
+        assert after.tolist() == [2100.0] * 4
+
+        phases = history.cycle_phases(now=30 * DAY)
+        assert list(phases) == [(1, 2)]
+        phase = phases[(1, 2)]
+        assert phase.cycle_length == 7 * DAY
+        assert phase.phase == pytest.approx(2 / 7)
+        assert phase.next_trough == 35 * DAY
+        assert phase.trough_price == 1980.0
+        assert phase.restorations == 4
+
+    def test_save_and_load(self):
+        history = PriceHistory.from_arrays([0, 60, 0], [1, 1, 2], [2, 2, 12], [1800, np.nan, 1500])
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "history.npz")
+            history.save(path)
+            loaded = PriceHistory.load(path)
+        assert loaded.series() == [(1, 2), (2, 12)]
+        assert np.isnan(loaded.changes(1, 2)[1][1])
+        assert loaded.changes(2, 12)[1].tolist() == [1500.0]
@@ -0,0 +1,108 @@
+"""Tests for `transport` module."""
+
+import os
+from unittest import TestCase, mock
+
+import pytest
+import requests
+
+from safpis.api import SafpisAPI
+from safpis.transport import RequestsTransport, Transport, TransportConfig, accept_encoding
+
+
+class ScriptedTransport(Transport):
+    """Returns or raises each of a list of outcomes in turn."""
+
+    def __init__(self, outcomes, config=None):
+        super().__init__(config)
+        self.outcomes = list(outcomes)
+        self.sent = []
+
+    def send(self, url, headers, params, cache, timeout):  # noqa: ARG002
+        self.sent.append((url, params, cache, timeout))
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+def _response(status_code, **headers):
+    return mock.Mock(status_code=status_code, headers=headers)
+
+
+@mock.patch("safpis.transport.time.sleep")
+class TestTransport(TestCase):
+    """Tests for `Transport`."""
+
+    def test_retries_server_errors_and_connection_errors(self, sleep):
+        unavailable = _response(503)
+        transport = ScriptedTransport([ConnectionError(), unavailable, _response(200)])
+        response = transport.get("https://example.com", {}, {"a": 1})
+        assert response.status_code == 200
+        assert len(transport.sent) == 3
+        assert sleep.call_count == 2
+        assert transport.sent[0][3] == (5.0, 30.0)
+        # The retried response is closed, releasing its connection.
+        unavailable.close.assert_called_once_with()
+        response.close.assert_not_called()
+
+    def test_send_is_abstract(self, sleep):  # noqa: ARG002
+        with pytest.raises(TypeError, match="abstract"):
+            Transport()
+
+    def test_gives_up_after_retries(self, sleep):
+        transport = ScriptedTransport([_response(500)] * 3, TransportConfig(retries=2))
+        assert transport.get("https://example.com", {}, {}).status_code == 500
+        transport = ScriptedTransport([TimeoutError()] * 2, TransportConfig(retries=1))
+        with pytest.raises(TimeoutError):
+            transport.get("https://example.com", {}, {})
+        assert sleep.call_count == 3
+
+    def test_does_not_retry_client_errors(self, sleep):
+        transport = ScriptedTransport([_response(404)])
+        assert transport.get("https://example.com", {}, {}).status_code == 404
+        sleep.assert_not_called()
+
+    def test_backoff(self, sleep):
+        transport = ScriptedTransport([], TransportConfig(backoff=1.0, max_backoff=5.0))
+        delays = [transport.backoff(2) for _ in range(100)]
+        assert all(0 <= delay <= 4.0 for delay in delays)
+        assert len(set(delays)) > 1
+        assert transport.backoff(0, "3") == 3.0
+        assert transport.backoff(10) <= 5.0
+        assert transport.backoff(0, "60") == 5.0
+        sleep.assert_not_called()
+
+
+class TestRequestsTransport(TestCase):
+    """Tests for `RequestsTransport`."""
+
+    def test_sessions(self):
+        transport = RequestsTransport(TransportConfig(pool_size=4, read_timeout=7))
+        adapter = transport.sessions["minute"].get_adapter("https://example.com")
+        assert adapter._pool_maxsize == 4  # noqa: SLF001
+        assert adapter.max_retries.total == 0
+        with mock.patch.object(transport.sessions["minute"], "get", return_value=_response(200)) as get:
+            transport.get("https://example.com", {}, {}, cache="minute")
+        assert get.call_args.kwargs["timeout"] == (5.0, 7)
+        assert issubclass(requests.ConnectTimeout, transport.retry_exceptions)
+        transport.close()
+
+    def test_accept_encoding(self):
+        codings = accept_encoding().split(", ")
+        assert codings[:2] == ["gzip", "deflate"]
+        try:
+            import brotli  # noqa: F401
+        except ImportError:
+            assert "br" not in codings
+
+    @mock.patch.dict(os.environ, {"SAFPIS_SUBSCRIBER_TOKEN": "FAKE-TOKEN"})
+    def test_custom_transport(self):
+        response = _response(200, ETag='"1"')
+        response.json.return_value = {"Brands": []}
+        transport = ScriptedTransport([response])
+        api = SafpisAPI(transport=transport)
+        assert api.GetCountryBrands() == {"Brands": []}
+        assert transport.sent[0][1:3] == ({"countryId": 21}, "day")
+        assert api.headers["Accept-Encoding"] == "gzip, deflate"
+        assert api.cached_session_day is None